@@ -32,6 +32,7 @@ from cmk.utils.type_defs import (
 )
 
 import cmk.base.api.agent_based.register as agent_based_register
+import cmk.base.config as config
 from cmk.base.api.agent_based.type_defs import SectionPlugin
 from cmk.base.sources import fetch_all, make_nodes, make_sources
 from cmk.base.sources.agent import AgentHostSections
@@ -300,6 +301,7 @@ def _collect_host_sections(
         cmk.utils.piggyback.store_piggyback_raw_data(
             hostname,
             host_sections.piggybacked_raw_data,
+            segmented=config.piggyback_segment_store,
         )
 
     return collected_host_sections, results
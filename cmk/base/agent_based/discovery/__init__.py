@@ -4,7 +4,9 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import contextlib
 import itertools
+import multiprocessing
 import os
 import socket
 import time
@@ -13,6 +15,7 @@ from typing import (
     Counter,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Sequence,
@@ -31,7 +34,7 @@ import cmk.utils.tty as tty
 from cmk.utils.caching import config_cache as _config_cache
 from cmk.utils.check_utils import wrap_parameters
 from cmk.utils.exceptions import MKGeneralException, MKTimeout
-from cmk.utils.log import console
+from cmk.utils.log import console, VERBOSE
 from cmk.utils.object_diff import make_object_diff
 from cmk.utils.type_defs import (
     CheckPluginName,
@@ -47,6 +50,8 @@ from cmk.utils.type_defs import (
     state_markers,
 )
 
+import cmk.snmplib.snmp_scan as snmp_scan
+
 import cmk.core_helpers.cache
 from cmk.core_helpers.host_sections import HostSections
 from cmk.core_helpers.protocol import FetcherMessage
@@ -184,38 +189,40 @@ def do_discovery(
 
     mode = Mode.DISCOVERY if selected_sections is NO_SELECTION else Mode.FORCE_SECTIONS
 
-    # Now loop through all hosts
-    for host_name in sorted(host_names):
-        host_config = config_cache.get_host_config(host_name)
-        section.section_begin(host_name)
-        try:
-            ipaddress = config.lookup_ip_address(host_config)
-            parsed_sections_broker, _results = make_broker(
-                config_cache=config_cache,
-                host_config=host_config,
-                ip_address=ipaddress,
-                mode=mode,
-                selected_sections=selected_sections,
-                file_cache_max_age=config.discovery_max_cachefile_age() if use_caches else 0,
-                fetcher_messages=(),
-                force_snmp_cache_refresh=False,
-                on_scan_error=on_error,
-            )
-            _do_discovery_for(
-                host_name,
-                ipaddress,
-                parsed_sections_broker,
-                run_only_plugin_names,
-                arg_only_new,
-                discovery_parameters,
-            )
-
-        except Exception as e:
-            if cmk.utils.debug.enabled():
-                raise
-            section.section_error("%s" % e)
-        finally:
-            cmk.utils.cleanup.cleanup_globals()
+    # Without the cache files all SNMP hosts are scanned
+    with prescan_snmp_hosts(host_names if mode is Mode.DISCOVERY and not use_caches else []):
+        # Now loop through all hosts
+        for host_name in sorted(host_names):
+            host_config = config_cache.get_host_config(host_name)
+            section.section_begin(host_name)
+            try:
+                ipaddress = config.lookup_ip_address(host_config)
+                parsed_sections_broker, _results = make_broker(
+                    config_cache=config_cache,
+                    host_config=host_config,
+                    ip_address=ipaddress,
+                    mode=mode,
+                    selected_sections=selected_sections,
+                    file_cache_max_age=config.discovery_max_cachefile_age() if use_caches else 0,
+                    fetcher_messages=(),
+                    force_snmp_cache_refresh=False,
+                    on_scan_error=on_error,
+                )
+                _do_discovery_for(
+                    host_name,
+                    ipaddress,
+                    parsed_sections_broker,
+                    run_only_plugin_names,
+                    arg_only_new,
+                    discovery_parameters,
+                )
+
+            except Exception as e:
+                if cmk.utils.debug.enabled():
+                    raise
+                section.section_error("%s" % e)
+            finally:
+                cmk.utils.cleanup.cleanup_globals()
 
 
 def _preprocess_hostnames(
@@ -249,6 +256,63 @@ def _preprocess_hostnames(
     return host_names
 
 
+@contextlib.contextmanager
+def prescan_snmp_hosts(host_names: Iterable[HostName]) -> Iterator[None]:
+    """Scan the SNMP hosts concurrently, before they are discovered one after the other
+
+    An SNMP scan mostly waits for the answers of the host. The hosts are scanned in
+    forked processes, up to snmp_scan_processes hosts at a time. The discovery of the
+    hosts uses the results of these scans (see snmp_scan.cached_scan_results()).
+
+    Only hosts fetching fresh SNMP data are scanned at all, so use this only in case
+    the SNMP cache files are not used."""
+    with snmp_scan.cached_scan_results() as scan_results:
+        config_cache = config.get_config_cache()
+        snmp_host_names = sorted(
+            host_name for host_name in host_names
+            for host_config in [config_cache.get_host_config(host_name)]
+            if not host_config.is_cluster and
+            (host_config.is_snmp_host or host_config.management_protocol == "snmp"))
+
+        num_processes = min(len(snmp_host_names), config.snmp_scan_processes)
+        # In verbose mode the hosts are scanned during their discovery, which keeps the
+        # output of the hosts together
+        if num_processes > 1 and not console.isEnabledFor(VERBOSE):
+            with multiprocessing.get_context("fork").Pool(num_processes) as pool:
+                for host_scan_results in pool.imap_unordered(_prescan_snmp_host,
+                                                             snmp_host_names):
+                    scan_results.update(host_scan_results)
+        yield
+
+
+def _prescan_snmp_host(host_name: HostName) -> snmp_scan.SNMPScanResults:
+    """Scans the SNMP sources of the host, called in the forked processes
+
+    Errors are ignored. The host is scanned again during its discovery, which reports them."""
+    host_config = config.get_config_cache().get_host_config(host_name)
+    with snmp_scan.cached_scan_results() as scan_results:
+        try:
+            snmp_sources = [
+                source for source in sources.make_sources(
+                    host_config,
+                    config.lookup_ip_address(host_config),
+                    mode=Mode.DISCOVERY,
+                    on_scan_error="raise",
+                ) if isinstance(source, sources.snmp.SNMPSource)
+            ]
+        except Exception:
+            snmp_sources = []
+
+        for source in snmp_sources:
+            try:
+                source.detect()
+            except Exception:
+                pass
+
+        cmk.utils.cleanup.cleanup_globals()
+        return scan_results
+
+
 def _do_discovery_for(
     host_name: HostName,
     ipaddress: Optional[HostAddress],
@@ -10,6 +10,7 @@ In the future all inventory code should be moved to this module."""
 
 import os
 from contextlib import suppress
+from pathlib import Path
 from typing import (
     Dict,
     Hashable,
@@ -30,6 +31,7 @@ import cmk.utils.paths
 import cmk.utils.store as store
 import cmk.utils.tty as tty
 from cmk.utils.exceptions import MKGeneralException
+from cmk.utils.inventory_archive import InventoryArchive
 from cmk.utils.log import console
 from cmk.utils.structured_data import StructuredDataTree
 from cmk.utils.type_defs import (
@@ -485,15 +487,19 @@ def _save_inventory_tree(
     store.makedirs(cmk.utils.paths.inventory_output_dir)
 
     filepath = cmk.utils.paths.inventory_output_dir + "/" + hostname
+    archive = InventoryArchive(Path(cmk.utils.paths.inventory_archive_dir, hostname),
+                               Path(filepath))
     if inventory_tree.is_empty():
         # Remove empty inventory files. Important for host inventory icon
         if os.path.exists(filepath):
+            archive.freeze()
             os.remove(filepath)
         if os.path.exists(filepath + ".gz"):
             os.remove(filepath + ".gz")
         return None
 
-    old_tree = StructuredDataTree().load_from(filepath)
+    old_raw_tree = store.load_object_from_file(filepath)
+    old_tree = StructuredDataTree().create_tree_from_raw_tree(old_raw_tree)
     old_tree.normalize_nodes()
     if old_tree.is_equal(inventory_tree):
         console.verbose("Inventory was unchanged\n")
@@ -504,9 +510,8 @@ def _save_inventory_tree(
     else:
         console.verbose("Inventory tree has changed\n")
         old_time = os.stat(filepath).st_mtime
-        arcdir = "%s/%s" % (cmk.utils.paths.inventory_archive_dir, hostname)
-        store.makedirs(arcdir)
-        os.rename(filepath, arcdir + ("/%d" % old_time))
+        archive.archive("%d" % old_time, old_raw_tree, inventory_tree.get_raw_tree(),
+                        inventory_tree.compare_with(old_tree))
     inventory_tree.save_to(cmk.utils.paths.inventory_output_dir, hostname)
     return old_tree
 
@@ -5,7 +5,24 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """Caring about persistance of the discovered services (aka autochecks)"""
 
-from typing import Any, Callable, Dict, List, Optional, Sequence, Set, Tuple, Union, NamedTuple
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    NamedTuple,
+)
+import dis
+import marshal
+import mmap
+import os
+import struct
 import sys
 from pathlib import Path
 
@@ -36,6 +53,10 @@ HostOfClusteredService = Callable[[HostName, str], str]
 
 ServiceWithNodes = NamedTuple("ServiceWithNodes", [("service", Service), ("nodes", List[HostName])])
 
+RawAutochecks = Union[List[Dict[str, Any]], Tuple]
+# Inode, modification time (ns) and size of an autochecks file
+FileVersion = Tuple[int, int, int]
+
 
 class AutochecksManager:
     """Read autochecks from the configuration
@@ -195,11 +216,29 @@ def _load_raw_autochecks(
     *,
     path: Path,
     check_variables: Optional[Dict[str, Any]],
-) -> Union[List[Dict[str, Any]], Tuple]:
-    """Read raw autochecks and resolve parameters"""
-    if not path.exists():
+) -> RawAutochecks:
+    """Read raw autochecks and resolve parameters
+
+    Without check variables the autochecks are taken from the autochecks index
+    as long as the file has not been changed since the index has been updated."""
+    try:
+        version = _file_version(path.stat())
+    except FileNotFoundError:
         return []
 
+    if check_variables is None:
+        index = _autochecks_index()
+        raw_autochecks = None if index is None else index.raw_autochecks(path.stem, version)
+        if raw_autochecks is not None:
+            return raw_autochecks
+
+    return _read_raw_autochecks_file(path, check_variables)
+
+
+def _read_raw_autochecks_file(
+    path: Path,
+    check_variables: Optional[Dict[str, Any]],
+) -> RawAutochecks:
     console.vverbose("Loading autochecks from %s\n", path)
     with path.open(encoding="utf-8") as f:
         raw_file_content = f.read()
@@ -208,8 +247,10 @@ def _load_raw_autochecks(
         return []
 
     try:
-        return eval(raw_file_content, check_variables or {}, check_variables or {})
-    except NameError as exc:
+        if check_variables is None:
+            return _parse_literal(raw_file_content, str(path))
+        return eval(raw_file_content, check_variables, check_variables)
+    except (NameError, ValueError) as exc:
         raise MKGeneralException(
             "%s in an autocheck entry of host '%s' (%s). This entry is in pre Checkmk 1.7 "
             "format and needs to be converted. This is normally done by "
@@ -218,6 +259,216 @@ def _load_raw_autochecks(
             (str(exc).capitalize(), path.stem, path))
 
 
+# Byte code that only builds containers of constants
+_LITERAL_OPCODES = frozenset(dis.opmap[name] for name in [
+    "BUILD_CONST_KEY_MAP",
+    "BUILD_LIST",
+    "BUILD_MAP",
+    "BUILD_SET",
+    "BUILD_TUPLE",
+    "CACHE",
+    "DICT_UPDATE",
+    "EXTENDED_ARG",
+    "LIST_APPEND",
+    "LIST_EXTEND",
+    "LIST_TO_TUPLE",
+    "LOAD_CONST",
+    "LOAD_SMALL_INT",
+    "MAP_ADD",
+    "NOP",
+    "RESUME",
+    "RETURN_CONST",
+    "RETURN_VALUE",
+    "SET_ADD",
+    "SET_UPDATE",
+] if name in dis.opmap)
+
+
+def _parse_literal(text: str, filename: str) -> Any:
+    """Evaluate a Python literal, like ast.literal_eval(), but faster
+
+    The text is compiled by the interpreter. It is only evaluated in case the byte
+    code consists of constants and container constructions. Names, attribute
+    access, calls and operators are rejected without executing anything."""
+    code = compile(text, filename, "eval")
+    if code.co_names or code.co_varnames or any(
+            isinstance(const, type(code)) for const in code.co_consts) or not set(
+                code.co_code[::2]) <= _LITERAL_OPCODES:
+        raise ValueError("Malformed literal in %s" % filename)
+    return eval(code, {"__builtins__": {}})  # pylint: disable=eval-used
+
+
+def _file_version(stat: os.stat_result) -> FileVersion:
+    # The autochecks files are replaced on every save, so the inode changes as well
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class AutochecksIndex:
+    """Snapshot of the raw autochecks of all hosts
+
+    Parsing the autochecks files of all hosts is a considerable part of the config
+    generation. The index holds the raw autochecks of all hosts together with the
+    version of the file they have been read from. An entry is only used as long as
+    the autochecks file of the host has not been changed.
+
+    Layout (numbers in native byte order):
+
+        header          magic, number of hosts
+        name offsets    number of hosts + 1 offsets into the names
+        entry offsets   number of hosts + 1 offsets into the entries
+        names           the sorted host names, UTF-8 encoded
+        entries         file version and marshaled raw autochecks of the hosts
+
+    The file is memory mapped, looking up a host only reads its entry."""
+    _magic = b"CMKACI01"
+    _header = struct.Struct("=8sQ")
+    _file_version = struct.Struct("=QQQ")
+
+    def __init__(self, data: Union[bytes, mmap.mmap]) -> None:
+        super(AutochecksIndex, self).__init__()
+        magic, num_hosts = self._header.unpack_from(data)
+        if magic != self._magic:
+            raise ValueError("Invalid autochecks index")
+
+        view = memoryview(data)
+        index_size = (num_hosts + 1) * struct.calcsize("=Q")
+        offset = self._header.size
+        self._name_offsets = view[offset:offset + index_size].cast("Q")
+        self._entry_offsets = view[offset + index_size:offset + 2 * index_size].cast("Q")
+        self._names_offset = offset + 2 * index_size
+        self._entries_offset = self._names_offset + self._name_offsets[-1]
+        self._data = data
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["AutochecksIndex"]:
+        """Returns None in case the index does not exist or is not valid"""
+        try:
+            with path.open("rb") as f:
+                # The mapping stays valid, even if the file is replaced in the meantime
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(data)
+        except (OSError, ValueError, struct.error):
+            return None
+
+    @classmethod
+    def write(cls, path: Path, entries: Dict[HostName, bytes]) -> None:
+        """Write the index, the entries are created by the entry() method"""
+        hostnames = sorted(entries)
+        names = [hostname.encode("utf-8") for hostname in hostnames]
+        chunks = [cls._header.pack(cls._magic, len(hostnames))]
+        for sized_chunks in [names, [entries[hostname] for hostname in hostnames]]:
+            offsets = [0]
+            for chunk in sized_chunks:
+                offsets.append(offsets[-1] + len(chunk))
+            chunks.append(struct.pack("=%dQ" % len(offsets), *offsets))
+        chunks.extend(names)
+        chunks.extend(entries[hostname] for hostname in hostnames)
+        store.save_bytes_to_file(path, b"".join(chunks))
+
+    @classmethod
+    def entry(cls, version: FileVersion, raw_autochecks: RawAutochecks) -> bytes:
+        return cls._file_version.pack(*version) + marshal.dumps(raw_autochecks)
+
+    def __len__(self) -> int:
+        return len(self._name_offsets) - 1
+
+    def _name(self, index: int) -> bytes:
+        return self._data[self._names_offset + self._name_offsets[index]:self._names_offset +
+                          self._name_offsets[index + 1]]
+
+    def _entry(self, index: int) -> bytes:
+        return self._data[self._entries_offset + self._entry_offsets[index]:self._entries_offset +
+                          self._entry_offsets[index + 1]]
+
+    def _host_index(self, hostname: HostName) -> Optional[int]:
+        name = hostname.encode("utf-8")
+        low, high = 0, len(self)
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self) and self._name(low) == name:
+            return low
+        return None
+
+    def raw_autochecks(self, hostname: HostName, version: FileVersion) -> Optional[RawAutochecks]:
+        """Returns None in case the index has no entry for this version of the file"""
+        index = self._host_index(hostname)
+        if index is None:
+            return None
+        entry = self._entry(index)
+        if self._entry_version(entry) != version:
+            return None
+        return marshal.loads(entry[self._file_version.size:])
+
+    @classmethod
+    def _entry_version(cls, entry: bytes) -> FileVersion:
+        inode, mtime_ns, size = cls._file_version.unpack_from(entry)
+        return inode, mtime_ns, size
+
+    def entries(self) -> Iterator[Tuple[HostName, FileVersion, bytes]]:
+        for index in range(len(self)):
+            entry = self._entry(index)
+            yield self._name(index).decode("utf-8"), self._entry_version(entry), entry
+
+
+# The index is loaded once per process. Entries of changed files are ignored.
+_loaded_indexes: Dict[Path, Optional[AutochecksIndex]] = {}
+
+
+def _autochecks_index() -> Optional[AutochecksIndex]:
+    index_path = cmk.utils.paths.autochecks_index_file
+    if index_path not in _loaded_indexes:
+        _loaded_indexes[index_path] = AutochecksIndex.load(index_path)
+    return _loaded_indexes[index_path]
+
+
+def update_autochecks_index() -> None:
+    """Bring the autochecks index up to date
+
+    Only the autochecks files that have been changed since the last update are
+    parsed. Files that can not be parsed are left out, their errors are reported
+    when the autochecks of the host are read."""
+    index_path = cmk.utils.paths.autochecks_index_file
+    index = AutochecksIndex.load(index_path)
+    known_entries = {} if index is None else {
+        hostname: (version, entry) for hostname, version, entry in index.entries()
+    }
+
+    entries: Dict[HostName, bytes] = {}
+    changed = index is None
+    try:
+        dir_entries = list(os.scandir(cmk.utils.paths.autochecks_dir))
+    except FileNotFoundError:
+        dir_entries = []
+
+    for dir_entry in dir_entries:
+        if not dir_entry.name.endswith(".mk"):
+            continue
+        hostname = dir_entry.name[:-3]
+        version = _file_version(dir_entry.stat())
+
+        known_version, entry = known_entries.get(hostname, (None, b""))
+        if known_version == version:
+            entries[hostname] = entry
+            continue
+
+        changed = True
+        try:
+            entries[hostname] = AutochecksIndex.entry(
+                version, _read_raw_autochecks_file(Path(dir_entry.path), None))
+        except Exception:
+            continue
+
+    if changed or entries.keys() != known_entries.keys():
+        store.makedirs(index_path.parent)
+        AutochecksIndex.write(index_path, entries)
+        index = AutochecksIndex.load(index_path)
+    _loaded_indexes[index_path] = index
+
+
 def parse_autochecks_file(
     hostname: HostName,
     service_description: GetServiceDescription,
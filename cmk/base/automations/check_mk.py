@@ -63,6 +63,7 @@ from cmk.base.core import CoreAction, do_restart
 import cmk.base.core_config as core_config
 import cmk.base.sources as sources
 import cmk.base.ip_lookup as ip_lookup
+import cmk.base.item_state as item_state
 import cmk.base.nagios_utils
 import cmk.base.notify as notify
 import cmk.base.parent_scan
@@ -135,22 +136,24 @@ class AutomationDiscovery(DiscoveryAutomation):
 
         results: Dict[HostName, DiscoveryResult] = {}
 
-        for hostname in hostnames:
-            host_config = config_cache.get_host_config(hostname)
-            results[hostname] = discovery.discover_on_host(
-                config_cache=config_cache,
-                host_config=host_config,
-                mode=mode,
-                service_filters=None,
-                on_error=on_error,
-                use_cached_snmp_data=use_cached_snmp_data,
-                max_cachefile_age=config.discovery_max_cachefile_age(),
-            )
+        # A full scan fetches fresh SNMP data of all SNMP hosts
+        with discovery.prescan_snmp_hosts(hostnames if not use_cached_snmp_data else []):
+            for hostname in hostnames:
+                host_config = config_cache.get_host_config(hostname)
+                results[hostname] = discovery.discover_on_host(
+                    config_cache=config_cache,
+                    host_config=host_config,
+                    mode=mode,
+                    service_filters=None,
+                    on_error=on_error,
+                    use_cached_snmp_data=use_cached_snmp_data,
+                    max_cachefile_age=config.discovery_max_cachefile_age(),
+                )
 
-            if results[hostname].error_text is None:
-                # Trigger the discovery service right after performing the discovery to
-                # make the service reflect the new state as soon as possible.
-                self._trigger_discovery_check(config_cache, host_config)
+                if results[hostname].error_text is None:
+                    # Trigger the discovery service right after performing the discovery to
+                    # make the service reflect the new state as soon as possible.
+                    self._trigger_discovery_check(config_cache, host_config)
 
         return AutomationDiscoveryResponse(results).serialize()
 
@@ -358,6 +361,9 @@ class AutomationRenameHosts(Automation):
                 if self._rename_host_file(piggybase + piggydir, oldname, newname):
                     actions.append("piggyback-pig")
 
+        if self._rename_host_file(str(cmk.utils.paths.piggyback_segment_dir), oldname, newname):
+            actions.append("piggyback-pig")
+
         # Logwatch
         if self._rename_host_dir(cmk.utils.paths.logwatch_dir, oldname, newname):
             actions.append("logwatch")
@@ -747,7 +753,6 @@ class AutomationDeleteHosts(Automation):
                 "%s/%s" % (cmk.utils.paths.precompiled_hostchecks_dir, hostname),
                 "%s/%s.py" % (cmk.utils.paths.precompiled_hostchecks_dir, hostname),
                 "%s/%s.mk" % (cmk.utils.paths.autochecks_dir, hostname),
-                "%s/%s" % (cmk.utils.paths.counters_dir, hostname),
                 "%s/%s" % (cmk.utils.paths.tcp_cache_dir, hostname),
                 "%s/persisted/%s" % (cmk.utils.paths.var_dir, hostname),
                 "%s/inventory/%s" % (cmk.utils.paths.var_dir, hostname),
@@ -756,6 +761,8 @@ class AutomationDeleteHosts(Automation):
         ]:
             self._delete_if_exists(path)
 
+        item_state.remove_item_states(hostname)
+
         try:
             ds_directories = os.listdir(cmk.utils.paths.data_source_cache_dir)
         except OSError as e:
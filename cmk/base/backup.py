@@ -32,6 +32,7 @@ def backup_paths() -> List[BackupPath]:
         ('check_mk_configdir',  cmk.utils.paths.check_mk_config_dir, "",              "Configuration sub files",           True,  ),
         ('autochecksdir',       cmk.utils.paths.autochecks_dir,      "",              "Automatically inventorized checks", True,  ),
         ('counters_directory',  cmk.utils.paths.counters_dir,        "",              "Performance counters",              True,  ),
+        ('item_states',         str(cmk.utils.paths.item_states_dir), "",             "Item states of all hosts",          True,  ),
         ('tcp_cache_dir',       cmk.utils.paths.tcp_cache_dir,       "",              "Agent cache",                       True,  ),
         ('logwatch_dir',        cmk.utils.paths.logwatch_dir,        "",              "Logwatch",                          True,  ),
     ]
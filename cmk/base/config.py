@@ -4,9 +4,11 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import array
 import ast
 import contextlib
 import copy
+import hashlib
 import inspect
 import itertools
 import marshal
@@ -17,14 +19,17 @@ import py_compile
 import socket
 import struct
 import sys
+import time
 from collections import Counter, OrderedDict
 from importlib.util import MAGIC_NUMBER as _MAGIC_NUMBER
 from pathlib import Path
+from types import CodeType
 from typing import (
     Any,
     Callable,
     cast,
     Dict,
+    IO,
     Iterable,
     Iterator,
     List,
@@ -106,6 +111,8 @@ import cmk.base.autochecks as autochecks
 import cmk.base.check_utils
 import cmk.base.default_config as default_config
 import cmk.base.ip_lookup as ip_lookup
+import cmk.base.item_state as item_state
+import cmk.base.profiling as profiling
 from cmk.base.api.agent_based.checking_classes import CheckPlugin
 from cmk.base.api.agent_based.register.check_plugins_legacy import create_check_plugin_from_legacy
 from cmk.base.api.agent_based.register.section_plugins_legacy import (
@@ -291,6 +298,7 @@ def _perform_post_config_loading_actions() -> None:
     _transform_plugin_names_from_160_to_170(global_dict)
 
     get_config_cache().initialize()
+    item_state.use_item_state_store(item_state_store)
 
     # In case the checks are not loaded yet it seems the current mode
     # is not working with the checks. In this case also don't load the
@@ -394,7 +402,13 @@ def _load_config(with_conf_d: bool, exclude_parents_mk: bool) -> None:
             all_hosts.set_current_path(current_path)
             clusters.set_current_path(current_path)
 
-            exec(open(_f).read(), global_dict, global_dict)
+            start = time.time()
+            code, compiled = _config_file_code(_f)
+            compile_duration = time.time() - start
+            exec(code, global_dict, global_dict)
+            if profiling.config_load_enabled():
+                profiling.add_config_file_load(_f, compiled, compile_duration,
+                                               time.time() - start - compile_duration)
 
             if not isinstance(all_hosts, SetFolderPathList):
                 raise MKGeneralException(
@@ -423,6 +437,39 @@ def _load_config(with_conf_d: bool, exclude_parents_mk: bool) -> None:
     clusters = dict(clusters)
 
 
+def _config_file_code(path: str) -> Tuple[CodeType, bool]:
+    """Returns the code object of a configuration file and whether it has been compiled
+
+    Compiling is the main part of reading the configuration files. The compiled code
+    objects are cached in marshaled files. Similar to the precompiled plugins (see
+    load_precompiled_plugin), they are used as long as the modification time and the
+    size of the configuration file are unchanged."""
+    stat = os.stat(path)
+    file_version = (_MAGIC_NUMBER, path, stat.st_mtime_ns, stat.st_size)
+    precompiled_path = _precompiled_config_path(path)
+    try:
+        cached_version, code = marshal.loads(precompiled_path.read_bytes())
+        if cached_version == file_version:
+            return code, False
+    except (FileNotFoundError, EOFError, ValueError, TypeError):
+        pass
+
+    with open(path) as f:
+        code = compile(f.read(), path, "exec")
+
+    try:
+        store.makedirs(precompiled_path.parent)
+        store.save_bytes_to_file(precompiled_path, marshal.dumps((file_version, code)))
+    except (OSError, MKGeneralException) as e:
+        # The configuration can be loaded without the cache
+        console.vverbose("Cannot cache the compiled configuration file %s: %s\n", path, e)
+    return code, True
+
+
+def _precompiled_config_path(path: str) -> Path:
+    return cmk.utils.paths.precompiled_config_dir / hashlib.sha256(path.encode()).hexdigest()
+
+
 def _transform_mgmt_config_vars_from_140_to_150() -> None:
     #FIXME We have to transform some configuration variables from host attributes
     # to cmk.base configuration variables because during the migration step from
@@ -726,21 +773,167 @@ class PackedConfigGenerator:
 
 
 class PackedConfigStore:
-    """Caring about persistence of the packed configuration"""
+    """Caring about persistence of the packed configuration
+
+    The settings of the single hosts (see _sharded_variable_names) are stored
+    separately from the global part of the configuration. When reading the
+    configuration, only the global part is loaded. The settings of a host are loaded
+    when it is accessed for the first time. A helper process usually only deals with
+    a few of the hosts.
+
+    The file contains:
+
+        header          length of the global part, number of hosts
+        global part     pickled global configuration and the sharded variable names
+        host index      offsets of the host names and of the host settings
+        host names      the sorted host names (UTF-8)
+        host settings   the pickled settings of every host
+    """
+
+    # These variables map the host names to the settings of the hosts
+    _sharded_variable_names = [
+        "host_attributes",
+        "ipaddresses",
+        "ipv6addresses",
+        "explicit_snmp_communities",
+    ]
+    _header = struct.Struct("=QQ")
+
     def __init__(self, serial: OptionalConfigSerial) -> None:
         base_path: Final[Path] = cmk.utils.paths.make_helper_config_path(serial)
         self.path: Final[Path] = base_path / "precompiled_check_config.mk"
 
     def write(self, helper_config: Mapping[str, Any]) -> None:
+        global_config = dict(helper_config)
+        sharded_variable_names = []
+        host_settings: Dict[HostName, Dict[str, Any]] = {}
+        for varname in self._sharded_variable_names:
+            if varname not in global_config:
+                continue
+            sharded_variable_names.append(varname)
+            for hostname, value in global_config.pop(varname).items():
+                host_settings.setdefault(hostname, {})[varname] = value
+
+        hostnames = sorted(host_settings)
+        encoded_hostnames = [hostname.encode("utf-8") for hostname in hostnames]
+        shards = [
+            pickle.dumps(host_settings[hostname], pickle.HIGHEST_PROTOCOL)
+            for hostname in hostnames
+        ]
+        global_part = pickle.dumps((global_config, sharded_variable_names),
+                                   pickle.HIGHEST_PROTOCOL)
+
         self.path.parent.mkdir(parents=True, exist_ok=True)
         tmp_path = self.path.with_suffix(self.path.suffix + ".compiled")
         with tmp_path.open("wb") as compiled_file:
-            pickle.dump(helper_config, compiled_file)
+            compiled_file.write(self._header.pack(len(global_part), len(hostnames)))
+            compiled_file.write(global_part)
+            compiled_file.write(_offsets(encoded_hostnames).tobytes())
+            compiled_file.write(_offsets(shards).tobytes())
+            compiled_file.writelines(encoded_hostnames)
+            compiled_file.writelines(shards)
         tmp_path.rename(self.path)
 
     def read(self) -> Mapping[str, Any]:
-        with self.path.open("rb") as f:
-            return pickle.load(f)
+        # The file stays open for reading the host settings. In case the file is
+        # replaced in the meantime, the settings are still read from this version.
+        f = self.path.open("rb")
+        global_part_length, num_hosts = self._header.unpack(f.read(self._header.size))
+        global_config, sharded_variable_names = pickle.loads(f.read(global_part_length))
+
+        shards = _PackedHostShards(f, num_hosts)
+        for varname in sharded_variable_names:
+            global_config[varname] = _PackedHostSettings(varname, shards)
+        return global_config
+
+
+def _offsets(chunks: List[bytes]) -> array.array:
+    offsets = array.array("Q", [0])
+    for chunk in chunks:
+        offsets.append(offsets[-1] + len(chunk))
+    return offsets
+
+
+class _PackedHostShards:
+    """Reads the settings of the hosts from a packed configuration file on demand
+
+    The host index and names are read as a whole, without creating objects per
+    host. The host names are looked up by binary search."""
+    def __init__(self, f: IO[bytes], num_hosts: int) -> None:
+        self._file = f
+        index_size = (num_hosts + 1) * array.array("Q").itemsize
+        self._name_offsets = memoryview(f.read(index_size)).cast("Q")
+        self._shard_offsets = memoryview(f.read(index_size)).cast("Q")
+        self._names = f.read(self._name_offsets[-1])
+        self._shards_offset = f.tell()
+        self._host_settings: Dict[HostName, Optional[Dict[str, Any]]] = {}
+
+    def _num_hosts(self) -> int:
+        return len(self._name_offsets) - 1
+
+    def _name(self, index: int) -> bytes:
+        return self._names[self._name_offsets[index]:self._name_offsets[index + 1]]
+
+    def _host_index(self, hostname: HostName) -> Optional[int]:
+        name = hostname.encode("utf-8")
+        low, high = 0, self._num_hosts()
+        while low < high:
+            middle = (low + high) // 2
+            if self._name(middle) < name:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._num_hosts() and self._name(low) == name:
+            return low
+        return None
+
+    def hostnames(self) -> Iterator[HostName]:
+        for index in range(self._num_hosts()):
+            yield self._name(index).decode("utf-8")
+
+    def host_settings(self, hostname: HostName) -> Optional[Dict[str, Any]]:
+        try:
+            return self._host_settings[hostname]
+        except KeyError:
+            pass
+
+        settings = None
+        index = self._host_index(hostname)
+        if index is not None:
+            start, end = self._shard_offsets[index], self._shard_offsets[index + 1]
+            # Independent of the file position, which may be shared with forked processes
+            settings = pickle.loads(
+                os.pread(self._file.fileno(), end - start, self._shards_offset + start))
+        self._host_settings[hostname] = settings
+        return settings
+
+
+class _PackedHostSettings(Mapping[HostName, Any]):
+    """A configuration variable mapping the host names to the settings of the hosts
+
+    Iterating over all hosts reads the settings of all hosts. This is not needed by
+    the helpers."""
+    def __init__(self, varname: str, shards: _PackedHostShards) -> None:
+        self._varname = varname
+        self._shards = shards
+
+    def __getitem__(self, hostname: HostName) -> Any:
+        settings = self._shards.host_settings(hostname)
+        if settings is None or self._varname not in settings:
+            raise KeyError(hostname)
+        return settings[self._varname]
+
+    def __contains__(self, hostname: object) -> bool:
+        if not isinstance(hostname, str):
+            return False
+        settings = self._shards.host_settings(hostname)
+        return settings is not None and self._varname in settings
+
+    def __iter__(self) -> Iterator[HostName]:
+        return (hostname for hostname in self._shards.hostnames() if hostname in self)
+
+    def __len__(self) -> int:
+        return sum(1 for _hostname in self)
 
 
 def make_core_autochecks_dir(serial: OptionalConfigSerial) -> Path:
@@ -2547,12 +2740,16 @@ class HostConfig:
                 return SNMPBackendEnum.INLINE
             if host_backend == "classic":
                 return SNMPBackendEnum.CLASSIC
+            if host_backend == "asyncio":
+                return SNMPBackendEnum.ASYNCIO
             raise MKGeneralException("Bad Host SNMP Backend configuration: %s" % host_backend)
 
         if with_pysnmp and snmp_backend_default == "pysnmp":
             return SNMPBackendEnum.PYSNMP
         if with_inline_snmp and snmp_backend_default == "inline":
             return SNMPBackendEnum.INLINE
+        if snmp_backend_default == "asyncio":
+            return SNMPBackendEnum.ASYNCIO
         return SNMPBackendEnum.CLASSIC
 
     def _is_cluster(self) -> bool:
@@ -33,6 +33,7 @@ from cmk.utils.type_defs import (
     LATEST_SERIAL,
 )
 
+import cmk.base.autochecks as autochecks
 import cmk.base.api.agent_based.register as agent_based_register
 import cmk.base.obsolete_output as out
 import cmk.base.config as config
@@ -396,16 +397,34 @@ def _create_core_config(core: MonitoringCore) -> ConfigurationWarnings:
 
     _verify_non_duplicate_hosts()
     _verify_non_deprecated_checkgroups()
+    autochecks.update_autochecks_index()
+
+    # Only the config generation evaluates the rules of all hosts. Other processes
+    # would only pay for the host digests of the persisted host matches.
+    config.get_config_cache().ruleset_matcher.ruleset_optimizer.enable_host_match_cache(
+        Path(cmk.utils.paths.tmp_dir, "ruleset_host_matches"))
 
     with HelperConfig(
             new_helper_config_serial()).create() as helper_config, _backup_objects_file(core):
         core.create_config(helper_config.serial)
 
+    _save_host_match_cache()
+
     cmk.utils.password_store.save(config.stored_passwords)
 
     return get_configuration_warnings()
 
 
+def _save_host_match_cache() -> None:
+    ruleset_optimizer = config.get_config_cache().ruleset_matcher.ruleset_optimizer
+    ruleset_optimizer.save_host_match_cache()
+
+    host_match_cache = ruleset_optimizer.get_host_match_cache()
+    if host_match_cache is not None:
+        console.verbose("Ruleset host match cache: %(hits)d hits, %(misses)d misses, "
+                        "%(conditions)d conditions\n" % host_match_cache.stats())
+
+
 def _verify_non_deprecated_checkgroups() -> None:
     """Verify that the user has no deprecated check groups configured.
     """
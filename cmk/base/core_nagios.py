@@ -6,13 +6,17 @@
 """Code for support of Nagios (and compatible) cores"""
 
 import base64
+import hashlib
+import multiprocessing
 import os
 import py_compile
 import socket
 import sys
+from contextlib import suppress
 from io import StringIO
+from importlib.util import MAGIC_NUMBER as _MAGIC_NUMBER
 from pathlib import Path
-from typing import Any, Dict, IO, Iterable, List, Optional, Set, Tuple, Union
+from typing import Any, Dict, IO, Iterable, Iterator, List, Optional, Set, Tuple, Union
 
 from six import ensure_binary, ensure_str
 
@@ -21,7 +25,7 @@ import cmk.utils.tty as tty
 import cmk.utils.store as store
 from cmk.utils.check_utils import section_name_of
 from cmk.utils.exceptions import MKGeneralException
-from cmk.utils.log import console
+from cmk.utils.log import console, VERBOSE
 from cmk.utils.macros import replace_macros_in_str
 from cmk.utils.type_defs import (
     CheckPluginName,
@@ -35,6 +39,8 @@ from cmk.utils.type_defs import (
     ServicegroupName,
     ServiceName,
     ConfigSerial,
+    LATEST_SERIAL,
+    OptionalConfigSerial,
 )
 
 from cmk.core_helpers.type_defs import Mode
@@ -942,34 +948,81 @@ def _find_check_plugins(checktype: CheckPluginNameStr) -> List[str]:
 class HostCheckStore:
     """Caring about persistence of the precompiled host check files"""
     @staticmethod
-    def host_check_file_path(serial: ConfigSerial, hostname: HostName) -> Path:
+    def host_check_file_path(serial: OptionalConfigSerial, hostname: HostName) -> Path:
         return cmk.utils.paths.make_helper_config_path(serial) / "host_checks" / hostname
 
     @staticmethod
-    def host_check_source_file_path(serial: ConfigSerial, hostname: HostName) -> Path:
+    def host_check_source_file_path(serial: OptionalConfigSerial, hostname: HostName) -> Path:
         # TODO: Use append_suffix(".py") once we are on Python 3.10
         path = HostCheckStore.host_check_file_path(serial, hostname)
         return path.with_suffix(path.suffix + ".py")
 
-    def write(self, serial: ConfigSerial, hostname: HostName, host_check: str) -> None:
+    @staticmethod
+    def source_hashes_file_path(serial: OptionalConfigSerial) -> Path:
+        return cmk.utils.paths.make_helper_config_path(serial) / "host_check_hashes"
+
+    def load_source_hashes(self, serial: OptionalConfigSerial) -> Dict[HostName, str]:
+        return store.load_object_from_file(self.source_hashes_file_path(serial), default={})
+
+    def save_source_hashes(self, serial: ConfigSerial, source_hashes: Dict[HostName, str]) -> None:
+        store.save_object_to_file(self.source_hashes_file_path(serial), source_hashes)
+
+    def write(self,
+              serial: ConfigSerial,
+              hostname: HostName,
+              host_check: str,
+              previous_source_hash: Optional[str] = None) -> str:
+        """Write and compile the host check, returns the hash of the source
+
+        In case the source has the same hash as the host check of the latest config
+        (previous_source_hash), the files of the latest config are reused."""
         compiled_filename = self.host_check_file_path(serial, hostname)
         source_filename = self.host_check_source_file_path(serial, hostname)
+        source_hash = hashlib.sha256(_MAGIC_NUMBER + host_check.encode("utf-8")).hexdigest()
 
         store.makedirs(compiled_filename.parent)
 
+        if (not config.delay_precompile and source_hash == previous_source_hash and
+                self._link_latest(serial, hostname)):
+            console.verbose(" ==> %s (unchanged).\n", compiled_filename, stream=sys.stderr)
+            return source_hash
+
         store.save_text_to_file(source_filename, host_check)
 
         # compile python (either now or delayed - see host_check code for delay_precompile handling)
         if config.delay_precompile:
             compiled_filename.symlink_to(hostname + ".py")
         else:
+            # The core executes the host checks of the latest config. Using this path as file
+            # name of the code makes the compiled file reusable by the following configs.
             py_compile.compile(file=str(source_filename),
                                cfile=str(compiled_filename),
-                               dfile=str(compiled_filename),
+                               dfile=str(self.host_check_file_path(LATEST_SERIAL, hostname)),
                                doraise=True)
             os.chmod(compiled_filename, 0o750)
 
         console.verbose(" ==> %s.\n", compiled_filename, stream=sys.stderr)
+        return source_hash
+
+    def _link_latest(self, serial: ConfigSerial, hostname: HostName) -> bool:
+        """Hard link the files of the latest config, returns False in case this failed"""
+        links = [
+            (self.host_check_source_file_path(LATEST_SERIAL, hostname),
+             self.host_check_source_file_path(serial, hostname)),
+            (self.host_check_file_path(LATEST_SERIAL, hostname),
+             self.host_check_file_path(serial, hostname)),
+        ]
+        try:
+            for latest_path, path in links:
+                if latest_path.resolve() == path.resolve():
+                    return False
+                os.link(str(latest_path.resolve()), str(path))
+        except OSError:
+            for _latest_path, path in links:
+                with suppress(FileNotFoundError):
+                    path.unlink()
+            return False
+        return True
 
 
 def _precompile_hostchecks(serial: ConfigSerial) -> None:
@@ -981,25 +1034,62 @@ def _precompile_hostchecks(serial: ConfigSerial) -> None:
     console.verbose("Precompiling host checks...\n")
 
     host_check_store = HostCheckStore()
-    for hostname in config_cache.all_active_hosts():
-        try:
-            console.verbose("%s%s%-16s%s:",
-                            tty.bold,
-                            tty.blue,
-                            hostname,
-                            tty.normal,
-                            stream=sys.stderr)
-            host_check = _dump_precompiled_hostcheck(config_cache, serial, hostname)
-            if host_check is None:
-                console.verbose("(no Checkmk checks)\n")
-                continue
+    source_hashes: Dict[HostName, str] = {}
+    global _precompile_context
+    _precompile_context = (config_cache, serial, host_check_store.load_source_hashes(LATEST_SERIAL))
+    try:
+        for hostname, source_hash, error in _precompile_hostchecks_of(
+                sorted(config_cache.all_active_hosts())):
+            if error is not None:
+                console.error("Error precompiling checks for host %s: %s\n" % (hostname, error))
+                sys.exit(5)
+            if source_hash is not None:
+                source_hashes[hostname] = source_hash
+    finally:
+        _precompile_context = None
 
-            host_check_store.write(serial, hostname, host_check)
-        except Exception as e:
-            if cmk.utils.debug.enabled():
-                raise
-            console.error("Error precompiling checks for host %s: %s\n" % (hostname, e))
-            sys.exit(5)
+    host_check_store.save_source_hashes(serial, source_hashes)
+
+
+# Is set while precompiling the host checks, shared with the forked processes
+_precompile_context: Optional[Tuple[ConfigCache, ConfigSerial, Dict[HostName, str]]] = None
+
+
+def _precompile_hostchecks_of(
+        hostnames: List[HostName]) -> Iterator[Tuple[HostName, Optional[str], Optional[str]]]:
+    """Precompiles the host checks, in parallel in forked processes
+
+    The processes share the config cache of this process. The verbose output is
+    written by the processes, so in verbose mode the host checks are precompiled
+    one after the other to keep the output of the hosts together."""
+    num_processes = min(len(hostnames), os.cpu_count() or 1)
+    if num_processes <= 1 or console.isEnabledFor(VERBOSE):
+        yield from map(_precompile_hostcheck, hostnames)
+        return
+
+    with multiprocessing.get_context("fork").Pool(num_processes) as pool:
+        yield from pool.imap_unordered(_precompile_hostcheck,
+                                       hostnames,
+                                       chunksize=max(1, len(hostnames) // (8 * num_processes)))
+
+
+def _precompile_hostcheck(hostname: HostName) -> Tuple[HostName, Optional[str], Optional[str]]:
+    """Returns the host name, the hash of the host check source and an error message"""
+    assert _precompile_context is not None
+    config_cache, serial, previous_source_hashes = _precompile_context
+    try:
+        console.verbose("%s%s%-16s%s:", tty.bold, tty.blue, hostname, tty.normal, stream=sys.stderr)
+        host_check = _dump_precompiled_hostcheck(config_cache, serial, hostname)
+        if host_check is None:
+            console.verbose("(no Checkmk checks)\n")
+            return hostname, None, None
+
+        return hostname, HostCheckStore().write(serial, hostname, host_check,
+                                                previous_source_hashes.get(hostname)), None
+    except Exception as e:
+        if cmk.utils.debug.enabled():
+            raise
+        return hostname, None, str(e)
 
 
 def _dump_precompiled_hostcheck(config_cache: ConfigCache,
@@ -36,6 +36,8 @@ default_host_group = 'check_mk'
 check_max_cachefile_age = 0  # per default do not use cache files when checking
 cluster_max_cachefile_age = 90  # secs.
 piggyback_max_cachefile_age = 3600  # secs
+piggyback_segment_store = False  # store the piggyback data of a source host in one file
+item_state_store = False  # store the item states of all hosts in lock-striped files
 # Ruleset for translating piggyback host names
 piggyback_translation: _List = []
 # Ruleset for translating service descriptions
@@ -108,6 +110,7 @@ inventory_check_interval = None  # Nagios intervals (4h = 240)
 inventory_check_severity = 1  # warning
 inventory_max_cachefile_age = 120  # seconds
 inventory_check_autotrigger = True  # Automatically trigger inv-check after automation-inventory
+snmp_scan_processes = 10  # SNMP hosts scanned concurrently by a discovery of many hosts
 # TODO: Remove this already deprecated option
 always_cleanup_autochecks = None  # For compatiblity with old configuration
 
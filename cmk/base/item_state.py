@@ -14,6 +14,10 @@ While a host is being checked this memory is kept in _cached_item_states.
 That is a dictionary. The keys are unique to one check type and
 item. The value is free form.
 
+The item states are either stored in one file per host or, when the
+item_state_store option is enabled, in the ItemStateStore shared by all
+hosts.
+
 Note: The item state is kept in tmpfs and not reboot-persistant.
 Do not store long-time things here. Also do not store complex
 structures like log files or stuff.
@@ -27,6 +31,7 @@ import cmk.utils.cleanup
 import cmk.utils.paths
 import cmk.utils.store as store
 from cmk.utils.exceptions import MKException, MKGeneralException
+from cmk.utils.item_state_store import ItemStateStore
 from cmk.utils.type_defs import HostName
 from cmk.utils.log import logger
 
@@ -44,6 +49,9 @@ ItemStateKey = Tuple[ItemStateKeyElement, ...]
 ItemStates = Dict[ItemStateKey, Any]
 OnWrap = Union[None, bool, float]
 
+# Is set when the item_state_store option is enabled
+_item_state_store: Optional[ItemStateStore] = None
+
 
 class MKCounterWrapped(MKException):
     pass
@@ -70,6 +78,10 @@ class CachedItemStates:
 
     def load(self, hostname: HostName) -> None:
         self._logger.debug("Loading item states")
+        if _item_state_store is not None:
+            self._item_states = _load_from_item_state_store(_item_state_store, hostname)
+            return
+
         filename = cmk.utils.paths.counters_dir + "/" + hostname
         try:
             # TODO: refactoring. put these two values into a named tuple
@@ -97,6 +109,15 @@ class CachedItemStates:
         if not self._removed_item_state_keys and not self._updated_item_states:
             return
 
+        if _item_state_store is not None:
+            try:
+                _item_state_store.save(hostname, self._updated_item_states,
+                                       self._removed_item_state_keys)
+            except Exception:
+                raise MKGeneralException("Cannot save item states of %s: %s" %
+                                         (hostname, traceback.format_exc()))
+            return
+
         try:
             if not os.path.exists(cmk.utils.paths.counters_dir):
                 os.makedirs(cmk.utils.paths.counters_dir)
@@ -159,9 +180,42 @@ class CachedItemStates:
         return self._item_state_prefix + (user_key,)
 
 
+def _load_from_item_state_store(item_state_store: ItemStateStore,
+                                hostname: HostName) -> ItemStates:
+    item_states = item_state_store.load(hostname)
+    if item_states is not None:
+        return item_states
+
+    # Migrate the item states from the file of the host
+    filename = cmk.utils.paths.counters_dir + "/" + hostname
+    if not os.path.exists(filename):
+        return {}
+    try:
+        store.aquire_lock(filename)
+        # Another process may have migrated the file while we were waiting for the lock.
+        # Taking the lock has created an empty file again in this case.
+        item_states = item_state_store.load(hostname)
+        if item_states is None:
+            item_states = store.load_object_from_file(filename, default={})
+            item_state_store.replace(hostname, item_states)
+        os.remove(filename)
+    finally:
+        store.release_lock(filename)
+    return item_states
+
+
 _cached_item_states = CachedItemStates()
 
 
+def use_item_state_store(enabled: bool) -> None:
+    """Store the item states of all hosts in the ItemStateStore instead of one file per host"""
+    global _item_state_store
+    if not enabled:
+        _item_state_store = None
+    elif _item_state_store is None:
+        _item_state_store = ItemStateStore(cmk.utils.paths.item_states_dir)
+
+
 def load(hostname: HostName) -> None:
     _cached_item_states.reset()
     _cached_item_states.load(hostname)
@@ -171,6 +225,19 @@ def save(hostname: HostName) -> None:
     _cached_item_states.save(hostname)
 
 
+def remove_item_states(hostname: HostName) -> bool:
+    """Remove all stored item states of a host, e.g. when the host is deleted
+
+    Returns whether or not item states of the host have been found."""
+    removed = _item_state_store is not None and _item_state_store.remove(hostname)
+    try:
+        os.remove(cmk.utils.paths.counters_dir + "/" + hostname)
+        removed = True
+    except OSError:
+        pass
+    return removed
+
+
 def set_item_state(user_key: str, state: Any) -> None:
     """Store arbitrary values until the next execution of a check.
 
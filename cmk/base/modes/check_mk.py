@@ -59,10 +59,12 @@ import cmk.base.agent_based.discovery as discovery
 import cmk.base.dump_host
 import cmk.base.agent_based.inventory as inventory
 import cmk.base.ip_lookup as ip_lookup
+import cmk.base.item_state as item_state
 import cmk.base.localize
 import cmk.base.obsolete_output as out
 import cmk.base.packaging
 import cmk.base.parent_scan
+import cmk.base.prediction as prediction
 import cmk.base.profiling as profiling
 from cmk.base.api.agent_based.type_defs import SNMPSectionPlugin
 from cmk.base.core_factory import create_core
@@ -183,6 +185,18 @@ modes.register_general_option(
     ))
 
 
+def option_profile_config_load() -> None:
+    profiling.enable_config_load()
+
+
+modes.register_general_option(
+    Option(
+        long_option="profile-config-load",
+        short_help="Show the time needed to load each configuration file",
+        handler_function=option_profile_config_load,
+    ))
+
+
 def option_fake_dns(a: str) -> None:
     ip_lookup.enforce_fake_dns(a)
 
@@ -545,6 +559,7 @@ def mode_paths() -> None:
         (cmk.utils.paths.precompiled_hostchecks_dir, directory, data, "Precompiled host checks"),
         (cmk.utils.paths.snmpwalks_dir, directory, data, "Stored snmpwalks (output of --snmpwalk)"),
         (cmk.utils.paths.counters_dir, directory, data, "Current state of performance counters"),
+        (str(cmk.utils.paths.item_states_dir), directory, data, "Item states of all hosts"),
         (cmk.utils.paths.tcp_cache_dir, directory, data, "Cached output from agents"),
         (cmk.utils.paths.logwatch_dir, directory, data,
          "Unacknowledged logfiles of logwatch extension"),
@@ -778,6 +793,58 @@ modes.register(
         short_help="Cleanup outdated piggyback files",
     ))
 
+#.
+#   .--predict.------------------------------------------------------------.
+#   |                           _  _        _                              |
+#   |    _ __   _ __   ___   __| |(_)  ___ | |_                            |
+#   |   | '_ \ | '__| / _ \ / _` || | / __|| __|                           |
+#   |   | |_) || |   |  __/| (_| || || (__ | |_                            |
+#   |   | .__/ |_|    \___| \__,_||_| \___| \__| _                         |
+#   |   |_|                                     (_)                        |
+#   '----------------------------------------------------------------------'
+
+
+def mode_precompute_predictions(options: Dict) -> None:
+    stats = prediction.precompute_predictions(lead_time=options.get("lead-time", 900),
+                                              num_processes=options.get("procs", 1))
+    out.output("Predictions: %d, computed: %d, failed: %d\n" %
+               (stats.num_requests, stats.num_computed, stats.num_failed))
+    out.output("Compute time: %.2f s (max. %.2f s)\n" %
+               (stats.compute_time, stats.max_compute_time))
+    out.output("Staleness: %.0f s (max. %.0f s)\n" % (stats.avg_staleness, stats.max_staleness))
+
+
+modes.register(
+    Mode(
+        long_option="precompute-predictions",
+        handler_function=mode_precompute_predictions,
+        needs_config=False,
+        needs_checks=False,
+        short_help="Compute the predictive levels ahead of time",
+        long_help=[
+            "Computes the predictions of all services using predictive levels, that will "
+            "be needed when the time groups (e.g. the days) change in the given lead time. "
+            "Services sharing the same metric and prediction parameters are computed once. "
+            "Without it, the checks compute the predictions themselves when the time groups "
+            "change.",
+        ],
+        sub_options=[
+            Option(
+                long_option="lead-time",
+                argument=True,
+                argument_descr="S",
+                argument_conv=int,
+                short_help="Compute the predictions needed in S seconds. Defaults to 900.",
+            ),
+            Option(
+                long_option="procs",
+                argument=True,
+                argument_descr="N",
+                argument_conv=int,
+                short_help="Start up to N processes in parallel. Defaults to 1.",
+            ),
+        ]))
+
 #.
 #   .--scan-parents--------------------------------------------------------.
 #   |                                                         _            |
@@ -996,12 +1063,9 @@ def mode_flush(hosts: List[HostName]) -> None:
         flushed = False
 
         # counters
-        try:
-            os.remove(cmk.utils.paths.counters_dir + "/" + host)
+        if item_state.remove_item_states(host):
             out.output(tty.bold + tty.blue + " counters")
             flushed = True
-        except OSError:
-            pass
 
         # cache files
         d = 0
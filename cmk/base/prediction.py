@@ -7,14 +7,18 @@
 
 import json
 import logging
-import math
+import multiprocessing
 import os
+import tempfile
 import time
-from typing import Optional, List, Any, cast, Dict, Union, Callable, Tuple, TypedDict
+from pathlib import Path
+from typing import (Optional, List, Any, cast, Dict, NamedTuple, Union, Callable, Sequence,
+                    Tuple, TypedDict)
 
 import cmk.utils.debug
 import cmk.utils
 import cmk.utils.defines as defines
+import cmk.utils.paths
 import cmk.utils.store as store
 from cmk.utils.log import VERBOSE
 import cmk.utils.prediction
@@ -23,10 +27,10 @@ from cmk.utils.type_defs import HostName, ServiceName, MetricName
 from cmk.utils.prediction import (
     Timestamp,
     Timegroup,
-    TimeSeriesValues,
+    TimeSeriesValue,
     Seconds,
     TimeWindow,
-    RRDColumnFunction,
+    RRDColumnsFunction,
     PredictionInfo,
     ConsolidationFunctionName,
     EstimatedLevels,
@@ -159,13 +163,19 @@ def _time_slices(
 
 
 def _retrieve_grouped_data_from_rrd(
-    rrd_column: RRDColumnFunction,
+    rrd_columns: RRDColumnsFunction,
     time_windows: _TimeSlices,
-) -> Tuple[TimeWindow, List[TimeSeriesValues]]:
-    "Collect all time slices and up-sample them to same resolution"
+) -> Tuple[TimeWindow, List[Any]]:
+    """Collect all time slices and up-sample them to same resolution
+
+    The values of each slice are returned as object array, holding the original
+    values (None, int or float)."""
+    import numpy as np  # type: ignore[import] # pylint: disable=import-outside-toplevel
     from_time = time_windows[0][0]
 
-    slices = [(rrd_column(start, end), from_time - start) for start, end in time_windows]
+    # All slices are fetched with a single query
+    slices = [(ts, from_time - start) for ts, (start, _end) in zip(rrd_columns(time_windows),
+                                                                   time_windows)]
 
     # The resolutions of the different time ranges differ. We upsample
     # to the best resolution. We assume that the youngest slice has the
@@ -174,35 +184,67 @@ def _retrieve_grouped_data_from_rrd(
     if twindow[2] == 0:
         raise MKGeneralException("Got no historic metrics")
 
-    return twindow, [ts.bfill_upsample(twindow, shift) for ts, shift in slices]
-
-
-def _data_stats(slices: List[TimeSeriesValues]) -> _DataStats:
-    "Statistically summarize all the upsampled RRD data"
-
-    descriptors: _DataStats = []
-
-    for time_column in zip(*slices):
-        point_line = [x for x in time_column if x is not None]
-        if point_line:
-            average = sum(point_line) / float(len(point_line))
-            descriptors.append([
-                average,
-                min(point_line),
-                max(point_line),
-                _std_dev(point_line, average),
-            ])
-        else:
-            descriptors.append([None, None, None, None])
-
-    return descriptors
+    return twindow, [
+        np.array(ts.values, dtype=object)[ts.bfill_upsample_indices(twindow, shift)]
+        for ts, shift in slices
+    ]
+
+
+def _data_stats(slices: Sequence[Sequence[TimeSeriesValue]]) -> _DataStats:
+    """Statistically summarize all the upsampled RRD data
+
+    The statistics of all points are computed at once on arrays. The values are
+    summed up slice by slice, so the averages are exactly the ones of summing up
+    the values of each point in Python. The minimum and maximum are the original
+    values."""
+    if not slices:
+        return []
+
+    # Imported here to keep numpy out of the check helpers importing this module
+    import numpy as np  # type: ignore[import] # pylint: disable=import-outside-toplevel
+    num_points = min(len(values) for values in slices)
+    values = np.empty((len(slices), num_points), dtype=object)
+    for row, slice_values in enumerate(slices):
+        values[row] = slice_values[:num_points]
+    # Missing values (None) become NaN
+    data = values.astype(float)
+    present = ~np.isnan(data)
+    samples = present.sum(axis=0)
+    filled = np.where(present, data, 0.0)
+
+    sums = np.zeros(num_points)
+    sums_of_squares = np.zeros(num_points)
+    for row_values in filled:
+        sums += row_values
+        sums_of_squares += row_values * row_values
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        averages = sums / samples
+        # In the case of a single data-point an unbiased standard deviation is
+        # undefined. In this case we take the magnitude of the measured value
+        # itself as a measure of the dispersion.
+        std_devs = np.where(
+            samples == 1,
+            np.abs(averages),
+            np.sqrt(np.abs(sums_of_squares - averages * averages * samples) / (samples - 1)),
+        )
+
+    # The first slice having the extreme value, like min() and max()
+    points = np.arange(num_points)
+    minimums = values[np.argmax(data == np.fmin.reduce(data, axis=0), axis=0), points]
+    maximums = values[np.argmax(data == np.fmax.reduce(data, axis=0), axis=0), points]
+
+    return [[average, minimum, maximum, std_dev] if num_samples else [None, None, None, None]
+            for num_samples, average, minimum, maximum, std_dev in zip(
+                samples.tolist(), averages.tolist(), minimums.tolist(), maximums.tolist(),
+                std_devs.tolist())]
 
 
 def _calculate_data_for_prediction(
     time_windows: _TimeSlices,
-    rrd_datacolumn: RRDColumnFunction,
+    rrd_datacolumns: RRDColumnsFunction,
 ) -> _PredictionData:
-    twindow, slices = _retrieve_grouped_data_from_rrd(rrd_datacolumn, time_windows)
+    twindow, slices = _retrieve_grouped_data_from_rrd(rrd_datacolumns, time_windows)
 
     descriptors = _data_stats(slices)
 
@@ -220,32 +262,33 @@ def _save_predictions(
     info: PredictionInfo,
     data_for_pred: _PredictionData,
 ) -> None:
-    with open(pred_file + '.info', "w") as fname:
-        json.dump(info, fname)
-    with open(pred_file, "w") as fname:
-        json.dump(data_for_pred, fname)
+    # Replace the files atomically, they may be read by checks at the same time
+    for path, data in [(pred_file + '.info', info), (pred_file, data_for_pred)]:
+        with tempfile.NamedTemporaryFile("w",
+                                         dir=os.path.dirname(path),
+                                         prefix=".%s.new" % os.path.basename(path),
+                                         delete=False) as tmp:
+            json.dump(data, tmp)
+        os.chmod(tmp.name, 0o660)
+        os.rename(tmp.name, path)
 
 
-def _std_dev(point_line: List[float], average: float) -> float:
-    samples = len(point_line)
-    # In the case of a single data-point an unbiased standard deviation is
-    # undefined. In this case we take the magnitude of the measured value
-    # itself as a measure of the dispersion.
-    if samples == 1:
-        return abs(average)
-    return math.sqrt(abs(sum(p**2 for p in point_line) - average**2 * samples) / float(samples - 1))
+def _prediction_params(params: _PredictionParameters) -> _PredictionParameters:
+    """The parameters the prediction data depends on, the levels only depend on the others"""
+    return json.loads(json.dumps({key: params[key] for key in ("period", "horizon")}))
 
 
 def _is_prediction_up_to_date(
     pred_file: str,
     timegroup: Timegroup,
     params: _PredictionParameters,
+    now: Optional[float] = None,
 ) -> bool:
     """Check, if we need to (re-)compute the prediction file.
 
     This is the case if:
     - no prediction has been made yet for this time group
-    - the prediction from the last time is outdated
+    - the prediction from the last time is outdated (at the time now)
     - the prediction from the last time was made with other parameters
     """
     last_info = cmk.utils.prediction.retrieve_data_for_prediction(pred_file + ".info", timegroup)
@@ -253,19 +296,64 @@ def _is_prediction_up_to_date(
         return False
 
     period_info = _PREDICTION_PERIODS[params["period"]]
-    now = time.time()
+    if now is None:
+        now = time.time()
     if last_info["time"] + cast(int, period_info["valid"]) * cast(int, period_info["slice"]) < now:
         logger.log(VERBOSE, "Prediction of %s outdated", timegroup)
         return False
 
-    jsonized_params = json.loads(json.dumps(params))
-    if last_info.get('params') != jsonized_params:
+    if _prediction_params(last_info.get('params', {})) != _prediction_params(params):
         logger.log(VERBOSE, "Prediction parameters have changed.")
         return False
 
     return True
 
 
+class PredictionRequest(NamedTuple):
+    hostname: HostName
+    service_description: ServiceName
+    dsname: MetricName
+    cf: ConsolidationFunctionName
+    params: _PredictionParameters
+
+    def key(self) -> Tuple[str, ...]:
+        """Requests with the same key have the same prediction data"""
+        return (self.hostname, self.service_description, self.dsname, self.cf,
+                json.dumps(_prediction_params(self.params), sort_keys=True))
+
+
+def _compute_prediction(request: PredictionRequest, now: int) -> _PredictionData:
+    """Computes the prediction of the time group of now and saves it"""
+    period_info = _PREDICTION_PERIODS[request.params["period"]]
+    timegroup = cast(_GroupByFunction, period_info["groupby"])(now)[0]
+    pred_dir = cmk.utils.prediction.predictions_dir(request.hostname,
+                                                    request.service_description, request.dsname)
+    store.makedirs(pred_dir)
+
+    time_windows = _time_slices(now, int(request.params["horizon"] * 86400), period_info,
+                                timegroup)
+
+    rrd_datacolumns = cmk.utils.prediction.rrd_datacolumns(request.hostname,
+                                                           request.service_description,
+                                                           request.dsname, request.cf)
+
+    data_for_pred = _calculate_data_for_prediction(time_windows, rrd_datacolumns)
+
+    info: PredictionInfo = {
+        u"time": now,
+        u"range": time_windows[0],
+        u"cf": request.cf,
+        u"dsname": request.dsname,
+        u"slice": period_info["slice"],
+        u"params": request.params,
+        # Needed to compute the prediction again by precompute_predictions()
+        u"host": request.hostname,
+        u"service": request.service_description,
+    }
+    _save_predictions(os.path.join(pred_dir, timegroup), info, data_for_pred)
+    return data_for_pred
+
+
 # cf: consilidation function (MAX, MIN, AVERAGE)
 # levels_factor: this multiplies all absolute levels. Usage for example
 # in the cpu.loads check the multiplies the levels by the number of CPU
@@ -299,25 +387,120 @@ def get_levels(
     if data_for_pred is None:
         logger.log(VERBOSE, "Calculating prediction data for time group %s", timegroup)
         cmk.utils.prediction.clean_prediction_files(pred_file, force=True)
-
-        time_windows = _time_slices(now, int(params["horizon"] * 86400), period_info, timegroup)
-
-        rrd_datacolumn = cmk.utils.prediction.rrd_datacolum(hostname, service_description, dsname,
-                                                            cf)
-
-        data_for_pred = _calculate_data_for_prediction(time_windows, rrd_datacolumn)
-
-        info: PredictionInfo = {
-            u"time": now,
-            u"range": time_windows[0],
-            u"cf": cf,
-            u"dsname": dsname,
-            u"slice": period_info["slice"],
-            u"params": params,
-        }
-        _save_predictions(pred_file, info, data_for_pred)
+        data_for_pred = _compute_prediction(
+            PredictionRequest(hostname, service_description, dsname, cf, params), now)
 
     # Find reference value in data_for_pred
     index = int(rel_time / cast(int, data_for_pred["step"]))  # fixed: true-division
     reference = dict(zip(data_for_pred["columns"], data_for_pred["points"][index]))
     return cmk.utils.prediction.estimate_levels(reference, params, levels_factor)
+
+
+#.
+#   .--Precompute----------------------------------------------------------.
+#   |  Computes the predictions of all services ahead of time, so that     |
+#   |  the checks only need to read them.                                  |
+#   '----------------------------------------------------------------------'
+
+
+class PrecomputeStats(NamedTuple):
+    num_requests: int
+    num_computed: int
+    num_failed: int
+    # Seconds spent computing, in total and for the slowest prediction
+    compute_time: float
+    max_compute_time: float
+    # Seconds since the newest prediction of a request has been computed, the
+    # maximum and the average of all requests
+    max_staleness: float
+    avg_staleness: float
+
+
+def prediction_requests() -> Dict[Tuple[str, ...], Tuple[PredictionRequest, float]]:
+    """Returns the requests of all predictions that have been made by checks
+
+    The requests are found in the info files of the predictions. Identical
+    requests, e.g. of the different time groups of a metric, are returned once,
+    together with the time of their newest prediction."""
+    requests: Dict[Tuple[str, ...], Tuple[PredictionRequest, float]] = {}
+    for info_file in sorted(
+            Path(cmk.utils.paths.var_dir, "prediction").glob("*/*/*/*.info")):
+        try:
+            info = json.loads(info_file.read_text())
+            request = PredictionRequest(info["host"], info["service"], info["dsname"],
+                                        info["cf"], info["params"])
+            computed = info["time"]
+            if request.params["period"] not in _PREDICTION_PERIODS:
+                continue
+        except (OSError, ValueError, KeyError, TypeError):
+            continue  # Written by an older version or invalid
+
+        key = request.key()
+        if key not in requests or requests[key][1] < computed:
+            requests[key] = (request, computed)
+    return requests
+
+
+def _precompute_prediction(request: PredictionRequest,
+                           target_time: int) -> Tuple[Optional[float], Optional[str]]:
+    """Computes the prediction, in case the one of target_time is missing or outdated
+
+    Returns the time needed to compute it (None in case it was up to date) and the error"""
+    period_info = _PREDICTION_PERIODS[request.params["period"]]
+    timegroup = cast(_GroupByFunction, period_info["groupby"])(target_time)[0]
+    pred_file = os.path.join(
+        cmk.utils.prediction.predictions_dir(request.hostname, request.service_description,
+                                             request.dsname), timegroup)
+    if _is_prediction_up_to_date(pred_file, timegroup, request.params, now=target_time):
+        return None, None
+
+    start = time.time()
+    try:
+        _compute_prediction(request, target_time)
+    except Exception as e:
+        if cmk.utils.debug.enabled():
+            raise
+        return time.time() - start, "%s" % e
+    return time.time() - start, None
+
+
+def _precompute_prediction_star(
+    args: Tuple[PredictionRequest, int]
+) -> Tuple[PredictionRequest, Optional[float], Optional[str]]:
+    return (args[0],) + _precompute_prediction(*args)
+
+
+def precompute_predictions(lead_time: int = 900, num_processes: int = 1) -> PrecomputeStats:
+    """Computes the predictions that will be needed in lead_time seconds
+
+    This is meant to be executed shortly before the time groups change, e.g. before
+    midnight. The predictions of the new time groups are computed in advance, so
+    that the checks do not need to compute them at the same time."""
+    now = time.time()
+    target_time = int(now) + lead_time
+    requests = prediction_requests()
+    staleness = [now - computed for _request, computed in requests.values()]
+
+    jobs = [(request, target_time) for request, _computed in requests.values()]
+    if num_processes > 1 and len(jobs) > 1:
+        with multiprocessing.Pool(min(num_processes, len(jobs))) as pool:
+            results = list(pool.imap_unordered(_precompute_prediction_star, jobs))
+    else:
+        results = [_precompute_prediction_star(job) for job in jobs]
+
+    compute_times = [duration for _request, duration, _error in results if duration is not None]
+    for request, _duration, error in results:
+        if error:
+            logger.warning("Cannot compute prediction of %s/%s/%s: %s", request.hostname,
+                           request.service_description, request.dsname, error)
+
+    return PrecomputeStats(
+        num_requests=len(requests),
+        num_computed=sum(1 for _request, duration, error in results
+                         if duration is not None and not error),
+        num_failed=sum(1 for _request, _duration, error in results if error),
+        compute_time=sum(compute_times),
+        max_compute_time=max(compute_times, default=0.0),
+        max_staleness=max(staleness, default=0.0),
+        avg_staleness=sum(staleness) / len(staleness) if staleness else 0.0,
+    )
@@ -6,6 +6,7 @@
 
 import sys
 from pathlib import Path
+from typing import List, Optional, Tuple
 
 import cmk.base.obsolete_output as out
 from cmk.utils.log import console
@@ -13,6 +14,10 @@ from cmk.utils.log import console
 _profile = None
 _profile_path = Path("profile.out")
 
+# The configuration files loaded, when enabled by --profile-config-load: The path,
+# whether or not the file has been compiled and the durations of compiling and executing
+_config_load_profile: Optional[List[Tuple[str, bool, float, float]]] = None
+
 
 def enable() -> None:
     global _profile
@@ -48,3 +53,41 @@ stats.sort_stats('time').print_stats()""" % _profile_path)
     show_profile.chmod(0o755)
     out.output("Profile '%s' written. Please run %s.\n" % (_profile_path, show_profile),
                stream=sys.stderr)
+
+
+def enable_config_load() -> None:
+    global _config_load_profile
+    _config_load_profile = []
+
+
+def config_load_enabled() -> bool:
+    return _config_load_profile is not None
+
+
+def add_config_file_load(path: str, compiled: bool, compile_duration: float,
+                         exec_duration: float) -> None:
+    if _config_load_profile is not None:
+        _config_load_profile.append((path, compiled, compile_duration, exec_duration))
+
+
+def output_config_load_profile(num_files: int = 20) -> None:
+    if not _config_load_profile:
+        return
+
+    total_compile = sum(entry[2] for entry in _config_load_profile)
+    total_exec = sum(entry[3] for entry in _config_load_profile)
+    num_compiled = sum(1 for entry in _config_load_profile if entry[1])
+    lines = [
+        "Loaded %d configuration files (%d compiled, %d from cache) in %.3f s "
+        "(compile/load code: %.3f s, execute: %.3f s)\n" %
+        (len(_config_load_profile), num_compiled, len(_config_load_profile) - num_compiled,
+         total_compile + total_exec, total_compile, total_exec),
+        "%10s %10s %10s  %s\n" % ("total [s]", "code [s]", "exec [s]", "file"),
+    ]
+    for path, compiled, compile_duration, exec_duration in sorted(
+            _config_load_profile, key=lambda entry: entry[2] + entry[3],
+            reverse=True)[:num_files]:
+        lines.append("%10.4f %10.4f %10.4f  %s%s\n" %
+                     (compile_duration + exec_duration, compile_duration, exec_duration, path,
+                      " (compiled)" if compiled else ""))
+    out.output("".join(lines), stream=sys.stderr)
@@ -139,6 +139,12 @@ class SNMPSource(Source[SNMPRawData, SNMPHostSections]):
             force_cache_refresh=force_cache_refresh,
         )
 
+    def detect(self) -> Set[SectionName]:
+        """Detect the sections of the host like fetch() would, without fetching them"""
+        fetcher = self._make_fetcher()
+        with fetcher:
+            return fetcher.detect(self.mode)
+
     def _make_file_cache(self) -> SNMPFileCache:
         return SNMPFileCacheFactory(
             path=self.file_cache_path,
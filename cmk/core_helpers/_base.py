@@ -38,6 +38,8 @@ class Fetcher(Generic[TRawData], metaclass=abc.ABCMeta):
         super().__init__()
         self.file_cache: Final[FileCache[TRawData]] = file_cache
         self._logger = logger
+        # Counters of the last fetch, e.g., bytes received or latencies.
+        self.stats: Dict[str, float] = {}
 
     @final
     @classmethod
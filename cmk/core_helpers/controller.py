@@ -30,6 +30,8 @@ logger = logging.getLogger("cmk.helper")
 class GlobalConfig(NamedTuple):
     cmc_log_level: int
     snmp_plugin_store: SNMPPluginStore
+    # The SNMP payload encoding the checker understands
+    snmp_payload_version: protocol.SNMPPayloadVersion = protocol.SNMPPayloadVersion.BINARY
 
     @property
     def log_level(self) -> int:
@@ -57,6 +59,9 @@ class GlobalConfig(NamedTuple):
             return cls(
                 cmc_log_level=fetcher_config["cmc_log_level"],
                 snmp_plugin_store=SNMPPluginStore.deserialize(fetcher_config["snmp_plugin_store"]),
+                # Configurations without the version come from checkers that only know JSON.
+                snmp_payload_version=protocol.SNMPPayloadVersion(
+                    fetcher_config.get("snmp_payload_version", protocol.SNMPPayloadVersion.JSON)),
             )
         except (LookupError, TypeError, ValueError) as exc:
             raise ValueError(serialized) from exc
@@ -66,6 +71,7 @@ class GlobalConfig(NamedTuple):
             "fetcher_config": {
                 "cmc_log_level": self.cmc_log_level,
                 "snmp_plugin_store": self.snmp_plugin_store.serialize(),
+                "snmp_payload_version": int(self.snmp_payload_version),
             },
         }
 
@@ -117,7 +123,10 @@ def process_command(command: Command) -> None:
         global_config = load_global_config(command.serial)
         logging.getLogger().setLevel(global_config.log_level)
         SNMPFetcher.plugin_store = global_config.snmp_plugin_store
-        run_fetchers(**command._asdict())
+        run_fetchers(
+            **command._asdict(),
+            snmp_payload_version=global_config.snmp_payload_version,
+        )
 
 
 @contextlib.contextmanager
@@ -129,7 +138,13 @@ def _confirm_command_processed() -> Iterator[None]:
         write_bytes(bytes(protocol.CMCMessage.end_of_reply()))
 
 
-def run_fetchers(serial: ConfigSerial, host_name: HostName, mode: Mode, timeout: int) -> None:
+def run_fetchers(
+    serial: ConfigSerial,
+    host_name: HostName,
+    mode: Mode,
+    timeout: int,
+    snmp_payload_version: protocol.SNMPPayloadVersion = protocol.SNMPPayloadVersion.JSON,
+) -> None:
     """Entry point from bin/fetcher"""
     # check that file is present, because lack of the file is not an error at the moment
     local_config_path = make_local_config_path(serial=serial, host_name=host_name)
@@ -139,7 +154,13 @@ def run_fetchers(serial: ConfigSerial, host_name: HostName, mode: Mode, timeout:
         return
 
     # Usually OMD_SITE/var/check_mk/core/fetcher-config/[config-serial]/[host].json
-    _run_fetchers_from_file(host_name, file_name=local_config_path, mode=mode, timeout=timeout)
+    _run_fetchers_from_file(
+        host_name,
+        file_name=local_config_path,
+        mode=mode,
+        timeout=timeout,
+        snmp_payload_version=snmp_payload_version,
+    )
 
     # Cleanup different things (like object specific caches)
     cmk.utils.cleanup.cleanup_globals()
@@ -151,10 +172,18 @@ def load_global_config(serial: ConfigSerial) -> GlobalConfig:
             return GlobalConfig.deserialize(json.load(f))
     except FileNotFoundError:
         logger.warning("fetcher global config %s is absent", serial)
-        return GlobalConfig(cmc_log_level=5, snmp_plugin_store=SNMPPluginStore())
+        return GlobalConfig(
+            cmc_log_level=5,
+            snmp_plugin_store=SNMPPluginStore(),
+            snmp_payload_version=protocol.SNMPPayloadVersion.JSON,
+        )
 
 
-def run_fetcher(entry: Dict[str, Any], mode: Mode) -> protocol.FetcherMessage:
+def run_fetcher(
+    entry: Dict[str, Any],
+    mode: Mode,
+    snmp_payload_version: protocol.SNMPPayloadVersion = protocol.SNMPPayloadVersion.JSON,
+) -> protocol.FetcherMessage:
     """ Entrypoint to obtain data from fetcher objects.    """
 
     try:
@@ -169,9 +198,11 @@ def run_fetcher(entry: Dict[str, Any], mode: Mode) -> protocol.FetcherMessage:
     except KeyError as exc:
         return protocol.FetcherMessage.error(fetcher_type, exc)
 
+    counters: Dict[str, float] = {}
     try:
         with CPUTracker() as tracker, fetcher_type.from_json(fetcher_params) as fetcher:
             raw_data = fetcher.fetch(mode)
+            counters = fetcher.stats
     except Exception as exc:
         raw_data = result.Error(exc)
 
@@ -179,10 +210,18 @@ def run_fetcher(entry: Dict[str, Any], mode: Mode) -> protocol.FetcherMessage:
         raw_data,
         tracker.duration,
         fetcher_type,
+        counters,
+        snmp_payload_version,
     )
 
 
-def _run_fetchers_from_file(host_name: HostName, file_name: Path, mode: Mode, timeout: int) -> None:
+def _run_fetchers_from_file(
+    host_name: HostName,
+    file_name: Path,
+    mode: Mode,
+    timeout: int,
+    snmp_payload_version: protocol.SNMPPayloadVersion,
+) -> None:
     """ Writes to the stdio next data:
     Count Answer        Content               Action
     ----- ------        -------               ------
@@ -210,7 +249,7 @@ def _run_fetchers_from_file(host_name: HostName, file_name: Path, mode: Mode, ti
         try:
             # fill as many messages as possible before timeout exception raised
             for entry in fetchers:
-                messages.append(run_fetcher(entry, mode))
+                messages.append(run_fetcher(entry, mode, snmp_payload_version))
         except MKTimeout as exc:
             # fill missing entries with timeout errors
             messages.extend([
@@ -23,12 +23,14 @@ We call "message" a header followed by the corresponding payload.
 """
 
 import abc
+import array
 import enum
 import json
 import logging
 import pickle
 import struct
-from typing import Final, Iterator, Sequence, Type, Union
+import sys
+from typing import Any, Dict, Final, Iterator, List, Mapping, Optional, Sequence, Tuple, Type, Union
 
 import cmk.utils.log as log
 from cmk.utils.cpu_tracking import Snapshot
@@ -36,13 +38,14 @@ from cmk.utils.exceptions import MKFetcherError, MKTimeout
 from cmk.utils.type_defs import AgentRawData, result, SectionName
 from cmk.utils.type_defs.protocol import Protocol
 
-from cmk.snmplib.type_defs import AbstractRawData, SNMPRawData
+from cmk.snmplib.type_defs import AbstractRawData, SNMPRawData, SNMPRawDataSection
 
 from . import FetcherType
 
 __all__ = [
     "ResultMessage",
     "PayloadType",
+    "SNMPPayloadVersion",
     "FetcherHeader",
     "FetcherMessage",
     "CMCHeader",
@@ -100,20 +103,34 @@ class ResultMessage(Protocol):
     def result(self) -> result.Result[AbstractRawData, Exception]:
         raise NotImplementedError
 
+    @classmethod
+    @abc.abstractmethod
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "ResultMessage":
+        raise NotImplementedError
+
 
 class ResultStats(Protocol):
-    def __init__(self, duration: Snapshot) -> None:
+    """Duration of the fetcher and optional counters, e.g., the bytes received"""
+    def __init__(self, duration: Snapshot, counters: Optional[Mapping[str, float]] = None) -> None:
         self.duration: Final = duration
+        self.counters: Final[Mapping[str, float]] = counters if counters else {}
 
     def __repr__(self) -> str:
-        return "%s(%r)" % (type(self).__name__, self.duration)
+        return "%s(%r, %r)" % (type(self).__name__, self.duration, self.counters)
 
     def __iter__(self) -> Iterator[bytes]:
-        yield json.dumps({"duration": self.duration.serialize()}).encode("ascii")
+        serialized: Dict[str, Any] = {"duration": self.duration.serialize()}
+        if self.counters:
+            serialized["counters"] = dict(self.counters)
+        yield json.dumps(serialized).encode("ascii")
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "ResultStats":
-        return ResultStats(Snapshot.deserialize(json.loads(data.decode("ascii"))["duration"]))
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "ResultStats":
+        serialized = json.loads(bytes(data).decode("ascii"))
+        return ResultStats(
+            Snapshot.deserialize(serialized["duration"]),
+            serialized.get("counters", {}),
+        )
 
 
 class PayloadType(enum.Enum):
@@ -151,25 +168,42 @@ class AgentResultMessage(ResultMessage):
         return self._value
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "AgentResultMessage":
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "AgentResultMessage":
         _type, length, *_rest = struct.unpack(
             ResultMessage.fmt,
             data[:ResultMessage.length],
         )
         try:
-            return cls(AgentRawData(data[ResultMessage.length:ResultMessage.length + length]))
+            return cls(AgentRawData(bytes(data[ResultMessage.length:ResultMessage.length + length])))
         except SyntaxError as exc:
-            raise ValueError(repr(data)) from exc
+            raise ValueError(repr(bytes(data))) from exc
 
     def result(self) -> result.Result[AbstractRawData, Exception]:
         return result.OK(self._value)
 
 
+class SNMPPayloadVersion(enum.IntEnum):
+    """The encoding of the SNMP payload
+
+    The decoder understands all versions. The encoder uses the version that
+    has been announced by the checker in the fetcher configuration.
+
+    """
+    JSON = 1
+    BINARY = 2
+
+
 class SNMPResultMessage(ResultMessage):
     payload_type = PayloadType.SNMP
 
-    def __init__(self, value: SNMPRawData) -> None:
+    def __init__(
+        self,
+        value: SNMPRawData,
+        version: SNMPPayloadVersion = SNMPPayloadVersion.JSON,
+    ) -> None:
         self._value: Final[SNMPRawData] = value
+        self.version: Final[SNMPPayloadVersion] = version
+        self._payload: Optional[bytes] = None
 
     def __repr__(self) -> str:
         return "%s(%r)" % (type(self).__name__, self._value)
@@ -184,32 +218,278 @@ class SNMPResultMessage(ResultMessage):
 
     @property
     def payload(self) -> bytes:
-        return self._serialize(self._value)
+        # The header needs the length, so the payload is requested more than once.
+        if self._payload is None:
+            self._payload = self._serialize(self._value, self.version)
+        return self._payload
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "SNMPResultMessage":
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "SNMPResultMessage":
         _type, length, *_rest = struct.unpack(
             ResultMessage.fmt,
             data[:ResultMessage.length],
         )
+        payload = memoryview(data)[ResultMessage.length:ResultMessage.length + length]
         try:
-            return cls(cls._deserialize(data[ResultMessage.length:ResultMessage.length + length]))
+            return cls(
+                cls._deserialize(payload),
+                SNMPPayloadVersion.BINARY
+                if payload[:1] == _SNMPPayloadEncoder.magic else SNMPPayloadVersion.JSON,
+            )
         except SyntaxError as exc:
-            raise ValueError(repr(data)) from exc
+            raise ValueError(repr(bytes(data))) from exc
 
     def result(self) -> result.Result[SNMPRawData, Exception]:
         return result.OK(self._value)
 
     @staticmethod
-    def _serialize(value: SNMPRawData) -> bytes:
+    def _serialize(value: SNMPRawData, version: SNMPPayloadVersion) -> bytes:
+        if version is SNMPPayloadVersion.BINARY:
+            return _SNMPPayloadEncoder().encode(value)
         return json.dumps({str(k): v for k, v in value.items()}).encode("utf8")
 
     @staticmethod
-    def _deserialize(data: bytes) -> SNMPRawData:
+    def _deserialize(data: Union[bytes, memoryview]) -> SNMPRawData:
+        return dict(iter_snmp_payload(data))
+
+
+def iter_snmp_payload(
+        data: Union[bytes, memoryview]) -> Iterator[Tuple[SectionName, SNMPRawDataSection]]:
+    """Decode the sections of an SNMP payload one by one
+
+    Both, the binary and the JSON encoding of old fetchers are understood.
+
+    """
+    view = memoryview(data)
+    if view[:1] != _SNMPPayloadEncoder.magic:
         try:
-            return {SectionName(k): v for k, v in json.loads(data.decode("utf8")).items()}
-        except json.JSONDecodeError:
-            raise ValueError(repr(data))
+            yield from ((SectionName(k), v) for k, v in json.loads(bytes(view)).items())
+        except (json.JSONDecodeError, UnicodeDecodeError):
+            raise ValueError(repr(bytes(view)))
+        return
+
+    try:
+        yield from _SNMPPayloadDecoder(view).iter_sections()
+    except (IndexError, UnicodeDecodeError, json.JSONDecodeError) as exc:
+        raise ValueError(repr(bytes(view))) from exc
+
+
+class _SNMPPayloadEncoder:
+    """Compact binary encoding of SNMP raw data
+
+    <MAGIC><VERSION><NUM SECTIONS>(<NAME><VALUE>)*
+
+    Numbers are unsigned LEB128 varints, names are length prefixed UTF-8 and
+    values are tagged.  Tables (lists of rows) are sent as flat arrays:
+
+    <NEW STRING LENGTHS><NEW STRINGS><ROW LENGTHS><CELLS><NUM OTHERS><OTHER VALUES>
+
+    Strings are interned: Every string is sent once, the cells only refer to
+    the index of the string as a packed 32 bit integer.  Cells that are not
+    strings (e.g. binary values) refer to -1 and follow as tagged values.
+    Lists of octets (binary SNMP values) are sent as raw bytes.  Everything
+    else JSON can handle is sent as length prefixed JSON.
+
+    The interning only refers to earlier data, so the payload can be decoded
+    section by section.
+
+    """
+    magic = b"\x00"  # A JSON payload never starts with a null byte
+
+    STRING = 0
+    TABLE = 1
+    LIST = 2
+    OCTETS = 3
+    INT = 4
+    NONE = 5
+    JSON = 6
+
+    def __init__(self) -> None:
+        self._buffer = bytearray()
+        # None is the placeholder for all cells that are no strings
+        self._strings: Dict[Optional[str], int] = {None: -1}
+
+    def encode(self, value: SNMPRawData) -> bytes:
+        self._buffer += self.magic
+        self._buffer.append(SNMPPayloadVersion.BINARY)
+        self._add_number(len(value))
+        for section_name, section in value.items():
+            self._add_text(str(section_name))
+            self._add_value(section)
+        return bytes(self._buffer)
+
+    def _add_number(self, number: int) -> None:
+        buffer = self._buffer
+        while number > 0x7f:
+            buffer.append((number & 0x7f) | 0x80)
+            number >>= 7
+        buffer.append(number)
+
+    def _add_text(self, text: str) -> None:
+        # Like JSON, transport lone surrogates from undecodable SNMP values unchanged
+        raw = text.encode("utf-8", "surrogatepass")
+        self._add_number(len(raw))
+        self._buffer += raw
+
+    def _add_array(self, values: "array.array") -> None:
+        if sys.byteorder == "big":
+            values.byteswap()
+        self._add_number(len(values))
+        self._buffer += values.tobytes()
+
+    def _add_value(self, value: Any) -> None:
+        buffer = self._buffer
+        value_type = type(value)
+        if value_type is list or value_type is tuple:
+            if _is_table(value):
+                buffer.append(self.TABLE)
+                self._add_table(value)
+            elif value and set(map(type, value)) == {int} and 0 <= min(value) and max(value) <= 0xff:
+                buffer.append(self.OCTETS)
+                self._add_number(len(value))
+                buffer += bytes(value)
+            else:
+                buffer.append(self.LIST)
+                self._add_number(len(value))
+                for entry in value:
+                    self._add_value(entry)
+        elif value_type is str:
+            buffer.append(self.STRING)
+            self._add_text(value)
+        elif value_type is int:
+            buffer.append(self.INT)
+            self._add_number(value << 1 if value >= 0 else (-value << 1) - 1)  # zigzag
+        elif value is None:
+            buffer.append(self.NONE)
+        else:
+            buffer.append(self.JSON)
+            self._add_text(json.dumps(value))
+
+    def _add_table(self, table: Sequence[Sequence[Any]]) -> None:
+        # Hot path: This visits every cell of the payload. Let the builtins do the loops.
+        strings = self._strings
+        cells = [cell for row in table for cell in row]
+        others = [cell for cell in cells if type(cell) is not str]
+        if others:
+            cells = [cell if type(cell) is str else None for cell in cells]
+
+        new_strings = [text for text in dict.fromkeys(cells) if text not in strings]
+        for text in new_strings:
+            strings[text] = len(strings) - 1
+
+        self._add_array(array.array("I", map(len, new_strings)))
+        self._add_text("".join(new_strings))
+        self._add_array(array.array("I", map(len, table)))
+        self._add_array(array.array("i", map(strings.__getitem__, cells)))
+        self._add_number(len(others))
+        for other in others:
+            self._add_value(other)
+
+
+def _is_table(value: Sequence[Any]) -> bool:
+    """A non empty list of rows, where the rows do not contain lists of rows"""
+    if not value or not all(type(row) is list or type(row) is tuple for row in value):
+        return False
+    for row in value:
+        if row:
+            return not isinstance(row[0], (list, tuple))
+    return True
+
+
+class _SNMPPayloadDecoder:
+    def __init__(self, data: memoryview) -> None:
+        self._data = data
+        self._pos = 0
+        self._strings: List[str] = []
+
+    def iter_sections(self) -> Iterator[Tuple[SectionName, SNMPRawDataSection]]:
+        if self._data[:1] != _SNMPPayloadEncoder.magic:
+            raise ValueError(bytes(self._data[:2]))
+        if self._data[1] != SNMPPayloadVersion.BINARY:
+            raise ValueError("Unsupported SNMP payload version: %r" % self._data[1])
+
+        self._pos = 2
+        for _ in range(self._read_number()):
+            section_name = SectionName(self._read_text())
+            yield section_name, self._read_value()
+
+        if self._pos != len(self._data):
+            raise ValueError("Unexpected trailing data")
+
+    def _read_number(self) -> int:
+        data = self._data
+        number = 0
+        shift = 0
+        while True:
+            byte = data[self._pos]
+            self._pos += 1
+            number |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return number
+            shift += 7
+
+    def _read_raw(self, length: int) -> memoryview:
+        start = self._pos
+        self._pos += length
+        if self._pos > len(self._data):
+            raise IndexError(self._pos)
+        return self._data[start:self._pos]
+
+    def _read_text(self) -> str:
+        return str(self._read_raw(self._read_number()), "utf-8", "surrogatepass")
+
+    def _read_array(self, typecode: str) -> "array.array":
+        values = array.array(typecode)
+        values.frombytes(self._read_raw(self._read_number() * values.itemsize))
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values
+
+    def _read_value(self) -> Any:
+        tag = self._data[self._pos]
+        self._pos += 1
+        if tag == _SNMPPayloadEncoder.TABLE:
+            return self._read_table()
+        if tag == _SNMPPayloadEncoder.STRING:
+            return self._read_text()
+        if tag == _SNMPPayloadEncoder.LIST:
+            return [self._read_value() for _ in range(self._read_number())]
+        if tag == _SNMPPayloadEncoder.OCTETS:
+            return list(self._read_raw(self._read_number()))
+        if tag == _SNMPPayloadEncoder.INT:
+            number = self._read_number()
+            return number >> 1 if not number & 1 else -((number + 1) >> 1)
+        if tag == _SNMPPayloadEncoder.NONE:
+            return None
+        if tag == _SNMPPayloadEncoder.JSON:
+            return json.loads(self._read_text())
+        raise ValueError("Unknown tag: %r" % tag)
+
+    def _read_table(self) -> List[List[Any]]:
+        strings = self._strings
+        string_lengths = self._read_array("I")
+        text = self._read_text()
+        start = 0
+        for length in string_lengths:
+            strings.append(text[start:start + length])
+            start += length
+
+        row_lengths = self._read_array("I")
+        indices = self._read_array("i")
+        others = [self._read_value() for _ in range(self._read_number())]
+
+        if others:
+            other_values = iter(others)
+            cells = [strings[i] if i >= 0 else next(other_values) for i in indices]
+        else:
+            cells = [strings[i] for i in indices]
+
+        table = []
+        start = 0
+        for length in row_lengths:
+            table.append(cells[start:start + length])
+            start += length
+        return table
 
 
 class ErrorResultMessage(ResultMessage):
@@ -231,7 +511,7 @@ class ErrorResultMessage(ResultMessage):
         return self._serialize(self._error)
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "ErrorResultMessage":
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "ErrorResultMessage":
         _type, length, *_rest = struct.unpack(
             ResultMessage.fmt,
             data[:ResultMessage.length],
@@ -239,7 +519,7 @@ class ErrorResultMessage(ResultMessage):
         try:
             return cls(cls._deserialize(data[ResultMessage.length:ResultMessage.length + length]))
         except SyntaxError as exc:
-            raise ValueError(repr(data)) from exc
+            raise ValueError(repr(bytes(data))) from exc
 
     def result(self) -> result.Result[AbstractRawData, Exception]:
         return result.Error(self._error)
@@ -249,12 +529,12 @@ class ErrorResultMessage(ResultMessage):
         return pickle.dumps({"exc_type": type(error), "exc_args": error.args})
 
     @staticmethod
-    def _deserialize(data: bytes) -> Exception:
+    def _deserialize(data: Union[bytes, memoryview]) -> Exception:
         try:
             ser = pickle.loads(data)
             return ser["exc_type"](*ser["exc_args"])
         except pickle.UnpicklingError as exc:
-            raise ValueError(data) from exc
+            raise ValueError(bytes(data)) from exc
 
 
 class FetcherHeader(Header):
@@ -312,7 +592,7 @@ class FetcherHeader(Header):
         )
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> 'FetcherHeader':
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> 'FetcherHeader':
         try:
             fetcher_type, payload_type, status, payload_length, stats_length = struct.unpack(
                 FetcherHeader.fmt,
@@ -326,7 +606,7 @@ class FetcherHeader(Header):
                 stats_length=stats_length,
             )
         except struct.error as exc:
-            raise ValueError(data) from exc
+            raise ValueError(bytes(data)) from exc
 
 
 class FetcherMessage(Protocol):
@@ -352,12 +632,15 @@ class FetcherMessage(Protocol):
         yield from self.stats
 
     @classmethod
-    def from_bytes(cls, data: bytes) -> "FetcherMessage":
+    def from_bytes(cls, data: Union[bytes, memoryview]) -> "FetcherMessage":
         header = FetcherHeader.from_bytes(data)
+        # Slicing a memoryview does not copy the (possibly large) payload.
+        view = memoryview(data)
         payload = header.payload_type.make().from_bytes(
-            data[len(header):len(header) + header.payload_length],)
-        stats = ResultStats.from_bytes(data[len(header) + header.payload_length:len(header) +
-                                            header.payload_length + header.stats_length])
+            view[len(header):len(header) + header.payload_length],)
+        stats = ResultStats.from_bytes(
+            bytes(view[len(header) + header.payload_length:len(header) + header.payload_length +
+                       header.stats_length]))
         return cls(header, payload, stats)
 
     @classmethod
@@ -366,8 +649,10 @@ class FetcherMessage(Protocol):
         raw_data: result.Result[AbstractRawData, Exception],
         duration: Snapshot,
         fetcher_type: FetcherType,
+        counters: Optional[Mapping[str, float]] = None,
+        snmp_payload_version: SNMPPayloadVersion = SNMPPayloadVersion.JSON,
     ) -> "FetcherMessage":
-        stats = ResultStats(duration)
+        stats = ResultStats(duration, counters)
         if raw_data.is_error():
             error_payload = ErrorResultMessage(raw_data.error)
             return cls(
@@ -385,7 +670,7 @@ class FetcherMessage(Protocol):
 
         if fetcher_type is FetcherType.SNMP:
             assert isinstance(raw_data.ok, dict)
-            snmp_payload = SNMPResultMessage(raw_data.ok)
+            snmp_payload = SNMPResultMessage(raw_data.ok, snmp_payload_version)
             return cls(
                 FetcherHeader(
                     fetcher_type,
@@ -580,9 +865,10 @@ class CMCMessage(Protocol):
     @staticmethod
     def _parse_result(header, data) -> Sequence[FetcherMessage]:
         index = len(header)
+        view = memoryview(data)
         messages = []
         while index < len(header) + header.payload_length:
-            message = FetcherMessage.from_bytes(data[index:])
+            message = FetcherMessage.from_bytes(view[index:])
             index += len(message)
             messages.append(message)
         return messages
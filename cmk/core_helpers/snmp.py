@@ -251,6 +251,11 @@ class SNMPFetcher(Fetcher[SNMPRawData]):
             backend=self._backend,
         )
 
+    def detect(self, mode: Mode) -> Set[SectionName]:
+        """Detect the sections like fetching in the mode would, but do not fetch them"""
+        return self._detect(select_from=self._get_detected_sections(mode) -
+                            self._get_selection(mode))
+
     def _use_snmpwalk_cache(self, mode: Mode) -> bool:
         """Decide whether to load data from the SNMP walk cache
 
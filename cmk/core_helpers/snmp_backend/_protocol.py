@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Encoding and decoding of SNMP messages
+
+Only the subset of the basic encoding rules (BER) and of the protocol operations
+(RFC 3416) needed by the asyncio backend is implemented, together with the user
+based security model of SNMPv3 (RFC 3414, AES of RFC 3826 and the SHA-2
+authentication protocols of RFC 7860).
+"""
+
+import hashlib
+import hmac
+from functools import lru_cache
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple, TYPE_CHECKING, Union
+
+try:
+    from cryptography.hazmat.backends import default_backend
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+    _HAS_CRYPTOGRAPHY = True
+except ImportError:
+    _HAS_CRYPTOGRAPHY = False
+
+if TYPE_CHECKING:
+    from cryptography.hazmat.primitives.ciphers import CipherAlgorithm
+    from cryptography.hazmat.primitives.ciphers.modes import Mode
+
+# Tags of the values
+INTEGER = 0x02
+OCTET_STRING = 0x04
+NULL = 0x05
+OBJECT_IDENTIFIER = 0x06
+SEQUENCE = 0x30
+IP_ADDRESS = 0x40
+COUNTER32 = 0x41
+GAUGE32 = 0x42
+TIME_TICKS = 0x43
+OPAQUE = 0x44
+COUNTER64 = 0x46
+NO_SUCH_OBJECT = 0x80
+NO_SUCH_INSTANCE = 0x81
+END_OF_MIB_VIEW = 0x82
+
+EXCEPTION_TAGS = frozenset([NO_SUCH_OBJECT, NO_SUCH_INSTANCE, END_OF_MIB_VIEW])
+_UNSIGNED_TAGS = frozenset([COUNTER32, GAUGE32, TIME_TICKS, COUNTER64])
+
+# Tags of the PDUs
+GET_REQUEST = 0xa0
+GET_NEXT_REQUEST = 0xa1
+RESPONSE = 0xa2
+GET_BULK_REQUEST = 0xa5
+REPORT = 0xa8
+
+# Error status of a response
+NO_ERROR = 0
+NO_SUCH_NAME = 2
+
+VERSION_1 = 0
+VERSION_2C = 1
+VERSION_3 = 3
+
+FLAG_AUTH = 0x01
+FLAG_PRIV = 0x02
+FLAG_REPORTABLE = 0x04
+
+USM_STATS_NOT_IN_TIME_WINDOWS = (1, 3, 6, 1, 6, 3, 15, 1, 1, 2, 0)
+USM_STATS_UNKNOWN_ENGINE_IDS = (1, 3, 6, 1, 6, 3, 15, 1, 1, 4, 0)
+
+_MAX_MESSAGE_SIZE = 65507
+_USM_SECURITY_MODEL = 3
+
+OIDTuple = Tuple[int, ...]
+Value = Union[None, int, bytes, OIDTuple]
+
+
+class VarBind(NamedTuple):
+    oid: OIDTuple
+    tag: int
+    value: Value
+
+
+class PDU(NamedTuple):
+    tag: int
+    request_id: int
+    error_status: int  # non-repeaters of a GetBulkRequest
+    error_index: int  # max-repetitions of a GetBulkRequest
+    varbinds: List[VarBind]
+
+
+class SecurityParameters(NamedTuple):
+    engine_id: bytes
+    engine_boots: int
+    engine_time: int
+    user_name: bytes
+    auth_parameters: bytes = b""
+    priv_parameters: bytes = b""
+
+
+class Message(NamedTuple):
+    version: int
+    pdu: PDU
+    # SNMPv1 and SNMPv2c
+    community: bytes = b""
+    # SNMPv3
+    msg_id: int = 0
+    flags: int = 0
+    security: Optional[SecurityParameters] = None
+    context_engine_id: bytes = b""
+    context_name: bytes = b""
+
+
+class AuthProtocol(NamedTuple):
+    hash_name: str
+    mac_length: int
+
+
+AUTH_PROTOCOLS = {
+    "md5": AuthProtocol("md5", 12),
+    "sha": AuthProtocol("sha1", 12),
+    "SHA-224": AuthProtocol("sha224", 16),
+    "SHA-256": AuthProtocol("sha256", 24),
+    "SHA-384": AuthProtocol("sha384", 32),
+    "SHA-512": AuthProtocol("sha512", 48),
+}
+
+PRIV_PROTOCOLS = ("DES", "AES")
+
+
+class USMUser(NamedTuple):
+    """A SNMPv3 user with the keys localized to the engine of the agent"""
+    name: bytes
+    auth_protocol: Optional[AuthProtocol] = None
+    auth_key: bytes = b""
+    priv_protocol: Optional[str] = None
+    priv_key: bytes = b""
+
+
+UserLookup = Callable[[bytes, bytes], Optional[USMUser]]
+
+
+def oid_from_str(oid: str) -> OIDTuple:
+    return tuple(int(arc) for arc in oid.strip(".").split("."))
+
+
+def oid_to_str(oid: OIDTuple) -> str:
+    return "." + ".".join(str(arc) for arc in oid)
+
+
+@lru_cache(maxsize=None)
+def _legacy_ciphers() -> Tuple[Any, Any]:
+    """The TripleDES algorithm and the CFB mode, None if they are not available"""
+    if not _HAS_CRYPTOGRAPHY:
+        return None, None
+
+    # Newer versions of cryptography moved DES and CFB out of the default ciphers
+    try:
+        from cryptography.hazmat.decrepit.ciphers.algorithms import TripleDES  # type: ignore[import] # pylint: disable=import-outside-toplevel
+    except ImportError:
+        TripleDES = getattr(algorithms, "TripleDES", None)
+
+    try:
+        from cryptography.hazmat.decrepit.ciphers.modes import CFB  # type: ignore[import] # pylint: disable=import-outside-toplevel
+    except ImportError:
+        CFB = getattr(modes, "CFB", None)
+
+    return TripleDES, CFB
+
+
+def has_privacy_support() -> bool:
+    return None not in _legacy_ciphers()
+
+
+def _privacy_ciphers() -> Tuple[Any, Any]:
+    if not has_privacy_support():
+        raise ValueError("SNMPv3 privacy needs the Python module cryptography")
+    return _legacy_ciphers()
+
+
+@lru_cache(maxsize=64)
+def localized_key(hash_name: str, password: bytes, engine_id: bytes) -> bytes:
+    """The password to key algorithm of RFC 3414 (A.2), localized to the engine"""
+    if not password:
+        raise ValueError("Empty password")
+    password_length = 1024 * 1024
+    stretched = password * (password_length // len(password) + 1)
+    key = hashlib.new(hash_name, stretched[:password_length]).digest()
+    return hashlib.new(hash_name, key + engine_id + key).digest()
+
+
+def make_user(
+    name: bytes,
+    engine_id: bytes,
+    auth_protocol: Optional[str] = None,
+    auth_password: bytes = b"",
+    priv_protocol: Optional[str] = None,
+    priv_password: bytes = b"",
+) -> USMUser:
+    if auth_protocol is None:
+        return USMUser(name)
+    protocol = AUTH_PROTOCOLS[auth_protocol]
+    return USMUser(
+        name,
+        protocol,
+        localized_key(protocol.hash_name, auth_password, engine_id),
+        priv_protocol,
+        localized_key(protocol.hash_name, priv_password, engine_id) if priv_protocol else b"",
+    )
+
+
+def _encode_length(length: int) -> bytes:
+    if length < 0x80:
+        return bytes((length,))
+    encoded = length.to_bytes((length.bit_length() + 7) // 8, "big")
+    return bytes((0x80 | len(encoded),)) + encoded
+
+
+def _tlv(tag: int, content: bytes) -> bytes:
+    return bytes((tag,)) + _encode_length(len(content)) + content
+
+
+def _encode_integer(tag: int, value: int) -> bytes:
+    length = (value if value >= 0 else ~value).bit_length() // 8 + 1
+    return _tlv(tag, value.to_bytes(length, "big", signed=True))
+
+
+def _encode_oid(oid: OIDTuple) -> bytes:
+    content = bytearray()
+    for arc in (oid[0] * 40 + oid[1],) + oid[2:]:
+        chunk = [arc & 0x7f]
+        arc >>= 7
+        while arc:
+            chunk.append(0x80 | (arc & 0x7f))
+            arc >>= 7
+        content.extend(reversed(chunk))
+    return _tlv(OBJECT_IDENTIFIER, bytes(content))
+
+
+def _encode_value(tag: int, value: Value) -> bytes:
+    if isinstance(value, int):
+        return _encode_integer(tag, value)
+    if isinstance(value, tuple):
+        return _encode_oid(value)
+    if isinstance(value, bytes):
+        return _tlv(tag, value)
+    return _tlv(tag, b"")
+
+
+def _encode_pdu(pdu: PDU) -> bytes:
+    varbinds = b"".join(
+        _tlv(SEQUENCE,
+             _encode_oid(varbind.oid) + _encode_value(varbind.tag, varbind.value))
+        for varbind in pdu.varbinds)
+    return _tlv(
+        pdu.tag,
+        _encode_integer(INTEGER, pdu.request_id) + _encode_integer(INTEGER, pdu.error_status) +
+        _encode_integer(INTEGER, pdu.error_index) + _tlv(SEQUENCE, varbinds))
+
+
+def encode_message(message: Message, user: Optional[USMUser] = None, salt: int = 0) -> bytes:
+    """Encode a message, SNMPv3 messages are authenticated and encrypted as the flags say
+
+    The salt of the encryption must not repeat for the messages of a user."""
+    pdu = _encode_pdu(message.pdu)
+    if message.version != VERSION_3:
+        return _tlv(
+            SEQUENCE,
+            _encode_integer(INTEGER, message.version) + _tlv(OCTET_STRING, message.community) +
+            pdu)
+
+    security = message.security
+    if security is None:
+        raise ValueError("Missing security parameters")
+
+    scoped_pdu = _tlv(
+        SEQUENCE,
+        _tlv(OCTET_STRING, message.context_engine_id) + _tlv(OCTET_STRING, message.context_name) +
+        pdu)
+    priv_parameters = b""
+    if message.flags & FLAG_PRIV:
+        if user is None:
+            raise ValueError("Missing user")
+        encrypted, priv_parameters = _encrypt(user, security, scoped_pdu, salt)
+        scoped_pdu = _tlv(OCTET_STRING, encrypted)
+
+    mac_length = 0
+    if message.flags & FLAG_AUTH:
+        if user is None or user.auth_protocol is None:
+            raise ValueError("Missing authentication protocol")
+        mac_length = user.auth_protocol.mac_length
+
+    # Everything behind the authentication parameters
+    tail = _tlv(OCTET_STRING, priv_parameters) + scoped_pdu
+    usm = _tlv(
+        SEQUENCE,
+        _tlv(OCTET_STRING, security.engine_id) +
+        _encode_integer(INTEGER, security.engine_boots) +
+        _encode_integer(INTEGER, security.engine_time) +
+        _tlv(OCTET_STRING, security.user_name) + _tlv(OCTET_STRING, b"\0" * mac_length) +
+        _tlv(OCTET_STRING, priv_parameters))
+    header = _tlv(
+        SEQUENCE,
+        _encode_integer(INTEGER, message.msg_id) + _encode_integer(INTEGER, _MAX_MESSAGE_SIZE) +
+        _tlv(OCTET_STRING, bytes((message.flags,))) +
+        _encode_integer(INTEGER, _USM_SECURITY_MODEL))
+    encoded = _tlv(
+        SEQUENCE,
+        _encode_integer(INTEGER, VERSION_3) + header + _tlv(OCTET_STRING, usm) + scoped_pdu)
+
+    if not mac_length or user is None:
+        return encoded
+    auth_offset = len(encoded) - len(tail) - mac_length
+    return encoded[:auth_offset] + _mac(user, encoded) + encoded[auth_offset + mac_length:]
+
+
+def _read_tlv(data: bytes, offset: int) -> Tuple[int, int, int]:
+    """Returns the tag and the start and the end of the content of the value at offset"""
+    try:
+        tag = data[offset]
+        length = data[offset + 1]
+    except IndexError:
+        raise ValueError("Truncated message")
+    offset += 2
+    if length & 0x80:
+        num_bytes = length & 0x7f
+        length = int.from_bytes(data[offset:offset + num_bytes], "big")
+        offset += num_bytes
+    end = offset + length
+    if end > len(data):
+        raise ValueError("Truncated message")
+    return tag, offset, end
+
+
+def _expect(data: bytes, offset: int, tag: int) -> Tuple[int, int]:
+    actual, start, end = _read_tlv(data, offset)
+    if actual != tag:
+        raise ValueError("Expected tag 0x%02x at %d, got 0x%02x" % (tag, offset, actual))
+    return start, end
+
+
+def _decode_integer(data: bytes, offset: int) -> Tuple[int, int]:
+    """Returns the integer at offset and the end of it"""
+    start, end = _expect(data, offset, INTEGER)
+    return int.from_bytes(data[start:end], "big", signed=True), end
+
+
+def _decode_octet_string(data: bytes, offset: int) -> Tuple[bytes, int]:
+    start, end = _expect(data, offset, OCTET_STRING)
+    return data[start:end], end
+
+
+def _decode_oid(content: bytes) -> OIDTuple:
+    if content.isascii():
+        # Fast path: all arcs are smaller than 128
+        arcs: List[int] = list(content)
+    else:
+        arcs = []
+        arc = 0
+        for byte in content:
+            arc = (arc << 7) | (byte & 0x7f)
+            if not byte & 0x80:
+                arcs.append(arc)
+                arc = 0
+    if not arcs:
+        raise ValueError("Empty object identifier")
+    first = arcs[0]
+    return (min(first // 40, 2), first - 40 * min(first // 40, 2)) + tuple(arcs[1:])
+
+
+def _decode_value(tag: int, content: bytes) -> Value:
+    if tag == INTEGER:
+        return int.from_bytes(content, "big", signed=True)
+    if tag in _UNSIGNED_TAGS:
+        return int.from_bytes(content, "big")
+    if tag == OBJECT_IDENTIFIER:
+        return _decode_oid(content)
+    if tag == NULL or tag in EXCEPTION_TAGS:
+        return None
+    return content
+
+
+def _decode_pdu(data: bytes, offset: int) -> PDU:
+    tag, start, _end = _read_tlv(data, offset)
+    request_id, offset = _decode_integer(data, start)
+    error_status, offset = _decode_integer(data, offset)
+    error_index, offset = _decode_integer(data, offset)
+    offset, end = _expect(data, offset, SEQUENCE)
+
+    varbinds = []
+    while offset < end:
+        start, offset = _expect(data, offset, SEQUENCE)
+        oid_start, oid_end = _expect(data, start, OBJECT_IDENTIFIER)
+        value_tag, value_start, value_end = _read_tlv(data, oid_end)
+        varbinds.append(
+            VarBind(
+                _decode_oid(data[oid_start:oid_end]),
+                value_tag,
+                _decode_value(value_tag, data[value_start:value_end]),
+            ))
+    return PDU(tag, request_id, error_status, error_index, varbinds)
+
+
+def decode_message(data: bytes, user_of: Optional[UserLookup] = None) -> Message:
+    """Decode a message, SNMPv3 messages are verified and decrypted as the flags say
+
+    The keys of a SNMPv3 user are looked up by the user name and the engine ID.
+    Raises ValueError in case the message is invalid or can not be verified."""
+    start, end = _expect(data, 0, SEQUENCE)
+    data = data[:end]
+    version, offset = _decode_integer(data, start)
+    if version != VERSION_3:
+        community, offset = _decode_octet_string(data, offset)
+        return Message(version, _decode_pdu(data, offset), community=community)
+
+    offset, usm_offset = _expect(data, offset, SEQUENCE)
+    msg_id, offset = _decode_integer(data, offset)
+    _max_size, offset = _decode_integer(data, offset)
+    raw_flags, offset = _decode_octet_string(data, offset)
+    flags = raw_flags[0] if raw_flags else 0
+
+    offset, scoped_pdu_offset = _expect(data, usm_offset, OCTET_STRING)
+    offset, _end = _expect(data, offset, SEQUENCE)
+    engine_id, offset = _decode_octet_string(data, offset)
+    engine_boots, offset = _decode_integer(data, offset)
+    engine_time, offset = _decode_integer(data, offset)
+    user_name, offset = _decode_octet_string(data, offset)
+    auth_start, offset = _expect(data, offset, OCTET_STRING)
+    auth_end = offset
+    priv_parameters, offset = _decode_octet_string(data, offset)
+    security = SecurityParameters(engine_id, engine_boots, engine_time, user_name,
+                                  data[auth_start:auth_end], priv_parameters)
+
+    user = None
+    if flags & FLAG_AUTH:
+        user = user_of(user_name, engine_id) if user_of else None
+        if user is None or user.auth_protocol is None:
+            raise ValueError("Unknown user %r" % user_name)
+        zeroed = data[:auth_start] + b"\0" * (auth_end - auth_start) + data[auth_end:]
+        if not hmac.compare_digest(_mac(user, zeroed), security.auth_parameters):
+            raise ValueError("Wrong authentication parameters")
+
+    if flags & FLAG_PRIV:
+        if user is None:
+            raise ValueError("Privacy without authentication")
+        start, end = _expect(data, scoped_pdu_offset, OCTET_STRING)
+        data = _decrypt(user, security, data[start:end])
+        scoped_pdu_offset = 0
+
+    offset, _end = _expect(data, scoped_pdu_offset, SEQUENCE)
+    context_engine_id, offset = _decode_octet_string(data, offset)
+    context_name, offset = _decode_octet_string(data, offset)
+    return Message(
+        VERSION_3,
+        _decode_pdu(data, offset),
+        msg_id=msg_id,
+        flags=flags,
+        security=security,
+        context_engine_id=context_engine_id,
+        context_name=context_name,
+    )
+
+
+def _mac(user: USMUser, message: bytes) -> bytes:
+    if user.auth_protocol is None:
+        raise ValueError("Missing authentication protocol")
+    return hmac.new(user.auth_key, message,
+                    user.auth_protocol.hash_name).digest()[:user.auth_protocol.mac_length]
+
+
+def _crypt(algorithm: "CipherAlgorithm", mode: "Mode", data: bytes, encrypt: bool) -> bytes:
+    cipher = Cipher(algorithm, mode, backend=default_backend())
+    context = cipher.encryptor() if encrypt else cipher.decryptor()
+    return context.update(data) + context.finalize()
+
+
+def _aes_iv(security: SecurityParameters, salt: bytes) -> bytes:
+    return (security.engine_boots.to_bytes(4, "big") + security.engine_time.to_bytes(4, "big") +
+            salt)
+
+
+def _des_iv(user: USMUser, salt: bytes) -> bytes:
+    return bytes(a ^ b for a, b in zip(user.priv_key[8:16], salt))
+
+
+def _des_key(user: USMUser) -> bytes:
+    # Triple DES with three identical keys is single DES
+    return user.priv_key[:8] * 3
+
+
+def _encrypt(user: USMUser, security: SecurityParameters, plaintext: bytes,
+             salt: int) -> Tuple[bytes, bytes]:
+    """Returns the cipher text and the privacy parameters"""
+    triple_des, cfb = _privacy_ciphers()
+    if user.priv_protocol == "AES":
+        priv_parameters = (salt & 0xffffffffffffffff).to_bytes(8, "big")
+        return _crypt(algorithms.AES(user.priv_key[:16]),
+                      cfb(_aes_iv(security, priv_parameters)), plaintext,
+                      True), priv_parameters
+    if user.priv_protocol == "DES":
+        priv_parameters = (security.engine_boots.to_bytes(4, "big") +
+                           (salt & 0xffffffff).to_bytes(4, "big"))
+        padded = plaintext + b"\0" * (-len(plaintext) % 8)
+        return _crypt(triple_des(_des_key(user)), modes.CBC(_des_iv(user, priv_parameters)),
+                      padded, True), priv_parameters
+    raise ValueError("Invalid privacy protocol %r" % user.priv_protocol)
+
+
+def _decrypt(user: USMUser, security: SecurityParameters, ciphertext: bytes) -> bytes:
+    if len(security.priv_parameters) != 8:
+        raise ValueError("Invalid privacy parameters")
+    triple_des, cfb = _privacy_ciphers()
+    if user.priv_protocol == "AES":
+        return _crypt(algorithms.AES(user.priv_key[:16]),
+                      cfb(_aes_iv(security, security.priv_parameters)), ciphertext, False)
+    if user.priv_protocol == "DES":
+        if len(ciphertext) % 8:
+            raise ValueError("Invalid length of the encrypted data")
+        return _crypt(triple_des(_des_key(user)),
+                      modes.CBC(_des_iv(user, security.priv_parameters)), ciphertext, False)
+    raise ValueError("Invalid privacy protocol %r" % user.priv_protocol)
@@ -0,0 +1,532 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""SNMP backend talking to the agents directly via UDP
+
+In contrast to the classic backend no command line tools are executed. A single
+UDP socket is used for all requests of a call. The columns of a table are walked
+together: every GETBULK (or GETNEXT) request asks for the next rows of several
+columns and the requests of bigger tables are sent concurrently.
+
+The values are the raw values of the agent, i.e. the same as the classic backend
+gets after parsing the output of the Net-SNMP command line tools.
+"""
+
+import asyncio
+import logging
+import random
+import socket
+import time
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    cast,
+    Dict,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    TypeVar,
+)
+
+import cmk.utils.tty as tty
+from cmk.utils.exceptions import MKGeneralException, MKSNMPError
+from cmk.utils.log import console
+from cmk.utils.type_defs import CheckPluginNameStr
+
+from cmk.snmplib.type_defs import (
+    OID,
+    SNMPBackend,
+    SNMPContextName,
+    SNMPHostConfig,
+    SNMPRawValue,
+    SNMPRowInfo,
+)
+
+from . import _protocol
+from ._protocol import OIDTuple, VarBind
+
+__all__ = ["AsyncioSNMPBackend"]
+
+# Number of columns asked for by a single request. The requests for the columns of
+# bigger tables are sent concurrently.
+_MAX_COLUMNS_PER_REQUEST = 10
+
+# The defaults of the Net-SNMP command line tools
+_DEFAULT_TIMEOUT = 1.0
+_DEFAULT_RETRIES = 5
+
+_SECURITY_LEVEL_FLAGS = {
+    "noAuthNoPriv": 0,
+    "authNoPriv": _protocol.FLAG_AUTH,
+    "authPriv": _protocol.FLAG_AUTH | _protocol.FLAG_PRIV,
+}
+
+_T = TypeVar("_T")
+
+
+class _Engine:
+    """The SNMPv3 engine of an agent as found by the discovery"""
+    def __init__(self, engine_id: bytes, boots: int, engine_time: int) -> None:
+        super().__init__()
+        self.engine_id = engine_id
+        self.boots = boots
+        self._time_offset = engine_time - time.monotonic()
+
+    @property
+    def time(self) -> int:
+        return max(int(time.monotonic() + self._time_offset), 0)
+
+    def synchronize(self, boots: int, engine_time: int) -> None:
+        self.boots = boots
+        self._time_offset = engine_time - time.monotonic()
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    """Dispatches the responses to the waiting requests"""
+    def __init__(self, user_of: _protocol.UserLookup) -> None:
+        super().__init__()
+        self._user_of = user_of
+        self.pending: Dict[int, "asyncio.Future[_protocol.Message]"] = {}
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        try:
+            message = _protocol.decode_message(data, self._user_of)
+        except ValueError as e:
+            console.vverbose("Dropping invalid SNMP message: %s\n" % e)
+            return
+
+        key = (message.msg_id
+               if message.version == _protocol.VERSION_3 else message.pdu.request_id)
+        future = self.pending.pop(key, None)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    def error_received(self, exc: Exception) -> None:
+        # E.g. an ICMP port unreachable, the requests run into their timeouts
+        console.vverbose("SNMP socket error: %s\n" % exc)
+
+
+class _Session:
+    """The requests of a single call of the backend"""
+    def __init__(self, config: SNMPHostConfig, context_name: Optional[SNMPContextName],
+                 engine: Optional[_Engine]) -> None:
+        super().__init__()
+        self._config = config
+        self._context_name = (context_name or "").encode("utf-8")
+        self.engine = engine
+
+        settings = config.timing
+        self._timeout = float(settings.get("timeout", _DEFAULT_TIMEOUT))
+        self._retries = int(settings.get("retries", _DEFAULT_RETRIES))
+
+        self._request_id = random.randint(1, 2**30)
+        self._salt = random.getrandbits(64)
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self._protocol: Optional[_ClientProtocol] = None
+
+        self._flags = 0
+        self._user: Optional[_protocol.USMUser] = None
+        self._credentials: Tuple[str, ...] = ()
+        if config.is_snmpv3_host:
+            self._version = _protocol.VERSION_3
+            self._credentials = _v3_credentials(config)
+            self._flags = _SECURITY_LEVEL_FLAGS[self._credentials[0]]
+            if engine is not None:
+                self._user = self._make_user(engine.engine_id)
+        elif config.is_bulkwalk_host or config.is_snmpv2or3_without_bulkwalk_host:
+            self._version = _protocol.VERSION_2C
+        else:
+            self._version = _protocol.VERSION_1
+
+    @property
+    def _is_bulk(self) -> bool:
+        return self._config.is_bulkwalk_host and self._version != _protocol.VERSION_1
+
+    def _make_user(self, engine_id: bytes) -> _protocol.USMUser:
+        credentials = self._credentials
+        if len(credentials) == 2:
+            return _protocol.make_user(credentials[1].encode("utf-8"), engine_id)
+        sec_level, auth_protocol, sec_name, auth_pass = credentials[:4]
+        if sec_level == "noAuthNoPriv":
+            return _protocol.make_user(sec_name.encode("utf-8"), engine_id)
+        priv_protocol: Optional[str] = None
+        priv_pass = ""
+        if sec_level == "authPriv":
+            priv_protocol, priv_pass = credentials[4:]
+        return _protocol.make_user(
+            sec_name.encode("utf-8"),
+            engine_id,
+            auth_protocol,
+            auth_pass.encode("utf-8"),
+            priv_protocol,
+            priv_pass.encode("utf-8"),
+        )
+
+    def _user_of(self, user_name: bytes, _engine_id: bytes) -> Optional[_protocol.USMUser]:
+        if self._user is not None and self._user.name == user_name:
+            return self._user
+        return None
+
+    def _next_request_id(self) -> int:
+        self._request_id = self._request_id % (2**31 - 1) + 1
+        return self._request_id
+
+    async def open(self) -> None:
+        family = socket.AF_INET6 if self._config.is_ipv6_primary else socket.AF_INET
+        transport, protocol = await asyncio.get_running_loop().create_datagram_endpoint(
+            lambda: _ClientProtocol(self._user_of),
+            remote_addr=(self._config.ipaddress, self._config.port),
+            family=family,
+        )
+        # The transports of the event loops do not derive from DatagramTransport
+        self._transport = cast(asyncio.DatagramTransport, transport)
+        assert isinstance(protocol, _ClientProtocol)
+        self._protocol = protocol
+
+    def close(self) -> None:
+        if self._transport is not None:
+            self._transport.close()
+
+    async def _send(self, request_id: int, data: bytes) -> _protocol.Message:
+        if self._transport is None or self._protocol is None:
+            raise TypeError()
+
+        future = asyncio.get_running_loop().create_future()
+        self._protocol.pending[request_id] = future
+        try:
+            for _attempt in range(self._retries + 1):
+                self._transport.sendto(data)
+                try:
+                    return await asyncio.wait_for(asyncio.shield(future), self._timeout)
+                except asyncio.TimeoutError:
+                    continue
+        finally:
+            self._protocol.pending.pop(request_id, None)
+        raise MKSNMPError("Timeout: No Response from %s" % self._config.ipaddress)
+
+    async def request(self,
+                      tag: int,
+                      oids: Sequence[OIDTuple],
+                      max_repetitions: int = 0) -> _protocol.PDU:
+        varbinds = [VarBind(oid, _protocol.NULL, None) for oid in oids]
+        if self._version != _protocol.VERSION_3:
+            request_id = self._next_request_id()
+            pdu = _protocol.PDU(tag, request_id, 0, max_repetitions, varbinds)
+            community = self._config.credentials
+            if not isinstance(community, str):
+                raise TypeError()
+            message = _protocol.Message(self._version, pdu, community=community.encode("utf-8"))
+            return (await self._send(request_id, _protocol.encode_message(message))).pdu
+
+        if self.engine is None:
+            await self._discover_engine()
+        for _attempt in range(2):
+            response = await self._send_v3(tag, varbinds, max_repetitions)
+            if response.pdu.tag != _protocol.REPORT:
+                return response.pdu
+            report_oids = [varbind.oid for varbind in response.pdu.varbinds]
+            if _protocol.USM_STATS_NOT_IN_TIME_WINDOWS not in report_oids or \
+               response.security is None or self.engine is None:
+                break
+            # The time of the engine is only known for sure from an authenticated message
+            self.engine.synchronize(response.security.engine_boots,
+                                    response.security.engine_time)
+        raise MKSNMPError("Report %s from %s" % (", ".join(
+            _protocol.oid_to_str(oid) for oid in report_oids), self._config.ipaddress))
+
+    async def _send_v3(self, tag: int, varbinds: List[VarBind],
+                       max_repetitions: int) -> _protocol.Message:
+        if self.engine is None:
+            raise TypeError()
+        request_id = self._next_request_id()
+        self._salt += 1
+        message = _protocol.Message(
+            _protocol.VERSION_3,
+            _protocol.PDU(tag, request_id, 0, max_repetitions, varbinds),
+            msg_id=request_id,
+            flags=self._flags | _protocol.FLAG_REPORTABLE,
+            security=_protocol.SecurityParameters(
+                self.engine.engine_id,
+                self.engine.boots,
+                self.engine.time,
+                self._user.name if self._user else b"",
+            ),
+            context_engine_id=self.engine.engine_id,
+            context_name=self._context_name,
+        )
+        return await self._send(request_id,
+                                _protocol.encode_message(message, self._user, self._salt))
+
+    async def _discover_engine(self) -> None:
+        request_id = self._next_request_id()
+        message = _protocol.Message(
+            _protocol.VERSION_3,
+            _protocol.PDU(_protocol.GET_REQUEST, request_id, 0, 0, []),
+            msg_id=request_id,
+            flags=_protocol.FLAG_REPORTABLE,
+            security=_protocol.SecurityParameters(b"", 0, 0, b""),
+        )
+        response = await self._send(request_id, _protocol.encode_message(message))
+        if response.security is None or not response.security.engine_id:
+            raise MKSNMPError("Failed to discover the SNMP engine of %s" %
+                              self._config.ipaddress)
+        self.engine = _Engine(response.security.engine_id, response.security.engine_boots,
+                              response.security.engine_time)
+        self._user = self._make_user(self.engine.engine_id)
+
+    async def get(self, oid: OIDTuple) -> Optional[VarBind]:
+        pdu = await self.request(_protocol.GET_REQUEST, [oid])
+        if pdu.error_status or not pdu.varbinds:
+            return None
+        varbind = pdu.varbinds[0]
+        if varbind.tag in _protocol.EXCEPTION_TAGS:
+            return None
+        return varbind
+
+    async def get_next(self, oid: OIDTuple) -> Optional[VarBind]:
+        pdu = await self.request(_protocol.GET_NEXT_REQUEST, [oid])
+        if pdu.error_status or not pdu.varbinds:
+            return None
+        varbind = pdu.varbinds[0]
+        if varbind.tag in _protocol.EXCEPTION_TAGS:
+            return None
+        return varbind
+
+    async def get_many(self, tag: int, oids: Sequence[OIDTuple]) -> List[Optional[VarBind]]:
+        """Get (or get the next of) several OIDs in a single request"""
+        varbinds: List[Optional[VarBind]] = [None] * len(oids)
+        indices = list(range(len(oids)))
+        while indices:
+            pdu = await self.request(tag, [oids[index] for index in indices])
+            if pdu.error_status == _protocol.NO_SUCH_NAME and \
+               0 < pdu.error_index <= len(indices):
+                # SNMPv1: The whole request fails in case one of the OIDs does not exist
+                del indices[pdu.error_index - 1]
+                continue
+            if pdu.error_status or len(pdu.varbinds) != len(indices):
+                # E.g. the response is too big: Request the OIDs one by one
+                if len(indices) > 1:
+                    for index, single in zip(
+                            indices, await asyncio.gather(*(self.get_many(tag, [oids[index]])
+                                                            for index in indices))):
+                        varbinds[index] = single[0]
+                break
+            for index, varbind in zip(indices, pdu.varbinds):
+                if varbind.tag not in _protocol.EXCEPTION_TAGS:
+                    varbinds[index] = varbind
+            break
+        return varbinds
+
+    async def walk_columns(self, roots: Sequence[OIDTuple]) -> List[List[VarBind]]:
+        groups = [
+            roots[index:index + _MAX_COLUMNS_PER_REQUEST]
+            for index in range(0, len(roots), _MAX_COLUMNS_PER_REQUEST)
+        ]
+        walked = await asyncio.gather(*(self._walk_group(group) for group in groups))
+        columns = [column for group in walked for column in group]
+
+        # Like Net-SNMP: In case nothing was found below the OID, the OID itself may exist
+        empty = [index for index, column in enumerate(columns) if not column]
+        for index, varbind in zip(
+                empty, await asyncio.gather(*(self.get(roots[index]) for index in empty))):
+            if varbind is not None:
+                columns[index].append(varbind)
+        return columns
+
+    async def _walk_group(self, roots: Sequence[OIDTuple]) -> List[List[VarBind]]:
+        columns: List[List[VarBind]] = [[] for _root in roots]
+        # Some agents do not return the OIDs in ascending order. Do not stop in
+        # that case (like snmpwalk -Cc), but stop at OIDs already seen.
+        seen: List[Set[OIDTuple]] = [set() for _root in roots]
+        positions: Dict[int, OIDTuple] = dict(enumerate(roots))
+
+        while positions:
+            indices = list(positions)
+            if self._is_bulk:
+                pdu = await self.request(
+                    _protocol.GET_BULK_REQUEST,
+                    [positions[index] for index in indices],
+                    max_repetitions=self._config.bulk_walk_size_of,
+                )
+            else:
+                pdu = await self.request(_protocol.GET_NEXT_REQUEST,
+                                         [positions[index] for index in indices])
+
+            if pdu.error_status == _protocol.NO_SUCH_NAME and \
+               0 < pdu.error_index <= len(indices):
+                # SNMPv1: The end of the MIB has been reached for this column
+                del positions[indices[pdu.error_index - 1]]
+                continue
+            if pdu.error_status:
+                raise MKSNMPError("SNMP error status %d from %s" %
+                                  (pdu.error_status, self._config.ipaddress))
+            if not pdu.varbinds:
+                raise MKSNMPError("Empty response from %s" % self._config.ipaddress)
+
+            for row_start in range(0, len(pdu.varbinds), len(indices)):
+                row = pdu.varbinds[row_start:row_start + len(indices)]
+                for index, varbind in zip(indices, row):
+                    if index not in positions:
+                        continue
+                    root = roots[index]
+                    if (varbind.tag in _protocol.EXCEPTION_TAGS or
+                            len(varbind.oid) <= len(root) or varbind.oid[:len(root)] != root or
+                            varbind.oid in seen[index]):
+                        del positions[index]
+                        continue
+                    seen[index].add(varbind.oid)
+                    columns[index].append(varbind)
+                    positions[index] = varbind.oid
+        return columns
+
+
+class AsyncioSNMPBackend(SNMPBackend):
+    def __init__(self, snmp_config: SNMPHostConfig, logger: logging.Logger) -> None:
+        super().__init__(snmp_config, logger)
+        # Found by the first SNMPv3 request, saves the discovery for the further requests
+        self._engine: Optional[_Engine] = None
+
+    def get(self,
+            oid: OID,
+            context_name: Optional[SNMPContextName] = None) -> Optional[SNMPRawValue]:
+        if oid.endswith(".*"):
+            oid_prefix = _protocol.oid_from_str(oid[:-2])
+            action: Callable[[_Session], Awaitable[Optional[VarBind]]] = \
+                lambda session: session.get_next(oid_prefix)
+        else:
+            oid_prefix = _protocol.oid_from_str(oid)
+            action = lambda session: session.get(oid_prefix)
+
+        try:
+            varbind = self._run(context_name, action)
+        except MKSNMPError as e:
+            console.verbose(tty.red + tty.bold + "ERROR: " + tty.normal + "SNMP error: %s\n" % e)
+            return None
+
+        if varbind is None:
+            return None
+        # In case of .*, check if prefix is the one we are looking for
+        if oid.endswith(".*") and (len(varbind.oid) <= len(oid_prefix) or
+                                   varbind.oid[:len(oid_prefix)] != oid_prefix):
+            return None
+
+        value = _raw_value(varbind)
+        console.vverbose("SNMP answer: ==> [%r]\n" % value)
+        return value
+
+    def get_many(self,
+                 oids: Sequence[OID],
+                 context_name: Optional[SNMPContextName] = None) -> List[Optional[SNMPRawValue]]:
+        # The OIDs ending with .* are requested with GETNEXT, all others with GET. The
+        # requests of up to _MAX_COLUMNS_PER_REQUEST OIDs each are sent concurrently.
+        requests: List[Tuple[int, List[Tuple[int, OIDTuple]]]] = []
+        for tag, entries in [
+            (_protocol.GET_REQUEST, [(index, _protocol.oid_from_str(oid))
+                                     for index, oid in enumerate(oids)
+                                     if not oid.endswith(".*")]),
+            (_protocol.GET_NEXT_REQUEST, [(index, _protocol.oid_from_str(oid[:-2]))
+                                          for index, oid in enumerate(oids)
+                                          if oid.endswith(".*")]),
+        ]:
+            requests.extend((tag, entries[start:start + _MAX_COLUMNS_PER_REQUEST])
+                            for start in range(0, len(entries), _MAX_COLUMNS_PER_REQUEST))
+
+        async def get_many(session: _Session) -> List[List[Optional[VarBind]]]:
+            return await asyncio.gather(*(session.get_many(tag, [oid for _index, oid in entries])
+                                          for tag, entries in requests))
+
+        values: List[Optional[SNMPRawValue]] = [None] * len(oids)
+        try:
+            responses = self._run(context_name, get_many)
+        except MKSNMPError as e:
+            console.verbose(tty.red + tty.bold + "ERROR: " + tty.normal + "SNMP error: %s\n" % e)
+            return values
+
+        for (_tag, entries), varbinds in zip(requests, responses):
+            for (index, oid_prefix), varbind in zip(entries, varbinds):
+                if varbind is None:
+                    continue
+                # In case of .*, check if prefix is the one we are looking for
+                if oids[index].endswith(".*") and (len(varbind.oid) <= len(oid_prefix) or
+                                                   varbind.oid[:len(oid_prefix)] != oid_prefix):
+                    continue
+                values[index] = _raw_value(varbind)
+        console.vverbose("SNMP answers: ==> %r\n" % values)
+        return values
+
+    def walk(self,
+             oid: OID,
+             check_plugin_name: Optional[CheckPluginNameStr] = None,
+             table_base_oid: Optional[OID] = None,
+             context_name: Optional[SNMPContextName] = None) -> SNMPRowInfo:
+        return self.walk_columns([oid], check_plugin_name, table_base_oid, context_name)[0]
+
+    def walk_columns(self,
+                     oids: Sequence[OID],
+                     check_plugin_name: Optional[CheckPluginNameStr] = None,
+                     table_base_oid: Optional[OID] = None,
+                     context_name: Optional[SNMPContextName] = None) -> List[SNMPRowInfo]:
+        roots = [_protocol.oid_from_str(oid) for oid in oids]
+        console.vverbose("Walking %s on %s\n" % (", ".join(oids), self.config.ipaddress))
+        try:
+            columns = self._run(context_name, lambda session: session.walk_columns(roots))
+        except MKSNMPError as e:
+            console.verbose(tty.red + tty.bold + "ERROR: " + tty.normal + "SNMP error: %s\n" % e)
+            raise MKSNMPError("SNMP Error on %s: %s" % (self.config.ipaddress, e))
+        return [[(_protocol.oid_to_str(varbind.oid), _raw_value(varbind))
+                 for varbind in column]
+                for column in columns]
+
+    def _run(self, context_name: Optional[SNMPContextName],
+             action: Callable[[_Session], Awaitable[_T]]) -> _T:
+        async def run() -> _T:
+            session = _Session(self.config, context_name, self._engine)
+            try:
+                await session.open()
+                return await action(session)
+            except OSError as e:
+                raise MKSNMPError(str(e))
+            finally:
+                session.close()
+                self._engine = session.engine
+
+        return asyncio.run(run())
+
+
+def _v3_credentials(config: SNMPHostConfig) -> Tuple[str, ...]:
+    # TODO: Fix the horrible credentials typing
+    credentials = config.credentials
+    if not (isinstance(credentials, tuple) and len(credentials) in (2, 4, 6)):
+        raise MKGeneralException("Invalid SNMP credentials '%r' for host %s: must be "
+                                 "string, 2-tuple, 4-tuple or 6-tuple" %
+                                 (credentials, config.hostname))
+    if credentials[0] not in _SECURITY_LEVEL_FLAGS or \
+       len(credentials) < {"noAuthNoPriv": 2, "authNoPriv": 4, "authPriv": 6}[credentials[0]]:
+        raise MKGeneralException("Invalid SNMP security level '%s' for host %s" %
+                                 (credentials[0], config.hostname))
+    if len(credentials) >= 4 and credentials[1] not in _protocol.AUTH_PROTOCOLS:
+        raise MKGeneralException("Invalid SNMP auth protocol: %s" % credentials[1])
+    if len(credentials) == 6:
+        if credentials[4] not in _protocol.PRIV_PROTOCOLS:
+            raise MKGeneralException("Invalid SNMP priv protocol: %s" % credentials[4])
+        if not _protocol.has_privacy_support():
+            raise MKGeneralException("SNMPv3 privacy needs the Python module cryptography")
+    return credentials
+
+
+def _raw_value(varbind: VarBind) -> SNMPRawValue:
+    value = varbind.value
+    if isinstance(value, int):
+        return b"%d" % value
+    if isinstance(value, tuple):
+        return _protocol.oid_to_str(value).encode("ascii")
+    if value is None:
+        return b""
+    if varbind.tag == _protocol.IP_ADDRESS:
+        return ".".join(str(byte) for byte in value).encode("ascii")
+    return value
@@ -5,12 +5,17 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """Abstract classes and types."""
 
-from typing import List, Optional, Tuple
+import mmap
+import os
+import struct
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple, Union
 
 from six import ensure_binary, ensure_str
 
 import cmk.utils.agent_simulator as agent_simulator
 import cmk.utils.paths
+import cmk.utils.store as store
 from cmk.utils.exceptions import MKGeneralException, MKSNMPError
 from cmk.utils.log import console
 from cmk.utils.type_defs import AgentRawData, CheckPluginNameStr
@@ -22,6 +27,9 @@ from ._utils import strip_snmp_value
 
 __all__ = ["StoredWalkSNMPBackend"]
 
+# Modification time (ns) and size of a walk file
+WalkVersion = Tuple[int, int]
+
 
 class StoredWalkSNMPBackend(SNMPBackend):
     def get(self,
@@ -41,54 +49,18 @@ class StoredWalkSNMPBackend(SNMPBackend):
              check_plugin_name: Optional[CheckPluginNameStr] = None,
              table_base_oid: Optional[OID] = None,
              context_name: Optional[SNMPContextName] = None) -> SNMPRowInfo:
-        if oid.startswith("."):
-            oid = oid[1:]
-
-        if oid.endswith(".*"):
-            oid_prefix = oid[:-2]
-            dot_star = True
-        else:
-            oid_prefix = oid
-            dot_star = False
-
         host_cache = snmp_cache.host_cache()
         try:
-            lines = host_cache[self.config.hostname]
+            index = host_cache[self.config.hostname]
         except KeyError:
             path = cmk.utils.paths.snmpwalks_dir + "/" + self.config.hostname
             console.vverbose("  Loading %s from %s\n" % (oid, path))
-            try:
-                lines = StoredWalkSNMPBackend.read_walk_data(path)
-            except IOError:
-                raise MKSNMPError("No snmpwalk file %s" % path)
-            host_cache[self.config.hostname] = lines
-
-        begin = 0
-        end = len(lines)
-        hit = None
-        while end - begin > 0:
-            current = (begin + end) // 2
-            parts = lines[current].split(None, 1)
-            comp = parts[0]
-            hit = StoredWalkSNMPBackend._compare_oids(oid_prefix, comp)
-            if hit == 0:
-                break
-            if hit == 1:  # we are too low
-                begin = current + 1
-            else:
-                end = current
-
-        if hit != 0:
-            return []  # not found
+            index = _walk_index(path)
+            host_cache[self.config.hostname] = index
 
-        rowinfo = StoredWalkSNMPBackend._collect_until(oid, oid_prefix, lines, current, -1)
-        rowinfo.reverse()
-        rowinfo += StoredWalkSNMPBackend._collect_until(oid, oid_prefix, lines, current + 1, 1)
-
-        if dot_star:
-            return [rowinfo[0]]
-
-        return rowinfo
+        if oid.endswith(".*"):
+            return index.walk(oid[:-2], below_only=True, limit=1)
+        return index.walk(oid)
 
     @staticmethod
     def read_walk_data(path: str):
@@ -103,50 +75,195 @@ class StoredWalkSNMPBackend(SNMPBackend):
                     lines[-1] += line
         return lines
 
-    @staticmethod
-    def _compare_oids(a: OID, b: OID) -> int:
-        aa = StoredWalkSNMPBackend._to_bin_string(a)
-        bb = StoredWalkSNMPBackend._to_bin_string(b)
-        if len(aa) <= len(bb) and bb[:len(aa)] == aa:
-            result = 0
-        else:
-            result = (aa > bb) - (aa < bb)
-        return result
 
-    @staticmethod
-    def _to_bin_string(oid: OID) -> Tuple[int, ...]:
+def _oid_key(oid: OID) -> bytes:
+    """The OID as bytes, which compare like the OIDs
+
+    Every sub identifier is a 32 bit big endian number, so a key starts with the
+    key of an other OID exactly in case the OID is below the other one."""
+    try:
+        sub_ids = [int(sub_id) for sub_id in oid.strip(".").split(".")]
+        return struct.pack(">%dI" % len(sub_ids), *sub_ids)
+    except (ValueError, struct.error):
+        raise MKGeneralException("Invalid OID %s" % oid)
+
+
+class StoredWalkIndex:
+    """Sorted index of a stored walk
+
+    Finding an OID in a walk file means parsing it. The index holds the keys of
+    all OIDs of the walk in sorted order, together with the values. The values
+    are stored ready for use, only values with agent simulator tags are processed
+    when they are fetched.
+
+    Layout (numbers in native byte order):
+
+        header          magic, version of the walk file, number of entries
+        key offsets     number of entries + 1 offsets into the keys
+        OID offsets     number of entries + 1 offsets into the OIDs
+        value offsets   number of entries + 1 offsets into the values
+        keys            the sorted keys of the OIDs
+        OIDs            the OIDs, each one terminated by a newline
+        flags           one byte per entry, 1 for values with agent simulator tags
+        values          the values
+
+    The file is memory mapped. A walk or a get is a binary search over the keys
+    and reads the OIDs and values of the result in one go."""
+    _magic = b"CMKSWI01"
+    _header = struct.Struct("=8sQQQ")
+    _simulated = 1
+
+    def __init__(self, data: Union[bytes, mmap.mmap]) -> None:
+        super(StoredWalkIndex, self).__init__()
+        magic, mtime_ns, size, num_entries = self._header.unpack_from(data)
+        if magic != self._magic:
+            raise ValueError("Invalid stored walk index")
+
+        view = memoryview(data)
+        index_size = (num_entries + 1) * struct.calcsize("=Q")
+        offset = self._header.size
+        self._key_offsets = view[offset:offset + index_size].cast("Q")
+        self._oid_offsets = view[offset + index_size:offset + 2 * index_size].cast("Q")
+        self._value_offsets = view[offset + 2 * index_size:offset + 3 * index_size].cast("Q")
+        self._keys_offset = offset + 3 * index_size
+        self._oids_offset = self._keys_offset + self._key_offsets[-1]
+        self._flags_offset = self._oids_offset + self._oid_offsets[-1]
+        self._values_offset = self._flags_offset + num_entries
+        self._data = data
+        self._len = num_entries
+        self.version: WalkVersion = (mtime_ns, size)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["StoredWalkIndex"]:
+        """Returns None in case the index does not exist or is not valid"""
         try:
-            return tuple(map(int, oid.strip(".").split(".")))
-        except Exception:
-            raise MKGeneralException("Invalid OID %s" % oid)
+            with path.open("rb") as f:
+                # The mapping stays valid, even if the file is replaced in the meantime
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            return cls(data)
+        except (OSError, ValueError, struct.error):
+            return None
 
-    @staticmethod
-    def _collect_until(oid: OID, oid_prefix: OID, lines: List[str], index: int,
-                       direction: int) -> SNMPRowInfo:
-        rows = []
-        # Handle case, where we run after the end of the lines list
-        if index >= len(lines):
-            if direction > 0:
-                return []
-            index -= 1
-        while True:
-            line = lines[index]
+    @classmethod
+    def create(cls, walk_path: str, version: WalkVersion) -> bytes:
+        """Create the index of a walk file"""
+        entries: List[Tuple[bytes, bytes, int, SNMPRawValue]] = []
+        for line in StoredWalkSNMPBackend.read_walk_data(walk_path):
             parts = line.split(None, 1)
-            o = parts[0]
-            if o.startswith('.'):
-                o = o[1:]
-            if o == oid or o.startswith(oid_prefix + "."):
-                if len(parts) > 1:
-                    # FIXME: This encoding ping-pong os horrible...
-                    value = ensure_str(
-                        agent_simulator.process(AgentRawData(ensure_binary(parts[1]),),),)
-                else:
-                    value = ""
-                # Fix for missing starting oids
-                rows.append(('.' + o, strip_snmp_value(value)))
-                index += direction
-                if index < 0 or index >= len(lines):
-                    break
+            oid = parts[0][1:]
+            value = parts[1] if len(parts) > 1 else ""
+            if "%{" in value:
+                flags, raw_value = cls._simulated, ensure_binary(value)
             else:
-                break
+                flags, raw_value = 0, cls._value(value)
+            entries.append((_oid_key(oid), ensure_binary(".%s\n" % oid), flags, raw_value))
+        # The walks are usually sorted already. Keep the order of duplicate OIDs.
+        entries.sort(key=lambda entry: entry[0])
+
+        keys = [entry[0] for entry in entries]
+        oids = [entry[1] for entry in entries]
+        values = [entry[3] for entry in entries]
+
+        chunks = [cls._header.pack(cls._magic, version[0], version[1], len(entries))]
+        for column in [keys, oids, values]:
+            offsets = [0]
+            for chunk in column:
+                offsets.append(offsets[-1] + len(chunk))
+            chunks.append(struct.pack("=%dQ" % len(offsets), *offsets))
+        chunks.extend(keys)
+        chunks.extend(oids)
+        chunks.append(bytes(entry[2] for entry in entries))
+        chunks.extend(values)
+        return b"".join(chunks)
+
+    @staticmethod
+    def _value(value: str) -> SNMPRawValue:
+        # FIXME: This encoding ping-pong os horrible...
+        return strip_snmp_value(
+            ensure_str(agent_simulator.process(AgentRawData(ensure_binary(value)))))
+
+    def __len__(self) -> int:
+        return self._len
+
+    def _key(self, index: int) -> bytes:
+        return self._data[self._keys_offset + self._key_offsets[index]:self._keys_offset +
+                          self._key_offsets[index + 1]]
+
+    def _lower_bound(self, key: bytes) -> int:
+        low, high = 0, self._len
+        while low < high:
+            middle = (low + high) // 2
+            if self._key(middle) < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def walk(self, oid: OID, below_only: bool = False, limit: Optional[int] = None) -> SNMPRowInfo:
+        """The rows of the OID and all OIDs below, or only the ones below"""
+        prefix = _oid_key(oid)
+        begin = self._lower_bound(prefix)
+        while below_only and begin < self._len and self._key(begin) == prefix:
+            begin += 1
+        try:
+            # The keys starting with the prefix are smaller than the prefix incremented by one
+            end = self._lower_bound(
+                (int.from_bytes(prefix, "big") + 1).to_bytes(len(prefix), "big"))
+        except OverflowError:
+            end = self._len
+        if limit is not None:
+            end = min(end, begin + limit)
+        if begin >= end:
+            return []
+
+        oids = self._data[self._oids_offset + self._oid_offsets[begin]:self._oids_offset +
+                          self._oid_offsets[end]].decode("ascii").split("\n")
+        offsets = self._value_offsets[begin:end + 1].tolist()
+        first = offsets[0]
+        values = self._data[self._values_offset + first:self._values_offset + offsets[-1]]
+        rows = [(oid, values[start - first:stop - first])
+                for oid, start, stop in zip(oids, offsets, offsets[1:])]
+
+        flags = self._data[self._flags_offset + begin:self._flags_offset + end]
+        if any(flags):
+            rows = [(oid, self._value(ensure_str(value)) if flag & self._simulated else value)
+                    for (oid, value), flag in zip(rows, flags)]
         return rows
+
+
+# The indexes are shared by all hosts using the same walk file
+_walk_indexes: Dict[Tuple[int, int], StoredWalkIndex] = {}
+
+
+def _walk_index(path: str) -> StoredWalkIndex:
+    """The index of the walk file, which is created once per version of the file"""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        raise MKSNMPError("No snmpwalk file %s" % path)
+    file_id = stat.st_dev, stat.st_ino
+    version = stat.st_mtime_ns, stat.st_size
+
+    index = _walk_indexes.get(file_id)
+    if index is not None and index.version == version:
+        return index
+
+    index_path = cmk.utils.paths.snmpwalk_index_dir / ("%x-%x" % file_id)
+    index = StoredWalkIndex.load(index_path)
+    if index is None or index.version != version:
+        console.vverbose("  Indexing %s\n" % path)
+        try:
+            data = StoredWalkIndex.create(path, version)
+        except IOError:
+            raise MKSNMPError("No snmpwalk file %s" % path)
+        try:
+            store.makedirs(index_path.parent)
+            store.save_bytes_to_file(index_path, data)
+            index = StoredWalkIndex.load(index_path)
+        except (OSError, MKGeneralException):
+            index = None
+        if index is None or index.version != version:
+            index = StoredWalkIndex(data)
+
+    _walk_indexes[file_id] = index
+    return index
@@ -6,8 +6,9 @@
 
 import logging
 import socket
+import time
 from hashlib import md5, sha256
-from typing import Any, Dict, Final, List, Mapping, Optional, Tuple
+from typing import Any, Dict, Final, Mapping, Optional, Tuple, Union
 
 from Cryptodome.Cipher import AES
 
@@ -21,6 +22,11 @@ from .type_defs import Mode
 
 
 class TCPFetcher(AgentFetcher):
+    # The receive buffer starts with this size and doubles whenever it is
+    # full, but grows by at most max_chunk_size at once.
+    initial_chunk_size = 64 * 1024
+    max_chunk_size = 16 * 1024 * 1024
+
     def __init__(
         self,
         file_cache: DefaultAgentFileCache,
@@ -70,7 +76,9 @@ class TCPFetcher(AgentFetcher):
         self._socket = socket.socket(self.family, socket.SOCK_STREAM)
         try:
             self._socket.settimeout(self.timeout)
+            start = time.monotonic()
             self._socket.connect(self.address)
+            self.stats["connect_time"] = time.monotonic() - start
             self._socket.settimeout(None)
         except socket.error as e:
             self._socket.close()
@@ -99,30 +107,49 @@ class TCPFetcher(AgentFetcher):
         if self._socket is None:
             raise MKFetcherError("Not connected")
 
-        return self._validate_decrypted_data(self._decrypt(self._raw_data()))
+        return self._validate_decrypted_data(AgentRawData(bytes(self._decrypt(self._raw_data()))))
 
-    def _raw_data(self) -> AgentRawData:
+    def _raw_data(self) -> bytearray:
         self._logger.debug("Reading data from agent")
         if not self._socket:
-            return AgentRawData(b"")
-
-        def recvall(sock: socket.socket) -> bytes:
-            buffer: List[bytes] = []
-            while True:
-                data = sock.recv(4096, socket.MSG_WAITALL)
-                if not data:
-                    break
-                buffer.append(data)
-            return b"".join(buffer)
+            return bytearray()
 
         try:
-            return AgentRawData(recvall(self._socket))
+            return self._recvall(self._socket)
         except socket.error as e:
             if cmk.utils.debug.enabled():
                 raise
             raise MKFetcherError("Communication failed: %s" % e)
 
-    def _decrypt(self, output: AgentRawData) -> AgentRawData:
+    def _recvall(self, sock: socket.socket) -> bytearray:
+        """Receive everything until the agent closes the connection
+
+        The data is received directly into a single growing buffer, so no
+        chunks have to be collected and joined afterwards.
+
+        """
+        start = time.monotonic()
+        buffer = bytearray(self.initial_chunk_size)
+        length = 0
+        while True:
+            if length == len(buffer):
+                buffer.extend(bytes(min(len(buffer), self.max_chunk_size)))
+
+            with memoryview(buffer) as view:
+                received = sock.recv_into(view[length:], 0, socket.MSG_WAITALL)
+            if not received:
+                break
+
+            if not length:
+                self.stats["first_byte_time"] = time.monotonic() - start
+            length += received
+
+        del buffer[length:]
+        self.stats["receive_time"] = time.monotonic() - start
+        self.stats["bytes_received"] = length
+        return buffer
+
+    def _decrypt(self, output: Union[bytes, bytearray]) -> Union[bytes, bytearray]:
         if not output:
             return output  # nothing to to, validation will fail
 
@@ -161,13 +188,12 @@ class TCPFetcher(AgentFetcher):
         return output
 
     # TODO: Sync with real_type_checks._decrypt_rtc_package
-    def _real_decrypt(self, output: AgentRawData) -> AgentRawData:
+    def _real_decrypt(self, output: Union[bytes, bytearray]) -> bytearray:
         try:
             # simply check if the protocol is an actual number
             protocol = int(output[:2])
         except ValueError:
             raise MKFetcherError("Unsupported protocol version: %r" % output[:2])
-        encrypted_pkg = output[2:]
         encryption_key = self.encryption_settings["passphrase"]
 
         encrypt_digest = sha256 if protocol == 2 else md5
@@ -183,6 +209,16 @@ class TCPFetcher(AgentFetcher):
 
         key, iv = derive_key_and_iv(encryption_key.encode("utf-8"), 32, AES.block_size)
         decryption_suite = AES.new(key, AES.MODE_CBC, iv)
-        decrypted_pkg = decryption_suite.decrypt(encrypted_pkg)
-        # Strip of fill bytes of openssl
-        return AgentRawData(decrypted_pkg[0:-decrypted_pkg[-1]])
+
+        # Decrypt in place, the package may be huge
+        buffer = output if isinstance(output, bytearray) else bytearray(output)
+        with memoryview(buffer) as view:
+            decryption_suite.decrypt(view[2:], output=view[2:])
+
+        # Strip of the protocol version and the fill bytes of openssl
+        fill_bytes = buffer[-1]
+        if not fill_bytes:
+            return bytearray()
+        del buffer[-fill_bytes:]
+        del buffer[:2]
+        return buffer
@@ -15,7 +15,7 @@ import abc
 import ast
 import errno
 import json
-from logging import Logger, getLogger
+from logging import Logger, getLogger, WARNING
 import os
 from pathlib import Path
 import pprint
@@ -28,7 +28,8 @@ import threading
 import time
 import traceback
 from types import FrameType
-from typing import Any, AnyStr, Dict, Iterable, Iterator, List, Optional, Tuple, Type, Union
+from typing import (Any, AnyStr, Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple,
+                    Type, Union)
 
 from six import ensure_binary
 
@@ -50,6 +51,8 @@ import livestatus
 from .actions import do_notify, do_event_action, do_event_actions, event_has_opened
 from .crash_reporting import ECCrashReport, CrashReportStore
 from .history import ActiveHistoryPeriod, History, scrub_string, quote_tab, get_logfile
+from .pipeline import EventPipeline
+from .prefilter import RulePrefilter
 from .query import MKClientError, Query, QueryGET, filter_operator_in
 from .rule_packs import load_config as load_config_using
 from .settings import FileDescriptor, PortNumber, Settings, settings as create_settings
@@ -489,6 +492,7 @@ class Perfcounters:
         "overflows",
         "events",
         "connects",
+        "pipeline_stalls",
     ]
 
     # Average processing times
@@ -496,6 +500,8 @@ class Perfcounters:
         "processing": 0.99,  # event processing
         "sync": 0.95,  # Replication sync
         "request": 0.95,  # Client requests
+        "save": 0.95,  # Saving the event state
+        "pipeline": 0.99,  # Time from receiving to processing a message in the pipeline
     }
 
     # TODO: Why aren't self._times / self._rates / ... not initialized with their defaults?
@@ -513,9 +519,9 @@ class Perfcounters:
 
         self._logger = logger.getChild("Perfcounters")
 
-    def count(self, counter: str) -> None:
+    def count(self, counter: str, value: int = 1) -> None:
         with self._lock:
-            self._counters[counter] += 1
+            self._counters[counter] += value
 
     def count_time(self, counter: str, ptime: float) -> None:
         with self._lock:
@@ -627,9 +633,14 @@ class EventServer(ECServerThread):
 
         # TODO: Improve type!
         self._rules: List[Any] = []
+        self._rule_sources: Tuple[Any, Any] = ([], [])
+        self.rules_generation = 0
         self._hash_stats = []
         for _unused_facility in range(32):
             self._hash_stats.append([0] * 8)
+        self._rule_prefilter: Optional[RulePrefilter] = None
+        # Number of rule candidates before and after prefiltering
+        self._prefilter_stats = [0, 0]
 
         self.host_config = HostConfig(self._logger)
         self._perfcounters = perfcounters
@@ -640,6 +651,7 @@ class EventServer(ECServerThread):
         self._message_period = ActiveHistoryPeriod()
         self._rule_matcher = RuleMatcher(self._logger, config)
         self._event_creator = EventCreator(self._logger, config)
+        self._pipeline: Optional[EventPipeline] = None
 
         # HACK for testing: The real fix would involve breaking up these huge
         # class monsters.
@@ -668,6 +680,7 @@ class EventServer(ECServerThread):
             ("status_config_load_time", 0),
             ("status_num_open_events", 0),
             ("status_virtual_memory_size", 0),
+            ("status_pipeline_queue_length", 0),
         ]
 
     @classmethod
@@ -704,6 +717,7 @@ class EventServer(ECServerThread):
             self._config["last_reload"],
             self._event_status.num_existing_events,
             self._virtual_memory_size(),
+            self._pipeline.queue_length() if self._pipeline else 0,
         ]
 
     def _virtual_memory_size(self):
@@ -816,10 +830,23 @@ class EventServer(ECServerThread):
         # http://www.outflux.net/blog/archives/2008/03/09/using-select-on-a-fifo/
         return os.open(str(self.settings.paths.event_pipe.value), os.O_RDWR | os.O_NONBLOCK)
 
+    def start_pipeline(self) -> None:
+        """Start the pipelined processing of messages in case it is configured"""
+        if self._pipeline is None and self._config["event_processing_workers"]:
+            self._pipeline = EventPipeline(self._logger, self, self._perfcounters,
+                                           self._config["event_processing_workers"])
+            self._pipeline.start()
+
+    def stop_pipeline(self) -> None:
+        if self._pipeline is not None:
+            self._pipeline.stop()
+            self._pipeline = None
+
     def handle_snmptrap(self, trap, ipaddress):
         self.process_event(self._event_creator.create_event_from_trap(trap, ipaddress))
 
     def serve(self) -> None:
+        self.start_pipeline()
         pipe_fragment = b''
         pipe = self.open_pipe()
         listen_list = [pipe]
@@ -888,14 +915,14 @@ class EventServer(ECServerThread):
                         # Do we have any complete messages?
                         if b'\n' in data:
                             complete, rest = data.rsplit(b"\n", 1)
-                            self.process_raw_lines(complete + b"\n", address)
+                            self.receive_raw_lines(complete + b"\n", address)
                         else:
                             rest = data  # keep for next time
 
                     # Only complete messages
                     else:
                         if data:
-                            self.process_raw_lines(data, address)
+                            self.receive_raw_lines(data, address)
                         rest = b""
 
                     # Connection still open?
@@ -918,11 +945,11 @@ class EventServer(ECServerThread):
                         if data[-1:] != b'\n':
                             if b'\n' in data:  # at least one complete message contained
                                 messages, pipe_fragment = data.rsplit(b'\n', 1)
-                                self.process_raw_lines(messages + b'\n')  # got lost in split
+                                self.receive_raw_lines(messages + b'\n')  # got lost in split
                             else:
                                 pipe_fragment = data  # keep beginning of message, wait for \n
                         else:
-                            self.process_raw_lines(data)
+                            self.receive_raw_lines(data)
                     else:  # EOF
                         os.close(pipe)
                         pipe = self.open_pipe()
@@ -938,14 +965,15 @@ class EventServer(ECServerThread):
 
             # Read events from builtin syslog server
             if self._syslog is not None and self._syslog.fileno() in readable:
-                self.process_raw_lines(*self._syslog.recvfrom(4096))
+                self.receive_raw_lines(*self._syslog.recvfrom(4096))
 
             # Read events from builtin snmptrap server
             if self._snmptrap is not None and self._snmptrap.fileno() in readable:
                 try:
                     message, sender_address = self._snmptrap.recvfrom(65535)
-                    self.process_raw_data(
-                        lambda: self._snmp_trap_engine.process_snmptrap(message, sender_address))
+                    self.receive_raw_data(lambda message=message, sender_address=sender_address: self.
+                                          _snmp_trap_engine.process_snmptrap(
+                                              message, sender_address))
                 except Exception:
                     self._logger.exception(
                         'Exception handling a SNMP trap from "%s". Skipping this one' %
@@ -954,12 +982,27 @@ class EventServer(ECServerThread):
             try:
                 # process the first spool file we get
                 spool_file = next(self.settings.paths.spool_dir.value.glob('[!.]*'))
-                self.process_raw_lines(spool_file.read_bytes())
+                self.receive_raw_lines(spool_file.read_bytes())
                 spool_file.unlink()
                 select_timeout = 0  # enable fast processing to process further files
             except StopIteration:
                 select_timeout = 1  # restore default select timeout
 
+        self.stop_pipeline()
+
+    # Hands the received data over to the pipeline or processes it right now
+    def receive_raw_data(self, handler):
+        if self._pipeline is not None:
+            self._pipeline.put_handler(handler)
+        else:
+            self.process_raw_data(handler)
+
+    def receive_raw_lines(self, data: bytes, address: Optional[Any] = None) -> None:
+        if self._pipeline is not None:
+            self._pipeline.put_lines(data, address)
+        else:
+            self.process_raw_lines(data, address)
+
     # Processes incoming data, just a wrapper between the real data and the
     # handler function to record some statistics etc.
     def process_raw_data(self, handler):
@@ -989,6 +1032,93 @@ class EventServer(ECServerThread):
                     self._logger.exception('Exception handling a log line (skipping this one): %s' %
                                            e)
 
+    def preprocess_raw_lines(self, data: bytes, address: Optional[Any]) -> List[Any]:
+        """Parse the lines and match them against the rules
+
+        This is done by the worker processes of the pipeline. The results are applied
+        to the event status by process_preprocessed_lines(). Nothing may be changed
+        here, the changes would only be done in the worker process."""
+        results: List[Any] = []
+        for line_bytes in data.splitlines():
+            line = scrub_and_decode(line_bytes.rstrip())
+            if line:
+                try:
+                    results.append(self._preprocess_line(line, address))
+                except Exception as e:
+                    self._logger.exception('Exception handling a log line (skipping this one): %s' %
+                                           e)
+                    results.append(None)
+        return results
+
+    def _preprocess_line(self, line, address):
+        if self._config["debug_rules"]:
+            self._logger.info(u"Processing message from %r: '%s'" % (address, line))
+
+        event = self._event_creator.create_event_from_line(line, address)
+        self.do_translate_hostname(event)
+
+        tries = 0
+
+        def event_rule_matches(rule, event):
+            nonlocal tries
+            tries += 1
+            # Without the lock, it is a copy of the configuration in the worker anyway
+            return self._rule_matcher.event_rule_matches(rule, event)
+
+        rule_candidates = self._rule_candidates(event)
+        hits = []
+        for rule, cancelling, match_groups in self._rule_hits(event, rule_candidates,
+                                                              event_rule_matches):
+            hits.append((rule["id"], cancelling, match_groups))
+            if rule.get("drop") != "skip_pack":
+                break  # The following rules are not needed anymore
+        return event, hits, tries, len(rule_candidates)
+
+    def pipeline_worker_setup(self) -> Tuple[int, Callable[..., 'EventServer'], Tuple]:
+        """The rules generation and how the workers of the pipeline create their event server
+
+        Taken under the configuration lock, so that the configuration and the rules
+        belong to the returned rules generation."""
+        with self._lock_configuration:
+            return self.rules_generation, make_pipeline_worker_event_server, (
+                self.settings,
+                self._config,
+                self._rule_sources,
+                self._logger.getEffectiveLevel(),
+            )
+
+    def process_preprocessed_lines(self, generation: int, results: List[Any], data: bytes,
+                                   address: Optional[Any]) -> None:
+        # The rules are replaced, not changed, when compiled. So the reference taken
+        # under the lock is an unchanging copy of the rules of this generation.
+        with self._lock_configuration:
+            rules_changed = generation != self.rules_generation
+            rule_by_id = self._rule_by_id
+
+        if rules_changed:
+            # The rules have been changed since the workers matched the lines
+            self.process_raw_lines(data, address)
+            return
+
+        for result in results:
+            if result is None:
+                self._perfcounters.count("messages")
+                continue
+
+            try:
+
+                def handler(result=result):
+                    event, hits, tries, num_candidates = result
+                    self._perfcounters.count("rule_tries", tries)
+                    self._process_rule_hits(
+                        event, num_candidates,
+                        ((rule_by_id[rule_id], cancelling, match_groups)
+                         for rule_id, cancelling, match_groups in hits))
+
+                self.process_raw_data(handler)
+            except Exception as e:
+                self._logger.exception('Exception handling a log line (skipping this one): %s' % e)
+
     def do_housekeeping(self) -> None:
         with self._event_status.lock:
             with self._lock_configuration:
@@ -1071,6 +1201,7 @@ class EventServer(ECServerThread):
                             event["count"] = max(0, event["count"] - new_tokens)
                             event[
                                 "last_token"] = last_token + new_tokens * secs_per_token  # not now! would be unfair
+                            self._event_status.event_changed(event)
                             if event["count"] == 0:
                                 self._logger.info(
                                     "Rule %s/%s, event %d: again without allowed rate, dropping event"
@@ -1096,6 +1227,7 @@ class EventServer(ECServerThread):
                     self._logger.info("Delayed event %d of rule %s is now activated." %
                                       (event["id"], event["rule_id"]))
                     event["phase"] = "open"
+                    self._event_status.event_changed(event)
                     self._history.add(event, "DELAYOVER")
                     if rule:
                         event_has_opened(self._history, self.settings, self._config, self._logger,
@@ -1167,9 +1299,9 @@ class EventServer(ECServerThread):
                 # First look for case 1: rule that already have at least one hit
                 # and this events in the state "counting" exist.
                 events_to_delete = []
-                events = self._event_status.events()
+                events = self._event_status.events_of_rule(rule["id"])
                 for nr, event in enumerate(events):
-                    if event["rule_id"] == rule["id"] and event["phase"] == "counting":
+                    if event["phase"] == "counting":
                         # time has elapsed. Now lets see if we have reached
                         # the neccessary count:
                         if event["count"] < expected_count:  # no -> trigger alarm
@@ -1213,10 +1345,8 @@ class EventServer(ECServerThread):
             merge, reset_ack = merge
 
         if merge != "never":
-            for event in self._event_status.events():
-                if event["rule_id"] == rule["id"] and \
-                        (event["phase"] == "open" or
-                         (event["phase"] == "ack" and merge == "acked")):
+            for event in self._event_status.events_of_rule(rule["id"]):
+                if event["phase"] == "open" or (event["phase"] == "ack" and merge == "acked"):
                     merge_event = event
                     break
 
@@ -1235,6 +1365,7 @@ class EventServer(ECServerThread):
             # Better rewrite (again). Rule might have changed. Also we have changed
             # the text and the user might have his own text added via set_text.
             self.rewrite_event(rule, merge_event, {}, set_first=False)
+            self._event_status.event_changed(merge_event)
             self._history.add(merge_event, "COUNTFAILED")
         else:
             # Create artifical event from scratch. Make sure that all important
@@ -1280,6 +1411,10 @@ class EventServer(ECServerThread):
     # Precompile regular expressions and similar stuff. Also convert legacy
     # "rules" parameter into new "rule_packs" parameter
     def compile_rules(self, legacy_rules, rule_packs):
+        # Before and after compiling, so that workers of the pipeline that have been
+        # forked in between are never considered to be up to date
+        self.rules_generation += 1
+        self._rule_sources = (legacy_rules, rule_packs)
         self._rules = []
         self._rule_by_id = {}
         # Speedup-Hash for rule execution
@@ -1321,14 +1456,18 @@ class EventServer(ECServerThread):
 
                         if 'state' in rule and isinstance(rule['state'], tuple) \
                            and rule['state'][0] == 'text_pattern':
+                            # The patterns are compiled into a copy, the rule sources are
+                            # compiled again by the workers of the pipeline
+                            state_patterns = rule['state'][1].copy()
                             for key in ['2', '1', '0']:
-                                if key in rule['state'][1]:
+                                if key in state_patterns:
                                     value = self._compile_matching_value(
-                                        'state', rule['state'][1][key])
+                                        'state', state_patterns[key])
                                     if value is None:
-                                        del rule['state'][1][key]
+                                        del state_patterns[key]
                                     else:
-                                        rule['state'][1][key] = value
+                                        state_patterns[key] = value
+                            rule['state'] = ('text_pattern', state_patterns)
 
                     except Exception as e:
                         if self.settings.options.debug:
@@ -1360,6 +1499,14 @@ class EventServer(ECServerThread):
                         stats.append("%s(%d)" % (SyslogPriority(prio), len(entries)))
                     self._logger.info(" %-12s: %s" % (SyslogFacility(facility), " ".join(stats)))
 
+            self._rule_prefilter = RulePrefilter(self._rules)
+            self._logger.info("Rule prefilter: %d rules - %d prefiltered by %d literals" %
+                              (len(self._rules), self._rule_prefilter.num_filtered_rules(),
+                               self._rule_prefilter.num_literals()))
+        else:
+            self._rule_prefilter = None
+        self.rules_generation += 1
+
     @staticmethod
     def _compile_matching_value(key, val):
         value = val.strip()
@@ -1423,6 +1570,11 @@ class EventServer(ECServerThread):
                               (SyslogFacility(facility), SyslogPriority(priority), count,
                                (100.0 * count / float(total_count))))
 
+        hashed, prefiltered = self._prefilter_stats
+        if hashed:
+            self._logger.info("Rule prefilter: %d of %d rule candidates had to be tried (%.2f%%)" %
+                              (prefiltered, hashed, 100.0 * prefiltered / hashed))
+
     def process_line(self, line, address):
         line = line.rstrip()
         if self._config["debug_rules"]:
@@ -1436,18 +1588,26 @@ class EventServer(ECServerThread):
 
     def process_event(self, event):
         self.do_translate_hostname(event)
+        rule_candidates = self._rule_candidates(event)
+        self._process_rule_hits(event, len(rule_candidates),
+                                self._rule_hits(event, rule_candidates, self.event_rule_matches))
 
-        # Log all incoming messages into a syslog-like text file if that is enabled
-        if self._config["log_messages"]:
-            self.log_message(event)
-
+    def _rule_candidates(self, event):
         # Rule optimizer
-        if self._config["rule_optimizer"]:
-            self._hash_stats[event["facility"]][event["priority"]] += 1
-            rule_candidates = self._rule_hash.get(event["facility"], {}).get(event["priority"], [])
-        else:
-            rule_candidates = self._rules
+        if not self._config["rule_optimizer"]:
+            return self._rules
+
+        rule_candidates = self._rule_hash.get(event["facility"], {}).get(event["priority"], [])
+        # In debug mode all rules are tried, so that the log tells why they do not match
+        if self._rule_prefilter is not None and not self._config["debug_rules"]:
+            return self._rule_prefilter.candidates(rule_candidates, event)
+        return rule_candidates
 
+    def _rule_hits(self, event, rule_candidates, event_rule_matches):
+        """Yields the matching rules together with the cancelling flag and the match groups
+
+        The rules are tried in the order they need to be applied. After a matching rule
+        with "skip_pack" the rest of its rule pack is skipped."""
         skip_pack = None
         for rule in rule_candidates:
             if skip_pack and rule["pack"] == skip_pack:
@@ -1455,111 +1615,126 @@ class EventServer(ECServerThread):
             skip_pack = None  # new pack, reset skipping
 
             try:
-                result = self.event_rule_matches(rule, event)
+                result = event_rule_matches(rule, event)
             except Exception as e:
                 self._logger.exception('  Exception during matching:\n%s' % e)
                 result = False
 
             if result:  # A tuple with (True/False, {match_info}).. O.o
-                self._perfcounters.count("rule_hits")
                 cancelling, match_groups = result
+                yield rule, cancelling, match_groups
+                if rule.get("drop") == "skip_pack":
+                    skip_pack = rule["pack"]
 
-                if self._config["debug_rules"]:
-                    self._logger.info("  matching groups:\n%s" % pprint.pformat(match_groups))
+    def _process_rule_hits(self, event, num_candidates, rule_hits):
+        # Log all incoming messages into a syslog-like text file if that is enabled
+        if self._config["log_messages"]:
+            self.log_message(event)
 
-                self._event_status.count_rule_match(rule["id"])
-                if self._config["log_rulehits"]:
-                    self._logger.info("Rule '%s/%s' hit by message %s/%s - '%s'." %
-                                      (rule["pack"], rule["id"], SyslogFacility(event["facility"]),
-                                       SyslogPriority(event["priority"]), event["text"]))
+        if self._config["rule_optimizer"]:
+            self._hash_stats[event["facility"]][event["priority"]] += 1
+            self._prefilter_stats[0] += len(self._rule_hash.get(event["facility"],
+                                                                {}).get(event["priority"], []))
+            self._prefilter_stats[1] += num_candidates
 
-                if rule.get("drop"):
-                    if rule["drop"] == "skip_pack":
-                        skip_pack = rule["pack"]
-                        if self._config["debug_rules"]:
-                            self._logger.info("  skipping this rule pack (%s)" % skip_pack)
-                        continue
-                    self._perfcounters.count("drops")
-                    return
-
-                if cancelling:
-                    self._event_status.cancel_events(self, self._event_columns, event, match_groups,
-                                                     rule)
-                    return
-
-                # Remember the rule id that this event originated from
-                event["rule_id"] = rule["id"]
-
-                # Attach optional contact group information for visibility
-                # and eventually for notifications
-                self._add_rule_contact_groups_to_event(rule, event)
-
-                # Store groups from matching this event. In order to make
-                # persistence easier, we do not safe them as list but join
-                # them on ASCII-1.
-                event["match_groups"] = match_groups.get("match_groups_message", ())
-                event["match_groups_syslog_application"] = match_groups.get(
-                    "match_groups_syslog_application", ())
-                self.rewrite_event(rule, event, match_groups)
-
-                # Lookup the monitoring core hosts and add the core host
-                # name to the event when one can be matched.
-                #
-                # Needs to be done AFTER event rewriting, because the rewriting
-                # may change the "host" field.
-                #
-                # For the moment we have no rule/condition matching on this
-                # field. So we only add the core host info for matched events.
-                self._add_core_host_to_new_event(event)
-
-                if "count" in rule:
-                    count = rule["count"]
-                    # Check if a matching event already exists that we need to
-                    # count up. If the count reaches the limit, the event will
-                    # be opened and its rule actions performed.
-                    existing_event = \
-                        self._event_status.count_event(self, event, rule, count)
-                    if existing_event:
-                        if "delay" in rule:
-                            if self._config["debug_rules"]:
-                                self._logger.info("Event opening will be delayed for %d seconds" %
-                                                  rule["delay"])
-                            existing_event["delay_until"] = time.time() + rule["delay"]
-                            existing_event["phase"] = "delayed"
-                        else:
-                            event_has_opened(self._history, self.settings, self._config,
-                                             self._logger, self, self._event_columns, rule,
-                                             existing_event)
+        for rule, cancelling, match_groups in rule_hits:
+            self._perfcounters.count("rule_hits")
 
-                        self._history.add(existing_event, "COUNTREACHED")
+            if self._config["debug_rules"]:
+                self._logger.info("  matching groups:\n%s" % pprint.pformat(match_groups))
 
-                        if "delay" not in rule and rule.get("autodelete"):
-                            existing_event["phase"] = "closed"
-                            self._history.add(existing_event, "AUTODELETE")
-                            with self._event_status.lock:
-                                self._event_status.remove_event(existing_event)
-                elif "expect" in rule:
-                    self._event_status.count_expected_event(self, event)
-                else:
+            self._event_status.count_rule_match(rule["id"])
+            if self._config["log_rulehits"]:
+                self._logger.info("Rule '%s/%s' hit by message %s/%s - '%s'." %
+                                  (rule["pack"], rule["id"], SyslogFacility(event["facility"]),
+                                   SyslogPriority(event["priority"]), event["text"]))
+
+            if rule.get("drop"):
+                if rule["drop"] == "skip_pack":
+                    if self._config["debug_rules"]:
+                        self._logger.info("  skipping this rule pack (%s)" % rule["pack"])
+                    continue
+                self._perfcounters.count("drops")
+                return
+
+            if cancelling:
+                self._event_status.cancel_events(self, self._event_columns, event, match_groups,
+                                                 rule)
+                return
+
+            # Remember the rule id that this event originated from
+            event["rule_id"] = rule["id"]
+
+            # Attach optional contact group information for visibility
+            # and eventually for notifications
+            self._add_rule_contact_groups_to_event(rule, event)
+
+            # Store groups from matching this event. In order to make
+            # persistence easier, we do not safe them as list but join
+            # them on ASCII-1.
+            event["match_groups"] = match_groups.get("match_groups_message", ())
+            event["match_groups_syslog_application"] = match_groups.get(
+                "match_groups_syslog_application", ())
+            self.rewrite_event(rule, event, match_groups)
+
+            # Lookup the monitoring core hosts and add the core host
+            # name to the event when one can be matched.
+            #
+            # Needs to be done AFTER event rewriting, because the rewriting
+            # may change the "host" field.
+            #
+            # For the moment we have no rule/condition matching on this
+            # field. So we only add the core host info for matched events.
+            self._add_core_host_to_new_event(event)
+
+            if "count" in rule:
+                count = rule["count"]
+                # Check if a matching event already exists that we need to
+                # count up. If the count reaches the limit, the event will
+                # be opened and its rule actions performed.
+                existing_event = \
+                    self._event_status.count_event(self, event, rule, count)
+                if existing_event:
                     if "delay" in rule:
                         if self._config["debug_rules"]:
                             self._logger.info("Event opening will be delayed for %d seconds" %
                                               rule["delay"])
-                        event["delay_until"] = time.time() + rule["delay"]
-                        event["phase"] = "delayed"
+                        existing_event["delay_until"] = time.time() + rule["delay"]
+                        existing_event["phase"] = "delayed"
                     else:
-                        event["phase"] = "open"
+                        event_has_opened(self._history, self.settings, self._config,
+                                         self._logger, self, self._event_columns, rule,
+                                         existing_event)
+
+                    self._history.add(existing_event, "COUNTREACHED")
+
+                    if "delay" not in rule and rule.get("autodelete"):
+                        existing_event["phase"] = "closed"
+                        self._history.add(existing_event, "AUTODELETE")
+                        with self._event_status.lock:
+                            self._event_status.remove_event(existing_event)
+            elif "expect" in rule:
+                self._event_status.count_expected_event(self, event)
+            else:
+                if "delay" in rule:
+                    if self._config["debug_rules"]:
+                        self._logger.info("Event opening will be delayed for %d seconds" %
+                                          rule["delay"])
+                    event["delay_until"] = time.time() + rule["delay"]
+                    event["phase"] = "delayed"
+                else:
+                    event["phase"] = "open"
 
-                    if self.new_event_respecting_limits(event):
-                        if event["phase"] == "open":
-                            event_has_opened(self._history, self.settings, self._config,
-                                             self._logger, self, self._event_columns, rule, event)
-                            if rule.get("autodelete"):
-                                event["phase"] = "closed"
-                                self._history.add(event, "AUTODELETE")
-                                with self._event_status.lock:
-                                    self._event_status.remove_event(event)
-                return
+                if self.new_event_respecting_limits(event):
+                    if event["phase"] == "open":
+                        event_has_opened(self._history, self.settings, self._config,
+                                         self._logger, self, self._event_columns, rule, event)
+                        if rule.get("autodelete"):
+                            event["phase"] = "closed"
+                            self._history.add(event, "AUTODELETE")
+                            with self._event_status.lock:
+                                self._event_status.remove_event(event)
+            return
 
         # End of loop over rules.
         if self._config["archive_orphans"]:
@@ -1615,20 +1790,7 @@ class EventServer(ECServerThread):
     def event_rule_matches(self, rule, event):
         self._perfcounters.count("rule_tries")
         with self._lock_configuration:
-            result = self._rule_matcher.event_rule_matches_non_inverted(rule, event)
-            if rule.get("invert_matching"):
-                if result is False:
-                    result = False, {}
-                    if self._config["debug_rules"]:
-                        self._logger.info(
-                            "  Rule would not match, but due to inverted matching does.")
-                else:
-                    result = False
-                    if self._config["debug_rules"]:
-                        self._logger.info(
-                            "  Rule would match, but due to inverted matching does not.")
-
-            return result
+            return self._rule_matcher.event_rule_matches(rule, event)
 
     # Rewrite texts and compute other fields in the event
     def rewrite_event(self, rule, event, groups, set_first=True):
@@ -1933,6 +2095,38 @@ class EventServer(ECServerThread):
         return new_event
 
 
+def make_pipeline_worker_event_server(settings: Settings, config: Dict[str, Any],
+                                      rule_sources: Tuple[Any, Any],
+                                      log_level: int) -> EventServer:
+    """Creates the event server of a worker process of the event pipeline
+
+    The workers only parse and match the lines. The event status and the history
+    belong to the event daemon and are not available here."""
+    if settings.options.foreground:
+        log.setup_logging_handler(sys.stderr)
+    else:
+        log.open_log(str(settings.paths.log_file.value))
+    logger = getLogger("cmk.mkeventd.EventServer")
+    # The daemon has already logged the statistics of the rules
+    logger.setLevel(max(log_level, WARNING))
+
+    event_server = EventServer(
+        logger,
+        settings,
+        config,
+        {},
+        Perfcounters(logger.getChild("lock.perfcounters")),
+        ECLock(logger.getChild("lock.configuration")),
+        None,  # type: ignore[arg-type]
+        None,  # type: ignore[arg-type]
+        [],
+        create_pipes_and_sockets=False,
+    )
+    event_server.compile_rules(*rule_sources)
+    logger.setLevel(log_level)
+    return event_server
+
+
 class EventCreator:
     def __init__(self, logger: Logger, config: Dict[str, Any]) -> None:
         super().__init__()
@@ -2240,6 +2434,19 @@ class RuleMatcher:
     def _debug_rules(self):
         return self._config["debug_rules"]
 
+    def event_rule_matches(self, rule, event):
+        result = self.event_rule_matches_non_inverted(rule, event)
+        if rule.get("invert_matching"):
+            if result is False:
+                result = False, {}
+                if self._debug_rules:
+                    self._logger.info("  Rule would not match, but due to inverted matching does.")
+            else:
+                result = False
+                if self._debug_rules:
+                    self._logger.info("  Rule would match, but due to inverted matching does not.")
+        return result
+
     def event_rule_matches_non_inverted(self, rule, event):
         if self._debug_rules:
             self._logger.info("Trying rule %s/%s..." % (rule["pack"], rule["id"]))
@@ -2968,6 +3175,7 @@ class StatusServer(ECServerThread):
             event["contact"] = contact
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "UPDATE", user)
 
     def handle_command_create(self, arguments: List[str]) -> None:
@@ -2987,6 +3195,7 @@ class StatusServer(ECServerThread):
         event["state"] = int(newstate)
         if user:
             event["owner"] = user
+        self._event_status.event_changed(event)
         self._history.add(event, "CHANGESTATE", user)
 
     def handle_command_reload(self) -> None:
@@ -3002,7 +3211,7 @@ class StatusServer(ECServerThread):
     def handle_command_flush(self) -> None:
         self._history.flush()
         self._event_status.flush()
-        self._event_status.save_status()
+        self._event_status.save_status(compact=True)
         if is_replication_slave(self._config):
             try:
                 self.settings.paths.master_config_file.value.unlink()
@@ -3028,6 +3237,7 @@ class StatusServer(ECServerThread):
         event = self._event_status.event(int(event_id))
         if user:
             event["owner"] = user
+            self._event_status.event_changed(event)
 
         if action_id == "@NOTIFY":
             do_notify(self._event_server, self._logger, event, user, is_cancelling=False)
@@ -3168,14 +3378,14 @@ class EventStatus:
         self.lock = threading.Lock()
         self._history = history
         self._logger = logger
+        self._journal_generation = 0
         self.flush()
 
     def reload_configuration(self, config: Dict[str, Any]) -> None:
         self._config = config
 
     def flush(self) -> None:
-        # TODO: Improve types!
-        self._events: List[Any] = []
+        self._set_events([])
         self._next_event_id = 1
         self._rule_stats: Dict[str, int] = {}
         # needed for expecting rules
@@ -3187,14 +3397,119 @@ class EventStatus:
         # - number of rule hits
         # - number of rule misses
 
+    # The open events are stored by their id in the order of their creation. The
+    # secondary indexes by rule and host are ordered the same way, so that the
+    # first event of an index is the oldest one. The phase of an event is changed
+    # in many places, so there is no index for it. All lookups by phase are
+    # restricted to the events of a single rule.
+    def _set_events(self, events: List[Any]) -> None:
+        # TODO: Improve types!
+        self._events: Dict[int, Any] = {}
+        self._events_by_rule: Dict[str, Dict[int, Any]] = {}
+        self._events_by_host: Dict[str, Dict[int, Any]] = {}
+        self._events_by_rule_and_host: Dict[Tuple[str, str], Dict[int, Any]] = {}
+        # The host and core host an event is indexed and counted with, these may change
+        self._indexed_hosts: Dict[int, Tuple[str, str]] = {}
+        # The keys of the host indexes whose events are not ordered by their ids anymore,
+        # because the host of an event has changed. They are sorted when they are read.
+        self._unsorted_host_keys: Set[str] = set()
+        self._unsorted_rule_and_host_keys: Set[Tuple[str, str]] = set()
+        for event in events:
+            self._add_event(event)
+        # All events have been replaced, the journal is not sufficient anymore
+        self._changed_event_ids: Set[int] = set()
+        self._removed_event_ids: Set[int] = set()
+        self._snapshot_needed = True
+
+    def _add_event(self, event: Any) -> None:
+        eid = event["id"]
+        self._events[eid] = event
+        self._events_by_rule.setdefault(event["rule_id"], {})[eid] = event
+        self._events_by_host.setdefault(event["host"], {})[eid] = event
+        self._events_by_rule_and_host.setdefault((event["rule_id"], event["host"]), {})[eid] = event
+        self._indexed_hosts[eid] = (event["host"], event["core_host"])
+
+    def _pop_event(self, eid: int) -> Any:
+        event = self._events.pop(eid)
+        host = self._indexed_hosts.pop(eid)[0]
+        self._changed_event_ids.discard(eid)
+        self._removed_event_ids.add(eid)
+        self._remove_from_index(self._events_by_rule, event["rule_id"], eid)
+        self._remove_from_index(self._events_by_host, host, eid)
+        self._remove_from_index(self._events_by_rule_and_host, (event["rule_id"], host), eid)
+        return event
+
+    @staticmethod
+    def _remove_from_index(index: Dict[Any, Dict[int, Any]], key: Any, eid: int) -> None:
+        events = index[key]
+        del events[eid]
+        if not events:
+            del index[key]
+
+    @staticmethod
+    def _add_to_index(index: Dict[Any, Dict[int, Any]], key: Any, eid: int, event: Any) -> bool:
+        """Adds an event to an index, returns whether the events of the key need to be sorted"""
+        events = index.setdefault(key, {})
+        needs_sorting = bool(events) and eid < next(reversed(events.keys()))
+        events[eid] = event
+        return needs_sorting
+
+    @staticmethod
+    def _sorted_index_entry(index: Dict[Any, Dict[int, Any]], unsorted_keys: Set[Any],
+                            key: Any) -> Dict[int, Any]:
+        # The ids reflect the order of creation
+        if key in unsorted_keys:
+            unsorted_keys.discard(key)
+            if key in index:
+                index[key] = dict(sorted(index[key].items()))
+        return index.get(key, {})
+
+    # protected by self.lock
+    def event_changed(self, event: Any) -> None:
+        """Needs to be called after an existing event has been changed
+
+        The event is written to the journal with the next save and the indexes are
+        updated in case the host of the event has been changed."""
+        eid = event["id"]
+        indexed_host_key = self._indexed_hosts.get(eid)
+        if indexed_host_key is None:
+            return
+        self._changed_event_ids.add(eid)
+
+        host_key = (event["host"], event["core_host"])
+        if indexed_host_key == host_key:
+            return
+
+        old_host, new_host = indexed_host_key[0], host_key[0]
+        if old_host != new_host:
+            self._remove_from_index(self._events_by_host, old_host, eid)
+            if self._add_to_index(self._events_by_host, new_host, eid, event):
+                self._unsorted_host_keys.add(new_host)
+
+            rule_id = event["rule_id"]
+            self._remove_from_index(self._events_by_rule_and_host, (rule_id, old_host), eid)
+            if self._add_to_index(self._events_by_rule_and_host, (rule_id, new_host), eid, event):
+                self._unsorted_rule_and_host_keys.add((rule_id, new_host))
+
+        self.num_existing_events_by_host[indexed_host_key] -= 1
+        self.num_existing_events_by_host[host_key] = self.num_existing_events_by_host.get(
+            host_key, 0) + 1
+        self._indexed_hosts[eid] = host_key
+
     def events(self) -> List[Any]:
         # TODO: Improve type!
-        return self._events
+        return list(self._events.values())
+
+    def events_of_rule(self, rule_id: str) -> List[Any]:
+        return list(self._events_by_rule.get(rule_id, {}).values())
+
+    def events_of_rule_and_host(self, rule_id: str, host: str) -> List[Any]:
+        return list(
+            self._sorted_index_entry(self._events_by_rule_and_host,
+                                     self._unsorted_rule_and_host_keys, (rule_id, host)).values())
 
     def event(self, eid):
-        for event in self._events:
-            if event["id"] == eid:
-                return event
+        return self._events.get(eid)
 
     # Return beginning of current expectation interval. For new rules
     # we start with the next interval in future.
@@ -3237,20 +3552,50 @@ class EventStatus:
     def pack_status(self):
         return {
             "next_event_id": self._next_event_id,
-            "events": self._events,
+            "events": list(self._events.values()),
             "rule_stats": self._rule_stats,
             "interval_starts": self._interval_starts,
         }
 
     def unpack_status(self, status):
         self._next_event_id = status["next_event_id"]
-        self._events = status["events"]
+        self._set_events(status["events"])
         self._rule_stats = status["rule_stats"]
         self._interval_starts = status["interval_starts"]
+        self._initialize_event_limit_status()
 
-    def save_status(self):
+    # The event state is saved as a snapshot of all events together with a journal.
+    # Each save appends the events that have been created, changed or removed since
+    # the previous save to the journal, so that the cost of a save depends on the
+    # number of changes and not on the number of open events. Once the journal has
+    # grown larger than the snapshot, both are compacted into a new snapshot.
+    #
+    # The journal starts with the generation of the snapshot it belongs to. A
+    # journal of another generation is left over from an interrupted compaction
+    # and is already contained in the snapshot.
+    def save_status(self, compact: bool = False) -> None:
         now = time.time()
+        if compact or self._snapshot_needed or self._journal_too_large():
+            self._save_snapshot()
+            what = "snapshot"
+        else:
+            self._append_to_journal()
+            what = "journal"
+        elapsed = time.time() - now
+        self._perfcounters.count_time("save", elapsed)
+        self._logger.log(VERBOSE, "Saved event state (%s) in %.3fms.", what, elapsed * 1000)
+
+    def _journal_too_large(self) -> bool:
+        try:
+            return self.settings.paths.status_journal_file.value.stat().st_size > max(
+                self.settings.paths.status_file.value.stat().st_size, 1024 * 1024)
+        except FileNotFoundError:
+            return True
+
+    def _save_snapshot(self) -> None:
+        self._journal_generation += 1
         status = self.pack_status()
+        status["journal_generation"] = self._journal_generation
         path = self.settings.paths.status_file.value
         path_new = path.parent / (path.name + '.new')
         # Believe it or not: cPickle is more than two times slower than repr()
@@ -3259,8 +3604,34 @@ class EventStatus:
             f.flush()
             os.fsync(f.fileno())
         path_new.rename(path)
-        elapsed = time.time() - now
-        self._logger.log(VERBOSE, "Saved event state to %s in %.3fms.", path, elapsed * 1000)
+
+        # Start a new journal. In case we crash before, the old journal is ignored
+        # during loading because of its generation.
+        with self.settings.paths.status_journal_file.value.open(mode="wb") as f:
+            f.write((repr({"journal_generation": self._journal_generation}) +
+                     "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._changed_event_ids = set()
+        self._removed_event_ids = set()
+        self._snapshot_needed = False
+
+    def _append_to_journal(self) -> None:
+        entry = {
+            "next_event_id": self._next_event_id,
+            "events": [self._events[eid] for eid in sorted(self._changed_event_ids)],
+            "removed_event_ids": sorted(self._removed_event_ids),
+            "rule_stats": self._rule_stats,
+            "interval_starts": self._interval_starts,
+        }
+        with self.settings.paths.status_journal_file.value.open(mode="ab") as f:
+            f.write((repr(entry) + "\n").encode("utf-8"))
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._changed_event_ids = set()
+        self._removed_event_ids = set()
 
     def reset_counters(self, rule_id):
         if rule_id:
@@ -3276,25 +3647,77 @@ class EventStatus:
             try:
                 status = ast.literal_eval(path.read_text(encoding="utf-8"))
                 self._next_event_id = status["next_event_id"]
-                self._events = status["events"]
+                events = status["events"]
                 self._rule_stats = status["rule_stats"]
                 self._interval_starts = status.get("interval_starts", {})
+                self._journal_generation = status.get("journal_generation", 0)
                 self._logger.info("Loaded event state from %s." % path)
             except Exception as e:
                 self._logger.exception("Error loading event state from %s: %s" % (path, e))
                 raise
 
-        # Add new columns
-        for event in self._events:
-            event.setdefault("ipaddress", "")
+            events = self._replay_journal(events)
+
+            # Add new columns
+            for event in events:
+                event.setdefault("ipaddress", "")
+
+                if "core_host" not in event:
+                    event_server.add_core_host_to_event(event)
+                    event["host_in_downtime"] = False
 
-            if "core_host" not in event:
-                event_server.add_core_host_to_event(event)
-                event["host_in_downtime"] = False
+            # The next save compacts the journal into a new snapshot
+            self._set_events(events)
 
         # core_host is needed to initialize the status
         self._initialize_event_limit_status()
 
+    def _replay_journal(self, events: List[Any]) -> List[Any]:
+        path = self.settings.paths.status_journal_file.value
+        try:
+            lines = path.read_text(encoding="utf-8").splitlines()
+        except FileNotFoundError:
+            return events
+
+        try:
+            generation = ast.literal_eval(lines[0]).get("journal_generation") if lines else None
+        except (SyntaxError, ValueError, AttributeError) as e:
+            # Keep the journal for analysis. The next save starts a new one.
+            corrupt_path = path.parent / (path.name + ".corrupt")
+            self._logger.exception("Ignoring journal %s with corrupt header, moved it to %s: %s" %
+                                   (path, corrupt_path, e))
+            path.rename(corrupt_path)
+            return events
+
+        if generation != self._journal_generation:
+            self._logger.info("Ignoring outdated journal %s." % path)
+            return events
+
+        entries = lines[1:]
+        events_by_id = {event["id"]: event for event in events}
+        for nr, line in enumerate(entries):
+            try:
+                entry = ast.literal_eval(line)
+            except (SyntaxError, ValueError):
+                # Only the last entry may be incomplete, written while crashing
+                if nr < len(entries) - 1:
+                    raise
+                self._logger.warning("Ignoring incomplete last entry of journal %s." % path)
+                entries = entries[:nr]
+                break
+
+            for eid in entry["removed_event_ids"]:
+                events_by_id.pop(eid, None)
+            for event in entry["events"]:
+                events_by_id[event["id"]] = event
+            self._next_event_id = entry["next_event_id"]
+            self._rule_stats = entry["rule_stats"]
+            self._interval_starts = entry["interval_starts"]
+
+        self._logger.info("Replayed %d entries of journal %s." % (len(entries), path))
+        # The ids reflect the order of creation
+        return [events_by_id[eid] for eid in sorted(events_by_id)]
+
     # Called on Event Console initialization from status file to initialize
     # the current event limit state -> Sets internal counters which are
     # updated during runtime.
@@ -3303,7 +3726,7 @@ class EventStatus:
 
         self.num_existing_events_by_host = {}
         self.num_existing_events_by_rule = {}
-        for event in self._events:
+        for event in self._events.values():
             self._count_event_add(event)
 
     def _count_event_add(self, event):
@@ -3319,7 +3742,7 @@ class EventStatus:
             self.num_existing_events_by_rule[event["rule_id"]] += 1
 
     def _count_event_remove(self, event):
-        host_key = (event["host"], event["core_host"])
+        host_key = self._indexed_hosts[event["id"]]
 
         self.num_existing_events -= 1
         self.num_existing_events_by_host[host_key] -= 1
@@ -3329,7 +3752,8 @@ class EventStatus:
         self._perfcounters.count("events")
         event["id"] = self._next_event_id
         self._next_event_id += 1
-        self._events.append(event)
+        self._add_event(event)
+        self._changed_event_ids.add(event["id"])
         self.num_existing_events += 1
         self._count_event_add(event)
         self._history.add(event, "NEW")
@@ -3343,21 +3767,21 @@ class EventStatus:
 
     def remove_event(self, event):
         try:
-            self._events.remove(event)
-            self._count_event_remove(event)
-        except ValueError:
+            self._remove_event_by_id(event["id"])
+        except KeyError:
             self._logger.exception("Cannot remove event %d: not present" % event["id"])
 
     # protected by self.lock
-    def _remove_event_by_nr(self, index):
-        event = self._events.pop(index)
-        self._count_event_remove(event)
+    def _remove_event_by_id(self, eid):
+        self._count_event_remove(self._events[eid])
+        self._pop_event(eid)
 
     # protected by self.lock
     def remove_oldest_event(self, ty, event):
         if ty == "overall":
             self._logger.log(VERBOSE, "  Removing oldest event")
-            self._remove_event_by_nr(0)
+            if self._events:
+                self._remove_event_by_id(next(iter(self._events)))
         elif ty == "by_rule":
             self._logger.log(VERBOSE, "  Removing oldest event of rule \"%s\"", event["rule_id"])
             self._remove_oldest_event_of_rule(event["rule_id"])
@@ -3367,17 +3791,15 @@ class EventStatus:
 
     # protected by self.lock
     def _remove_oldest_event_of_rule(self, rule_id):
-        for event in self._events:
-            if event["rule_id"] == rule_id:
-                self.remove_event(event)
-                return
+        events = self._events_by_rule.get(rule_id)
+        if events:
+            self._remove_event_by_id(next(iter(events)))
 
     # protected by self.lock
     def _remove_oldest_event_of_host(self, hostname):
-        for event in self._events:
-            if event["host"] == hostname:
-                self.remove_event(event)
-                return
+        events = self._sorted_index_entry(self._events_by_host, self._unsorted_host_keys, hostname)
+        if events:
+            self._remove_event_by_id(next(iter(events)))
 
     # protected by self.lock
     def get_num_existing_events_by(self, ty, event):
@@ -3393,56 +3815,61 @@ class EventStatus:
     # of the same "breed" as a new event.
     def cancel_events(self, event_server, event_columns, new_event, match_groups, rule):
         with self.lock:
-            to_delete = []
-            for nr, event in enumerate(self._events):
-                if event["rule_id"] == rule["id"]:
-                    if self.cancelling_match(match_groups, new_event, event, rule):
-                        # Fill a few fields of the cancelled event with data from
-                        # the cancelling event so that action scripts have useful
-                        # values and the logfile entry if more relevant.
-                        previous_phase = event["phase"]
-                        event["phase"] = "closed"
-                        # TODO: Why do we use OK below and not new_event["state"]???
-                        event["state"] = 0  # OK
-                        event["text"] = new_event["text"]
-                        # TODO: This is a hack and partial copy-n-paste from rewrite_events...
-                        if "set_text" in rule:
-                            event["text"] = replace_groups(rule["set_text"], event["text"],
-                                                           match_groups)
-                        event["time"] = new_event["time"]
-                        event["last"] = new_event["time"]
-                        event["priority"] = new_event["priority"]
-                        self._history.add(event, "CANCELLED")
-                        actions = rule.get("cancel_actions", [])
-                        if actions:
-                            if previous_phase != "open" \
-                               and rule.get("cancel_action_phases", "always") == "open":
-                                self._logger.info(
-                                    "Do not execute cancelling actions, event %s's phase "
-                                    "is not 'open' but '%s'" % (event["id"], previous_phase))
-                            else:
-                                do_event_actions(self._history,
-                                                 self.settings,
-                                                 self._config,
-                                                 self._logger,
-                                                 event_server,
-                                                 event_columns,
-                                                 actions,
-                                                 event,
-                                                 is_cancelling=True)
-
-                        to_delete.append(nr)
-
-            for nr in to_delete[::-1]:
-                self._remove_event_by_nr(nr)
-
-    def cancelling_match(self, match_groups, new_event, event, rule):
-        debug = self._config["debug_rules"]
+            if self._config["debug_rules"]:
+                # Log the reason for all events of the rule that are not cancelled
+                candidates = self.events_of_rule(rule["id"])
+            else:
+                # Only events of the same host are cancelled, see cancelling_match()
+                candidates = self.events_of_rule_and_host(
+                    rule["id"], self._cancelling_host(match_groups, new_event, rule))
 
+            to_delete = []
+            for event in candidates:
+                if self.cancelling_match(match_groups, new_event, event, rule):
+                    # Fill a few fields of the cancelled event with data from
+                    # the cancelling event so that action scripts have useful
+                    # values and the logfile entry if more relevant.
+                    previous_phase = event["phase"]
+                    event["phase"] = "closed"
+                    # TODO: Why do we use OK below and not new_event["state"]???
+                    event["state"] = 0  # OK
+                    event["text"] = new_event["text"]
+                    # TODO: This is a hack and partial copy-n-paste from rewrite_events...
+                    if "set_text" in rule:
+                        event["text"] = replace_groups(rule["set_text"], event["text"],
+                                                       match_groups)
+                    event["time"] = new_event["time"]
+                    event["last"] = new_event["time"]
+                    event["priority"] = new_event["priority"]
+                    self._history.add(event, "CANCELLED")
+                    actions = rule.get("cancel_actions", [])
+                    if actions:
+                        if previous_phase != "open" \
+                           and rule.get("cancel_action_phases", "always") == "open":
+                            self._logger.info(
+                                "Do not execute cancelling actions, event %s's phase "
+                                "is not 'open' but '%s'" % (event["id"], previous_phase))
+                        else:
+                            do_event_actions(self._history,
+                                             self.settings,
+                                             self._config,
+                                             self._logger,
+                                             event_server,
+                                             event_columns,
+                                             actions,
+                                             event,
+                                             is_cancelling=True)
+
+                    to_delete.append(event)
+
+            for event in to_delete:
+                self._remove_event_by_id(event["id"])
+
+    def _cancelling_host(self, match_groups, new_event, rule):
         # The match_groups of the canceling match only contain the *_ok match groups
         # Since the rewrite definitions are based on the positive match, we need to
         # create some missing keys. O.o
-        for key in match_groups.keys():
+        for key in list(match_groups.keys()):
             if key.endswith("_ok"):
                 match_groups[key[:-3]] = match_groups[key]
 
@@ -3452,7 +3879,12 @@ class EventStatus:
         host = new_event["host"]
         if "set_host" in rule:
             host = replace_groups(rule["set_host"], host, match_groups)
+        return host
+
+    def cancelling_match(self, match_groups, new_event, event, rule):
+        debug = self._config["debug_rules"]
 
+        host = self._cancelling_host(match_groups, new_event, rule)
         if event["host"] != host:
             if debug:
                 self._logger.info("Do not cancel event %d: host is not the same (%s != %s)" %
@@ -3529,10 +3961,11 @@ class EventStatus:
                 preserve["contact"] = found["contact"]
         found.update(event)
         found.update(preserve)
+        self.event_changed(found)
 
     def count_expected_event(self, event_server, event):
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"] and ev["phase"] == "counting":
+        for ev in self.events_of_rule(event["rule_id"]):
+            if ev["phase"] == "counting":
                 self.count_event_up(ev, event)
                 return
 
@@ -3547,31 +3980,35 @@ class EventStatus:
         # we do never modify events that are already in the state "open"
         # since the event has been created because the count was too
         # low in the specified period of time.
-        for ev in self._events:
-            if ev["rule_id"] == event["rule_id"]:
-                if ev["phase"] == "ack" and not count["count_ack"]:
-                    continue  # skip acknowledged events
+        if count["separate_host"]:
+            candidates = self.events_of_rule_and_host(event["rule_id"], event["host"])
+        else:
+            candidates = self.events_of_rule(event["rule_id"])
 
-                if count["separate_host"] and ev["host"] != event["host"]:
-                    continue  # treat events with separated hosts separately
+        for ev in candidates:
+            if ev["phase"] == "ack" and not count["count_ack"]:
+                continue  # skip acknowledged events
 
-                if count["separate_application"] and ev["application"] != event["application"]:
-                    continue  # same for application
+            if count["separate_host"] and ev["host"] != event["host"]:
+                continue  # treat events with separated hosts separately
 
-                if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
-                    continue
+            if count["separate_application"] and ev["application"] != event["application"]:
+                continue  # same for application
 
-                if count.get("count_duration"
-                            ) is not None and ev["first"] + count["count_duration"] < event["time"]:
-                    # Counting has been discontinued on this event after a certain time
-                    continue
+            if count["separate_match_groups"] and ev["match_groups"] != event["match_groups"]:
+                continue
+
+            if count.get("count_duration"
+                        ) is not None and ev["first"] + count["count_duration"] < event["time"]:
+                # Counting has been discontinued on this event after a certain time
+                continue
 
-                if ev["host_in_downtime"] != event["host_in_downtime"]:
-                    continue  # treat events with different downtime states separately
+            if ev["host_in_downtime"] != event["host_in_downtime"]:
+                continue  # treat events with different downtime states separately
 
-                found = ev
-                self.count_event_up(found, event)
-                break
+            found = ev
+            self.count_event_up(found, event)
+            break
         else:
             event["count"] = 1
             event["phase"] = "counting"
@@ -3586,18 +4023,17 @@ class EventStatus:
 
     # locked with self.lock
     def delete_event(self, event_id, user):
-        for nr, event in enumerate(self._events):
-            if event["id"] == event_id:
-                event["phase"] = "closed"
-                if user:
-                    event["owner"] = user
-                self._history.add(event, "DELETE", user)
-                self._remove_event_by_nr(nr)
-                return
-        raise MKClientError("No event with id %s" % event_id)
+        event = self._events.get(event_id)
+        if event is None:
+            raise MKClientError("No event with id %s" % event_id)
+        event["phase"] = "closed"
+        if user:
+            event["owner"] = user
+        self._history.add(event, "DELETE", user)
+        self._remove_event_by_id(event_id)
 
     def get_events(self):
-        return self._events
+        return self.events()
 
     def get_rule_stats(self):
         return sorted(self._rule_stats.items(), key=lambda x: x[0])
@@ -3989,7 +4425,7 @@ def main() -> None:
         os.close(pipe)  # Close pipe
 
         logger.log(VERBOSE, "Saving final event state")
-        event_status.save_status()
+        event_status.save_status(compact=True)
 
         logger.log(VERBOSE, "Cleaning up sockets")
         settings.paths.unix_socket.value.unlink()
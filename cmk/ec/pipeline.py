@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Pipelined processing of incoming messages
+
+Without the pipeline the EventServer thread receives, parses and matches each
+message and applies the resulting state changes before it reads the next
+message from its sockets. During a burst of messages the kernel buffers of the
+sockets overflow and messages are lost.
+
+With the pipeline the EventServer thread only receives the messages and puts
+them into a bounded queue. The messages are parsed and matched against the
+rules by a pool of worker processes. The state changes are applied by a single
+thread in the order the messages have been received.
+
+The event daemon is multithreaded, so the workers are not forked from it. They
+are started by a fork server and create their own event server from the
+configuration and the rules of the daemon.
+"""
+
+import collections
+import multiprocessing
+import queue
+import signal
+import threading
+import time
+from logging import Logger
+from typing import Any, Callable, Deque, List, Optional, Tuple
+
+# The event server of the worker processes, created by _init_worker()
+_worker_event_server: Any = None
+
+
+def _init_worker(make_event_server: Callable[..., Any], args: Tuple) -> None:
+    # The signal handlers of the event daemon must not be executed in the workers
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    global _worker_event_server
+    _worker_event_server = make_event_server(*args)
+
+
+def _preprocess_raw_lines(data: bytes, address: Optional[Any]) -> List[Any]:
+    return _worker_event_server.preprocess_raw_lines(data, address)
+
+
+# Either raw lines received from a socket or a handler processing a message
+_Item = Tuple[float, Optional[bytes], Optional[Any], Optional[Callable[[], None]]]
+
+
+class EventPipeline:
+    """Distributes the received messages to the workers and applies the results
+
+    The event server needs to provide:
+
+    rules_generation      changes whenever the rules are compiled
+    pipeline_worker_setup  the rules generation and how the workers create
+                          their event server for it
+    preprocess_raw_lines  parses and matches the lines, called by the workers
+    process_preprocessed_lines  applies the results of preprocess_raw_lines or
+                          processes the lines again in case the rules changed
+    process_raw_lines     processes the lines without the workers
+    process_raw_data      processes a message with the given handler
+    """
+    queue_size = 10000
+
+    def __init__(self, logger: Logger, event_server: Any, perfcounters: Any,
+                 num_workers: int) -> None:
+        super().__init__()
+        self._logger = logger
+        self._event_server = event_server
+        self._perfcounters = perfcounters
+        self._num_workers = num_workers
+        # Number of batches that are processed by the workers at the same time
+        self._max_pending = 4 * num_workers
+        self._queue: 'queue.Queue[Optional[_Item]]' = queue.Queue(maxsize=self.queue_size)
+        self._pending: Deque[Tuple[_Item, int, Any]] = collections.deque()
+        self._pool: Any = None
+        self._pool_generation: Optional[int] = None
+        self._thread = threading.Thread(target=self._run, name="EventPipeline")
+
+    def start(self) -> None:
+        self._logger.info("Starting event processing pipeline with %d workers" % self._num_workers)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Processes all received messages and terminates the workers"""
+        self._queue.put(None)
+        self._thread.join()
+        self._logger.info("Stopped event processing pipeline")
+
+    def queue_length(self) -> int:
+        return self._queue.qsize() + len(self._pending)
+
+    def put_lines(self, data: bytes, address: Optional[Any]) -> None:
+        self._put((time.time(), data, address, None))
+
+    def put_handler(self, handler: Callable[[], None]) -> None:
+        self._put((time.time(), None, None, handler))
+
+    def _put(self, item: _Item) -> None:
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            # Stop receiving until the pipeline has caught up. The messages are
+            # buffered by the kernel (and UDP messages may be dropped there).
+            self._perfcounters.count("pipeline_stalls")
+            self._queue.put(item)
+
+    def _run(self) -> None:
+        try:
+            while True:
+                try:
+                    # Wait for new items only in case no results are pending
+                    item = self._queue.get(block=not self._pending)
+                except queue.Empty:
+                    self._apply_oldest()
+                    continue
+
+                if item is None:
+                    break
+
+                self._submit(item)
+                if len(self._pending) >= self._max_pending:
+                    self._apply_oldest()
+
+            while self._pending:
+                self._apply_oldest()
+        finally:
+            self._close_pool()
+
+    def _submit(self, item: _Item) -> None:
+        _received, data, address, _handler = item
+        if data is None:
+            self._pending.append((item, 0, None))
+            return
+
+        if self._event_server.rules_generation != self._pool_generation:
+            # The workers need the new rules, so they are started again
+            self._close_pool()
+            self._open_pool()
+        generation = self._pool_generation
+        assert generation is not None
+        self._pending.append(
+            (item, generation, self._pool.apply_async(_preprocess_raw_lines, (data, address))))
+
+    def _apply_oldest(self) -> None:
+        (received, data, address, handler), generation, result = self._pending.popleft()
+        try:
+            if handler is not None:
+                self._event_server.process_raw_data(handler)
+            else:
+                assert data is not None
+                self._event_server.process_preprocessed_lines(generation, result.get(), data,
+                                                              address)
+        except Exception as e:
+            self._logger.exception("Exception in event processing pipeline: %s" % e)
+        self._perfcounters.count_time("pipeline", time.time() - received)
+
+    def _open_pool(self) -> None:
+        # Forking the multithreaded event daemon could copy locks held by other threads
+        generation, make_event_server, args = self._event_server.pipeline_worker_setup()
+        self._pool = multiprocessing.get_context("forkserver").Pool(
+            self._num_workers,
+            initializer=_init_worker,
+            initargs=(make_event_server, args),
+        )
+        self._pool_generation = generation
+
+    def _close_pool(self) -> None:
+        # Results of the old pool that are still pending would be lost
+        while self._pending:
+            self._apply_oldest()
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+        self._pool = None
+        self._pool_generation = None
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Literal prefilter for the rules of the Event Console
+
+Most regular expressions of the rules contain literal text that needs to be
+contained in a message to match, e.g. "Disk .* is full" can only match texts
+containing "disk " or " is full". The prefilter extracts such literals from the
+message, host and application conditions of the rules. For an event it checks
+which literals are contained in its fields and drops the rules that cannot
+match. The remaining rules are matched as before, so the result is exactly the
+same as without the prefilter.
+
+Only ASCII literals are used. The fields of the event are case folded in a way
+that every character matching an ASCII character case insensitively, is folded
+to the lower case ASCII character.
+"""
+
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Set, Tuple
+
+try:
+    import re._parser as sre_parse  # type: ignore[import]  # Python >= 3.11
+except ImportError:
+    import sre_parse  # type: ignore[no-redef]
+
+# Not available in older Python versions
+_ATOMIC_GROUP = getattr(sre_parse, "ATOMIC_GROUP", None)
+_POSSESSIVE_REPEAT = getattr(sre_parse, "POSSESSIVE_REPEAT", None)
+
+# Characters that match "i" or "s" case insensitively, but are not lowered to them
+_FOLD_TABLE = {0x130: "i", 0x131: "i", 0x17f: "s"}
+
+# The event fields and the rule conditions that are checked against them. A rule
+# can only match in case one of the conditions of a field matches.
+_FIELDS = [
+    ("text", ("match", "match_ok")),
+    ("host", ("match_host",)),
+    ("application", ("match_application", "cancel_application")),
+]
+
+# One of the literals needs to be contained in the field
+Literals = FrozenSet[str]
+
+
+def fold(text: str) -> str:
+    return text.translate(_FOLD_TABLE).lower()
+
+
+def required_literals(pattern: Any) -> Optional[Literals]:
+    """Returns literals of which at least one is contained in every match of the pattern
+
+    The pattern is either a compiled regex or a lower case string that needs to be
+    contained in the text, as used by the rules. None is returned in case there are
+    no such literals."""
+    if isinstance(pattern, str):
+        return frozenset([pattern]) if pattern and pattern.isascii() else None
+
+    try:
+        parsed = sre_parse.parse(pattern.pattern, pattern.flags)
+    except Exception:
+        return None
+    return _required_literals(parsed)
+
+
+def _required_literals(subpattern: Iterable[Tuple[Any, Any]]) -> Optional[Literals]:
+    candidates: List[Literals] = []
+    run: List[str] = []
+    for op, av in subpattern:
+        if op is sre_parse.LITERAL and av < 128:
+            run.append(chr(av).lower())
+            continue
+
+        if run:
+            candidates.append(frozenset(["".join(run)]))
+            run = []
+
+        literals: Optional[Literals] = None
+        if op is sre_parse.SUBPATTERN:
+            literals = _required_literals(av[-1])
+        elif op is _ATOMIC_GROUP:
+            literals = _required_literals(av)
+        elif op is sre_parse.BRANCH:
+            branches = [_required_literals(branch) for branch in av[1]]
+            if all(branches):
+                literals = frozenset().union(*branches)  # type: ignore[arg-type]
+        elif op in (sre_parse.MAX_REPEAT, sre_parse.MIN_REPEAT, _POSSESSIVE_REPEAT):
+            min_count, _max_count, item = av
+            if min_count >= 1:
+                literals = _required_literals(item)
+
+        if literals:
+            candidates.append(literals)
+
+    if run:
+        candidates.append(frozenset(["".join(run)]))
+
+    if not candidates:
+        return None
+    # The shortest literal of the alternatives is the least selective one
+    return max(candidates, key=lambda literals: min(len(l) for l in literals))
+
+
+def rule_literals(rule: Dict[str, Any]) -> Dict[str, Literals]:
+    """Returns the literals of the fields that can be prefiltered for the rule"""
+    if rule.get("invert_matching"):
+        return {}
+
+    result: Dict[str, Literals] = {}
+    for field, keys in _FIELDS:
+        if field == "text" and "match" not in rule:
+            continue  # Matches every text
+        patterns = [rule[key] for key in keys if key in rule]
+        if not patterns:
+            continue
+
+        field_literals: Set[str] = set()
+        for pattern in patterns:
+            literals = required_literals(pattern)
+            if literals is None:
+                break
+            field_literals |= literals
+        else:
+            result[field] = frozenset(field_literals)
+    return result
+
+
+class RulePrefilter:
+    """Drops the rules that cannot match an event
+
+    The literals of all rules are checked once per event. The rules of a rule pack
+    need to be contiguous, otherwise dropping rules would change the skipping of
+    rule packs."""
+    def __init__(self, rules: Iterable[Dict[str, Any]]) -> None:
+        super().__init__()
+        # Rules (by id()) by the literals they need
+        self._rules_by_literal: Dict[str, Dict[str, Set[int]]] = {
+            field: {} for field, _keys in _FIELDS
+        }
+        # Rules (by id()) that can be prefiltered by the field
+        self._filtered_rules: Dict[str, Set[int]] = {field: set() for field, _keys in _FIELDS}
+        for rule in rules:
+            for field, literals in rule_literals(rule).items():
+                self._filtered_rules[field].add(id(rule))
+                for literal in literals:
+                    self._rules_by_literal[field].setdefault(literal, set()).add(id(rule))
+
+    def num_filtered_rules(self) -> int:
+        filtered_rules: Set[int] = set()
+        return len(filtered_rules.union(*self._filtered_rules.values()))
+
+    def num_literals(self) -> int:
+        return sum(len(literals) for literals in self._rules_by_literal.values())
+
+    def excluded_rules(self, event: Dict[str, Any]) -> Set[int]:
+        """Returns the rules (by id()) that cannot match the event"""
+        excluded: Set[int] = set()
+        for field, _keys in _FIELDS:
+            filtered_rules = self._filtered_rules[field]
+            if not filtered_rules:
+                continue
+            value = fold(event[field])
+            possible: Set[int] = set()
+            for literal, rules in self._rules_by_literal[field].items():
+                if literal in value:
+                    possible |= rules
+            excluded |= filtered_rules - possible
+        return excluded
+
+    def candidates(self, rules: List[Dict[str, Any]], event: Dict[str, Any]) -> List[Dict[str, Any]]:
+        excluded = self.excluded_rules(event)
+        if not excluded:
+            return rules
+        return [rule for rule in rules if id(rule) not in excluded]
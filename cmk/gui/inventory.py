@@ -18,6 +18,7 @@ import dicttoxml  # type: ignore[import]
 import livestatus
 
 import cmk.utils.paths
+from cmk.utils.inventory_archive import InventoryArchive
 from cmk.utils.structured_data import StructuredDataTree, Container, Numeration, Attributes
 from cmk.utils.exceptions import (
     MKException,
@@ -154,11 +155,11 @@ def get_history_deltas(hostname, search_timestamp=None):
         return [], []
 
     latest_timestamp = str(int(os.stat(inventory_path).st_mtime))
-    inventory_archive_dir = "%s/inventory_archive/%s" % (cmk.utils.paths.var_dir, hostname)
-    try:
-        archived_timestamps = sorted(os.listdir(inventory_archive_dir))
-    except OSError:
+    inventory_archive_dir = Path(cmk.utils.paths.var_dir, "inventory_archive", hostname)
+    if not inventory_archive_dir.is_dir():
         return [], []
+    archive = InventoryArchive(inventory_archive_dir, Path(inventory_path))
+    archived_timestamps = archive.timestamps()
 
     all_timestamps = archived_timestamps + [latest_timestamp]
     previous_timestamp = None
@@ -188,11 +189,17 @@ def get_history_deltas(hostname, search_timestamp=None):
                 return
             tree_lookup[timestamp] = inventory_tree
         else:
-            inventory_archive_path = "%s/%s" % (inventory_archive_dir, timestamp)
-            tree_lookup[timestamp] = _filter_tree(
-                StructuredDataTree().load_from(inventory_archive_path))
+            tree_lookup[timestamp] = _filter_tree(archive.load_tree(timestamp))
         return tree_lookup[timestamp]
 
+    def get_delta(previous_timestamp, timestamp):
+        # The differences stored in the archive are the ones of the unfiltered trees
+        if previous_timestamp is not None and _get_permitted_inventory_paths() is None:
+            stored_delta = archive.diff(previous_timestamp)
+            if stored_delta is not None:
+                return stored_delta
+        return get_tree(timestamp).compare_with(get_tree(previous_timestamp))
+
     corrupted_history_files = []
     delta_history = []
     for _idx, timestamp in enumerate(required_timestamps):
@@ -214,9 +221,7 @@ def get_history_deltas(hostname, search_timestamp=None):
             continue
 
         try:
-            previous_tree = get_tree(previous_timestamp)
-            current_tree = get_tree(timestamp)
-            delta_data = current_tree.compare_with(previous_tree)
+            delta_data = get_delta(previous_timestamp, timestamp)
             new, changed, removed, delta_tree = delta_data
             if new or changed or removed:
                 store.save_file(
@@ -239,8 +244,11 @@ def get_short_inventory_filepath(hostname):
 
 
 def get_short_inventory_history_filepath(hostname, timestamp):
-    return Path(cmk.utils.paths.inventory_archive_dir).joinpath(
-        "%s/%s" % (hostname, timestamp)).relative_to(cmk.utils.paths.omd_root)
+    archive = InventoryArchive(
+        Path(cmk.utils.paths.inventory_archive_dir, hostname),
+        Path(cmk.utils.paths.inventory_output_dir, hostname),
+    )
+    return archive.path(timestamp).relative_to(cmk.utils.paths.omd_root)
 
 
 def parent_path(invpath):
@@ -536,8 +544,8 @@ class InventoryHousekeeping:
         except OSError:
             pass
 
-        for filename in [
-                x for x in (self._inventory_archive_path / hostname).iterdir() if not x.is_dir()
-        ]:
-            timestamps.add(filename.name)
+        # The archived versions are stored completely or as deltas
+        archive = InventoryArchive(self._inventory_archive_path / hostname,
+                                   self._inventory_path / hostname)
+        timestamps.update(archive.timestamps())
         return timestamps
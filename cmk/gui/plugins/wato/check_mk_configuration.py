@@ -2431,6 +2431,55 @@ class ConfigVariablePiggybackMaxCachefileAge(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariablePiggybackSegmentStore(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "piggyback_segment_store"
+
+    def valuespec(self):
+        return Checkbox(
+            title=_("Store piggyback data in one file per source host"),
+            label=_("Use one segment file per source host"),
+            help=_("Per default the piggyback data of every piggybacked host is stored in a "
+                   "separate file. Source hosts that deliver data for thousands of piggybacked "
+                   "hosts cause a lot of file system operations this way. With this option the "
+                   "data of all piggybacked hosts of a source host is stored in a single file "
+                   "containing an index. Existing piggyback files are migrated automatically "
+                   "when the source host delivers new data."),
+        )
+
+
+@config_variable_registry.register
+class ConfigVariableItemStateStore(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupCheckExecution
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "item_state_store"
+
+    def valuespec(self):
+        return Checkbox(
+            title=_("Store item states of all hosts in shared files"),
+            label=_("Use a shared item state store"),
+            help=_("Checks remember values like counters between two check cycles. Per default "
+                   "these item states are stored in one file per host, which is completely "
+                   "rewritten in every check cycle. With this option the item states of all "
+                   "hosts are stored in a fixed number of shared files and only the changed "
+                   "values are written. Existing item states are migrated automatically. When "
+                   "you disable this option again, the counters of the checks are initialized "
+                   "anew."),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableCheckMKPerfdataWithTimes(ConfigVariable):
     def group(self):
@@ -2489,6 +2538,8 @@ def transform_snmp_backend_default_forth(backend):
         return SNMPBackendEnum.PYSNMP
     if backend in [False, "classic"]:
         return SNMPBackendEnum.CLASSIC
+    if backend == "asyncio":
+        return SNMPBackendEnum.ASYNCIO
     raise MKConfigError("SNMPBackendEnum %r not implemented" % backend)
 
 
@@ -2499,6 +2550,8 @@ def transform_snmp_backend_back(backend):
         return "classic"
     if backend == SNMPBackendEnum.INLINE:
         return "inline"
+    if backend == SNMPBackendEnum.ASYNCIO:
+        return "asyncio"
     raise MKConfigError("SNMPBackendEnum %r not implemented" % backend)
 
 
@@ -2521,6 +2574,7 @@ class ConfigVariableChooseSNMPBackend(ConfigVariable):
                     (SNMPBackendEnum.CLASSIC, _("Use Classic SNMP Backend")),
                     (SNMPBackendEnum.INLINE, _("Use Inline SNMP Backend")),
                     (SNMPBackendEnum.PYSNMP, _("Use Inline SNMP (PySNMP) Backend (experimental)")),
+                    (SNMPBackendEnum.ASYNCIO, _("Use Asyncio SNMP Backend (experimental)")),
                 ],
                 help=
                 _("By default Checkmk uses command line calls of Net-SNMP tools like snmpget or "
@@ -2529,7 +2583,9 @@ class ConfigVariableChooseSNMPBackend(ConfigVariable):
                   "which calls the respective libraries directly via its python bindings. This "
                   "should increase the performance of SNMP checks in a significant way. Both "
                   "SNMP modes are features which improve the performance for large installations and are "
-                  "only available via our subscription."),
+                  "only available via our subscription. The Asyncio SNMP Backend is available in all "
+                  "editions: It talks SNMP directly from Checkmk without the Net-SNMP tools and "
+                  "fetches the columns of a table concurrently."),
             ),
             forth=transform_snmp_backend_default_forth,
             back=transform_snmp_backend_back,
@@ -2716,6 +2772,30 @@ class ConfigVariableInventoryCheckAutotrigger(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableSNMPScanProcesses(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupServiceDiscovery
+
+    def domain(self):
+        return ConfigDomainCore
+
+    def ident(self):
+        return "snmp_scan_processes"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Concurrent SNMP scans"),
+            help=_("When the service discovery of several hosts fetches new SNMP data, e.g. "
+                   "during a bulk discovery with a full scan, the SNMP hosts are scanned "
+                   "concurrently in the given number of processes before their services are "
+                   "discovered. A value of 1 scans the hosts one after the other during their "
+                   "discovery."),
+            minvalue=1,
+            unit=_("processes"),
+        )
+
+
 #.
 #   .--Rulesets------------------------------------------------------------.
 #   |                ____        _                _                        |
@@ -4469,6 +4549,8 @@ def transform_snmp_backend_hosts_forth(backend):
         return SNMPBackendEnum.PYSNMP
     if backend in [True, "classic"]:
         return SNMPBackendEnum.CLASSIC
+    if backend == "asyncio":
+        return SNMPBackendEnum.ASYNCIO
     raise MKConfigError("SNMPBackendEnum %r not implemented" % backend)
 
 
@@ -4480,6 +4562,7 @@ def _valuespec_snmp_backend():
                 (SNMPBackendEnum.INLINE, _("Use Inline SNMP Backend")),
                 (SNMPBackendEnum.PYSNMP, _("Use Inline SNMP (PySNMP) Backend (experimental)")),
                 (SNMPBackendEnum.CLASSIC, _("Use Classic Backend")),
+                (SNMPBackendEnum.ASYNCIO, _("Use Asyncio SNMP Backend (experimental)")),
             ],
         ),
         forth=transform_snmp_backend_hosts_forth,
@@ -59,12 +59,25 @@ def states(user: Optional[LoggedInUser] = None,
 
 
 def disconnect() -> None:
-    """Actively closes all Livestatus connections."""
+    """Actively closes all Livestatus connections.
+
+    The sockets of sites with persistent connections are handed back to the connection pool."""
     logger.debug("Disconnecing site connections")
-    g.pop('live', None)
+    live = g.pop('live', None)
+    if live is not None:
+        live.release()
     g.pop('site_status', None)
 
 
+@contextmanager
+def cleanup_connections() -> Iterator[None]:
+    """Closes the Livestatus connections of the request once it has been processed"""
+    try:
+        yield
+    finally:
+        disconnect()
+
+
 # TODO: This should live somewhere else, it's just a random helper...
 def all_groups(what: str) -> List[Tuple[str, str]]:
     """Returns a list of host/service/contact groups (pairs of name/alias)
@@ -3396,6 +3396,32 @@ class ConfigVariableEventConsoleRuleOptimizer(ConfigVariable):
         )
 
 
+@config_variable_registry.register
+class ConfigVariableEventConsoleEventProcessingWorkers(ConfigVariable):
+    def group(self):
+        return ConfigVariableGroupEventConsoleGeneric
+
+    def domain(self):
+        return ConfigDomainEventConsole
+
+    def ident(self):
+        return "event_processing_workers"
+
+    def valuespec(self):
+        return Integer(
+            title=_("Worker processes for event processing"),
+            help=_("With the default of 0 the Event Console receives, parses and classifies "
+                   "the incoming messages one after another. When a burst of messages comes in, "
+                   "the receive buffers of the sockets may overflow and messages are lost. "
+                   "With worker processes, the Event Console only receives the messages and "
+                   "lets the workers parse them and match them against the rules in parallel. "
+                   "The resulting events are processed in the order the messages have been "
+                   "received. A change of this setting needs a restart of the Event Console."),
+            minvalue=0,
+            unit=_("processes"),
+        )
+
+
 @config_variable_registry.register
 class ConfigVariableEventConsoleActions(ConfigVariable):
     def group(self):
@@ -6,7 +6,7 @@
 """SNMP caching"""
 
 import os
-from typing import Dict, List, Optional
+from typing import Any, Dict, Optional
 
 import cmk.utils.cleanup
 import cmk.utils.paths
@@ -19,8 +19,8 @@ from .type_defs import OID, SNMPDecodedString, SNMPHostConfig
 _g_single_oid_hostname: Optional[HostName] = None
 _g_single_oid_ipaddress: Optional[HostAddress] = None
 _g_single_oid_cache: Optional[Dict[OID, Optional[SNMPDecodedString]]] = None
-# TODO: Move to StoredWalkSNMPBackend?
-_g_walk_cache: Dict[HostName, List[str]] = {}
+# The indexes of the stored walks used by the hosts (see StoredWalkSNMPBackend)
+_g_walk_cache: Dict[HostName, Any] = {}
 
 
 def initialize_single_oid_cache(snmp_config: SNMPHostConfig, from_disk: bool = False) -> None:
@@ -58,7 +58,7 @@ def single_oid_cache() -> Dict[OID, Optional[SNMPDecodedString]]:
     return _g_single_oid_cache
 
 
-def host_cache() -> Dict[HostName, List[str]]:
+def host_cache() -> Dict[HostName, Any]:
     return _g_walk_cache
 
 
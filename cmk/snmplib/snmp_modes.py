@@ -90,6 +90,60 @@ def get_single_oid(oid: str,
     return decoded_value
 
 
+def get_multiple_oids(oids: Iterable[str],
+                      *,
+                      section_name: Optional[SectionName] = None,
+                      backend: SNMPBackend) -> Dict[OID, Optional[SNMPDecodedString]]:
+    """Like get_single_oid() for several OIDs, the uncached ones are fetched at once
+
+    The OIDs that could not be fetched because of an error are None, but are not added
+    to the cache. So they are fetched again by the next request."""
+    normalized: List[OID] = []
+    for oid in oids:
+        if oid[0] != '.':
+            if cmk.utils.debug.enabled():
+                raise MKGeneralException("OID definition '%s' does not begin with a '.'" % oid)
+            oid = '.' + oid
+        normalized.append(oid)
+
+    cache = snmp_cache.single_oid_cache()
+    missing = [oid for oid in dict.fromkeys(normalized) if oid not in cache]
+    if missing:
+        # Like get_single_oid(): With multiple SNMP contexts, each OID is fetched from the
+        # contexts until the first answer is received.
+        console.vverbose("       Getting OIDs %s\n" % ", ".join(missing))
+        values: List[Optional[SNMPRawValue]] = [None] * len(missing)
+        answered = [False] * len(missing)
+        for context_name in backend.config.snmpv3_contexts_of(section_name):
+            unanswered = [index for index, value in enumerate(values) if value is None]
+            if not unanswered:
+                break
+            try:
+                answers = backend.get_many(
+                    oids=[missing[index] for index in unanswered],
+                    context_name=context_name,
+                )
+            except Exception:
+                if cmk.utils.debug.enabled():
+                    raise
+                continue
+            for index, value in zip(unanswered, answers):
+                values[index] = value
+                answered[index] = True
+
+        for oid, value, oid_answered in zip(missing, values, answered):
+            console.vverbose("       Got OID %s: " % oid)
+            if value is None:
+                console.vverbose("failed.\n")
+                if oid_answered:
+                    cache[oid] = None
+            else:
+                console.vverbose("%s%s%r%s\n" % (tty.bold, tty.green, value, tty.normal))
+                cache[oid] = backend.config.ensure_str(value)
+
+    return {oid: cache.get(oid) for oid in normalized}
+
+
 def walk_for_export(oid: OID, *, backend: SNMPBackend) -> SNMPRowInfoForStoredWalk:
     return _convert_rows_for_stored_walk(backend.walk(oid=oid))
 
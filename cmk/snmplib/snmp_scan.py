@@ -4,22 +4,62 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import contextlib
 import functools
-from typing import Collection, Iterable, Tuple, Set
+from typing import (
+    Collection,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+)
 
 import cmk.utils.tty as tty
 from cmk.utils.exceptions import MKGeneralException, MKSNMPError
 from cmk.utils.log import console
-from cmk.utils.type_defs import SectionName, SNMPDetectBaseType
+from cmk.utils.type_defs import HostAddress, HostName, SectionName, SNMPDetectBaseType
 
 import cmk.snmplib.snmp_cache as snmp_cache
 import cmk.snmplib.snmp_modes as snmp_modes
-from cmk.snmplib.type_defs import SNMPBackend
+from cmk.snmplib.type_defs import OID, SNMPBackend, SNMPContext, SNMPDecodedString
 from cmk.snmplib.utils import evaluate_snmp_detection
 
 SNMPScanSection = Tuple[SectionName, SNMPDetectBaseType]
 
 
+class SNMPScanResult(NamedTuple):
+    """The detected sections of a host, valid as long as the system description is the same"""
+    description: Dict[OID, Optional[SNMPDecodedString]]
+    sections: Dict[SectionName, bool]
+
+
+SNMPScanResults = Dict[Tuple[HostName, Optional[HostAddress]], SNMPScanResult]
+
+# The results of the SNMP scans while cached_scan_results() is active
+_scan_results: Optional[SNMPScanResults] = None
+
+
+@contextlib.contextmanager
+def cached_scan_results() -> Iterator[SNMPScanResults]:
+    """Remember the results of the SNMP scans, e.g. during the discovery of many hosts
+
+    A host is scanned only once. A further scan of the host only evaluates the sections
+    not scanned yet, unless the system object ID of the host has changed.
+    """
+    global _scan_results
+    previous = _scan_results
+    _scan_results = {}
+    try:
+        yield _scan_results
+    finally:
+        _scan_results = previous
+
+
 # gather auto_discovered check_plugin_names for this host
 def gather_available_raw_section_names(
     sections: Collection[SNMPScanSection],
@@ -61,34 +101,83 @@ def _snmp_scan(
     snmp_cache.initialize_single_oid_cache(backend.config)
     console.vverbose("  SNMP scan:\n")
 
+    scan_result = _previous_scan_result(backend)
     if missing_sys_description:
         _fake_description_object()
     else:
         _prefetch_description_object(backend=backend)
+    # Only a scan that got the system description is remembered
+    scan_result = _remember_scan_result(backend, scan_result)
 
-    found_sections = _find_sections(
-        sections,
-        on_error=on_error,
-        backend=backend,
-    )
+    sections = list(sections)
+    unknown_sections = [(name, specs) for name, specs in sections
+                        if name not in scan_result.sections]
+    if len(unknown_sections) < len(sections):
+        console.vverbose("       Using the results of a previous scan for %d sections\n" %
+                         (len(sections) - len(unknown_sections)))
+    found_unknown_sections: Set[SectionName] = set()
+    if unknown_sections:
+        failed_sections = _prefetch_detection_oids(unknown_sections, backend=backend)
+        found_unknown_sections = _find_sections(
+            unknown_sections,
+            on_error=on_error,
+            backend=backend,
+        )
+        # The sections are detected again by the next scan in case their OIDs failed
+        scan_result.sections.update((name, name in found_unknown_sections)
+                                    for name, _specs in unknown_sections
+                                    if name not in failed_sections)
+
+    found_sections = {
+        name for name, _specs in sections
+        if scan_result.sections.get(name, name in found_unknown_sections)
+    }
     _output_snmp_check_plugins("SNMP scan found", found_sections)
     snmp_cache.write_single_oid_cache(backend.config)
     return found_sections
 
 
+def _previous_scan_result(backend: SNMPBackend) -> Optional[SNMPScanResult]:
+    """The result of a previous scan of the host
+
+    The system description of the previous scan is used, so it is not fetched again."""
+    if _scan_results is None:
+        return None
+    scan_result = _scan_results.get((backend.hostname, backend.address))
+    if scan_result is not None:
+        for oid, value in scan_result.description.items():
+            if value is not None:
+                snmp_cache.single_oid_cache().setdefault(oid, value)
+    return scan_result
+
+
+def _remember_scan_result(
+    backend: SNMPBackend,
+    scan_result: Optional[SNMPScanResult],
+) -> SNMPScanResult:
+    description = {
+        oid: snmp_cache.single_oid_cache().get(oid) for oid in [OID_SYS_DESCR, OID_SYS_OBJ]
+    }
+    if scan_result is None or scan_result.description.get(OID_SYS_OBJ) != description[OID_SYS_OBJ]:
+        scan_result = SNMPScanResult(description, {})
+    if _scan_results is not None:
+        _scan_results[(backend.hostname, backend.address)] = scan_result
+    return scan_result
+
+
 def _prefetch_description_object(
     *,
     backend: SNMPBackend,
 ) -> None:
+    values = snmp_modes.get_multiple_oids(
+        [OID_SYS_DESCR, OID_SYS_OBJ],
+        backend=backend,
+    )
     for oid, name in [
         (OID_SYS_DESCR, "system description"),
         (OID_SYS_OBJ, "system object"),
     ]:
-        value = snmp_modes.get_single_oid(
-            oid,
-            backend=backend,
-        )
-        if value is None:
+        if values[oid] is None:
             raise MKSNMPError(
                 "Cannot fetch %s OID %s. Please check your SNMP "
                 "configuration. Possible reason might be: Wrong credentials, "
@@ -107,6 +196,67 @@ def _fake_description_object() -> None:
     snmp_cache.single_oid_cache()[OID_SYS_OBJ] = ""
 
 
+class _UnknownOID(Exception):
+    pass
+
+
+def _prefetch_detection_oids(
+    sections: Sequence[SNMPScanSection],
+    *,
+    backend: SNMPBackend,
+) -> Set[SectionName]:
+    """Fetch the OIDs needed for the detection of the sections in rounds
+
+    The detection of a section stops at the first condition deciding it, so the OIDs
+    needed are only known while evaluating it. Each round evaluates the sections up to
+    the first OID not known yet and fetches the OIDs of all sections at once.
+
+    Returns the sections needing an OID that could not be fetched because of an error.
+    """
+    def oid_value_getter(oid: str) -> Optional[SNMPDecodedString]:
+        oid = oid if oid.startswith(".") else "." + oid
+        try:
+            return snmp_cache.single_oid_cache()[oid]
+        except KeyError:
+            raise _UnknownOID(oid)
+
+    failed_oids: Set[OID] = set()
+    failed_sections: Set[SectionName] = set()
+    pending = list(sections)
+    while pending:
+        # The OIDs are fetched from the SNMP contexts of the sections needing them
+        unknown_oids: Dict[Tuple[SNMPContext, ...], Tuple[SectionName, List[OID]]] = {}
+        undecided = []
+        for name, specs in pending:
+            try:
+                evaluate_snmp_detection(
+                    detect_spec=specs,
+                    oid_value_getter=oid_value_getter,
+                )
+            except _UnknownOID as e:
+                if e.args[0] in failed_oids:
+                    failed_sections.add(name)
+                    continue
+                _name, oids = unknown_oids.setdefault(
+                    tuple(backend.config.snmpv3_contexts_of(name)), (name, []))
+                oids.append(e.args[0])
+                undecided.append((name, specs))
+            except Exception:
+                # Left to _find_sections()
+                pass
+
+        for section_name, oids in unknown_oids.values():
+            snmp_modes.get_multiple_oids(
+                oids,
+                section_name=section_name,
+                backend=backend,
+            )
+            failed_oids.update(oid for oid in oids if oid not in snmp_cache.single_oid_cache())
+        pending = undecided
+
+    return failed_sections
+
+
 def _find_sections(
     sections: Iterable[SNMPScanSection],
     *,
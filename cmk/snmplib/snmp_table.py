@@ -5,12 +5,31 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """Provide methods to get an snmp table with or without caching
 """
-from typing import Callable, Iterable, Iterator, List, MutableMapping, Optional, Set, Tuple
+from array import array
+from itertools import accumulate, chain
+import mmap
+import os
+import struct
+import time
+from typing import (
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
 
 from pathlib import Path
 from six import ensure_binary
 
 import cmk.utils.debug
+import cmk.utils.paths
 import cmk.utils.store as store
 from cmk.utils.exceptions import MKGeneralException
 from cmk.utils.log import console
@@ -34,6 +53,11 @@ ResultColumnsSanitized = List[Tuple[List[SNMPRawValue], SNMPValueEncoding]]
 ResultColumnsDecoded = List[List[SNMPDecodedValues]]
 
 
+class _CachedColumn(NamedTuple):
+    fetched_at: float
+    data: Union[bytes, memoryview]
+
+
 class WalkCache(MutableMapping[str, Tuple[bool, SNMPRowInfo]]):  # pylint: disable=too-many-ancestors
     """A cache on a per-fetchoid basis
 
@@ -43,30 +67,61 @@ class WalkCache(MutableMapping[str, Tuple[bool, SNMPRowInfo]]):  # pylint: disab
     The fetched data is always saved to a file *if* the respective OID is marked as being cached
     by the plugin using `OIDCached` (that is: if the save_to_cache attribute of the OID object
     is true).
+
+    All cached OIDs of a host are stored in one file, together with the time they have
+    been fetched. Loading the cache only reads the list of the cached OIDs, the walk of
+    an OID is decoded when it is accessed. The file is written once per fetch and only
+    in case OIDs to be cached have been fetched.
     """
-    __slots__ = ("_store", "_path")
+    __slots__ = ("_store", "_path", "_cached", "_fetched")
 
     def __init__(self, host_name: HostName):
         self._store: MutableMapping[str, Tuple[bool, SNMPRowInfo]] = {}
-        self._path = Path(cmk.utils.paths.var_dir, "snmp_cache", host_name)
+        # Loaded but not yet decoded walks
+        self._cached: Dict[str, _CachedColumn] = {}
+        # Fetch time of the walks to be saved
+        self._fetched: Dict[str, float] = {}
+        self._path = Path(cmk.utils.paths.var_dir, "snmp_cache", "%s.walks" % host_name)
 
     def __repr__(self) -> str:
         return "%s(%r)" % (type(self).__name__, self._store)
 
     def __getitem__(self, key: str) -> Tuple[bool, SNMPRowInfo]:
-        return self._store.__getitem__(key)
+        try:
+            return self._store.__getitem__(key)
+        except KeyError:
+            column = self._cached.pop(key)
+
+        try:
+            rowinfo = _decode_walk(column.data)
+        except Exception:
+            console.verbose(f"  Failed to load {key} from walk cache {self._path}\n")
+            if cmk.utils.debug.enabled():
+                raise
+            raise KeyError(key)
+
+        self._store[key] = (True, rowinfo)
+        return self._store[key]
 
     def __setitem__(self, key: str, value: Tuple[bool, SNMPRowInfo]) -> None:
+        self._cached.pop(key, None)
+        if value[0]:
+            self._fetched[key] = time.time()
         return self._store.__setitem__(key, value)
 
     def __delitem__(self, key: str) -> None:
-        return self._store.__delitem__(key)
+        self._fetched.pop(key, None)
+        if self._cached.pop(key, None) is None:
+            self._store.__delitem__(key)
+        else:
+            self._store.pop(key, None)
 
     def __iter__(self) -> Iterator[str]:
-        return self._store.__iter__()
+        yield from self._store
+        yield from (key for key in self._cached if key not in self._store)
 
     def __len__(self) -> int:
-        return self._store.__len__()
+        return len(self._store) + len(self._cached.keys() - self._store.keys())
 
     def load(
         self,
@@ -74,34 +129,169 @@ class WalkCache(MutableMapping[str, Tuple[bool, SNMPRowInfo]]):  # pylint: disab
         trees: Iterable[BackendSNMPTree],
     ) -> None:
         """Try to read the OIDs data from cache files"""
-        for tree in trees:
-            for oid in (o for o in tree.oids if o.save_to_cache):  # no point in reading otherwise
-
-                fetchoid = f"{tree.base}.{oid.column}"
-                path = self._path / fetchoid
-
-                console.vverbose(f"  Loading {fetchoid} from walk cache {path}\n")
-                try:
-                    read_walk = store.load_object_from_file(path)
-                except Exception:
-                    console.verbose(f"  Failed to load {fetchoid} from walk cache {path}\n")
-                    if cmk.utils.debug.enabled():
-                        raise
-                    continue
-
-                if read_walk is not None:
-                    self._store[fetchoid] = (oid.save_to_cache, read_walk)  # (True, ...)
+        fetchoids = {
+            f"{tree.base}.{oid.column}" for tree in trees for oid in tree.oids
+            if oid.save_to_cache  # no point in reading otherwise
+        }
+        if not fetchoids:
+            return
+
+        try:
+            cached = _read_walk_cache(self._path)
+        except Exception:
+            console.verbose(f"  Failed to load walk cache {self._path}\n")
+            if cmk.utils.debug.enabled():
+                raise
+            return
+
+        now = time.time()
+        for fetchoid in sorted(fetchoids & cached.keys()):
+            console.vverbose(f"  Loading {fetchoid} from walk cache {self._path} "
+                             f"(fetched {now - cached[fetchoid].fetched_at:.0f}s ago)\n")
+            self._cached[fetchoid] = cached[fetchoid]
 
     def save(self) -> None:
-        self._path.mkdir(parents=True, exist_ok=True)
-
-        for fetchoid, (save_flag, rowinfo) in self._store.items():
-            if not save_flag:
-                continue
+        if not self._fetched:
+            return
+
+        try:
+            # Keep the walks of the OIDs not fetched this time
+            cached = _read_walk_cache(self._path)
+        except Exception:
+            cached = {}
+
+        for fetchoid, fetched_at in self._fetched.items():
+            console.vverbose(f"  Saving walk of {fetchoid} to walk cache {self._path}\n")
+            cached[fetchoid] = _CachedColumn(fetched_at, _encode_walk(fetchoid,
+                                                                      self._store[fetchoid][1]))
+
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        store.save_bytes_to_file(self._path, _serialize_walk_cache(cached))
+        self._fetched.clear()
+
+
+# Layout of the walk cache file (numbers in native byte order):
+#
+#   header          magic, number of walks
+#   walks           for each walk: header (fetch time, size, length of the fetchoid),
+#                   the fetchoid and the encoded walk
+#
+# Layout of an encoded walk:
+#
+#   header          encoding of the OIDs, number of rows, length of the OID prefix
+#   OID prefix      the common prefix of all OIDs of the walk (usually the fetchoid)
+#   OIDs            the rest of the OIDs:
+#                   _OIDS_DELTAS: the differences of the last sub identifiers
+#                   _OIDS_TEXT: the length of the text and the text, one OID per line
+#   value offsets   the end offset of every value
+#   values          the raw values
+_WALK_CACHE_MAGIC = b"CMKSWC01"
+_WALK_CACHE_HEADER = struct.Struct("=8sQ")
+_CACHED_WALK_HEADER = struct.Struct("=dQH")
+_WALK_HEADER = struct.Struct("=BQH")
+_OFFSET = struct.Struct("=Q")
+_OIDS_DELTAS = 0
+_OIDS_TEXT = 1
+
+
+def _read_walk_cache(path: Path) -> Dict[str, _CachedColumn]:
+    try:
+        with path.open("rb") as f:
+            if not os.fstat(f.fileno()).st_size:
+                return {}
+            # The mapping stays valid, even if the file is replaced in the meantime
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except FileNotFoundError:
+        return {}
+
+    magic, num_walks = _WALK_CACHE_HEADER.unpack_from(data)
+    if magic != _WALK_CACHE_MAGIC:
+        raise ValueError("Invalid walk cache %s" % path)
+
+    view = memoryview(data)
+    offset = _WALK_CACHE_HEADER.size
+    cached = {}
+    for _index in range(num_walks):
+        fetched_at, size, fetchoid_length = _CACHED_WALK_HEADER.unpack_from(data, offset)
+        offset += _CACHED_WALK_HEADER.size
+        fetchoid = data[offset:offset + fetchoid_length].decode("utf-8")
+        offset += fetchoid_length
+        cached[fetchoid] = _CachedColumn(fetched_at, view[offset:offset + size])
+        offset += size
+    return cached
+
+
+def _serialize_walk_cache(cached: Dict[str, _CachedColumn]) -> bytes:
+    chunks = [_WALK_CACHE_HEADER.pack(_WALK_CACHE_MAGIC, len(cached))]
+    for fetchoid, (fetched_at, data) in sorted(cached.items()):
+        raw_fetchoid = fetchoid.encode("utf-8")
+        chunks.append(_CACHED_WALK_HEADER.pack(fetched_at, len(data), len(raw_fetchoid)))
+        chunks.append(raw_fetchoid)
+        chunks.append(bytes(data))
+    return b"".join(chunks)
+
+
+def _is_sub_id(text: str) -> bool:
+    return text.isdigit() and text.isascii() and (text == "0" or text[0] != "0")
+
+
+def _encode_walk(fetchoid: OID, rowinfo: SNMPRowInfo) -> bytes:
+    """Encode the walk of an OID, usually a column of a table
+
+    The OIDs of table columns usually differ in the last sub identifier only. In this
+    case only the differences of the last sub identifiers are stored."""
+    prefix = fetchoid + "."
+    suffixes = [oid[len(prefix):] for oid, _value in rowinfo if oid.startswith(prefix)]
+    if len(suffixes) != len(rowinfo):
+        prefix, suffixes = "", [oid for oid, _value in rowinfo]
+
+    if prefix and all(_is_sub_id(suffix) for suffix in suffixes):
+        sub_ids = [int(suffix) for suffix in suffixes]
+        encoding = _OIDS_DELTAS
+        oids = array("q", (b - a for a, b in zip([0] + sub_ids, sub_ids))).tobytes()
+    else:
+        encoding = _OIDS_TEXT
+        text = "\n".join(suffixes).encode("utf-8")
+        oids = _OFFSET.pack(len(text)) + text
+
+    raw_prefix = prefix.encode("utf-8")
+    values = [value for _oid, value in rowinfo]
+    return b"".join([
+        _WALK_HEADER.pack(encoding, len(rowinfo), len(raw_prefix)),
+        raw_prefix,
+        oids,
+        array("Q", accumulate(len(value) for value in values)).tobytes(),
+    ] + values)
+
+
+def _decode_walk(data: Union[bytes, memoryview]) -> SNMPRowInfo:
+    encoding, num_rows, prefix_length = _WALK_HEADER.unpack_from(data)
+    offset = _WALK_HEADER.size
+    prefix = bytes(data[offset:offset + prefix_length]).decode("utf-8")
+    offset += prefix_length
+
+    if encoding == _OIDS_DELTAS:
+        deltas = array("q")
+        deltas.frombytes(data[offset:offset + deltas.itemsize * num_rows])
+        offset += deltas.itemsize * num_rows
+        oids = [prefix + str(sub_id) for sub_id in accumulate(deltas)]
+    elif encoding == _OIDS_TEXT:
+        (text_length,) = _OFFSET.unpack_from(data, offset)
+        offset += _OFFSET.size
+        text = bytes(data[offset:offset + text_length]).decode("utf-8")
+        offset += text_length
+        oids = [prefix + suffix for suffix in text.split("\n")] if num_rows else []
+    else:
+        raise ValueError("Invalid encoding of the OIDs: %r" % encoding)
 
-            path = self._path / fetchoid
-            console.vverbose(f"  Saving walk of {fetchoid} to walk cache {path}\n")
-            store.save_object_to_file(path, rowinfo, pretty=False)
+    ends = array("Q")
+    ends.frombytes(data[offset:offset + ends.itemsize * num_rows])
+    offset += ends.itemsize * num_rows
+    values_length = ends[-1] if num_rows else 0
+    values = bytes(data[offset:offset + values_length])
+    if len(oids) != num_rows or len(ends) != num_rows or len(values) != values_length:
+        raise ValueError("Truncated walk")
+    return [(oid, values[start:end]) for oid, start, end in zip(oids, chain((0,), ends), ends)]
 
 
 def get_snmp_table(
@@ -119,6 +309,13 @@ def get_snmp_table(
     max_len = 0
     max_len_col = -1
 
+    rowinfos = _get_snmpwalks(
+        section_name,
+        tree,
+        walk_cache=walk_cache,
+        backend=backend,
+    )
+
     for oid in tree.oids:
         fetchoid: OID = "%s.%s" % (tree.base, oid.column)
         # column may be integer or string like "1.5.4.2.3"
@@ -138,14 +335,7 @@ def get_snmp_table(
             index_column = len(columns)
             index_format = oid.column
         else:
-            rowinfo = _get_snmpwalk(
-                section_name,
-                tree.base,
-                fetchoid,
-                walk_cache=walk_cache,
-                save_walk_cache=oid.save_to_cache,
-                backend=backend,
-            )
+            rowinfo = rowinfos[fetchoid]
             if len(rowinfo) > max_len:
                 max_len_col = len(columns)
 
@@ -228,40 +418,52 @@ def _key_oid_pairs(pair1: Tuple[OID, SNMPRawValue]) -> List[int]:
     return _oid_to_intlist(pair1[0].lstrip('.'))
 
 
-def _get_snmpwalk(
+def _get_snmpwalks(
     section_name: Optional[SectionName],
-    base: str,
-    fetchoid: OID,
+    tree: BackendSNMPTree,
     *,
     walk_cache: MutableMapping[str, Tuple[bool, SNMPRowInfo]],
-    save_walk_cache: bool,
     backend: SNMPBackend,
-) -> SNMPRowInfo:
-    try:
-        rowinfo = walk_cache[fetchoid][1]
-        console.vverbose(f"Already fetched OID: {fetchoid}\n")
-        return rowinfo
-    except KeyError:
-        pass
-
-    rowinfo = _perform_snmpwalk(section_name, base, fetchoid, backend=backend)
-    walk_cache[fetchoid] = (save_walk_cache, rowinfo)
-    return rowinfo
-
-
-def _perform_snmpwalk(
+) -> Dict[OID, SNMPRowInfo]:
+    """Get the columns of the tree, the ones missing in the walk cache are walked at once"""
+    rowinfos: Dict[OID, SNMPRowInfo] = {}
+    save_walk_cache: Dict[OID, bool] = {}
+    for oid in tree.oids:
+        if isinstance(oid.column, SpecialColumn):
+            continue
+        fetchoid: OID = "%s.%s" % (tree.base, oid.column)
+        try:
+            rowinfos[fetchoid] = walk_cache[fetchoid][1]
+            console.vverbose(f"Already fetched OID: {fetchoid}\n")
+        except KeyError:
+            save_walk_cache.setdefault(fetchoid, oid.save_to_cache)
+
+    fetchoids = list(save_walk_cache)
+    for fetchoid, rowinfo in zip(
+            fetchoids,
+            _perform_snmpwalks(section_name, tree.base, fetchoids, backend=backend),
+    ):
+        walk_cache[fetchoid] = (save_walk_cache[fetchoid], rowinfo)
+        rowinfos[fetchoid] = rowinfo
+    return rowinfos
+
+
+def _perform_snmpwalks(
     section_name: Optional[SectionName],
     base_oid: str,
-    fetchoid: OID,
+    fetchoids: List[OID],
     *,
     backend: SNMPBackend,
-) -> SNMPRowInfo:
-    added_oids: Set[OID] = set([])
-    rowinfo: SNMPRowInfo = []
+) -> List[SNMPRowInfo]:
+    if not fetchoids:
+        return []
+
+    added_oids: List[Set[OID]] = [set() for _fetchoid in fetchoids]
+    rowinfos: List[SNMPRowInfo] = [[] for _fetchoid in fetchoids]
 
     for context_name in backend.config.snmpv3_contexts_of(section_name):
-        rows = backend.walk(
-            oid=fetchoid,
+        columns = backend.walk_columns(
+            fetchoids,
             # revert back to legacy "possilbly-empty-string"-Type
             # TODO: pass Optional[SectionName] along!
             check_plugin_name=str(section_name) if section_name else "",
@@ -269,23 +471,24 @@ def _perform_snmpwalk(
             context_name=context_name,
         )
 
-        # I've seen a broken device (Mikrotik Router), that broke after an
-        # update to RouterOS v6.22. It would return 9 time the same OID when
-        # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
-        # by removing any duplicate OID information
-        if len(rows) > 1 and rows[0][0] == rows[1][0]:
-            console.vverbose("Detected broken SNMP agent. Ignoring duplicate OID %s.\n" %
-                             rows[0][0])
-            rows = rows[:1]
+        for rows, rowinfo, added in zip(columns, rowinfos, added_oids):
+            # I've seen a broken device (Mikrotik Router), that broke after an
+            # update to RouterOS v6.22. It would return 9 time the same OID when
+            # .1.3.6.1.2.1.1.1.0 was being walked. We try to detect these situations
+            # by removing any duplicate OID information
+            if len(rows) > 1 and rows[0][0] == rows[1][0]:
+                console.vverbose("Detected broken SNMP agent. Ignoring duplicate OID %s.\n" %
+                                 rows[0][0])
+                rows = rows[:1]
 
-        for row_oid, val in rows:
-            if row_oid in added_oids:
-                console.vverbose("Duplicate OID found: %s (%r)\n" % (row_oid, val))
-            else:
-                rowinfo.append((row_oid, val))
-                added_oids.add(row_oid)
+            for row_oid, val in rows:
+                if row_oid in added:
+                    console.vverbose("Duplicate OID found: %s (%r)\n" % (row_oid, val))
+                else:
+                    rowinfo.append((row_oid, val))
+                    added.add(row_oid)
 
-    return rowinfo
+    return rowinfos
 
 
 def _sanitize_snmp_encoding(columns: ResultColumnsSanitized,
@@ -309,10 +512,12 @@ def _sanitize_snmp_table_columns(columns: ResultColumnsUnsanitized) -> ResultCol
     # First compute the complete list of end-oids appearing in the output
     # by looping all results and putting the endoids to a flat list
     endoids: List[OID] = []
+    seen_endoids: Set[OID] = set()
     for fetchoid, row_info, value_encoding in columns:
         for o, value in row_info:
             endoid = _extract_end_oid(fetchoid, o)
-            if endoid not in endoids:
+            if endoid not in seen_endoids:
+                seen_endoids.add(endoid)
                 endoids.append(endoid)
 
     # The list needs to be sorted to prevent problems when the first
@@ -87,6 +87,7 @@ class SNMPBackendEnum(enum.Enum):
     INLINE = "Inline"
     PYSNMP = "PySNMP"
     CLASSIC = "Classic"
+    ASYNCIO = "Asyncio"
 
     def serialize(self) -> str:
         return self.name
@@ -194,6 +195,22 @@ class SNMPBackend(metaclass=abc.ABCMeta):
         """
         raise NotImplementedError()
 
+    def get_many(self,
+                 oids: Sequence[OID],
+                 context_name: Optional[SNMPContextName] = None) -> List[Optional[SNMPRawValue]]:
+        """Fetch several OIDs, like get() does for a single one
+
+        Backends that are able to fetch the OIDs at once override this.
+        """
+        values: List[Optional[SNMPRawValue]] = []
+        for oid in oids:
+            try:
+                values.append(self.get(oid, context_name))
+            except Exception:
+                # Only the failing OID is lost, like with single requests
+                values.append(None)
+        return values
+
     @abc.abstractmethod
     def walk(self,
              oid: OID,
@@ -202,6 +219,17 @@ class SNMPBackend(metaclass=abc.ABCMeta):
              context_name: Optional[SNMPContextName] = None) -> SNMPRowInfo:
         return []
 
+    def walk_columns(self,
+                     oids: Sequence[OID],
+                     check_plugin_name: Optional[_CheckPluginName] = None,
+                     table_base_oid: Optional[OID] = None,
+                     context_name: Optional[SNMPContextName] = None) -> List[SNMPRowInfo]:
+        """Walk several OIDs, usually the columns of a table
+
+        Backends that are able to walk the columns at once override this.
+        """
+        return [self.walk(oid, check_plugin_name, table_base_oid, context_name) for oid in oids]
+
 
 class SpecialColumn(enum.IntEnum):
     # Until we remove all but the first, its worth having an enum
@@ -551,7 +551,12 @@ class UpdateConfig:
 
         walk_cache_dir = Path(cmk.utils.paths.var_dir, "snmp_cache")
         if walk_cache_dir.exists():
-            paths.extend(walk_cache_dir.iterdir())
+            # The walk cache files of the hosts and the directories of the former per OID files
+            for path in walk_cache_dir.iterdir():
+                if path.is_dir():
+                    paths.append(path)
+                else:
+                    path.unlink()
 
         for base_dir in paths:
             try:
@@ -5,17 +5,23 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 
 import os
+import sys
 import time
 import cmk
+import hashlib
 import marshal
+import multiprocessing
+import subprocess
 from pathlib import Path
 from typing import (
     TYPE_CHECKING,
     Dict,
+    Iterable,
     Set,
     Optional,
     TypedDict,
     List,
+    Tuple,
 )
 
 from cmk.utils.log import logger
@@ -33,13 +39,140 @@ from cmk.utils.exceptions import MKGeneralException
 from cmk.utils.i18n import _
 from cmk.utils.bi.bi_trees import BICompiledAggregation
 from cmk.utils.bi.bi_aggregation import BIAggregation
-from cmk.utils.bi.bi_lib import SitesCallback
+from cmk.utils.bi.bi_lib import BIHostData, BIServiceData, SitesCallback
+from cmk.utils.type_defs import HostName
 
 from cmk.utils.redis import get_redis_client
 if TYPE_CHECKING:
     from cmk.utils.redis import RedisDecoded
 
 
+# The compiled aggregations loaded by this process, by the path and the modification
+# time and size of their file. Keeping them makes the results cached for them in the
+# computer (see BIBranchResultCache) reusable for the following requests.
+_loaded_aggregations: Dict[str, Tuple[Tuple[int, int], BICompiledAggregation]] = {}
+
+
+# The title and the required elements of a compiled branch. These are kept for each
+# aggregation, next to the compiled aggregation, for the checks and lookups spanning
+# all aggregations. Unchanged aggregations do not need to be loaded for them.
+BranchInfo = Tuple[str, List[Tuple[str, str, Optional[str]]]]
+
+
+# The aggregation, its branch infos, the hosts selected by its searches and the duration
+CompilationResult = Tuple[str, List[BranchInfo], List[HostName], float]
+
+# The state the compilation processes inherit from the helper process: the
+# aggregations to compile, the searcher and the directory of the compiled aggregations
+_compilation_context: Optional[Tuple[Dict[str, BIAggregation], BISearcher, Path]] = None
+
+
+def _branch_infos(compiled_aggregation: BICompiledAggregation) -> List[BranchInfo]:
+    return [(branch.properties.title, [
+        (element.site_id, element.host_name, element.service_description)
+        for element in sorted(branch.required_elements(), key=repr)
+    ]) for branch in compiled_aggregation.branches]
+
+
+def _compile_and_save(aggregation: BIAggregation, bi_searcher: BISearcher,
+                      path_compiled_aggregations: Path) -> CompilationResult:
+    start = time.time()
+    selected_host_names = bi_searcher.record_selected_hosts()
+    compiled_aggregation = aggregation.compile(bi_searcher)
+    BICompiler._marshal_save_data(path_compiled_aggregations.joinpath(aggregation.id),
+                                  compiled_aggregation.serialize())
+    return (aggregation.id, _branch_infos(compiled_aggregation), sorted(selected_host_names),
+            time.time() - start)
+
+
+def _compile_aggregation(aggr_id: str) -> CompilationResult:
+    """Compiles and saves one aggregation, executed by the compilation processes"""
+    assert _compilation_context is not None
+    aggregations, bi_searcher, path_compiled_aggregations = _compilation_context
+    return _compile_and_save(aggregations[aggr_id], bi_searcher, path_compiled_aggregations)
+
+
+def compile_in_pool(aggregations: Dict[str, BIAggregation], bi_searcher: BISearcher,
+                    path_compiled_aggregations: Path,
+                    aggr_ids: List[str]) -> Iterable[CompilationResult]:
+    """Compiles the aggregations in a pool of forked processes
+
+    The processes share the prepared searcher. This must only be called by a single
+    threaded process, see BICompiler._compile_aggregations."""
+    global _compilation_context
+    _compilation_context = (aggregations, bi_searcher, path_compiled_aggregations)
+    try:
+        num_processes = min(len(aggr_ids), os.cpu_count() or 1)
+        with multiprocessing.get_context("fork").Pool(num_processes) as pool:
+            yield from pool.imap_unordered(_compile_aggregation, aggr_ids)
+    finally:
+        _compilation_context = None
+
+
+def _raw_hosts(hosts: Dict[HostName, BIHostData]) -> Dict[HostName, Tuple]:
+    """The hosts in the format of the structure data (see BIStructureFetcher.add_site_data)"""
+    return {
+        host_name: (host.site_id, host.tags, host.labels, host.folder,
+                    {
+                        service_description: tuple(service)
+                        for service_description, service in host.services.items()
+                    }, host.children, host.parents, host.alias, host.name)
+        for host_name, host in hosts.items()
+    }
+
+
+def _hosts_from_raw(raw_hosts: Dict[HostName, Tuple]) -> Dict[HostName, BIHostData]:
+    hosts = {}
+    for host_name, (site_id, tags, labels, folder, services, children, parents, alias,
+                    name) in raw_hosts.items():
+        hosts[host_name] = BIHostData(
+            site_id,
+            tags,
+            labels,
+            folder,
+            {x: BIServiceData(*y) for x, y in services.items()},
+            children,
+            parents,
+            alias,
+            name,
+        )
+    return hosts
+
+
+def _host_digests(hosts: Dict[HostName, BIHostData]) -> Dict[HostName, str]:
+    """Identifies the data of each host, which may end up in the compiled aggregations"""
+    return {
+        host_name: hashlib.sha256(
+            repr((
+                host.site_id,
+                sorted(host.tags),
+                sorted(host.labels.items()),
+                host.folder,
+                sorted((service_description, sorted(service.tags), sorted(service.labels.items()))
+                       for service_description, service in host.services.items()),
+                host.children,
+                host.parents,
+                host.alias,
+            )).encode()).hexdigest() for host_name, host in hosts.items()
+    }
+
+
+def _host_index_digest(hosts: Dict[HostName, BIHostData]) -> str:
+    """Identifies the host attributes the host searches select the hosts by
+
+    A changed digest means that the searches may select other hosts than before."""
+    return hashlib.sha256(
+        repr(
+            sorted((host_name, host.alias, sorted(host.tags), sorted(host.labels.items()))
+                   for host_name, host in hosts.items())).encode()).hexdigest()
+
+
+def _selected_hosts_digest(host_digests: Dict[HostName, str], host_names: List[HostName]) -> str:
+    return hashlib.sha256(
+        repr([(host_name, host_digests.get(host_name)) for host_name in host_names
+             ]).encode()).hexdigest()
+
+
 class ConfigStatus(TypedDict):
     configfile_timestamp: float
     known_sites: Set[SiteProgramStart]
@@ -47,6 +180,10 @@ class ConfigStatus(TypedDict):
 
 
 class BICompiler:
+    # Fewer outdated aggregations are compiled by the web server process itself
+    parallel_compilation_threshold = 4
+    helper_command = ["python3", "-m", "cmk.utils.bi.bi_compiler"]
+
     def __init__(self, bi_configuration_file, sites_callback: SitesCallback):
         self._sites_callback = sites_callback
         self._bi_configuration_file = bi_configuration_file
@@ -57,6 +194,8 @@ class BICompiler:
         self._path_compilation_timestamp = Path(get_cache_dir(), "last_compilation")
         self._path_compiled_aggregations = Path(get_cache_dir(), "compiled_aggregations")
         self._path_compiled_aggregations.mkdir(parents=True, exist_ok=True)
+        self._path_aggregation_infos = Path(get_cache_dir(), "compiled_aggregation_infos")
+        self._path_aggregation_infos.mkdir(parents=True, exist_ok=True)
 
         self._redis_client: Optional['RedisDecoded'] = None
         self._setup()
@@ -86,9 +225,18 @@ class BICompiler:
             aggr_id = path_object.name
             if aggr_id in self._compiled_aggregations:
                 continue
+            stat = path_object.stat()
+            file_version = (stat.st_mtime_ns, stat.st_size)
+            loaded = _loaded_aggregations.get(str(path_object))
+            if loaded is not None and loaded[0] == file_version:
+                self._compiled_aggregations[aggr_id] = loaded[1]
+                continue
+
             self._logger.debug("Loading cached aggregation results %s" % aggr_id)
             aggr_data = self._marshal_load_data(str(path_object))
             self._compiled_aggregations[aggr_id] = BIAggregation.create_trees_from_schema(aggr_data)
+            _loaded_aggregations[str(path_object)] = (file_version,
+                                                      self._compiled_aggregations[aggr_id])
 
     def _check_compilation_status(self) -> None:
         current_configstatus = self.compute_current_configstatus()
@@ -106,45 +254,122 @@ class BICompiler:
 
             self.prepare_for_compilation(current_configstatus["online_sites"])
 
-            # Compile the raw tree
-            for aggregation in self._bi_packs.get_all_aggregations():
-                start = time.time()
-                self._compiled_aggregations[aggregation.id] = aggregation.compile(self.bi_searcher)
-                self._logger.debug("Compilation of %s took %f" %
-                                   (aggregation.id, time.time() - start))
-
-            self._verify_aggregation_title_uniqueness(self._compiled_aggregations)
-
-            for aggr_id, aggr in self._compiled_aggregations.items():
-                start = time.time()
-                result = aggr.serialize()
-                self._logger.debug("Schema dump %s took config took %f (%d branches)" %
-                                   (aggr_id, time.time() - start, len(aggr.branches)))
-                self._marshal_save_data(self._path_compiled_aggregations.joinpath(aggr_id), result)
-
-            self._generate_part_of_aggregation_lookup(self._compiled_aggregations)
+            # Only the aggregations whose configuration or hosts have changed are compiled
+            aggregations = {
+                aggregation.id: aggregation
+                for aggregation in self._bi_packs.get_all_aggregations()
+            }
+            host_digests = _host_digests(self.bi_searcher.hosts)
+            host_index_digest = _host_index_digest(self.bi_searcher.hosts)
+            branch_infos: Dict[str, List[BranchInfo]] = {}
+            outdated_aggregations: Dict[str, str] = {}
+            for aggr_id, aggregation in aggregations.items():
+                fingerprint = self._aggregation_fingerprint(aggregation, host_index_digest)
+                aggregation_info = self._load_aggregation_info(aggr_id)
+                if aggregation_info.get("fingerprint") == fingerprint and aggregation_info.get(
+                        "hosts_digest") == _selected_hosts_digest(
+                            host_digests, aggregation_info.get("hosts", [])):
+                    branch_infos[aggr_id] = aggregation_info["branches"]
+                else:
+                    outdated_aggregations[aggr_id] = fingerprint
+
+            for aggr_id, aggregation_branch_infos, host_names, duration in self._compile_aggregations(
+                    aggregations, list(outdated_aggregations)):
+                self._logger.debug("Compilation of %s took %f (%d branches)" %
+                                   (aggr_id, duration, len(aggregation_branch_infos)))
+                # The compiled aggregation is loaded again from its file
+                self._compiled_aggregations.pop(aggr_id, None)
+                branch_infos[aggr_id] = aggregation_branch_infos
+                self._marshal_save_data(
+                    self._path_aggregation_infos.joinpath(aggr_id), {
+                        "fingerprint": outdated_aggregations[aggr_id],
+                        "hosts": host_names,
+                        "hosts_digest": _selected_hosts_digest(host_digests, host_names),
+                        "branches": aggregation_branch_infos,
+                    })
+
+            branch_infos = {aggr_id: branch_infos[aggr_id] for aggr_id in aggregations}
+            self._verify_aggregation_title_uniqueness(branch_infos)
+            self._generate_part_of_aggregation_lookup(branch_infos)
 
         known_sites = {kv[0]: kv[1] for kv in current_configstatus.get("known_sites", set())}
-        self._cleanup_vanished_aggregations()
+        self._cleanup_vanished_aggregations(set(aggregations))
         self._bi_structure_fetcher.cleanup_orphaned_files(known_sites)
 
         self._path_compilation_timestamp.write_text(
             str(current_configstatus["configfile_timestamp"]))
 
-    def _cleanup_vanished_aggregations(self):
-        valid_aggregations = list(self._compiled_aggregations.keys())
-        for path_object in self._path_compiled_aggregations.iterdir():
-            if path_object.is_dir():
-                continue
-            if path_object.name not in valid_aggregations:
-                path_object.unlink(missing_ok=True)
+    def _aggregation_fingerprint(self, aggregation: BIAggregation, host_index_digest: str) -> str:
+        """Identifies the inputs of the compilation of an aggregation, except for its hosts
+
+        These are the configuration of the aggregation and of the rules it calls, and
+        the host attributes deciding which hosts are selected. The data of the
+        selected hosts is compared separately (see BISearcher.selected_host_names)."""
+        rules = sorted((bi_rule.id, bi_rule.serialize())
+                       for bi_rule in self._bi_packs.get_rules_of_aggregation(aggregation))
+        return hashlib.sha256(repr((aggregation.serialize(), rules,
+                                    host_index_digest)).encode()).hexdigest()
 
-    def _verify_aggregation_title_uniqueness(
-            self, compiled_aggregations: Dict[str, BICompiledAggregation]) -> None:
+    def _load_aggregation_info(self, aggr_id: str) -> Dict:
+        if not self._path_compiled_aggregations.joinpath(aggr_id).exists():
+            return {}
+        try:
+            return self._marshal_load_data(self._path_aggregation_infos.joinpath(aggr_id))
+        except FileNotFoundError:
+            return {}
+
+    def _compile_aggregations(self, aggregations: Dict[str, BIAggregation],
+                              aggr_ids: List[str]) -> Iterable[CompilationResult]:
+        """Compiles and saves the aggregations and returns their branch infos
+
+        The compilation runs in the (multithreaded) web server processes. Forking
+        them could deadlock on locks held by other threads, and the interpreter of
+        mod_wsgi can not be started for spawned processes. Many aggregations are
+        therefore compiled by a helper process, which compiles them in a pool of
+        processes forked from it."""
+        if len(aggr_ids) < self.parallel_compilation_threshold or (os.cpu_count() or 1) == 1:
+            for aggr_id in aggr_ids:
+                yield _compile_and_save(aggregations[aggr_id], self.bi_searcher,
+                                        self._path_compiled_aggregations)
+            return
+
+        yield from self._compile_in_helper(aggr_ids)
+
+    def _compile_in_helper(self, aggr_ids: List[str]) -> List[CompilationResult]:
+        completed_process = subprocess.run(
+            self.helper_command,
+            input=marshal.dumps((
+                self._bi_packs.serialize(),
+                _raw_hosts(self.bi_searcher.hosts),
+                aggr_ids,
+                str(self._path_compiled_aggregations),
+            )),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            close_fds=True,
+            check=False,
+        )
+        if completed_process.returncode != 0:
+            raise MKGeneralException(
+                _("The compilation of the aggregations failed: %s") %
+                completed_process.stderr.decode("utf-8", "replace"))
+        return marshal.loads(completed_process.stdout)
+
+    def _cleanup_vanished_aggregations(self, valid_aggregations: Set[str]):
+        for path in [self._path_compiled_aggregations, self._path_aggregation_infos]:
+            for path_object in path.iterdir():
+                if path_object.is_dir():
+                    continue
+                if path_object.name not in valid_aggregations:
+                    path_object.unlink(missing_ok=True)
+        for aggr_id in set(self._compiled_aggregations) - valid_aggregations:
+            del self._compiled_aggregations[aggr_id]
+
+    def _verify_aggregation_title_uniqueness(self,
+                                             branch_infos: Dict[str, List[BranchInfo]]) -> None:
         used_titles: Dict[str, str] = {}
-        for aggr_id, bi_aggregation in compiled_aggregations.items():
-            for bi_branch in bi_aggregation.branches:
-                branch_title = bi_branch.properties.title
+        for aggr_id, aggregation_branch_infos in branch_infos.items():
+            for branch_title, _required_elements in aggregation_branch_infos:
                 if branch_title in used_titles:
                     raise MKGeneralException(
                         _("The aggregation titles are not unique. \"%s\" is created "
@@ -233,7 +458,8 @@ class BICompiler:
 
         return latest_timestamp
 
-    def _marshal_save_data(self, filepath, data) -> None:
+    @staticmethod
+    def _marshal_save_data(filepath, data) -> None:
         with open(filepath, "wb") as f:
             marshal.dump(data, f)
             os.fsync(f.fileno())
@@ -270,22 +496,25 @@ class BICompiler:
             lookup_lock.acquire()
             if not client.exists("bi:aggregation_lookup"):
                 self.load_compiled_aggregations()
-                self._generate_part_of_aggregation_lookup(self._compiled_aggregations)
+                self._generate_part_of_aggregation_lookup({
+                    aggr_id: _branch_infos(compiled_aggregation)
+                    for aggr_id, compiled_aggregation in self._compiled_aggregations.items()
+                })
         finally:
             if lookup_lock.owned():
                 lookup_lock.release()
 
-    def _generate_part_of_aggregation_lookup(self, compiled_aggregations):
+    def _generate_part_of_aggregation_lookup(self, branch_infos: Dict[str, List[BranchInfo]]):
         part_of_aggregation_map: Dict[str, List[str]] = {}
-        for aggr_id, compiled_aggregation in compiled_aggregations.items():
-            for branch in compiled_aggregation.branches:
-                for _site, host_name, service_description in branch.required_elements():
+        for aggr_id, aggregation_branch_infos in branch_infos.items():
+            for branch_title, required_elements in aggregation_branch_infos:
+                for _site, host_name, service_description in required_elements:
                     # This information can be used to selectively load the relevant compiled
                     # aggregation for any host/service. Right now it is only an indicator if this
                     # host/service is part of an aggregation
                     key = "bi:aggregation_lookup:%s:%s" % (host_name, service_description)
                     part_of_aggregation_map.setdefault(key, []).append(
-                        "%s\t%s" % (aggr_id, branch.properties.title))
+                        "%s\t%s" % (aggr_id, branch_title))
 
         client = self._get_redis_client()
 
@@ -314,3 +543,24 @@ class BICompiler:
             pipeline.delete(*obsolete_keys)
 
         pipeline.execute()
+
+
+def main() -> int:
+    """Compiles the aggregations passed by BICompiler._compile_in_helper"""
+    packs_config, raw_hosts, aggr_ids, path_compiled_aggregations = marshal.load(sys.stdin.buffer)
+    bi_packs = BIAggregationPacks("")
+    bi_packs._load_config(packs_config)  # pylint: disable=protected-access
+    bi_searcher = BISearcher()
+    bi_searcher.set_hosts(_hosts_from_raw(raw_hosts))
+
+    aggregations = {
+        aggregation.id: aggregation for aggregation in bi_packs.get_all_aggregations()
+    }
+    results = list(
+        compile_in_pool(aggregations, bi_searcher, Path(path_compiled_aggregations), aggr_ids))
+    marshal.dump(results, sys.stdout.buffer)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
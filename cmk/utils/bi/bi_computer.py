@@ -5,11 +5,19 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 
 import copy
-from typing import NamedTuple, List, Tuple, Set, Dict, Optional, Iterator
+import threading
+import weakref
+from typing import Any, NamedTuple, List, Tuple, Set, Dict, Optional, Iterator
 
 import cmk.utils.plugin_registry
 from cmk.utils.type_defs import ServiceName
-from cmk.utils.bi.bi_lib import RequiredBIElement, BIHostSpec
+from cmk.utils.bi.bi_lib import (
+    ABCBICompiledNode,
+    ABCBIStatusFetcher,
+    BIAggregationComputationOptions,
+    RequiredBIElement,
+    BIHostSpec,
+)
 from cmk.utils.bi.bi_trees import BICompiledRule, BICompiledAggregation, NodeResultBundle
 
 BIAggregationFilter = NamedTuple("BIAggregationFilter", [
@@ -48,6 +56,127 @@ class BIComputerPostprocessingRegistry(
 
 bi_computer_postprocessing_registry = BIComputerPostprocessingRegistry()
 
+#   .--Result cache--------------------------------------------------------.
+#   |        ____                 _ _                     _                |
+#   |       |  _ \ ___  ___ _   _| | |_    ___ __ _  ___| |__   ___       |
+#   |       | |_) / _ \/ __| | | | | __|  / __/ _` |/ __| '_ \ / _ \      |
+#   |       |  _ <  __/\__ \ |_| | | |_  | (_| (_| | (__| | | |  __/      |
+#   |       |_| \_\___||___/\__,_|_|\__|  \___\__,_|\___|_| |_|\___|      |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+
+
+class BIBranchResultCache:
+    """Results of the rules of a compiled aggregation
+
+    The result of a rule only depends on the states of the hosts and services it
+    requires (and the assumed states). The cache keeps the states of the required
+    elements seen during the last computation and a reverse index from the
+    elements to the rules requiring them. Only the rules requiring an element
+    that has changed since then are computed again, all other rules, including
+    sub rules of changed branches, reuse their last result."""
+    def __init__(self) -> None:
+        super().__init__()
+        self._lock = threading.Lock()
+        # The elements required by the indexed branches (by id())
+        self._elements_of_branch: Dict[int, Set[RequiredBIElement]] = {}
+        self._rules_of_element: Dict[RequiredBIElement, List[int]] = {}
+        self._element_states: Dict[RequiredBIElement, Any] = {}
+        # The last result and whether or not it has been computed with assumed states
+        self._results: Dict[int, Tuple[bool, Optional[NodeResultBundle]]] = {}
+
+    def compute_branches(self, compiled_aggregation: BICompiledAggregation,
+                         branches: List[BICompiledRule],
+                         bi_status_fetcher: ABCBIStatusFetcher) -> List[NodeResultBundle]:
+        """Same as BICompiledAggregation.compute_branches, using the cached results"""
+        with self._lock:
+            branch_elements = [self._required_elements(branch) for branch in branches]
+            self._forget_changed_elements(
+                set().union(*branch_elements),  # type: ignore[arg-type]
+                bi_status_fetcher)
+
+            assumed_state_ids = set(bi_status_fetcher.assumed_states)
+            aggregation_results = []
+            for branch, required_elements in zip(branches, branch_elements):
+                compute_assumed_state = any(assumed_state_ids.intersection(required_elements))
+                result = self._compute_node(branch, compiled_aggregation.computation_options,
+                                            bi_status_fetcher, compute_assumed_state)
+                if result is not None:
+                    aggregation_results.append(result)
+            return aggregation_results
+
+    def _required_elements(self, branch: BICompiledRule) -> Set[RequiredBIElement]:
+        required_elements = self._elements_of_branch.get(id(branch))
+        if required_elements is None:
+            required_elements = self._index_rule(branch)
+            self._elements_of_branch[id(branch)] = required_elements
+        return required_elements
+
+    def _index_rule(self, rule: BICompiledRule) -> Set[RequiredBIElement]:
+        required_elements: Set[RequiredBIElement] = set()
+        for node in rule.nodes:
+            if isinstance(node, BICompiledRule):
+                required_elements |= self._index_rule(node)
+            else:
+                required_elements |= node.required_elements()
+        for element in required_elements:
+            self._rules_of_element.setdefault(element, []).append(id(rule))
+        return required_elements
+
+    def _forget_changed_elements(self, required_elements: Set[RequiredBIElement],
+                                 bi_status_fetcher: ABCBIStatusFetcher) -> None:
+        for element in required_elements:
+            state = self._element_state(element, bi_status_fetcher)
+            if element in self._element_states and self._element_states[element] == state:
+                continue
+            self._element_states[element] = state
+            for rule_id in self._rules_of_element.get(element, []):
+                self._results.pop(rule_id, None)
+
+    def _element_state(self, element: RequiredBIElement,
+                       bi_status_fetcher: ABCBIStatusFetcher) -> Any:
+        """The data BICompiledLeaf.compute() computes the result of the element from"""
+        assumed_state = bi_status_fetcher.assumed_states.get(element)
+        entity = bi_status_fetcher.states.get(BIHostSpec(element.site_id, element.host_name))
+        if entity is None:
+            return None, assumed_state
+        if element.service_description is None:
+            # The host state, without the services
+            return entity[:7], assumed_state
+        return entity.services_with_fullstate.get(element.service_description), assumed_state
+
+    def _compute_node(self, node: ABCBICompiledNode,
+                      computation_options: BIAggregationComputationOptions,
+                      bi_status_fetcher: ABCBIStatusFetcher,
+                      use_assumed: bool) -> Optional[NodeResultBundle]:
+        if not isinstance(node, BICompiledRule):
+            return node.compute(computation_options, bi_status_fetcher, use_assumed)
+
+        cached = self._results.get(id(node))
+        if cached is not None and cached[0] == use_assumed:
+            return cached[1]
+
+        result = node.aggregate_node_results(
+            [
+                self._compute_node(sub_node, computation_options, bi_status_fetcher, use_assumed)
+                for sub_node in node.nodes
+            ],
+            computation_options,
+            use_assumed,
+        )
+        self._results[id(node)] = (use_assumed, result)
+        return result
+
+
+# The caches live as long as the compiled aggregations (which are kept by the
+# compiler for the lifetime of the process)
+_branch_result_caches: 'weakref.WeakKeyDictionary[BICompiledAggregation, BIBranchResultCache]' = (
+    weakref.WeakKeyDictionary())
+
+
+def branch_result_cache(compiled_aggregation: BICompiledAggregation) -> BIBranchResultCache:
+    return _branch_result_caches.setdefault(compiled_aggregation, BIBranchResultCache())
+
 
 class BIComputer:
     def __init__(self, compiled_aggregations, bi_status_fetcher):
@@ -101,10 +230,18 @@ class BIComputer:
     ) -> List[Tuple[BICompiledAggregation, List[NodeResultBundle]]]:
         results = []
         for compiled_aggregation, branches in required_aggregations:
-            node_result_bundles = compiled_aggregation.compute_branches(
-                branches,
-                self._bi_status_fetcher,
-            )
+            if bi_computer_postprocessing_registry:
+                # The postprocessing may modify the results, so they can not be reused
+                node_result_bundles = compiled_aggregation.compute_branches(
+                    branches,
+                    self._bi_status_fetcher,
+                )
+            else:
+                node_result_bundles = branch_result_cache(compiled_aggregation).compute_branches(
+                    compiled_aggregation,
+                    branches,
+                    self._bi_status_fetcher,
+                )
 
             # Postprocess results. Custom user plugins may add additional information for each node
             node_result_bundles = list(
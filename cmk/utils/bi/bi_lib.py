@@ -346,8 +346,8 @@ def replace_macros_in_string(pattern: str, macros: MacroMapping) -> str:
 class ABCBISearcher(metaclass=abc.ABCMeta):
     def __init__(self):
         self.hosts = {}
-        self._host_regex_match_cache = {}
-        self._host_regex_miss_cache = {}
+        # The values of hosts, shared by all searches for all hosts
+        self.all_hosts: List[BIHostData] = []
 
     @abc.abstractmethod
     def search_hosts(self, conditions: Dict) -> List[BIHostSearchMatch]:
@@ -355,6 +355,21 @@ class BIAggregationPacks:
             if isinstance(node.action, BICallARuleAction):
                 self._traverse_rule(self.get_rule_mandatory(node.action.rule_id), list(parents))
 
+    def get_rules_of_aggregation(self, bi_aggregation: BIAggregation) -> List[BIRule]:
+        """Returns the rules called by the aggregation, directly or indirectly"""
+        rules: Dict[str, BIRule] = {}
+        nodes = [bi_aggregation.node]
+        while nodes:
+            node = nodes.pop()
+            if not isinstance(node.action, BICallARuleAction) or node.action.rule_id in rules:
+                continue
+            bi_rule = self.get_rule(node.action.rule_id)
+            if bi_rule is None:
+                continue
+            rules[bi_rule.id] = bi_rule
+            nodes.extend(bi_rule.get_nodes())
+        return list(rules.values())
+
     def count_rule_references(self, check_rule_id: str) -> RuleReferencesResult:
         aggr_refs = 0
         for bi_aggregation in self.get_all_aggregations():
@@ -4,9 +4,12 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import bisect
+from typing import Dict, Iterable, Iterator, List, Set, Tuple
+
 from cmk.utils.regex import regex
-from typing import Dict, List, Tuple
-from cmk.utils.rulesets.ruleset_matcher import matches_labels, matches_tag_spec
+from cmk.utils.rulesets.ruleset_matcher import matches_labels
+from cmk.utils.type_defs import HostName
 
 from cmk.utils.bi.bi_lib import (
     ABCBISearcher,
@@ -36,20 +39,118 @@ from cmk.utils.bi.bi_lib import (
 #   +----------------------------------------------------------------------+
 
 
+def _literal_prefix(pattern: str) -> str:
+    """Returns a prefix of all texts the pattern matches (from their start)"""
+    if "|" in pattern:
+        return ""
+    prefix = ""
+    for char in pattern:
+        if char in ".^$*+?{}[]\\|()":
+            if char in "*?{":
+                # The previous character is optional
+                prefix = prefix[:-1]
+            break
+        prefix += char
+    return prefix
+
+
+def _with_prefix(sorted_texts: List[str], prefix: str) -> Iterator[str]:
+    for index in range(bisect.bisect_left(sorted_texts, prefix), len(sorted_texts)):
+        if not sorted_texts[index].startswith(prefix):
+            break
+        yield sorted_texts[index]
+
+
 class BISearcher(ABCBISearcher):
+    """Searches the hosts and services for the compilation of the aggregations
+
+    The hosts are indexed by their tags, labels and names. The results of the
+    regex patterns are computed once for all hosts and service descriptions and
+    kept until the hosts change. The texts a regex pattern is applied to are
+    narrowed down by the literal prefix of the pattern.
+
+    The hosts passed to the methods are always hosts of self.hosts. In case all
+    hosts are passed, the results are taken from the indexes without looking at
+    the single hosts.
+
+    The names of the hosts selected by the searches, and therefore the hosts whose
+    data may end up in the compiled aggregation, are recorded in
+    selected_host_names (see record_selected_hosts)."""
+    def __init__(self):
+        super().__init__()
+        self._host_positions: Dict[HostName, int] = {}
+        self._host_names_by_tag: Dict[str, Set[HostName]] = {}
+        self._host_names_by_label: Dict[Tuple[str, str], Set[HostName]] = {}
+        self._sorted_host_names: List[HostName] = []
+        self._sorted_host_aliases: List[str] = []
+        self._sorted_service_descriptions: List[str] = []
+        # Results of the regex patterns: match groups by host name or text
+        self._host_name_matches: Dict[str, Dict[HostName, Tuple]] = {}
+        self._host_alias_matches: Dict[str, Dict[str, Tuple]] = {}
+        self._service_description_matches: Dict[str, Dict[str, Tuple]] = {}
+        self.selected_host_names: Set[HostName] = set()
+
+    def record_selected_hosts(self) -> Set[HostName]:
+        """Starts a new record of the hosts selected by the following searches"""
+        self.selected_host_names = set()
+        return self.selected_host_names
+
+    def _select(self, hosts: Iterable[BIHostData]) -> None:
+        if hosts is self.all_hosts:
+            self.selected_host_names.update(self.hosts)
+        else:
+            self.selected_host_names.update(host.name for host in hosts)
+
     def set_hosts(self, hosts: Dict[str, BIHostData]) -> None:
         self.cleanup()
         self.hosts = hosts
+        self.all_hosts = list(hosts.values())
+
+        service_descriptions: Set[str] = set()
+        for position, (host_name, host) in enumerate(hosts.items()):
+            self._host_positions[host_name] = position
+            for tag in host.tags:
+                self._host_names_by_tag.setdefault(tag, set()).add(host_name)
+            for label in host.labels.items():
+                self._host_names_by_label.setdefault(label, set()).add(host_name)
+            service_descriptions.update(host.services)
+        self._sorted_host_names = sorted(hosts)
+        self._sorted_host_aliases = sorted({host.alias for host in hosts.values()})
+        self._sorted_service_descriptions = sorted(service_descriptions)
 
     def cleanup(self) -> None:
         # Note: Do not call clear() on hosts
         #       This would clear the reference we've got on set_hosts
         self.hosts = {}
-        self._host_regex_match_cache.clear()
-        self._host_regex_miss_cache.clear()
+        self.all_hosts = []
+        self._host_positions = {}
+        self._host_names_by_tag = {}
+        self._host_names_by_label = {}
+        self._sorted_host_names = []
+        self._sorted_host_aliases = []
+        self._sorted_service_descriptions = []
+        self._host_name_matches.clear()
+        self._host_alias_matches.clear()
+        self._service_description_matches.clear()
+        self.selected_host_names = set()
+
+    def _are_all_hosts(self, hosts: List[BIHostData]) -> bool:
+        return len(hosts) == len(self.hosts)
+
+    def _select_hosts(self, hosts: List[BIHostData], host_names: Set[HostName]) -> List[BIHostData]:
+        return [host for host in hosts if host.name in host_names]
+
+    def _match_texts(self, sorted_texts: List[str], pattern: str) -> Dict[str, Tuple]:
+        regex_pattern = regex(pattern)
+        matches: Dict[str, Tuple] = {}
+        for text in _with_prefix(sorted_texts, _literal_prefix(pattern)):
+            match = regex_pattern.match(text)
+            if match is not None:
+                matches[text] = tuple(match.groups())
+        return matches
 
     def search_hosts(self, conditions: Dict) -> List[BIHostSearchMatch]:
-        matched_hosts, matched_re_groups = self.filter_host_choice(list(self.hosts.values()),
+        matched_hosts, matched_re_groups = self.filter_host_choice(self.all_hosts,
                                                                    conditions["host_choice"])
         matched_hosts = self.filter_host_tags(matched_hosts, conditions["host_tags"])
         matched_hosts = self.filter_host_labels(matched_hosts, conditions["host_labels"])
@@ -58,6 +159,7 @@ class BISearcher(ABCBISearcher):
     def filter_host_choice(self, hosts: List[BIHostData],
                            condition: Dict) -> Tuple[List[BIHostData], Dict]:
         if condition["type"] == "all_hosts":
+            self._select(hosts)
             return hosts, self._host_match_groups(hosts)
 
         if condition["type"] == "host_name_regex":
@@ -75,12 +177,14 @@ class BISearcher(ABCBISearcher):
                               pattern: str) -> Tuple[List[BIHostData], Dict]:
 
         if pattern == "(.*)":
+            self._select(hosts)
             return hosts, self._host_match_groups(hosts)
 
         is_regex_match = any(map(lambda x: x in pattern, ["(", ")", "*", "$", "|", "[", "]"]))
         if not is_regex_match:
             host = self.hosts.get(pattern)
             if host:
+                self.selected_host_names.add(host.name)
                 return [host], {pattern: (pattern,)}
             return [], {}
 
@@ -89,59 +193,53 @@ class BISearcher(ABCBISearcher):
         if not pattern_with_anchor.endswith("$"):
             pattern_with_anchor += "$"
 
-        matched_hosts = []
-        matched_re_groups = {}
-        regex_pattern = regex(pattern_with_anchor)
-        pattern_match_cache = self._host_regex_match_cache.setdefault(pattern_with_anchor, {})
-        pattern_miss_cache = self._host_regex_miss_cache.setdefault(pattern_with_anchor, {})
-        for host in hosts:
-            if host.name in pattern_miss_cache:
-                continue
-
-            cached_match = pattern_match_cache.get(host.name)
-            if cached_match:
-                matched_hosts.append(host)
-                matched_re_groups[host.name] = cached_match
-                continue
-
-            match = regex_pattern.match(host.name)
-            if match is None:
-                pattern_miss_cache[host.name] = True
-                continue
-            pattern_match_cache[host.name] = match.groups()
-            matched_hosts.append(host)
-            matched_re_groups[host.name] = pattern_match_cache[host.name]
-        return matched_hosts, matched_re_groups
+        matches = self._host_name_matches.get(pattern_with_anchor)
+        if matches is None:
+            # In the order of the hosts
+            matches = dict(
+                sorted(self._match_texts(self._sorted_host_names, pattern_with_anchor).items(),
+                       key=lambda item: self._host_positions[item[0]]))
+            self._host_name_matches[pattern_with_anchor] = matches
+
+        if self._are_all_hosts(hosts):
+            self.selected_host_names.update(matches)
+            return [self.hosts[host_name] for host_name in matches], dict(matches)
+
+        matched_hosts = self._select_hosts(hosts, set(matches))
+        self._select(matched_hosts)
+        return matched_hosts, {host.name: matches[host.name] for host in matched_hosts}
 
     def get_host_alias_matches(self, hosts: List[BIHostData],
                                pattern: str) -> Tuple[List[BIHostData], Dict]:
         if pattern == "(.*)":
+            self._select(hosts)
             return hosts, self._host_match_groups(hosts, "alias")
 
-        # TODO: alias matches currently costs way more performance than the host matches
-        #       requires alias lookup cache to fix
-        matched_hosts = []
-        matched_re_groups = {}
-        regex_pattern = regex(pattern)
-        for host in hosts:
-            match = regex_pattern.match(host.alias)
-            if match is None:
-                continue
-            matched_hosts.append(host)
-            matched_re_groups[host.name] = tuple(match.groups())
-        return matched_hosts, matched_re_groups
+        matches = self._host_alias_matches.get(pattern)
+        if matches is None:
+            matches = self._match_texts(self._sorted_host_aliases, pattern)
+            self._host_alias_matches[pattern] = matches
+
+        matched_hosts = [host for host in hosts if host.alias in matches]
+        self._select(matched_hosts)
+        return matched_hosts, {host.name: matches[host.alias] for host in matched_hosts}
 
     def get_service_description_matches(self, hosts: List[BIHostData],
                                         pattern: str) -> List[BIServiceSearchMatch]:
+        matches = self._service_description_matches.get(pattern)
+        if matches is None:
+            matches = self._match_texts(self._sorted_service_descriptions, pattern)
+            self._service_description_matches[pattern] = matches
+
+        self._select(hosts)
         matched_services = []
-        regex_pattern = regex(pattern)
         for host in hosts:
             for service_description in host.services.keys():
-                match = regex_pattern.match(service_description)
-                if match is None:
+                match_groups = matches.get(service_description)
+                if match_groups is None:
                     continue
-                matched_services.append(
-                    BIServiceSearchMatch(host, service_description, tuple(match.groups())))
+                matched_services.append(BIServiceSearchMatch(host, service_description,
+                                                             match_groups))
         return matched_services
 
     def search_services(self, conditions: Dict) -> List[BIServiceSearchMatch]:
@@ -152,23 +250,46 @@ class BISearcher(ABCBISearcher):
         return service_matches
 
     def filter_host_tags(self, hosts: List[BIHostData], condition: Dict) -> List[BIHostData]:
-        matched_hosts = []
-        for host in hosts:
-            for tag_condition in condition.values():
-                if not matches_tag_spec(tag_condition, host.tags):
-                    break
-            else:  # I know..
-                matched_hosts.append(host)
-        return matched_hosts
+        if not condition:
+            return hosts
+
+        host_names = set(self.hosts)
+        for tag_condition in condition.values():
+            host_names &= self._host_names_matching_tag_spec(tag_condition)
+        return self._select_hosts(hosts, host_names)
+
+    def _host_names_matching_tag_spec(self, tag_spec) -> Set[HostName]:
+        """Same as matches_tag_spec() for all hosts"""
+        if isinstance(tag_spec, dict):
+            if "$ne" in tag_spec:
+                return set(self.hosts) - self._host_names_matching_tag_spec(tag_spec["$ne"])
+
+            if "$or" in tag_spec:
+                host_names: Set[HostName] = set()
+                return host_names.union(*(self._host_names_matching_tag_spec(sub_tag_spec)
+                                          for sub_tag_spec in tag_spec["$or"]))
+
+            if "$nor" in tag_spec:
+                return set(self.hosts).difference(*(self._host_names_matching_tag_spec(
+                    sub_tag_spec) for sub_tag_spec in tag_spec["$nor"]))
+
+            raise NotImplementedError()
+
+        return self._host_names_by_tag.get(tag_spec, set())
 
     def filter_host_labels(self, hosts: List[BIHostData], required_labels):
         if not required_labels:
             return hosts
-        matched_hosts = []
-        for host in hosts:
-            if matches_labels(host.labels, required_labels):
-                matched_hosts.append(host)
-        return matched_hosts
+
+        # Same as matches_labels() for all hosts
+        host_names = set(self.hosts)
+        for label_group_id, label_spec in required_labels.items():
+            if isinstance(label_spec, dict):
+                host_names -= self._host_names_by_label.get((label_group_id, label_spec["$ne"]),
+                                                            set())
+            else:
+                host_names &= self._host_names_by_label.get((label_group_id, label_spec), set())
+        return self._select_hosts(hosts, host_names)
 
     def filter_service_labels(self, services: List[BIServiceSearchMatch], required_labels):
         if not required_labels:
@@ -282,12 +282,21 @@ class BICompiledRule(ABCBICompiledNode):
                 computation_options: BIAggregationComputationOptions,
                 bi_status_fetcher: ABCBIStatusFetcher,
                 use_assumed=False) -> Optional[NodeResultBundle]:
-        bundled_results = [
-            bundle for bundle in [
+        return self.aggregate_node_results(
+            [
                 node.compute(computation_options, bi_status_fetcher, use_assumed)
                 for node in self.nodes
-            ] if bundle is not None
-        ]
+            ],
+            computation_options,
+            use_assumed,
+        )
+
+    def aggregate_node_results(self,
+                               node_results: List[Optional[NodeResultBundle]],
+                               computation_options: BIAggregationComputationOptions,
+                               use_assumed=False) -> Optional[NodeResultBundle]:
+        """Computes the result of the rule from the results of its nodes"""
+        bundled_results = [bundle for bundle in node_results if bundle is not None]
         if not bundled_results:
             return None
         actual_result = self._process_node_compute_result(
@@ -512,8 +521,8 @@ class BICompiledAggregation:
 
     def create_aggr_tree(self, bi_compiled_branch: BICompiledRule) -> Dict:
         response = self.eval_result_node(bi_compiled_branch)
-        response["aggr_group_tree"] = self.groups.names
-        response["aggr_group_tree"] += ["/".join(x) for x in self.groups.paths]
+        # The compiled aggregations are kept by the process, they must not be modified
+        response["aggr_group_tree"] = self.groups.names + ["/".join(x) for x in self.groups.paths]
         response["aggr_type"] = "multi"
         response["aggregation_id"] = self.id
         response["downtime_aggr_warn"] = self.computation_options.escalate_downtimes_as_warn
@@ -0,0 +1,272 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Delta encoded archive of the inventory history of a host
+
+Whenever the inventory tree of a host changes, the previous tree is archived.
+Storing every archived tree completely needs a lot of space for hosts with
+thousands of software packages or interfaces, of which only a few change.
+
+The archive of a host contains one entry per archived version. The version is
+stored either completely (a checkpoint, in the same format as the current
+tree), or as delta that reconstructs it from the next newer version. The next
+newer version of the newest entry is the current tree of the host. At most
+checkpoint_interval - 1 deltas follow each other, which limits the work needed
+to reconstruct a version.
+
+Together with the version, the differences to the next newer version (as
+computed by StructuredDataTree.compare_with) are stored. These make it possible
+to show the history of a host without reconstructing all the versions.
+
+Files of the archive directory of a host:
+
+    <timestamp>         complete tree of the version (also written by older versions)
+    <timestamp>.delta   delta reconstructing the version from the next newer one
+    <timestamp>.diff    differences of the version to the next newer one
+"""
+
+import difflib
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import cmk.utils.store as store
+from cmk.utils.exceptions import MKGeneralException
+from cmk.utils.structured_data import StructuredDataTree
+
+RawTree = Dict[Any, Any]
+# Number of new, changed and removed entries and the delta tree
+TreeDiff = Tuple[int, int, int, StructuredDataTree]
+
+#   .--delta---------------------------------------------------------------.
+#   |                          _        _  _                               |
+#   |                       __| |  ___ | || |_   __ _                      |
+#   |                      / _` | / _ \| || __| / _` |                     |
+#   |                     | (_| ||  __/| || |_ | (_| |                     |
+#   |                      \__,_| \___||_| \__| \__,_|                     |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   |  Deltas between raw trees. A delta is a Python literal:              |
+#   |                                                                      |
+#   |  ("dict", {key: value}, [removed keys], {key: delta})                |
+#   |  ("list", [(start, end) or [new items]])                             |
+#   |  ("value", value)                                                    |
+#   '----------------------------------------------------------------------'
+
+
+def compute_delta(source: Any, target: Any) -> Any:
+    """Returns the delta that turns source into target, None in case they are equal"""
+    if source == target:
+        return None
+
+    if isinstance(source, dict) and isinstance(target, dict):
+        new_items: Dict[Any, Any] = {}
+        sub_deltas: Dict[Any, Any] = {}
+        for key, value in target.items():
+            if key not in source:
+                new_items[key] = value
+            elif source[key] != value:
+                if (isinstance(source[key], dict) and isinstance(value, dict)) or \
+                   (isinstance(source[key], list) and isinstance(value, list)):
+                    sub_deltas[key] = compute_delta(source[key], value)
+                else:
+                    new_items[key] = value
+        removed_keys = [key for key in source if key not in target]
+        return ("dict", new_items, removed_keys, sub_deltas)
+
+    if isinstance(source, list) and isinstance(target, list):
+        return ("list", _list_operations(source, target))
+
+    return ("value", target)
+
+
+def _list_operations(source: List[Any], target: List[Any]) -> List[Any]:
+    # The entries of numerations are dicts, which are compared by their repr()
+    matcher = difflib.SequenceMatcher(None, [repr(entry) for entry in source],
+                                      [repr(entry) for entry in target],
+                                      autojunk=False)
+    operations: List[Any] = []
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            operations.append((i1, i2))
+        elif tag in ("replace", "insert"):
+            operations.append(target[j1:j2])
+    return operations
+
+
+def apply_delta(source: Any, delta: Any) -> Any:
+    """Returns the target of the delta, source is not modified"""
+    if delta is None:
+        return source
+
+    kind = delta[0]
+    if kind == "dict":
+        _kind, new_items, removed_keys, sub_deltas = delta
+        target = {key: value for key, value in source.items() if key not in removed_keys}
+        for key, sub_delta in sub_deltas.items():
+            target[key] = apply_delta(source[key], sub_delta)
+        target.update(new_items)
+        return target
+
+    if kind == "list":
+        target_list: List[Any] = []
+        for operation in delta[1]:
+            if isinstance(operation, tuple):
+                target_list += source[operation[0]:operation[1]]
+            else:
+                target_list += operation
+        return target_list
+
+    if kind == "value":
+        return delta[1]
+
+    raise MKGeneralException("Invalid inventory delta: %r" % (kind,))
+
+
+#.
+#   .--archive-------------------------------------------------------------.
+#   |                                  _      _                            |
+#   |                __ _  _ __   ___ | |__  (_)__   __  ___               |
+#   |               / _` || '__| / __|| '_ \ | |\ \ / / / _ \              |
+#   |              | (_| || |   | (__ | | | || | \ V / |  __/              |
+#   |               \__,_||_|    \___||_| |_||_|  \_/   \___|              |
+#   |                                                                      |
+#   '----------------------------------------------------------------------'
+
+
+class InventoryArchive:
+    """The archived inventory trees of a host
+
+    archive_dir is the archive directory of the host, current_path the file of
+    its current inventory tree."""
+    checkpoint_interval = 10
+
+    def __init__(self, archive_dir: Path, current_path: Path) -> None:
+        super().__init__()
+        self._archive_dir = archive_dir
+        self._current_path = current_path
+        self._timestamps: Optional[List[str]] = None
+        self._raw_trees: Dict[Optional[str], RawTree] = {}
+
+    def _full_path(self, timestamp: str) -> Path:
+        return self._archive_dir / timestamp
+
+    def _delta_path(self, timestamp: str) -> Path:
+        return self._archive_dir / ("%s.delta" % timestamp)
+
+    def _diff_path(self, timestamp: str) -> Path:
+        return self._archive_dir / ("%s.diff" % timestamp)
+
+    def path(self, timestamp: str) -> Path:
+        """The file storing an archived version, either completely or as delta"""
+        full_path = self._full_path(timestamp)
+        return full_path if full_path.exists() else self._delta_path(timestamp)
+
+    def timestamps(self) -> List[str]:
+        """The timestamps of the archived versions, the oldest first"""
+        if self._timestamps is None:
+            try:
+                names = {
+                    path.name.split(".", 1)[0]
+                    for path in self._archive_dir.iterdir()
+                    if not path.name.startswith(".") and not path.name.endswith(".diff")
+                }
+            except FileNotFoundError:
+                names = set()
+            self._timestamps = sorted((name for name in names if name.isdigit()), key=int)
+        return self._timestamps
+
+    def _successor(self, timestamp: str) -> Optional[str]:
+        """The timestamp of the next newer version, None for the current tree"""
+        timestamps = self.timestamps()
+        index = timestamps.index(timestamp)
+        return timestamps[index + 1] if index + 1 < len(timestamps) else None
+
+    def _is_checkpoint(self, timestamp: str) -> bool:
+        return self._full_path(timestamp).exists()
+
+    def archive(self, timestamp: str, raw_tree: RawTree, successor_raw_tree: RawTree,
+                diff: Optional[TreeDiff]) -> None:
+        """Archive the current tree, before it is replaced by its successor
+
+        diff are the differences of the successor to the archived tree."""
+        timestamps = self.timestamps()
+        num_deltas = 0
+        for archived in reversed(timestamps):
+            if self._is_checkpoint(archived):
+                break
+            num_deltas += 1
+
+        store.makedirs(self._archive_dir)
+        if diff is not None:
+            num_new, num_changed, num_removed, delta_tree = diff
+            store.save_object_to_file(
+                self._diff_path(timestamp),
+                (num_new, num_changed, num_removed, delta_tree.get_raw_tree()),
+            )
+
+        if num_deltas + 1 >= self.checkpoint_interval:
+            store.save_object_to_file(self._full_path(timestamp), raw_tree)
+        else:
+            store.save_object_to_file(self._delta_path(timestamp),
+                                      compute_delta(successor_raw_tree, raw_tree))
+
+        self._timestamps = sorted(set(timestamps) | {timestamp}, key=int)
+        self._raw_trees.clear()
+
+    def freeze(self) -> None:
+        """Store the newest version completely, before the current tree is removed
+
+        Afterwards the archive does not depend on the current tree anymore."""
+        timestamps = self.timestamps()
+        if not timestamps or self._is_checkpoint(timestamps[-1]):
+            return
+        timestamp = timestamps[-1]
+        store.save_object_to_file(self._full_path(timestamp), self.load_raw_tree(timestamp))
+        self._delta_path(timestamp).unlink()
+
+    def load_raw_tree(self, timestamp: Optional[str]) -> RawTree:
+        """Reconstruct the raw tree of an archived version, None is the current tree
+
+        The deltas are applied starting from the next checkpoint or the current
+        tree. The trees are cached, reconstructing all versions one after
+        another reads every file only once."""
+        if timestamp in self._raw_trees:
+            return self._raw_trees[timestamp]
+
+        if timestamp is None:
+            raw_tree = store.load_object_from_file(self._current_path, default={})
+        elif self._is_checkpoint(timestamp):
+            raw_tree = store.load_object_from_file(self._full_path(timestamp), default={})
+        else:
+            # Walk up to the next checkpoint without recursion
+            chain = [timestamp]
+            successor = self._successor(timestamp)
+            while successor is not None and successor not in self._raw_trees and \
+                  not self._is_checkpoint(successor):
+                chain.append(successor)
+                successor = self._successor(successor)
+
+            raw_tree = self.load_raw_tree(successor)
+            for archived in reversed(chain):
+                delta = store.load_object_from_file(self._delta_path(archived))
+                raw_tree = apply_delta(raw_tree, delta)
+                self._raw_trees[archived] = raw_tree
+
+        self._raw_trees[timestamp] = raw_tree
+        return raw_tree
+
+    def load_tree(self, timestamp: str) -> StructuredDataTree:
+        return StructuredDataTree().create_tree_from_raw_tree(self.load_raw_tree(timestamp))
+
+    def diff(self, timestamp: str) -> Optional[TreeDiff]:
+        """The differences of the next newer version to an archived version
+
+        None is returned for versions archived without the differences."""
+        stored = store.load_object_from_file(self._diff_path(timestamp))
+        if stored is None:
+            return None
+        num_new, num_changed, num_removed, raw_delta_tree = stored
+        delta_tree = StructuredDataTree().create_tree_from_raw_tree(raw_delta_tree)
+        return num_new, num_changed, num_removed, delta_tree
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Shared storage of the item states of all hosts
+
+The item states (e.g. counters) of all hosts are stored in a fixed number of
+stripe files instead of one file per host. The stripe of a host is chosen by a
+hash of the host name. Every stripe has its own lock, so processes working on
+hosts of different stripes do not block each other.
+
+A stripe is an append only log. Saving the item states of a host appends a
+single record that only contains the updated and the removed keys. The readers
+map the stripe into memory and remember the records of each host, so a load
+only parses the records that have been appended since the last access to the
+stripe.
+
+Layout of a record (all numbers are little endian):
+
+    header   length of the host name, length of the data, flags
+    name     the host name, UTF-8 encoded
+    data     marshaled tuple of the updated item states and the removed keys
+
+A record with the FULL flag contains all item states of the host, the records
+of the host before it are obsolete. Such a record is written when a host has
+collected too many records. An empty FULL record removes the host. A stripe
+that mostly consists of obsolete records is compacted, i.e. rewritten with one
+full record per host.
+"""
+
+import fcntl
+import marshal
+import mmap
+import os
+import struct
+import zlib
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
+
+import cmk.utils.store as store
+from cmk.utils.type_defs import HostName
+
+ItemStates = Dict[Any, Any]
+
+_RECORD_HEADER = struct.Struct("<HIB")
+_FLAG_FULL = 1
+
+# Write a full record instead of a delta when a host has collected this number of records
+_MAX_RECORDS_PER_HOST = 16
+# Stripes smaller than this are never compacted
+_MIN_COMPACTION_SIZE = 1024 * 1024
+
+
+class _Record(NamedTuple):
+    data_offset: int
+    data_length: int
+    size: int
+
+
+def _pack_record(hostname: HostName, updated: ItemStates, removed: List[Any],
+                 full: bool) -> bytes:
+    name = hostname.encode("utf-8")
+    data = marshal.dumps((updated, removed))
+    return _RECORD_HEADER.pack(len(name), len(data), _FLAG_FULL if full else 0) + name + data
+
+
+class _Stripe:
+    def __init__(self, path: Path) -> None:
+        super().__init__()
+        self._path = path
+        self._lock_path = path.with_name(path.name + ".lock")
+        self._lock_fd: Optional[int] = None
+        self._fd: Optional[int] = None
+        self._inode: Optional[int] = None
+        self._data: Optional[mmap.mmap] = None
+        self._mapped_size = 0
+        # The records of the hosts found up to this offset
+        self._indexed_size = 0
+        self._records: Dict[HostName, List[_Record]] = {}
+        self._live_size = 0
+
+    @contextmanager
+    def locked(self, exclusive: bool) -> Iterator[None]:
+        if self._lock_fd is None:
+            store.makedirs(self._path.parent)
+            self._lock_fd = os.open(str(self._lock_path), os.O_RDWR | os.O_CREAT, 0o660)
+        fcntl.flock(self._lock_fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        try:
+            self._refresh()
+            yield
+        finally:
+            fcntl.flock(self._lock_fd, fcntl.LOCK_UN)
+
+    def _close(self) -> None:
+        if self._data is not None:
+            self._data.close()
+        if self._fd is not None:
+            os.close(self._fd)
+        self._fd = self._inode = self._data = None
+        self._mapped_size = self._indexed_size = self._live_size = 0
+        self._records = {}
+
+    def _refresh(self) -> None:
+        try:
+            stat = os.stat(str(self._path))
+        except FileNotFoundError:
+            self._close()
+            return
+
+        if stat.st_ino != self._inode:
+            # The stripe has been compacted by another process
+            self._close()
+            self._fd = os.open(str(self._path), os.O_RDWR | os.O_APPEND)
+            self._inode = os.fstat(self._fd).st_ino
+
+        if stat.st_size != self._mapped_size:
+            if self._data is not None:
+                self._data.close()
+                self._data = None
+            if stat.st_size:
+                assert self._fd is not None
+                self._data = mmap.mmap(self._fd, stat.st_size, access=mmap.ACCESS_READ)
+            self._mapped_size = stat.st_size
+            self._index()
+
+    def _index(self) -> None:
+        """Add the records appended since the last refresh to the index"""
+        data = self._data
+        offset = self._indexed_size
+        while data is not None and offset + _RECORD_HEADER.size <= self._mapped_size:
+            name_length, data_length, flags = _RECORD_HEADER.unpack_from(data, offset)
+            data_offset = offset + _RECORD_HEADER.size + name_length
+            end = data_offset + data_length
+            if end > self._mapped_size:
+                break  # Incomplete record of an interrupted write
+
+            hostname = data[offset + _RECORD_HEADER.size:data_offset].decode("utf-8")
+            if flags & _FLAG_FULL:
+                self._live_size -= sum(record.size for record in self._records.pop(hostname, []))
+                if marshal.loads(data[data_offset:end]) == ({}, []):
+                    # The host has been removed
+                    offset = end
+                    continue
+            self._records.setdefault(hostname, []).append(
+                _Record(data_offset, data_length, end - offset))
+            self._live_size += end - offset
+            offset = end
+        self._indexed_size = offset
+
+    def __contains__(self, hostname: HostName) -> bool:
+        return hostname in self._records
+
+    def num_records(self, hostname: HostName) -> int:
+        return len(self._records.get(hostname, []))
+
+    def item_states(self, hostname: HostName) -> ItemStates:
+        item_states: ItemStates = {}
+        data = self._data
+        if data is None:
+            return item_states
+
+        for record in self._records.get(hostname, []):
+            updated, removed = marshal.loads(
+                data[record.data_offset:record.data_offset + record.data_length])
+            for key in removed:
+                item_states.pop(key, None)
+            item_states.update(updated)
+        return item_states
+
+    def append(self, hostname: HostName, updated: ItemStates, removed: List[Any],
+               full: bool) -> None:
+        """Append a record to the stripe, needs the exclusive lock"""
+        if self._fd is None:
+            self._fd = os.open(str(self._path), os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o660)
+            self._inode = os.fstat(self._fd).st_ino
+        elif self._mapped_size > self._indexed_size:
+            # Drop the incomplete record of an interrupted write
+            os.ftruncate(self._fd, self._indexed_size)
+
+        os.write(self._fd, _pack_record(hostname, updated, removed, full))
+        self._refresh()
+
+        if self._indexed_size > max(_MIN_COMPACTION_SIZE, 2 * self._live_size):
+            self._compact()
+
+    def _compact(self) -> None:
+        """Rewrite the stripe with one full record per host, needs the exclusive lock"""
+        records = []
+        for hostname in self._records:
+            item_states = self.item_states(hostname)
+            if item_states:
+                records.append(_pack_record(hostname, item_states, [], full=True))
+
+        tmp_path = self._path.with_name(self._path.name + ".new")
+        with tmp_path.open("wb") as f:
+            f.write(b"".join(records))
+        tmp_path.rename(self._path)
+        self._refresh()
+
+
+class ItemStateStore:
+    """The item states of all hosts, stored in a fixed number of lock-striped files"""
+    def __init__(self, directory: Path, num_stripes: int = 64) -> None:
+        super().__init__()
+        self._stripes = [
+            _Stripe(directory / ("stripe.%02d" % index)) for index in range(num_stripes)
+        ]
+
+    def _stripe(self, hostname: HostName) -> _Stripe:
+        # crc32 is stable across processes, unlike hash()
+        return self._stripes[zlib.crc32(hostname.encode("utf-8")) % len(self._stripes)]
+
+    def load(self, hostname: HostName) -> Optional[ItemStates]:
+        """Returns None in case the store does not know the host at all"""
+        stripe = self._stripe(hostname)
+        with stripe.locked(exclusive=False):
+            if hostname not in stripe:
+                return None
+            return stripe.item_states(hostname)
+
+    def save(self, hostname: HostName, updated: ItemStates, removed: List[Any]) -> None:
+        """Apply the changes to the stored item states of the host
+
+        Only the changes are written. Changes of other processes since the last load
+        are kept, except for the keys that are updated or removed here."""
+        stripe = self._stripe(hostname)
+        with stripe.locked(exclusive=True):
+            if stripe.num_records(hostname) < _MAX_RECORDS_PER_HOST:
+                stripe.append(hostname, updated, removed, full=False)
+                return
+
+            item_states = stripe.item_states(hostname)
+            for key in removed:
+                item_states.pop(key, None)
+            item_states.update(updated)
+            stripe.append(hostname, item_states, [], full=True)
+
+    def replace(self, hostname: HostName, item_states: ItemStates) -> None:
+        stripe = self._stripe(hostname)
+        with stripe.locked(exclusive=True):
+            stripe.append(hostname, item_states, [], full=True)
+
+    def remove(self, hostname: HostName) -> bool:
+        """Returns whether or not the store knew the host"""
+        stripe = self._stripe(hostname)
+        with stripe.locked(exclusive=True):
+            if hostname not in stripe:
+                return False
+            stripe.append(hostname, {}, [], full=True)
+            return True
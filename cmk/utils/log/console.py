@@ -41,6 +41,10 @@ def log(level: int, text: str, *args: Any, **kwargs: Any) -> None:
     stream: IO[str] = kwargs.pop("stream", sys.stdout)
     assert not kwargs
 
+    # Setting the stream is expensive, e.g. for the output of the SNMP scan of every OID
+    if not _console.isEnabledFor(level):
+        return
+
     with set_stream(_console, _handler, stream):
         _console.log(level, text, *args)
 
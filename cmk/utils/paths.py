@@ -71,6 +71,11 @@ base_discovered_host_labels_dir = Path(_omd_path("var/check_mk/discovered_host_l
 discovered_host_labels_dir = base_discovered_host_labels_dir
 piggyback_dir = Path(tmp_dir, "piggyback")
 piggyback_source_dir = Path(tmp_dir, "piggyback_sources")
+piggyback_segment_dir = Path(tmp_dir, "piggyback_segments")
+precompiled_config_dir = Path(tmp_dir, "precompiled_config")
+item_states_dir = Path(tmp_dir, "item_states")
+autochecks_index_file = Path(tmp_dir, "autochecks_index")
+snmpwalk_index_dir = Path(tmp_dir, "snmpwalk_index")
 crash_dir = Path(var_dir, "crashes")
 diagnostics_dir = Path(var_dir, "diagnostics")
 site_config_dir = Path(var_dir, "site_configs")
@@ -8,6 +8,7 @@ import errno
 import logging
 import os
 import tempfile
+import time
 from pathlib import Path
 from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
 
@@ -17,6 +18,7 @@ import cmk.utils.store as store
 import cmk.utils.translations
 from cmk.utils.exceptions import MKGeneralException
 from cmk.utils.log import VERBOSE
+from cmk.utils.piggyback_segment import Segment, SegmentEntry, write_segment
 from cmk.utils.regex import regex
 from cmk.utils.render import Age
 from cmk.utils.type_defs import AgentRawData
@@ -29,6 +31,8 @@ PiggybackFileInfo = NamedTuple('PiggybackFileInfo', [
     ('successfully_processed', bool),
     ('reason', str),
     ('reason_status', int),
+    # Only set for data read from a segment
+    ('segment', Optional[Segment]),
 ])
 
 PiggybackRawDataInfo = NamedTuple('PiggybackRawDataInfo', [
@@ -58,6 +62,13 @@ PiggybackTimeSettings = List[Tuple[Optional[str], str, int]]
 # "source_hostname":
 # - Path(tmp/check_mk/piggyback/HOST/SOURCE).name
 # - Path(tmp/check_mk/piggyback_sources/SOURCE).name
+# - Path(tmp/check_mk/piggyback_segments/SOURCE).name
+#
+# "segment":
+# - tmp/check_mk/piggyback_segments/SOURCE
+# - Holds the data of all piggybacked hosts of the source host, see
+#   cmk.utils.piggyback_segment. Used instead of the piggybacked host
+#   sources and the source state file if enabled.
 
 
 def get_piggyback_raw_data(
@@ -88,7 +99,7 @@ def get_piggyback_raw_data(
             # Raw data is always stored as bytes. Later the content is
             # converted to unicode in abstact.py:_parse_info which respects
             # 'encoding' in section options.
-            raw_data = AgentRawData(store.load_bytes_from_file(file_info.file_path))
+            raw_data = _load_piggyback_raw_data(file_info, piggybacked_hostname)
 
         except IOError as e:
             reason = "Cannot read piggyback raw data from source '%s'" % file_info.source_hostname
@@ -135,19 +146,39 @@ def get_piggyback_raw_data(
     return piggyback_data
 
 
+def _load_piggyback_raw_data(file_info: PiggybackFileInfo,
+                             piggybacked_hostname: str) -> AgentRawData:
+    if file_info.segment is None:
+        return AgentRawData(store.load_bytes_from_file(file_info.file_path))
+
+    raw_data = file_info.segment.raw_data(piggybacked_hostname)
+    if raw_data is None:
+        raise IOError("No data for '%s' in segment" % piggybacked_hostname)
+    return AgentRawData(raw_data)
+
+
 def get_source_and_piggyback_hosts(
         time_settings: PiggybackTimeSettings) -> Iterator[Tuple[str, str]]:
     """Generates all piggyback pig/piggybacked host pairs that have up-to-date data"""
+    segments = _get_segments()
+
+    piggybacked_hostnames: Dict[str, None] = {
+        piggybacked_host_folder.name: None
+        for piggybacked_host_folder in _get_piggybacked_host_folders()
+    }
+    for segment in segments.values():
+        piggybacked_hostnames.update(dict.fromkeys(segment.piggybacked_hostnames()))
 
     # Pylint bug (https://github.com/PyCQA/pylint/issues/1660). Fixed with pylint 2.x
-    for piggybacked_host_folder in _get_piggybacked_host_folders():
+    for piggybacked_hostname in piggybacked_hostnames:
         for file_info in _get_piggyback_processed_file_infos(
-                piggybacked_host_folder.name,
+                piggybacked_hostname,
                 time_settings,
+                segments,
         ):
             if not file_info.successfully_processed:
                 continue
-            yield file_info.source_hostname, piggybacked_host_folder.name
+            yield file_info.source_hostname, piggybacked_hostname
 
 
 def has_piggyback_raw_data(piggybacked_hostname: str, time_settings: PiggybackTimeSettings) -> bool:
@@ -158,7 +189,10 @@ def has_piggyback_raw_data(piggybacked_hostname: str, time_settings: PiggybackTi
 
 
 def _get_piggyback_processed_file_infos(
-        piggybacked_hostname: str, time_settings: PiggybackTimeSettings) -> List[PiggybackFileInfo]:
+    piggybacked_hostname: str,
+    time_settings: PiggybackTimeSettings,
+    segments: Optional[Dict[str, Segment]] = None,
+) -> List[PiggybackFileInfo]:
     """Gather a list of piggyback files to read for further processing.
 
     Please note that there may be multiple parallel calls executing the
@@ -166,9 +200,22 @@ def _get_piggyback_processed_file_infos(
     functions. Therefor all these functions needs to deal with suddenly vanishing or
     updated files/directories.
     """
-    source_hostnames = get_source_hostnames(piggybacked_hostname)
-    matching_time_settings = _get_matching_time_settings(source_hostnames, piggybacked_hostname,
-                                                         time_settings)
+    if segments is None:
+        segments = _get_segments()
+
+    stored_in_segments: Dict[str, Tuple[Segment, float]] = {}
+    for source_hostname, segment in segments.items():
+        stored = segment.stored(piggybacked_hostname)
+        if stored is not None:
+            stored_in_segments[source_hostname] = (segment, stored)
+
+    # A source host that already uses a segment may have left some files behind
+    source_hostnames = [
+        source_hostname for source_hostname in _get_source_hostnames_of_files(piggybacked_hostname)
+        if source_hostname not in stored_in_segments
+    ]
+    matching_time_settings = _get_matching_time_settings(
+        source_hostnames + list(stored_in_segments), piggybacked_hostname, time_settings)
 
     file_infos: List[PiggybackFileInfo] = []
     for source_hostname in source_hostnames:
@@ -181,8 +228,18 @@ def _get_piggyback_processed_file_infos(
             source_hostname, piggybacked_hostname, piggyback_file_path, matching_time_settings)
 
         piggyback_file_info = PiggybackFileInfo(source_hostname, piggyback_file_path,
-                                                successfully_processed, reason, reason_status)
+                                                successfully_processed, reason, reason_status,
+                                                None)
         file_infos.append(piggyback_file_info)
+
+    for source_hostname, (segment, stored) in stored_in_segments.items():
+        successfully_processed, reason, reason_status = _get_piggyback_processed_segment_info(
+            source_hostname, piggybacked_hostname, stored, segment.last_contact,
+            matching_time_settings)
+
+        file_infos.append(
+            PiggybackFileInfo(source_hostname, _get_segment_path(source_hostname),
+                              successfully_processed, reason, reason_status, segment))
     return file_infos
 
 
@@ -232,6 +289,32 @@ def _get_piggyback_processed_file_info(
     return True, "Successfully processed from source '%s'" % source_hostname, 0
 
 
+def _get_piggyback_processed_segment_info(
+        source_hostname: str, piggybacked_hostname: str, stored: float, last_contact: float,
+        time_settings: Dict[Tuple[Optional[str], str], int]) -> Tuple[bool, str, int]:
+    """Same as _get_piggyback_processed_file_info(), but based on the segment index
+
+    The time the data was stored replaces the mtime of the piggyback file and the
+    last contact of the source replaces the mtime of the source status file."""
+    max_cache_age = _get_max_cache_age(source_hostname, piggybacked_hostname, time_settings)
+    validity_period = _get_validity_period(source_hostname, piggybacked_hostname, time_settings)
+    validity_state = _get_validity_state(source_hostname, piggybacked_hostname, time_settings)
+
+    file_age = time.time() - stored
+    if file_age > max_cache_age:
+        return False, "Piggyback file too old: %s" % Age(file_age - max_cache_age), 0
+
+    if not last_contact:
+        reason = "Source '%s' not sending piggyback data" % source_hostname
+        return _eval_file_in_validity_period(file_age, validity_period, validity_state, reason)
+
+    if last_contact > stored:
+        reason = "Piggyback file not updated by source '%s'" % source_hostname
+        return _eval_file_in_validity_period(file_age, validity_period, validity_state, reason)
+
+    return True, "Successfully processed from source '%s'" % source_hostname, 0
+
+
 def _get_max_cache_age(source_hostname: str, piggybacked_hostname: str,
                        time_settings: Dict[Tuple[Optional[str], str], int]) -> int:
     key = 'max_cache_age'
@@ -291,11 +374,40 @@ def remove_source_status_file(source_hostname: str) -> bool:
     """Remove the source_status_file of this piggyback host which will
     mark the piggyback data from this source as outdated."""
     source_status_path = _get_source_status_file_path(source_hostname)
-    return _remove_piggyback_file(source_status_path)
+    removed = _remove_piggyback_file(source_status_path)
+    return _reset_last_contact_of_segment(source_hostname) or removed
 
 
-def store_piggyback_raw_data(source_hostname: str, piggybacked_raw_data: Dict[str,
-                                                                              List[bytes]]) -> None:
+def _reset_last_contact_of_segment(source_hostname: str) -> bool:
+    segment_path = _get_segment_path(source_hostname)
+    if not segment_path.exists():
+        return False
+
+    with store.locked(segment_path):
+        segment = Segment.load(segment_path)
+        if segment is None or not segment.last_contact:
+            return False
+        write_segment(segment_path, 0.0, segment)
+    return True
+
+
+def store_piggyback_raw_data(
+    source_hostname: str,
+    piggybacked_raw_data: Dict[str, List[bytes]],
+    segmented: bool = False,
+) -> None:
+    """Store the piggyback data received from a source host
+
+    With segmented=True the data of all piggybacked hosts is written to the
+    segment of the source host instead of one file per piggybacked host. Files
+    left from the other storage are removed when the storage is switched."""
+    if segmented:
+        _store_piggyback_segment(source_hostname, piggybacked_raw_data)
+        return
+
+    # Data only present in a segment has to be sent again by the source host
+    _remove_piggyback_file(_get_segment_path(source_hostname))
+
     piggyback_file_paths = []
     for piggybacked_hostname, lines in piggybacked_raw_data.items():
         piggyback_file_path = _get_piggybacked_file_path(source_hostname, piggybacked_hostname)
@@ -324,6 +436,49 @@ def store_piggyback_raw_data(source_hostname: str, piggybacked_raw_data: Dict[st
         remove_source_status_file(source_hostname)
 
 
+def _store_piggyback_segment(source_hostname: str,
+                             piggybacked_raw_data: Dict[str, List[bytes]]) -> None:
+    segment_path = _get_segment_path(source_hostname)
+    with store.locked(segment_path):
+        previous_segment = Segment.load(segment_path)
+        if previous_segment is None:
+            # Migrate: The files of this source host are replaced by the segment
+            _remove_piggyback_files_of_source(source_hostname)
+        elif not piggybacked_raw_data and not previous_segment.last_contact:
+            logger.log(VERBOSE, "Received no piggyback data")
+            return
+
+        # The last contact is compared with the time the data of a piggybacked host was
+        # stored, just like the mtime of the status file with the mtime of the data files.
+        now = time.time()
+        entries = [
+            SegmentEntry(piggybacked_hostname, now, b"%s\n" % b"\n".join(lines))
+            for piggybacked_hostname, lines in piggybacked_raw_data.items()
+        ]
+        if previous_segment is not None:
+            # Keep the data of the piggybacked hosts missing this time. It is still
+            # used within the validity period and removed by the cleanup.
+            entries.extend(entry for entry in previous_segment
+                           if entry.piggybacked_hostname not in piggybacked_raw_data)
+
+        if piggybacked_raw_data:
+            logger.log(VERBOSE, "Received piggyback data for %d hosts", len(piggybacked_raw_data))
+        else:
+            logger.log(VERBOSE, "Received no piggyback data")
+
+        if not entries:
+            _remove_piggyback_file(segment_path)
+            return
+
+        write_segment(segment_path, now if piggybacked_raw_data else 0.0, entries)
+
+
+def _remove_piggyback_files_of_source(source_hostname: str) -> None:
+    for piggybacked_host_folder in _get_piggybacked_host_folders():
+        _remove_piggyback_file(piggybacked_host_folder / source_hostname)
+    _remove_piggyback_file(_get_source_status_file_path(source_hostname))
+
+
 def _store_status_file_of(status_file_path: Path, piggyback_file_paths: List[Path]) -> None:
     store.makedirs(status_file_path.parent)
 
@@ -369,13 +524,25 @@ def _store_status_file_of(status_file_path: Path, piggyback_file_paths: List[Pat
 
 
 def get_source_hostnames(piggybacked_hostname: Optional[str] = None) -> List[str]:
+    segments = _get_segments()
     if piggybacked_hostname is None:
         return [
             source_host.name
             for piggybacked_host_folder in _get_piggybacked_host_folders()
             for source_host in _get_piggybacked_host_sources(piggybacked_host_folder)
+        ] + [
+            source_hostname for source_hostname, segment in segments.items()
+            for _piggybacked_hostname in segment.piggybacked_hostnames()
         ]
 
+    source_hostnames = _get_source_hostnames_of_files(piggybacked_hostname)
+    return source_hostnames + [
+        source_hostname for source_hostname, segment in segments.items()
+        if piggybacked_hostname in segment and source_hostname not in source_hostnames
+    ]
+
+
+def _get_source_hostnames_of_files(piggybacked_hostname: str) -> List[str]:
     piggybacked_host_folder = cmk.utils.paths.piggyback_dir / Path(piggybacked_hostname)
     return [
         source_host.name for source_host in _get_piggybacked_host_sources(piggybacked_host_folder)
@@ -421,6 +588,31 @@ def _get_source_state_files() -> List[Path]:
         raise
 
 
+def _get_segment_paths() -> List[Path]:
+    try:
+        return [
+            segment_path for segment_path in cmk.utils.paths.piggyback_segment_dir.iterdir()
+            if not segment_path.name.startswith(".")
+        ]
+    except OSError as e:
+        if e.errno == errno.ENOENT:
+            return []
+        raise
+
+
+def _get_segments() -> Dict[str, Segment]:
+    segments = {}
+    for segment_path in _get_segment_paths():
+        segment = Segment.load(segment_path)
+        if segment is not None:
+            segments[segment_path.name] = segment
+    return segments
+
+
+def _get_segment_path(source_hostname: str) -> Path:
+    return cmk.utils.paths.piggyback_segment_dir / source_hostname
+
+
 def _get_source_status_file_path(source_hostname: str) -> Path:
     return cmk.utils.paths.piggyback_source_dir / source_hostname
 
@@ -458,6 +650,7 @@ def cleanup_piggyback_files(time_settings: List[Tuple[Optional[str], str, int]])
 
     _cleanup_old_source_status_files(piggybacked_hosts_settings)
     _cleanup_old_piggybacked_files(piggybacked_hosts_settings)
+    _cleanup_old_segment_entries(time_settings)
 
 
 def _get_piggybacked_hosts_settings(
@@ -558,3 +751,45 @@ def _cleanup_old_piggybacked_files(
                 "Piggyback folder '%s' is empty. Removed it.",
                 piggybacked_host_folder,
             )
+
+
+def _cleanup_old_segment_entries(time_settings: List[Tuple[Optional[str], str, int]]) -> None:
+    """Remove the data of piggybacked hosts which exceed configured maximum cache age
+    from the segments. Segments without any data left are removed."""
+
+    for segment_path in _get_segment_paths():
+        source_hostname = segment_path.name
+        with store.locked(segment_path):
+            segment = Segment.load(segment_path)
+            if segment is None:
+                # Nobody is writing it, we have the lock
+                _remove_piggyback_file(segment_path)
+                continue
+
+            entries = []
+            for entry in segment:
+                successfully_processed, reason, _reason_status = _get_piggyback_processed_segment_info(
+                    source_hostname,
+                    entry.piggybacked_hostname,
+                    entry.stored,
+                    segment.last_contact,
+                    _get_matching_time_settings([source_hostname], entry.piggybacked_hostname,
+                                                time_settings),
+                )
+                if successfully_processed:
+                    entries.append(entry)
+                    continue
+
+                logger.log(
+                    VERBOSE,
+                    "Piggyback data of '%s' in '%s' is outdated (%s). Remove it.",
+                    entry.piggybacked_hostname,
+                    segment_path,
+                    reason,
+                )
+
+            if not entries:
+                logger.log(VERBOSE, "Piggyback segment '%s' is empty. Removed it.", segment_path)
+                _remove_piggyback_file(segment_path)
+            elif len(entries) < len(segment):
+                write_segment(segment_path, segment.last_contact, entries)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Segment storage of piggyback data
+
+A source host like a vSphere server or a Kubernetes cluster may deliver piggyback
+data for thousands of piggybacked hosts. Storing one file per piggybacked host
+means to create, rename and stat thousands of small files in every check cycle.
+
+A segment holds the piggyback data of all piggybacked hosts of one source host
+in a single file. The file starts with an index that makes it possible to look
+up the data of a single piggybacked host without reading the whole file.
+
+Layout (all numbers are little endian):
+
+    header   magic, last contact of the source, number of slots and entries
+    slots    open addressing hash table: entry number + 1 or 0 for empty slots
+    entries  offset and length of the name and of the data, time of storage
+    names    the piggybacked host names, UTF-8 encoded
+    data     the raw piggyback data
+"""
+
+import mmap
+import struct
+import zlib
+from pathlib import Path
+from typing import Iterable, Iterator, List, NamedTuple, Optional, Tuple, Union
+
+import cmk.utils.store as store
+
+_MAGIC = b"CMKPBS01"
+_HEADER = struct.Struct("<8sdII")
+_SLOT = struct.Struct("<I")
+_ENTRY = struct.Struct("<IIdQQ")
+
+
+class SegmentEntry(NamedTuple):
+    piggybacked_hostname: str
+    # Time the data has been received from the source host
+    stored: float
+    raw_data: bytes
+
+
+def _slot_of(name: bytes, num_slots: int) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(name) & (num_slots - 1)
+
+
+def write_segment(path: Path, last_contact: float, entries: Iterable[SegmentEntry]) -> None:
+    """Write the segment of a source host
+
+    last_contact is the time the source host has sent piggyback data the last time,
+    0.0 means that the source host did not send piggyback data the last time."""
+    entries = list(entries)
+    names = [entry.piggybacked_hostname.encode("utf-8") for entry in entries]
+
+    num_slots = 2
+    while num_slots < 2 * len(entries):
+        num_slots *= 2
+
+    slots = [0] * num_slots
+    for index, name in enumerate(names):
+        slot = _slot_of(name, num_slots)
+        while slots[slot]:
+            slot = (slot + 1) & (num_slots - 1)
+        slots[slot] = index + 1
+
+    name_offset = _HEADER.size + num_slots * _SLOT.size + len(entries) * _ENTRY.size
+    data_offset = name_offset + sum(len(name) for name in names)
+
+    chunks: List[bytes] = [
+        _HEADER.pack(_MAGIC, last_contact, num_slots, len(entries)),
+        struct.pack("<%dI" % num_slots, *slots),
+    ]
+    for name, entry in zip(names, entries):
+        chunks.append(
+            _ENTRY.pack(name_offset, len(name), entry.stored, data_offset, len(entry.raw_data)))
+        name_offset += len(name)
+        data_offset += len(entry.raw_data)
+    chunks.extend(names)
+    chunks.extend(entry.raw_data for entry in entries)
+
+    store.makedirs(path.parent)
+    store.save_bytes_to_file(path, b"".join(chunks))
+
+
+class Segment:
+    """Read access to the segment of a source host
+
+    The file is memory mapped. The index is not parsed up front, only the
+    entries that are looked up are read."""
+    def __init__(self, data: Union[bytes, mmap.mmap]) -> None:
+        super().__init__()
+        magic, last_contact, self._num_slots, self._num_entries = _HEADER.unpack_from(data)
+        if magic != _MAGIC:
+            raise ValueError("Invalid piggyback segment")
+        self.last_contact: float = last_contact
+        self._data = data
+        self._entries_offset = _HEADER.size + self._num_slots * _SLOT.size
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["Segment"]:
+        """Returns None in case the segment does not exist or is not (yet) valid"""
+        try:
+            with path.open("rb") as f:
+                # The mapping stays valid, even if the file is replaced in the meantime
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except FileNotFoundError:
+            return None
+        except ValueError:
+            return None  # Empty file, e.g. created by locking
+
+        try:
+            return cls(data)
+        except (struct.error, ValueError):
+            return None
+
+    def __len__(self) -> int:
+        return self._num_entries
+
+    def _entry(self, index: int) -> Tuple[bytes, float, int, int]:
+        name_offset, name_length, stored, data_offset, data_length = _ENTRY.unpack_from(
+            self._data, self._entries_offset + index * _ENTRY.size)
+        return self._data[name_offset:name_offset + name_length], stored, data_offset, data_length
+
+    def _find(self, piggybacked_hostname: str) -> Optional[Tuple[float, int, int]]:
+        name = piggybacked_hostname.encode("utf-8")
+        slot = _slot_of(name, self._num_slots)
+        while True:
+            index = _SLOT.unpack_from(self._data, _HEADER.size + slot * _SLOT.size)[0]
+            if not index:
+                return None
+            entry_name, stored, data_offset, data_length = self._entry(index - 1)
+            if entry_name == name:
+                return stored, data_offset, data_length
+            slot = (slot + 1) & (self._num_slots - 1)
+
+    def __contains__(self, piggybacked_hostname: str) -> bool:
+        return self._find(piggybacked_hostname) is not None
+
+    def stored(self, piggybacked_hostname: str) -> Optional[float]:
+        """Time the data of the piggybacked host has been stored"""
+        found = self._find(piggybacked_hostname)
+        return None if found is None else found[0]
+
+    def raw_data(self, piggybacked_hostname: str) -> Optional[bytes]:
+        found = self._find(piggybacked_hostname)
+        if found is None:
+            return None
+        _stored, data_offset, data_length = found
+        return self._data[data_offset:data_offset + data_length]
+
+    def piggybacked_hostnames(self) -> Iterator[str]:
+        for index in range(self._num_entries):
+            yield self._entry(index)[0].decode("utf-8")
+
+    def __iter__(self) -> Iterator[SegmentEntry]:
+        for index in range(self._num_entries):
+            name, stored, data_offset, data_length = self._entry(index)
+            yield SegmentEntry(name.decode("utf-8"), stored,
+                               self._data[data_offset:data_offset + data_length])
@@ -8,7 +8,7 @@ import json
 import logging
 import os
 import time
-from typing import Dict, Callable, List, Optional, Tuple, Iterator
+from typing import Any, Dict, Callable, List, Optional, Tuple, Iterator
 
 from six import ensure_str
 
@@ -23,6 +23,7 @@ logger = logging.getLogger("cmk.prediction")
 
 TimeWindow = Tuple[Timestamp, Timestamp, Seconds]
 RRDColumnFunction = Callable[[Timestamp, Timestamp], "TimeSeries"]
+RRDColumnsFunction = Callable[[List[Tuple[Timestamp, Timestamp]]], List["TimeSeries"]]
 TimeSeriesValue = Optional[float]
 TimeSeriesValues = List[TimeSeriesValue]
 ConsolidationFunctionName = str
@@ -118,19 +119,42 @@ class TimeSeries:
         twindow : 3-tuple, (start, end, step)
              description of target time interval
         """
-        upsa = []
-        i = 0
         start, end, step = twindow
-        current_times = rrd_timestamps(self.twindow)
-        if start != self.start or end != self.end or step != self.step:
-            for t in range(start, end, step):
-                if t >= current_times[i] + shift:
-                    i += 1
-                upsa.append(self.values[i])
+        if start == self.start and end == self.end and step == self.step:
+            return self.values
 
-            return upsa
+        values = self.values
+        return [values[i] for i in self.bfill_upsample_indices(twindow, shift).tolist()]
 
-        return self.values
+    def bfill_upsample_indices(self, twindow: TimeWindow, shift: Seconds) -> Any:
+        """Indices of the values for the points of the upsampled time series
+
+        The values are the same as the ones of bfill_upsample, but can be
+        selected from an array at once."""
+        # Imported here to keep numpy out of all the processes not computing predictions
+        import numpy as np  # type: ignore[import] # pylint: disable=import-outside-toplevel
+        start, end, step = twindow
+        if start == self.start and end == self.end and step == self.step:
+            return np.arange(len(self.values))
+
+        if self.step >= step:
+            # The resolution of the series is not finer than the one of twindow, so
+            # every point is at most one measurement ahead of the previous one. The
+            # index is the number of measurements before the point.
+            indices = np.arange(self.start + self.step + shift, self.end + self.step + shift,
+                                self.step).searchsorted(np.arange(start, end, step), side="right")
+            if not len(indices) or (indices[0] <= 1 and
+                                    indices[-1] < len(range(self.start, self.end, self.step))):
+                return indices
+
+        i = 0
+        stepwise = []
+        current_times = rrd_timestamps(self.twindow)
+        for t in range(start, end, step):
+            if t >= current_times[i] + shift:
+                i += 1
+            stepwise.append(i)
+        return np.array(stepwise, dtype=int)
 
     def downsample(self,
                    twindow: TimeWindow,
@@ -234,28 +258,42 @@ def get_rrd_data(hostname: HostName,
           x---v---v---v---v---y
 
     """
+    return get_rrd_data_batch(hostname, service_description, varname, cf, [(fromtime, untiltime)],
+                              max_entries)[0]
+
+
+def get_rrd_data_batch(hostname: HostName,
+                       service_description: ServiceName,
+                       varname: MetricName,
+                       cf: ConsolidationFunctionName,
+                       time_ranges: List[Tuple[Timestamp, Timestamp]],
+                       max_entries: int = 400) -> List[TimeSeries]:
+    """Fetch RRD historic metrics data of several time ranges with a single query
 
+    Returns a TimeSeries object per time range, see get_rrd_data"""
     step = 1
     rpn = "%s.%s" % (varname, cf.lower())  # "MAX" -> "max"
-    point_range = ":".join(
-        livestatus.lqencode(str(x)) for x in (fromtime, untiltime, step, max_entries))
-    column = "rrddata:m1:%s:%s" % (rpn, point_range)
+    columns = []
+    for nr, (fromtime, untiltime) in enumerate(time_ranges, 1):
+        point_range = ":".join(
+            livestatus.lqencode(str(x)) for x in (fromtime, untiltime, step, max_entries))
+        columns.append("rrddata:m%d:%s:%s" % (nr, rpn, point_range))
 
-    lql = livestatus_lql([hostname], [column], service_description) + "OutputFormat: python\n"
+    lql = livestatus_lql([hostname], columns, service_description) + "OutputFormat: python\n"
 
     try:
         connection = livestatus.SingleSiteConnection("unix:%s" %
                                                      cmk.utils.paths.livestatus_unix_socket)
-        response = connection.query_value(lql)
+        response = connection.query_row(lql)
     except livestatus.MKLivestatusNotFoundError as e:
         if cmk.utils.debug.enabled():
             raise
         raise MKGeneralException("Cannot get historic metrics via Livestatus: %s" % e)
 
-    if response is None:
+    if any(data is None for data in response):
         raise MKGeneralException("Cannot retrieve historic data with Nagios Core")
 
-    return TimeSeries(response)
+    return [TimeSeries(data) for data in response]
 
 
 def rrd_datacolum(hostname: HostName, service_description: ServiceName, varname: MetricName,
@@ -268,6 +306,16 @@ def rrd_datacolum(hostname: HostName, service_description: ServiceName, varname:
     return time_boundaries
 
 
+def rrd_datacolumns(hostname: HostName, service_description: ServiceName, varname: MetricName,
+                    cf: ConsolidationFunctionName) -> RRDColumnsFunction:
+    "Partial helper function to get the rrd data of several time ranges at once"
+
+    def time_ranges(ranges: List[Tuple[Timestamp, Timestamp]]) -> List[TimeSeries]:
+        return get_rrd_data_batch(hostname, service_description, varname, cf, ranges)
+
+    return time_ranges
+
+
 def predictions_dir(hostname: HostName, service_description: ServiceName,
                     dsname: MetricName) -> str:
     return os.path.join(cmk.utils.paths.var_dir, "prediction", hostname,
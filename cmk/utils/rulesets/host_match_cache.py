@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Persisted host matches of rule conditions
+
+The RulesetOptimizer computes the set of matching hosts for every host condition
+of every rule. In most cases neither the rules nor the hosts change between two
+configuration runs. The HostMatchCache persists these host sets, keyed by the
+hash of the condition. Together with the matches, a digest of the match relevant
+attributes (tags and folder) of every host is stored. On the next run only the
+hosts with a changed digest need to be evaluated again.
+"""
+
+import hashlib
+import pickle
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Hashable, Optional, Set, Tuple
+
+import cmk.utils.store as store
+from cmk.utils.type_defs import HostName
+
+HostDigests = Dict[HostName, str]
+
+
+def condition_hash(condition_id: Hashable) -> str:
+    """Computes a stable (not process dependent) key for a host condition"""
+    return hashlib.sha256(repr(condition_id).encode("utf-8")).hexdigest()
+
+
+def host_digest(tags: Any, folder: str) -> str:
+    return hashlib.md5(repr((sorted(tags), folder)).encode("utf-8")).hexdigest()
+
+
+class HostMatchCache:
+    """Persists the hosts matching a host condition across processes
+
+    The file is only loaded on first access. The matches are always stored
+    for all configured hosts of the site. Callers that work on a subset of the
+    hosts have to intersect the result with their hosts.
+    """
+    def __init__(self, path: Path, host_digests: HostDigests) -> None:
+        super(HostMatchCache, self).__init__()
+        self._path = path
+        self._host_digests = host_digests
+        self._loaded = False
+        self._changed = False
+
+        self._matches: Dict[str, FrozenSet[HostName]] = {}
+        # Hosts that were added or changed since the matches were computed
+        self._outdated_hosts: Set[HostName] = set()
+        # Conditions that have been evaluated for the current hosts in this process
+        self._updated: Set[str] = set()
+
+        self.hits = 0
+        self.misses = 0
+
+    def _load(self) -> None:
+        self._loaded = True
+        raw = store.load_bytes_from_file(self._path)
+        if not raw:
+            return
+
+        try:
+            stored_digests, self._matches = pickle.loads(raw)
+        except Exception:
+            # Simply start from scratch. The file will be replaced on the next save.
+            self._matches = {}
+            return
+
+        self._outdated_hosts = {
+            hostname for hostname, digest in self._host_digests.items()
+            if stored_digests.get(hostname) != digest
+        }
+
+    def get(self, condition_id: Hashable) -> Optional[Tuple[Set[HostName], Set[HostName]]]:
+        """Returns the matching hosts and the hosts which need to be evaluated again
+
+        The removed hosts are already removed from the matching hosts. In case the
+        condition is not known, None is returned."""
+        if not self._loaded:
+            self._load()
+
+        try:
+            matches = self._matches[condition_hash(condition_id)]
+        except KeyError:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        valid_matches = {
+            hostname for hostname in matches
+            if hostname in self._host_digests and hostname not in self._outdated_hosts
+        }
+        return valid_matches, self._outdated_hosts
+
+    def set(self, condition_id: Hashable, matching_hosts: Set[HostName]) -> None:
+        """Remember the matches of a condition evaluated for all configured hosts"""
+        if not self._loaded:
+            self._load()
+
+        key = condition_hash(condition_id)
+        self._updated.add(key)
+
+        matches = frozenset(matching_hosts)
+        if self._matches.get(key) != matches:
+            self._matches[key] = matches
+            self._changed = True
+
+    def save(self) -> None:
+        """Write the matches of the current configuration"""
+        if not self._changed and not self._outdated_hosts:
+            return
+
+        # The stored matches of conditions that were not evaluated again are not
+        # valid for the outdated hosts. Forget them instead of storing wrong matches.
+        if self._outdated_hosts:
+            self._matches = {
+                key: matches for key, matches in self._matches.items() if key in self._updated
+            }
+
+        store.makedirs(self._path.parent)
+        store.save_bytes_to_file(self._path, pickle.dumps((self._host_digests, self._matches)))
+        self._changed = False
+        self._outdated_hosts = set()
+        self._updated.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "conditions": len(self._matches),
+            "outdated_hosts": len(self._outdated_hosts),
+        }
@@ -5,6 +5,7 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """This module provides generic Check_MK ruleset processing functionality"""
 
+from pathlib import Path
 from typing import TYPE_CHECKING, Any, Dict, Generator, List, Optional, Pattern, Set, Tuple
 
 from cmk.utils.rulesets.tuple_rulesets import (
@@ -14,7 +15,8 @@ from cmk.utils.rulesets.tuple_rulesets import (
     PHYSICAL_HOSTS,
     NEGATE,
 )
-from cmk.utils.regex import regex
+from cmk.utils.regex import regex, is_regex
+from cmk.utils.rulesets.host_match_cache import HostMatchCache, host_digest
 from cmk.utils.exceptions import MKGeneralException
 from cmk.utils.type_defs import HostName, ServiceName, TagGroups, TagList, Ruleset, RuleValue, Union
 
@@ -76,6 +78,7 @@ class RulesetMatcher:
         all_configured_hosts: Set[HostName],
         clusters_of: Dict[HostName, List[HostName]],
         nodes_of: Dict[HostName, List[HostName]],
+        host_match_cache_path: Optional[Path] = None,
     ) -> None:
         super(RulesetMatcher, self).__init__()
 
@@ -89,10 +92,9 @@ class RulesetMatcher:
             all_configured_hosts,
             clusters_of,
             nodes_of,
+            host_match_cache_path,
         )
 
-        self._service_match_cache: Dict = {}
-
     def is_matching_host_ruleset(self, match_object: RulesetMatchObject,
                                  ruleset: List[Dict]) -> bool:
         """Compute outcome of a ruleset set that just says yes/no
@@ -168,53 +170,13 @@ class RulesetMatcher:
 
         with_foreign_hosts = match_object.host_name not in \
                                 self.ruleset_optimizer.all_processed_hosts()
-        optimized_ruleset = self.ruleset_optimizer.get_service_ruleset(ruleset,
-                                                                       with_foreign_hosts,
-                                                                       is_binary=is_binary)
-
-        for value, hosts, service_labels_condition, service_labels_condition_cache_id, service_description_condition in optimized_ruleset:
-            if match_object.service_description is None:
-                continue
-
-            if match_object.host_name not in hosts:
-                continue
-
-            service_cache_id = (match_object.service_cache_id, service_description_condition,
-                                service_labels_condition_cache_id)
-
-            if service_cache_id in self._service_match_cache:
-                match = self._service_match_cache[service_cache_id]
-            else:
-                match = self._matches_service_conditions(service_description_condition,
-                                                         service_labels_condition, match_object)
-                self._service_match_cache[service_cache_id] = match
-
-            if match:
-                yield value
-
-    def _matches_service_conditions(self, service_description_condition: Tuple[bool, Pattern[str]],
-                                    service_labels_condition: Dict[str, str],
-                                    match_object: RulesetMatchObject) -> bool:
-        if not self._matches_service_description_condition(service_description_condition,
-                                                           match_object):
-            return False
-
-        if service_labels_condition \
-           and not matches_labels(match_object.service_labels, service_labels_condition):
-            return False
-
-        return True
+        if match_object.service_description is None:
+            return
 
-    def _matches_service_description_condition(self,
-                                               service_description_condition: Tuple[bool,
-                                                                                    Pattern[str]],
-                                               match_object: RulesetMatchObject) -> bool:
-        negate, pattern = service_description_condition
+        compiled_ruleset = self.ruleset_optimizer.get_compiled_service_ruleset(
+            ruleset, with_foreign_hosts, is_binary=is_binary)
 
-        if match_object.service_description is not None \
-            and pattern.match(match_object.service_description) is not None:
-            return not negate
-        return negate
+        yield from compiled_ruleset.matching_values(match_object)
 
     # TODO: Find a way to use the generic get_host_ruleset_values
     def get_values_for_generic_agent_host(self, ruleset: Ruleset) -> List[RuleValue]:
@@ -254,10 +216,15 @@ class RulesetMatcher:
 class RulesetOptimizer:
     """Performs some precalculations on the configured rulesets to improve the
     processing performance"""
-    def __init__(self, ruleset_matcher: RulesetMatcher, host_tag_lists: Dict[HostName, TagList],
-                 host_paths: Dict[HostName, str], labels: 'LabelManager',
-                 all_configured_hosts: Set[HostName], clusters_of: Dict[HostName, List[HostName]],
-                 nodes_of: Dict[HostName, List[HostName]]) -> None:
+    def __init__(self,
+                 ruleset_matcher: RulesetMatcher,
+                 host_tag_lists: Dict[HostName, TagList],
+                 host_paths: Dict[HostName, str],
+                 labels: 'LabelManager',
+                 all_configured_hosts: Set[HostName],
+                 clusters_of: Dict[HostName, List[HostName]],
+                 nodes_of: Dict[HostName, List[HostName]],
+                 host_match_cache_path: Optional[Path] = None) -> None:
         super(RulesetOptimizer, self).__init__()
         self._ruleset_matcher = ruleset_matcher
         self._labels = labels
@@ -273,6 +240,7 @@ class RulesetOptimizer:
         # Howewer, in a multiprocessing environment all_processed_hosts only
         # may contain a reduced set of hosts, since each process handles a subset
         self._all_processed_hosts = self._all_configured_hosts
+        self._processes_all_configured_hosts = True
 
         # A factor which indicates how much hosts share the same host tag configuration (excluding folders).
         # len(all_processed_hosts) / len(different tag combinations)
@@ -280,9 +248,15 @@ class RulesetOptimizer:
         self._all_processed_hosts_similarity = 1.0
 
         self._service_ruleset_cache: Dict = {}
+        self._compiled_service_ruleset_cache: Dict = {}
         self._host_ruleset_cache: Dict = {}
         self._all_matching_hosts_match_cache: Dict = {}
 
+        # Host matches of label independent conditions, persisted across processes.
+        # It is created lazily, because computing the host digests is not for free.
+        self._host_match_cache_path = host_match_cache_path
+        self._host_match_cache: Optional[HostMatchCache] = None
+
         # Reference dirname -> hosts in this dir including subfolders
         self._folder_host_lookup: Dict[Tuple[bool, str], Set[HostName]] = {}
 
@@ -301,11 +275,38 @@ class RulesetOptimizer:
     def clear_ruleset_caches(self) -> None:
         self._host_ruleset_cache.clear()
         self._service_ruleset_cache.clear()
+        self._compiled_service_ruleset_cache.clear()
 
     def clear_caches(self) -> None:
         self._host_ruleset_cache.clear()
         self._all_matching_hosts_match_cache.clear()
 
+    def enable_host_match_cache(self, path: Path) -> None:
+        """Persist the host matches of the rule conditions in the given file
+
+        Only useful for processes which evaluate the rules of all hosts, e.g. the
+        config generation. Computing the host digests is not for free."""
+        if self._host_match_cache_path != path:
+            self._host_match_cache_path = path
+            self._host_match_cache = None
+
+    def get_host_match_cache(self) -> Optional[HostMatchCache]:
+        if self._host_match_cache_path is None:
+            return None
+
+        if self._host_match_cache is None:
+            self._host_match_cache = HostMatchCache(
+                self._host_match_cache_path, {
+                    hostname: host_digest(self._host_tag_lists[hostname],
+                                          self._host_paths.get(hostname, "/"))
+                    for hostname in self._all_configured_hosts
+                })
+        return self._host_match_cache
+
+    def save_host_match_cache(self) -> None:
+        if self._host_match_cache is not None:
+            self._host_match_cache.save()
+
     def all_processed_hosts(self) -> Set[HostName]:
         """Returns a set of all processed hosts"""
         return self._all_processed_hosts
@@ -322,6 +323,8 @@ class RulesetOptimizer:
         nodes_and_clusters.intersection_update(self._all_configured_hosts)
 
         self._all_processed_hosts.update(nodes_and_clusters)
+        self._processes_all_configured_hosts = (
+            self._all_processed_hosts == self._all_configured_hosts)
 
         # The folder host lookup includes a list of all -processed- hosts within a given
         # folder. Any update with set_all_processed hosts invalidates this cache, because
@@ -410,23 +413,33 @@ class RulesetOptimizer:
                  self._convert_pattern_list(rule["condition"].get("service_description"))))
         return new_rules
 
+    def get_compiled_service_ruleset(self, ruleset: Ruleset, with_foreign_hosts: bool,
+                                     is_binary: bool) -> 'CompiledServiceRuleset':
+        cache_id = id(ruleset), with_foreign_hosts
+
+        if cache_id in self._compiled_service_ruleset_cache:
+            return self._compiled_service_ruleset_cache[cache_id]
+
+        compiled_ruleset = CompiledServiceRuleset(
+            self.get_service_ruleset(ruleset, with_foreign_hosts, is_binary),
+            [
+                _split_pattern_list(rule["condition"].get("service_description"))
+                for rule in ruleset
+                if not ("options" in rule and "disabled" in rule["options"])
+            ],
+        )
+        self._compiled_service_ruleset_cache[cache_id] = compiled_ruleset
+        return compiled_ruleset
+
     def _convert_pattern_list(self, patterns: List[str]) -> PreprocessedPattern:
         """Compiles a list of service match patterns to a to a single regex
 
         Reducing the number of individual regex matches improves the performance dramatically.
         This function assumes either all or no pattern is negated (like WATO creates the rules).
         """
+        negate, pattern_parts = _split_pattern_list(patterns)
         if not patterns:
-            return False, regex(u"")  # Match everything
-
-        negate, patterns = parse_negated_condition_list(patterns)
-
-        pattern_parts = []
-        for p in patterns:
-            if isinstance(p, dict):
-                pattern_parts.append(p["$regex"])
-            else:
-                pattern_parts.append(p)
+            return negate, regex(u"")  # Match everything
 
         return negate, regex("(?:%s)" % "|".join("(?:%s)" % p for p in pattern_parts))
 
@@ -456,6 +469,46 @@ class RulesetOptimizer:
         valid_hosts = self.get_hosts_within_folder(rule_path,
                                                    with_foreign_hosts).intersection(valid_hosts)
 
+        # Host labels are computed by rules themselves and are not covered by the host
+        # digests of the persisted cache. Conditions using labels are always evaluated.
+        host_match_cache = None if labels else self.get_host_match_cache()
+        if host_match_cache is not None:
+            persisted = self._persisted_matching_hosts(host_match_cache, cache_id[0], hostlist,
+                                                       tags, rule_path)
+            if persisted is not None:
+                matching = persisted.intersection(valid_hosts)
+                self._all_matching_hosts_match_cache[cache_id] = matching
+                return matching
+
+        matching = self._compute_matching_hosts(cache_id, valid_hosts, hostlist, tags, labels)
+        self._all_matching_hosts_match_cache[cache_id] = matching
+
+        # Only results computed for all hosts of the site are valid for other processes
+        if host_match_cache is not None and (with_foreign_hosts or
+                                             self._processes_all_configured_hosts):
+            host_match_cache.set(cache_id[0], matching)
+
+        return matching
+
+    def _persisted_matching_hosts(self, host_match_cache: HostMatchCache, condition_id: Tuple,
+                                  hostlist, tags, rule_path: str) -> Optional[Set[HostName]]:
+        persisted = host_match_cache.get(condition_id)
+        if persisted is None:
+            return None
+
+        matching, outdated_hosts = persisted
+        # Empty host list -> Nothing matches (see _compute_matching_hosts)
+        if outdated_hosts and hostlist != []:
+            hosts_in_folder = self.get_hosts_within_folder(rule_path, with_foreign_hosts=True)
+            matching.update(
+                hostname for hostname in outdated_hosts if hostname in hosts_in_folder and
+                self._matches_host_conditions(hostname, hostlist, tags, labels={}))
+            host_match_cache.set(condition_id, matching)
+
+        return matching
+
+    def _compute_matching_hosts(self, cache_id, valid_hosts: Set[HostName], hostlist, tags,
+                                labels) -> Set[HostName]:
         if tags and hostlist is None and not labels:
             # TODO: Labels could also be optimized like the tags
             matched_by_tags = self._match_hosts_by_tags(cache_id, valid_hosts, tags)
@@ -485,23 +538,23 @@ class RulesetOptimizer:
                 hosts_to_check = valid_hosts
 
             for hostname in hosts_to_check:
-                # When no tag matching is requested, do not filter by tags. Accept all hosts
-                # and filter only by hostlist
-                if tags and not self.matches_host_tags(self._host_tag_lists[hostname], tags):
-                    continue
+                if self._matches_host_conditions(hostname, hostlist, tags, labels):
+                    matching.add(hostname)
 
-                if labels:
-                    host_labels = self._labels.labels_of_host(self._ruleset_matcher, hostname)
-                    if not matches_labels(host_labels, labels):
-                        continue
+        return matching
 
-                if not self.matches_host_name(hostlist, hostname):
-                    continue
+    def _matches_host_conditions(self, hostname: HostName, hostlist, tags, labels) -> bool:
+        # When no tag matching is requested, do not filter by tags. Accept all hosts
+        # and filter only by hostlist
+        if tags and not self.matches_host_tags(self._host_tag_lists[hostname], tags):
+            return False
 
-                matching.add(hostname)
+        if labels:
+            host_labels = self._labels.labels_of_host(self._ruleset_matcher, hostname)
+            if not matches_labels(host_labels, labels):
+                return False
 
-        self._all_matching_hosts_match_cache[cache_id] = matching
-        return matching
+        return self.matches_host_name(hostlist, hostname)
 
     def matches_host_name(self, host_entries, hostname):
         if not host_entries:
@@ -645,6 +698,168 @@ class RulesetOptimizer:
             self._host_grouped_ref[hostname] = group_ref
 
 
+def _split_pattern_list(patterns) -> Tuple[bool, List[str]]:
+    """Returns the negation flag and the plain regex strings of a service pattern list"""
+    if not patterns:
+        return False, [u""]  # Match everything
+
+    negate, patterns = parse_negated_condition_list(patterns)
+
+    pattern_parts = []
+    for p in patterns:
+        if isinstance(p, dict):
+            pattern_parts.append(p["$regex"])
+        else:
+            pattern_parts.append(p)
+
+    if not pattern_parts:
+        pattern_parts.append(u"")  # Like the empty regex this matches everything
+
+    return negate, pattern_parts
+
+
+class CompiledServiceRuleset:
+    """Index driven service ruleset matching
+
+    The rules of a preprocessed service ruleset are grouped by the set of rules
+    that apply to a host. Hosts which are affected by the same rules share one
+    _ServiceRuleGroup and with it the compiled service description index and the
+    match results. The host lookup is done lazily, because usually only a fraction
+    of all hosts is asked for a specific ruleset in one process.
+    """
+    def __init__(self, preprocessed_ruleset: PreprocessedServiceRuleset,
+                 pattern_lists: List[Tuple[bool, List[str]]]) -> None:
+        super(CompiledServiceRuleset, self).__init__()
+        assert len(preprocessed_ruleset) == len(pattern_lists)
+        self._rules = preprocessed_ruleset
+        self._pattern_lists = pattern_lists
+        self._groups: Dict[Tuple[int, ...], _ServiceRuleGroup] = {}
+        self._group_of_host: Dict[Optional[HostName], _ServiceRuleGroup] = {}
+
+    def group_of(self, host_name: Optional[HostName]) -> '_ServiceRuleGroup':
+        try:
+            return self._group_of_host[host_name]
+        except KeyError:
+            pass
+
+        rule_indices = tuple(
+            index for index, rule in enumerate(self._rules) if host_name in rule[1])
+
+        try:
+            group = self._groups[rule_indices]
+        except KeyError:
+            group = self._groups[rule_indices] = _ServiceRuleGroup(
+                [(self._rules[index], self._pattern_lists[index]) for index in rule_indices])
+
+        self._group_of_host[host_name] = group
+        return group
+
+    def matching_values(self, match_object: RulesetMatchObject) -> Tuple[RuleValue, ...]:
+        return self.group_of(match_object.host_name).matching_values(match_object)
+
+
+class _ServiceRuleGroup:
+    """The service conditions of all rules that apply to a set of hosts
+
+    Service description conditions which only consist of literal prefixes (or
+    of literal strings anchored with "$") are put into a lookup table. With it all
+    literal conditions are evaluated with one dict lookup per distinct prefix
+    length. Only the remaining real regex conditions are evaluated one by one.
+    """
+    def __init__(self, rules: List[Tuple[Tuple, Tuple[bool, List[str]]]]) -> None:
+        super(_ServiceRuleGroup, self).__init__()
+        self._values: List[RuleValue] = []
+        self._negate: List[bool] = []
+        self._label_conditions: List[Tuple[int, LabelConditions]] = []
+        self._prefixes: Dict[str, List[int]] = {}
+        self._exact_matches: Dict[str, List[int]] = {}
+        self._regex_conditions: List[Tuple[int, Pattern[str]]] = []
+        self._match_cache: Dict[Tuple, Tuple[RuleValue, ...]] = {}
+
+        for position, (rule, (negate, pattern_parts)) in enumerate(rules):
+            value, _hosts, service_labels_condition = rule[:3]
+            self._values.append(value)
+            self._negate.append(negate)
+            if service_labels_condition:
+                self._label_conditions.append((position, service_labels_condition))
+
+            if not all(_is_literal_pattern(p) for p in pattern_parts):
+                self._regex_conditions.append(
+                    (position, regex("(?:%s)" % "|".join("(?:%s)" % p for p in pattern_parts))))
+                continue
+
+            for p in pattern_parts:
+                if p.endswith("$"):
+                    self._exact_matches.setdefault(p[:-1], []).append(position)
+                else:
+                    self._prefixes.setdefault(p, []).append(position)
+
+        self._prefix_lengths = sorted({len(p) for p in self._prefixes})
+
+    def matching_values(self, match_object: RulesetMatchObject) -> Tuple[RuleValue, ...]:
+        try:
+            return self._match_cache[match_object.service_cache_id]
+        except KeyError:
+            pass
+
+        description = match_object.service_description
+        assert description is not None
+
+        matched = self._matched_descriptions(description)
+        matching = [
+            position for position, negate in enumerate(self._negate)
+            if (position in matched) is not negate
+        ]
+
+        if self._label_conditions:
+            not_matching_labels = {
+                position for position, condition in self._label_conditions
+                if not matches_labels(match_object.service_labels, condition)
+            }
+            matching = [p for p in matching if p not in not_matching_labels]
+
+        values = tuple(self._values[p] for p in matching)
+        self._match_cache[match_object.service_cache_id] = values
+        return values
+
+    def _matched_descriptions(self, description: ServiceName) -> Set[int]:
+        """Returns the positions of all rules which patterns match the description
+
+        The negation of the conditions is not applied here."""
+        matched: Set[int] = set()
+        for length in self._prefix_lengths:
+            if length > len(description):
+                break
+            matched.update(self._prefixes.get(description[:length], ()))
+
+        if self._exact_matches:
+            matched.update(self._exact_matches.get(description, ()))
+            if description.endswith("\n"):
+                # Like re, "$" also matches in front of a trailing newline
+                matched.update(self._exact_matches.get(description[:-1], ()))
+
+        for position, pattern in self._regex_conditions:
+            if pattern.match(description) is not None:
+                matched.add(position)
+
+        return matched
+
+
+def _is_literal_pattern(pattern: str) -> bool:
+    """Whether or not a service pattern can be evaluated without regex matching
+
+    >>> _is_literal_pattern("CPU load")
+    True
+    >>> _is_literal_pattern("Interface 1$")
+    True
+    >>> _is_literal_pattern("Interface .*")
+    False
+    """
+    if pattern.endswith("$"):
+        pattern = pattern[:-1]
+    return not is_regex(pattern)
+
+
 def _tags_or_labels_cache_id(tag_or_label_spec):
     if isinstance(tag_or_label_spec, dict):
         if "$ne" in tag_or_label_spec:
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure loading the autochecks of all hosts with and without the autochecks index
+
+Writes synthetic autochecks files and compares reading all of them with eval()
+(the way before the index), with the literal parser and from the autochecks
+index. Also measures building and updating the index and looking up a single
+host in a fresh process, like the service discovery of the GUI does.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_autochecks.py [HOSTS [SERVICES [CHANGED]]]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List
+
+import cmk.utils.paths
+from cmk.utils.type_defs import CheckPluginName
+
+import cmk.base.autochecks as autochecks
+from cmk.base.check_utils import Service
+from cmk.base.discovered_labels import DiscoveredServiceLabels, ServiceLabel
+
+
+def _make_services(host_index: int, num_services: int) -> List[Service]:
+    return [
+        Service(
+            CheckPluginName("interfaces"),
+            "%d" % index,
+            "Interface %d" % index,
+            {
+                "state": ["1"],
+                "speed": 1000000000,
+                "discovered_oper_status": ["1"],
+                "discovered_speed": 1000000000 + host_index,
+            },
+            DiscoveredServiceLabels(ServiceLabel(u"cmk/os_family", u"linux")),
+        ) for index in range(num_services)
+    ]
+
+
+def _measure(function: Callable[[], None]) -> float:
+    start = time.time()
+    function()
+    return time.time() - start
+
+
+def main(args: List[str]) -> None:
+    num_hosts = int(args[0]) if len(args) > 0 else 10000
+    num_services = int(args[1]) if len(args) > 1 else 30
+    num_changed = int(args[2]) if len(args) > 2 else num_hosts // 100
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmk.utils.paths.autochecks_dir = str(Path(tmp_dir, "autochecks"))
+        cmk.utils.paths.autochecks_index_file = Path(tmp_dir, "autochecks_index")
+        hostnames = ["host%06d" % index for index in range(num_hosts)]
+        for index, hostname in enumerate(hostnames):
+            autochecks.save_autochecks_file(hostname, _make_services(index, num_services))
+        paths = [autochecks._autochecks_path_for(hostname) for hostname in hostnames]
+
+        def load_all_with_eval() -> None:
+            for path in paths:
+                with path.open(encoding="utf-8") as f:
+                    eval(f.read(), {}, {})  # pylint: disable=eval-used
+
+        def load_all_with_literal_parser() -> None:
+            for path in paths:
+                autochecks._read_raw_autochecks_file(path, None)
+
+        def load_all() -> None:
+            autochecks._loaded_indexes.clear()
+            for path in paths:
+                autochecks._load_raw_autochecks(path=path, check_variables=None)
+
+        def load_single_host() -> None:
+            autochecks._loaded_indexes.clear()
+            autochecks._load_raw_autochecks(path=paths[num_hosts // 2], check_variables=None)
+
+        def change_hosts() -> None:
+            for index in range(num_changed):
+                autochecks.save_autochecks_file(hostnames[index],
+                                                _make_services(index, num_services + 1))
+
+        print("%-32s %10s" % ("%d hosts, %d services" % (num_hosts, num_services), "time [s]"))
+        print("%-32s %10.3f" % ("eval() all files", _measure(load_all_with_eval)))
+        print("%-32s %10.3f" % ("literal parser all files", _measure(load_all_with_literal_parser)))
+        print("%-32s %10.3f" % ("build index", _measure(autochecks.update_autochecks_index)))
+        print("%-32s %10.3f" % ("update index, nothing changed",
+                                _measure(autochecks.update_autochecks_index)))
+        print("%-32s %10.3f" % ("all hosts from index", _measure(load_all)))
+        print("%-32s %10.6f" % ("single host from index", _measure(load_single_host)))
+        change_hosts()
+        print("%-32s %10.3f" % ("update index, %d changed" % num_changed,
+                                _measure(autochecks.update_autochecks_index)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the compilation of the BI sample configuration for growing numbers of hosts
+
+Creates synthetic hosts with the services the rules of the sample configuration
+search for and compiles all aggregations of the sample configuration (enabled).
+With the indexes of the BISearcher the time per host should stay about the same
+while the number of hosts grows.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_bi_compile.py [HOSTS [SERVICES]]
+"""
+
+import copy
+import random
+import sys
+import time
+from typing import Dict, List
+
+from cmk.utils.bi.bi_lib import BIHostData, BIServiceData
+from cmk.utils.bi.bi_packs import BIAggregationPacks
+from cmk.utils.bi.bi_sample_configs import bi_sample_config
+from cmk.utils.bi.bi_searcher import BISearcher
+
+SERVICE_PREFIXES = ["fs_/", "Filesystem /", "Interface ", "Disk IO ", "LOG /var/log/"]
+SERVICES = ["CPU load", "Memory", "Uptime", "Check_MK", "Check_MK Discovery", "Mount options /"]
+
+
+def _make_hosts(num_hosts: int, num_services: int) -> Dict[str, BIHostData]:
+    rnd = random.Random(42)
+    hosts = {}
+    for index in range(num_hosts):
+        host_name = "host%05d" % index
+        services = {
+            service_description: BIServiceData(set(), {}) for service_description in SERVICES
+        }
+        for service_index in range(num_services - len(SERVICES)):
+            services["%s%d" % (rnd.choice(SERVICE_PREFIXES), service_index)] = BIServiceData(
+                set(), {})
+        hosts[host_name] = BIHostData(
+            "site",
+            {"tcp", "prod" if rnd.random() < 0.7 else "test"},
+            {"os": "linux"},
+            "/folder%d/" % rnd.randint(0, 20),
+            services,
+            (),
+            (),
+            "Alias of %s" % host_name,
+            host_name,
+        )
+    return hosts
+
+
+def _make_packs() -> BIAggregationPacks:
+    config = copy.deepcopy(bi_sample_config)
+    for pack in config["packs"]:
+        for aggregation in pack["aggregations"]:
+            aggregation["computation_options"]["disabled"] = False
+    bi_packs = BIAggregationPacks("")
+    bi_packs._load_config(config)
+    return bi_packs
+
+
+def main(args: List[str]) -> None:
+    max_hosts = int(args[0]) if len(args) > 0 else 4000
+    num_services = int(args[1]) if len(args) > 1 else 40
+
+    bi_packs = _make_packs()
+    print("%10s %10s %10s %10s" % ("hosts", "branches", "time [s]", "ms/host"))
+    num_hosts = max(max_hosts // 8, 1)
+    while num_hosts <= max_hosts:
+        bi_searcher = BISearcher()
+        bi_searcher.set_hosts(_make_hosts(num_hosts, num_services))
+
+        start = time.time()
+        num_branches = 0
+        for aggregation in bi_packs.get_all_aggregations():
+            num_branches += len(aggregation.compile(bi_searcher).branches)
+        duration = time.time() - start
+
+        print("%10d %10d %10.3f %10.3f" %
+              (num_hosts, num_branches, duration, 1000 * duration / num_hosts))
+        num_hosts *= 2
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the message throughput of the Event Console EventStatus
+
+Fills the event status with an increasing number of open events and measures
+how many incoming messages per second can be handled. Every message is counted
+by a rule, cancels events of another rule or creates a new event that replaces
+the oldest event of its host (event limit "delete_oldest").
+
+Usage: PYTHONPATH=. doc/benchmark/bench_ec_event_status.py [MESSAGES]
+"""
+
+import logging
+import sys
+import time
+from typing import Any, Dict, List
+
+from cmk.ec.main import EventStatus, Perfcounters
+
+NUM_RULES = 100
+NUM_HOSTS = 1000
+COUNT = {
+    "count": 10**9,
+    "count_ack": False,
+    "separate_host": True,
+    "separate_application": False,
+    "separate_match_groups": False,
+}
+
+
+class _History:
+    def add(self, event: Dict[str, Any], what: str, who: str = "", addinfo: str = "") -> None:
+        pass
+
+
+class _EventServer:
+    def __init__(self, event_status: EventStatus) -> None:
+        self._event_status = event_status
+
+    def new_event_respecting_limits(self, event: Dict[str, Any]) -> bool:
+        self._event_status.new_event(event)
+        return True
+
+
+def _event(nr: int) -> Dict[str, Any]:
+    host = "host%d" % (nr % NUM_HOSTS)
+    return {
+        "rule_id": "rule%d" % (nr % NUM_RULES),
+        "text": "message %d" % nr,
+        "phase": "open",
+        "count": 1,
+        "time": nr,
+        "first": nr,
+        "last": nr,
+        "comment": "",
+        "host": host,
+        "core_host": host,
+        "ipaddress": "",
+        "application": "app",
+        "pid": 0,
+        "priority": 3,
+        "facility": 1,
+        "match_groups": (),
+        "host_in_downtime": False,
+    }
+
+
+def _measure(num_events: int, num_messages: int) -> float:
+    event_status = EventStatus(
+        None,  # type: ignore[arg-type]
+        {"debug_rules": False},
+        Perfcounters(logging.getLogger("bench")),
+        _History(),  # type: ignore[arg-type]
+        logging.getLogger("bench"),
+    )
+    event_server = _EventServer(event_status)
+    for nr in range(num_events):
+        event_status.new_event(_event(nr))
+
+    # Rules that never cancel anything, the events of the rule are checked nevertheless
+    no_cancel_rule = {"id": "rule1", "set_host": "nohost"}
+
+    start = time.time()
+    for nr in range(num_events, num_events + num_messages):
+        event = _event(nr)
+        kind = nr % 3
+        if kind == 0:
+            event_status.count_event(event_server, event, {}, COUNT)
+        elif kind == 1:
+            event_status.cancel_events(event_server, [], event, {}, no_cancel_rule)
+        else:
+            with event_status.lock:
+                event_status.remove_oldest_event("by_host", event)
+                event_status.new_event(event)
+        event_status.event(nr - num_events + 1)
+    return num_messages / (time.time() - start)
+
+
+def main(args: List[str]) -> None:
+    num_messages = int(args[0]) if args else 3000
+    print("%10s %15s" % ("events", "messages/s"))
+    for num_events in (1000, 10000, 50000, 200000):
+        print("%10d %15.0f" % (num_events, _measure(num_events, num_messages)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the message throughput of the Event Console with and without pipeline
+
+Generates a burst of syslog messages and feeds it into the EventServer, once
+processed in the EventServer thread and once with the pipeline and different
+numbers of worker processes. The rules are regex rules of which most do not
+match, like in typical syslog setups. A few messages are dropped and a few
+create events.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_ec_pipeline.py [MESSAGES [RULES]]
+"""
+
+import logging
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import cmk.ec.export as ec
+import cmk.ec.history
+import cmk.ec.main
+
+
+def _rules(num_rules: int) -> List[Dict[str, Any]]:
+    rules = [
+        {
+            "id": "rule%d" % nr,
+            "state": 2,
+            "sl": {
+                "value": 0,
+                "precedence": "message"
+            },
+            "actions": [],
+            "match": r"^kernel: .*error in module mod%d at (0x[0-9a-f]+)$" % nr,
+        } for nr in range(num_rules)
+    ]
+    rules.append({
+        "id": "drop",
+        "state": 0,
+        "sl": {
+            "value": 0,
+            "precedence": "message"
+        },
+        "actions": [],
+        "match": r"session (opened|closed) for user \w+$",
+        "drop": True,
+    })
+    return rules
+
+
+def _messages(num_messages: int, num_rules: int) -> List[bytes]:
+    messages = []
+    for nr in range(num_messages):
+        if nr % 100 == 0:
+            text = "kernel: fatal error in module mod%d at 0x%x" % (nr % num_rules, nr)
+        elif nr % 2:
+            text = "sshd[%d]: pam_unix(sshd:session): session opened for user u%d" % (nr, nr)
+        else:
+            text = "app[%d]: request %d served in %d ms" % (nr, nr, nr % 1000)
+        messages.append(b"<30>May 26 13:45:01 host%d %s\n" % (nr % 500, text.encode("ascii")))
+    return messages
+
+
+def _event_server(omd_root: Path, num_workers: int, num_rules: int) -> Any:
+    logger = logging.getLogger("bench")
+    settings = ec.settings("bench", omd_root, omd_root / "etc", ["mkeventd"])
+    config = ec.default_config()
+    config["event_processing_workers"] = num_workers
+    perfcounters = cmk.ec.main.Perfcounters(logger)
+    history = cmk.ec.history.History(settings, config, logger,
+                                     cmk.ec.main.StatusTableEvents.columns,
+                                     cmk.ec.main.StatusTableHistory.columns)
+    event_status = cmk.ec.main.EventStatus(settings, config, perfcounters, history, logger)
+    event_server = cmk.ec.main.EventServer(logger, settings, config,
+                                           cmk.ec.main.default_slave_status_master(), perfcounters,
+                                           cmk.ec.main.ECLock(logger), history, event_status,
+                                           cmk.ec.main.StatusTableEvents.columns, False)
+    event_server.compile_rules([], [{"id": "bench", "disabled": False, "rules": _rules(num_rules)}])
+    # There is no monitoring core to ask for the hosts
+    event_server.host_config.get_canonical_name = lambda host_name: ""
+    return event_server
+
+
+def _measure(omd_root: Path, num_workers: int, num_rules: int, messages: List[bytes]) -> float:
+    event_server = _event_server(omd_root, num_workers, num_rules)
+    event_server.start_pipeline()
+    start = time.time()
+    # The receiving thread, like the EventServer thread in the daemon
+    receiver = threading.Thread(target=lambda: [event_server.receive_raw_lines(message)
+                                                for message in messages])
+    receiver.start()
+    receiver.join()
+    event_server.stop_pipeline()
+    return len(messages) / (time.time() - start)
+
+
+def main(args: List[str]) -> None:
+    num_messages = int(args[0]) if len(args) > 0 else 50000
+    num_rules = int(args[1]) if len(args) > 1 else 200
+    logging.getLogger("bench").setLevel(logging.ERROR)
+    messages = _messages(num_messages, num_rules)
+
+    print("%d messages, %d rules" % (num_messages, num_rules))
+    print("%10s %15s" % ("workers", "messages/s"))
+    with tempfile.TemporaryDirectory() as omd_root:
+        for num_workers in (0, 1, 2, 4, 8):
+            print("%10d %15.0f" % (num_workers, _measure(Path(omd_root), num_workers, num_rules,
+                                                         messages)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
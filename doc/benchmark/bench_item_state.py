@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare the I/O of a check cycle with the per host files and the item state store
+
+Simulates check cycles of all hosts: the item states of every host are loaded,
+some of the counters are updated and the item states are saved again. Reports
+the time, the read and write system calls and the written bytes of the process
+(from /proc/self/io) and the number of opened and renamed files per check cycle,
+once with one file per host and once with the ItemStateStore.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_item_state.py [HOSTS [COUNTERS [CHANGED]]]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Tuple
+
+import cmk.utils.paths
+
+import cmk.base.item_state as item_state
+
+_file_operations = {"open": 0, "os.rename": 0}
+
+
+def _audit(event: str, _args: Tuple[Any, ...]) -> None:
+    if event in _file_operations:
+        _file_operations[event] += 1
+
+
+def _proc_io() -> Dict[str, int]:
+    with open("/proc/self/io") as f:
+        return {key: int(value) for key, value in (line.split(":") for line in f)}
+
+
+def _check_cycle(hostnames: List[str], num_counters: int, num_changed: int, now: float) -> None:
+    for hostname in hostnames:
+        item_state.load(hostname)
+        for index in range(num_changed):
+            item_state.set_item_state_prefix("if", "%d" % (index % num_counters))
+            item_state.set_item_state("in_octets", (now, 1000 * now + index))
+        item_state.save(hostname)
+        item_state.cleanup_item_states()
+
+
+def _measure(hostnames: List[str], num_counters: int, num_changed: int) -> List[float]:
+    # Initialize the counters of all hosts
+    _check_cycle(hostnames, num_counters, num_counters, 0.0)
+
+    io_before, opened_before = _proc_io(), dict(_file_operations)
+    start = time.time()
+    _check_cycle(hostnames, num_counters, num_changed, 60.0)
+    duration = time.time() - start
+    io_after, opened_after = _proc_io(), dict(_file_operations)
+    return [
+        1000 * duration,
+        io_after["syscr"] - io_before["syscr"],
+        io_after["syscw"] - io_before["syscw"],
+        (io_after["wchar"] - io_before["wchar"]) / 1024.0 / 1024.0,
+        opened_after["open"] - opened_before["open"],
+        opened_after["os.rename"] - opened_before["os.rename"],
+    ]
+
+
+def main(args: List[str]) -> None:
+    num_hosts = int(args[0]) if len(args) > 0 else 10000
+    num_counters = int(args[1]) if len(args) > 1 else 100
+    num_changed = int(args[2]) if len(args) > 2 else 10
+
+    sys.addaudithook(_audit)
+    hostnames = ["host%06d" % index for index in range(num_hosts)]
+
+    print("%10s %10s %10s %10s %10s %10s %10s" %
+          ("backend", "time [ms]", "reads", "writes", "MB written", "opens", "renames"))
+    for backend in ["files", "store"]:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cmk.utils.paths.counters_dir = str(Path(tmp_dir, "counters"))
+            cmk.utils.paths.item_states_dir = Path(tmp_dir, "item_states")
+            item_state.use_item_state_store(False)
+            item_state.use_item_state_store(backend == "store")
+            print("%10s %10.1f %10d %10d %10.2f %10d %10d" %
+                  (backend, *_measure(hostnames, num_counters, num_changed)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare the startup of a helper with the monolithic and the sharded packed config
+
+Writes a synthetic packed configuration (host attributes and IP addresses of all
+hosts, some global settings) for growing numbers of hosts. Measures the time and
+the memory needed to read it and to access the settings of a single host, once
+for a single pickled dict (the format before the sharding) and once with
+PackedConfigStore.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_packed_config.py [MAX_HOSTS]
+"""
+
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+
+import cmk.utils.paths
+from cmk.utils.type_defs import ConfigSerial
+
+import cmk.base.config as config
+
+
+def _make_helper_config(num_hosts: int) -> Dict[str, Any]:
+    hostnames = ["host%06d" % index for index in range(num_hosts)]
+    return {
+        "check_max_cachefile_age": 600,
+        "inventory_check_interval": 120,
+        "ipaddresses": {
+            hostname: "10.%d.%d.%d" % (index >> 16, (index >> 8) & 255, index & 255)
+            for index, hostname in enumerate(hostnames)
+        },
+        "host_attributes": {
+            hostname: {
+                "alias": "Alias of %s" % hostname,
+                "address": "10.0.0.1",
+                "management_address": "10.1.0.1",
+                "additional_ipv4addresses": ["10.2.0.1", "10.3.0.1"],
+                "labels": {
+                    "location": "datacenter%d" % (index % 7)
+                },
+                "contactgroups": (True, ["all", "group%d" % (index % 13)]),
+            } for index, hostname in enumerate(hostnames)
+        },
+    }
+
+
+def _measure(startup: Callable[[], Any]) -> Tuple[float, float]:
+    tracemalloc.start()
+    start = time.time()
+    startup()
+    duration = time.time() - start
+    _current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return duration, peak / 1024.0 / 1024.0
+
+
+def main(args: List[str]) -> None:
+    max_hosts = int(args[0]) if len(args) > 0 else 40000
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmk.utils.paths.core_helper_config_dir = Path(tmp_dir)
+        store = config.PackedConfigStore(ConfigSerial("1"))
+        monolithic_path = Path(tmp_dir, "monolithic")
+
+        def monolithic_startup() -> None:
+            with monolithic_path.open("rb") as f:
+                packed_config = pickle.load(f)
+            packed_config["host_attributes"].get("host000001", {}).get("management_address")
+
+        def sharded_startup() -> None:
+            packed_config = store.read()
+            packed_config["host_attributes"].get("host000001", {}).get("management_address")
+
+        print("%10s %12s %12s %12s %12s" %
+              ("hosts", "mono [ms]", "mono [MB]", "shard [ms]", "shard [MB]"))
+        num_hosts = max(max_hosts // 16, 1)
+        while num_hosts <= max_hosts:
+            helper_config = _make_helper_config(num_hosts)
+            with monolithic_path.open("wb") as f:
+                pickle.dump(helper_config, f)
+            store.write(helper_config)
+            del helper_config
+
+            monolithic_duration, monolithic_memory = _measure(monolithic_startup)
+            sharded_duration, sharded_memory = _measure(sharded_startup)
+            print("%10d %12.1f %12.2f %12.1f %12.2f" %
+                  (num_hosts, 1000 * monolithic_duration, monolithic_memory,
+                   1000 * sharded_duration, sharded_memory))
+            num_hosts *= 2
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
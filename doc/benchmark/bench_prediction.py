@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the computation of predictive levels
+
+Up-samples and summarizes the slices of a prediction horizon, once with the
+former per point implementation in Python and once with the array based
+implementation of _calculate_data_for_prediction. The RRD data is generated,
+the time needed to fetch it is not measured. Note that the RRD data of all
+slices is now fetched with one query instead of one query per slice.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_prediction.py [ROUNDS]
+"""
+
+import math
+import random
+import sys
+import time
+from typing import Callable, List, Optional, Tuple
+
+from cmk.base import prediction
+from cmk.utils.prediction import TimeSeries, TimeSeriesValues, rrd_timestamps
+
+# A horizon of 90 days with slices of one day, in the finest resolution of 5 minutes
+# for the youngest slice and 30 minutes for the older ones
+SLICE = 86400
+POINTS = 288
+
+
+def _series(start: int, step: int, rand: random.Random) -> TimeSeries:
+    values: List[Optional[float]] = [
+        None if rand.random() < 0.05 else round(rand.uniform(0, 10), 4)
+        for _nr in range(SLICE // step)
+    ]
+    return TimeSeries([start, start + SLICE, step] + values)
+
+
+def _slices(num_slices: int) -> Tuple[List[Tuple[int, int]], List[TimeSeries]]:
+    rand = random.Random(42)
+    from_time = 1600000000
+    time_windows = []
+    series = []
+    for nr in range(num_slices):
+        start = from_time - nr * SLICE
+        time_windows.append((start, start + SLICE))
+        series.append(_series(start, 300 if nr < 3 else 1800, rand))
+    return time_windows, series
+
+
+def _python_upsample(ts: TimeSeries, twindow: Tuple[int, int, int],
+                     shift: int) -> TimeSeriesValues:
+    upsa = []
+    i = 0
+    start, end, step = twindow
+    current_times = rrd_timestamps(ts.twindow)
+    if twindow == ts.twindow:
+        return ts.values
+    for t in range(start, end, step):
+        if t >= current_times[i] + shift:
+            i += 1
+        upsa.append(ts.values[i])
+    return upsa
+
+
+def _python_data_stats(slices: List[TimeSeriesValues]) -> List[List[Optional[float]]]:
+    descriptors: List[List[Optional[float]]] = []
+    for time_column in zip(*slices):
+        point_line = [x for x in time_column if x is not None]
+        if point_line:
+            average = sum(point_line) / float(len(point_line))
+            samples = len(point_line)
+            std_dev = abs(average) if samples == 1 else math.sqrt(
+                abs(sum(p**2 for p in point_line) - average**2 * samples) / float(samples - 1))
+            descriptors.append([average, min(point_line), max(point_line), std_dev])
+        else:
+            descriptors.append([None, None, None, None])
+    return descriptors
+
+
+def _python(time_windows: List[Tuple[int, int]], series: List[TimeSeries]) -> List:
+    from_time = time_windows[0][0]
+    twindow = series[0].twindow
+    return _python_data_stats([
+        _python_upsample(ts, twindow, from_time - start)
+        for ts, (start, _end) in zip(series, time_windows)
+    ])
+
+
+def _arrays(time_windows: List[Tuple[int, int]], series: List[TimeSeries]) -> List:
+    return prediction._calculate_data_for_prediction(time_windows, lambda ranges: series)["points"]
+
+
+def _measure(function: Callable, time_windows: List[Tuple[int, int]], series: List[TimeSeries],
+             rounds: int) -> Tuple[float, List]:
+    start = time.time()
+    for _nr in range(rounds):
+        result = function(time_windows, series)
+    return (time.time() - start) / rounds, result
+
+
+def main(args: List[str]) -> None:
+    rounds = int(args[0]) if args else 20
+    print("%10s %15s %15s %10s" % ("slices", "python ms", "arrays ms", "speedup"))
+    for num_slices in (7, 28, 90, 365):
+        time_windows, series = _slices(num_slices)
+        python_time, python_result = _measure(_python, time_windows, series, rounds)
+        arrays_time, arrays_result = _measure(_arrays, time_windows, series, rounds)
+        # The standard deviation may differ in the last bit
+        assert [point[:3] for point in python_result] == [point[:3] for point in arrays_result]
+        print("%10d %15.2f %15.2f %10.1f" % (num_slices, python_time * 1000, arrays_time * 1000,
+                                           python_time / arrays_time))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare the compiled service ruleset matching with the linear rule evaluation
+
+Creates a synthetic configuration (hosts with some tags, service rulesets with
+literal and regex service conditions) and measures the time needed to compute
+the values of all rulesets for all services of all hosts.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_ruleset_matcher.py [HOSTS [SERVICES [RULES]]]
+"""
+
+import random
+import sys
+import time
+from typing import Dict, List, Set
+
+from cmk.utils.labels import LabelManager
+from cmk.utils.rulesets.ruleset_matcher import RulesetMatcher, RulesetMatchObject, matches_labels
+
+SERVICE_PREFIXES = ["CPU load", "CPU utilization", "Memory", "Filesystem ", "Interface ", "NTP Time"]
+
+
+def _make_matcher(num_hosts: int) -> RulesetMatcher:
+    rnd = random.Random(42)
+    host_tag_lists = {}
+    host_paths = {}
+    for index in range(num_hosts):
+        hostname = "host%05d" % index
+        folder = "/folder%d/" % rnd.randint(0, 20)
+        host_paths[hostname] = folder
+        host_tag_lists[hostname] = {
+            "prod" if rnd.random() < 0.7 else "test",
+            "lan" if rnd.random() < 0.5 else "wan",
+            folder,
+        }
+
+    return RulesetMatcher(
+        tag_to_group_map={},
+        host_tag_lists=host_tag_lists,  # type: ignore[arg-type]
+        host_paths=host_paths,
+        labels=LabelManager({}, [], [], lambda h, s: {}),
+        all_configured_hosts=set(host_tag_lists),
+        clusters_of={},
+        nodes_of={},
+    )
+
+
+def _make_ruleset(num_rules: int, seed: int) -> List[Dict]:
+    rnd = random.Random(seed)
+    ruleset = []
+    for index in range(num_rules):
+        condition: Dict = {}
+        kind = rnd.random()
+        if kind < 0.5:
+            condition["service_description"] = [{"$regex": rnd.choice(SERVICE_PREFIXES)}]
+        elif kind < 0.7:
+            condition["service_description"] = [{
+                "$regex": "%s%d$" % (rnd.choice(SERVICE_PREFIXES), rnd.randint(0, 60))
+            }]
+        elif kind < 0.9:
+            condition["service_description"] = [{
+                "$regex": "%s[0-9]+" % rnd.choice(SERVICE_PREFIXES)
+            }]
+        else:
+            condition["service_description"] = {
+                "$nor": [{
+                    "$regex": rnd.choice(SERVICE_PREFIXES)
+                }]
+            }
+
+        if rnd.random() < 0.5:
+            condition["host_tags"] = {"criticality": rnd.choice(["prod", "test"])}
+        if rnd.random() < 0.3:
+            condition["host_folder"] = "/folder%d/" % rnd.randint(0, 20)
+
+        ruleset.append({"value": {"rule": index}, "condition": condition})
+    return ruleset
+
+
+def _linear_service_ruleset_values(matcher: RulesetMatcher, match_object: RulesetMatchObject,
+                                   ruleset: List[Dict]) -> List:
+    """The rule by rule evaluation as it was done before the compiled matching"""
+    optimized_ruleset = matcher.ruleset_optimizer.get_service_ruleset(ruleset, False, False)
+    values = []
+    for value, hosts, service_labels_condition, _cache_id, (negate, pattern) in optimized_ruleset:
+        if match_object.host_name not in hosts:
+            continue
+        assert match_object.service_description is not None
+        if (pattern.match(match_object.service_description) is not None) is negate:
+            continue
+        if service_labels_condition and not matches_labels(match_object.service_labels,
+                                                           service_labels_condition):
+            continue
+        values.append(value)
+    return values
+
+
+def main(args: List[str]) -> None:
+    num_hosts = int(args[0]) if len(args) > 0 else 2000
+    num_services = int(args[1]) if len(args) > 1 else 60
+    num_rules = int(args[2]) if len(args) > 2 else 300
+    num_rulesets = 10
+
+    matcher = _make_matcher(num_hosts)
+    rulesets = [_make_ruleset(num_rules // num_rulesets, seed) for seed in range(num_rulesets)]
+    hosts: Set[str] = matcher.ruleset_optimizer.all_processed_hosts()
+    match_objects = [
+        RulesetMatchObject(host_name=hostname,
+                           service_description="%s%d" % (SERVICE_PREFIXES[index % len(
+                               SERVICE_PREFIXES)], index))
+        for hostname in sorted(hosts)
+        for index in range(num_services)
+    ]
+
+    # Precompute the host sets, both variants share them
+    for ruleset in rulesets:
+        matcher.ruleset_optimizer.get_service_ruleset(ruleset, False, False)
+
+    start = time.time()
+    linear_result = [
+        _linear_service_ruleset_values(matcher, match_object, ruleset)
+        for ruleset in rulesets
+        for match_object in match_objects
+    ]
+    linear_duration = time.time() - start
+
+    start = time.time()
+    compiled_result = [
+        list(matcher.get_service_ruleset_values(match_object, ruleset, is_binary=False))
+        for ruleset in rulesets
+        for match_object in match_objects
+    ]
+    compiled_duration = time.time() - start
+
+    assert linear_result == compiled_result, "Compiled matching differs from linear matching"
+
+    print("%d hosts, %d services per host, %d rules in %d rulesets" %
+          (num_hosts, num_services, num_rules, num_rulesets))
+    print("linear:   %.3f s" % linear_duration)
+    print("compiled: %.3f s (%.1fx)" % (compiled_duration, linear_duration / compiled_duration))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare fetching an interface table with the classic and the asyncio SNMP backend
+
+Writes a stored walk of a synthetic switch (ifTable and ifXTable of all
+interfaces) and serves it with the stored walk responder of the tests on
+localhost. Every response is delayed to simulate the round trip time of the
+network. Measures get_snmp_table() for the columns of the if64 section with the
+classic backend (only if the Net-SNMP tools are installed), with the asyncio
+backend walking one column after the other and with the asyncio backend walking
+all columns together. Reports the time and the number of SNMP requests.
+
+Usage: PYTHONPATH=.:tests doc/benchmark/bench_snmp_backend.py [INTERFACES [DELAY_MS]]
+"""
+
+import logging
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from testlib.snmp_responder import StoredWalkResponder  # type: ignore[import]
+
+from cmk.utils.type_defs import SectionName
+
+import cmk.snmplib.snmp_table as snmp_table
+from cmk.snmplib.type_defs import (
+    BackendOIDSpec,
+    BackendSNMPTree,
+    SNMPBackend,
+    SNMPBackendEnum,
+    SNMPHostConfig,
+    SpecialColumn,
+)
+
+from cmk.core_helpers.snmp_backend import AsyncioSNMPBackend, ClassicSNMPBackend
+
+_IF_TABLE = ".1.3.6.1.2.1.2.2.1"
+_IF_X_TABLE = ".1.3.6.1.2.1.31.1.1.1"
+
+_TREE = BackendSNMPTree(
+    base=".1.3.6.1.2.1",
+    oids=[BackendOIDSpec(SpecialColumn.END, "string", False)] +
+    [BackendOIDSpec("2.2.1.%d" % column, "string", False) for column in range(1, 23)] +
+    [BackendOIDSpec("31.1.1.1.%d" % column, "string", False) for column in range(1, 19)],
+)
+
+
+def _write_walk(path: Path, num_interfaces: int) -> None:
+    with path.open("w") as f:
+        for table, num_columns in [(_IF_TABLE, 22), (_IF_X_TABLE, 18)]:
+            for column in range(1, num_columns + 1):
+                for index in range(1, num_interfaces + 1):
+                    if column in (2, 18) and table == _IF_TABLE or column == 1:
+                        value = "GigabitEthernet1/0/%d" % index
+                    elif column == 6 and table == _IF_TABLE:
+                        value = '"00 1A 4B %02X %02X %02X "' % (index >> 16, (index >> 8) & 255,
+                                                               index & 255)
+                    else:
+                        value = "%d" % (index * 1000003 * column)
+                    f.write("%s.%d.%d %s\n" % (table, column, index, value))
+
+
+class _SequentialAsyncioSNMPBackend(AsyncioSNMPBackend):
+    """Walks one column after the other, like the other backends"""
+    def walk_columns(self, oids, check_plugin_name=None, table_base_oid=None, context_name=None):
+        return [
+            super(_SequentialAsyncioSNMPBackend,
+                  self).walk_columns([oid], check_plugin_name, table_base_oid, context_name)[0]
+            for oid in oids
+        ]
+
+
+def _measure(backend: SNMPBackend, responder: StoredWalkResponder) -> List[float]:
+    requests_before = responder.requests
+    start = time.time()
+    table = snmp_table.get_snmp_table(
+        section_name=SectionName("if64"),
+        tree=_TREE,
+        walk_cache={},
+        backend=backend,
+    )
+    duration = time.time() - start
+    return [1000 * duration, responder.requests - requests_before, len(table)]
+
+
+def main(args: List[str]) -> None:
+    num_interfaces = int(args[0]) if len(args) > 0 else 1000
+    delay = float(args[1]) / 1000.0 if len(args) > 1 else 0.001
+
+    logger = logging.getLogger("bench")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        walk_path = Path(tmp_dir, "switch")
+        _write_walk(walk_path, num_interfaces)
+        with StoredWalkResponder(walk_path, delay=delay) as responder:
+            config = SNMPHostConfig(
+                is_ipv6_primary=False,
+                hostname="switch",
+                ipaddress="127.0.0.1",
+                credentials="public",
+                port=responder.port,
+                is_bulkwalk_host=True,
+                is_snmpv2or3_without_bulkwalk_host=False,
+                bulk_walk_size_of=10,
+                timing={},
+                oid_range_limits=[],
+                snmpv3_contexts=[],
+                character_encoding=None,
+                is_usewalk_host=False,
+                snmp_backend=SNMPBackendEnum.ASYNCIO,
+            )
+
+            backends: List[Optional[SNMPBackend]] = [
+                ClassicSNMPBackend(config, logger) if shutil.which("snmpbulkwalk") else None,
+                _SequentialAsyncioSNMPBackend(config, logger),
+                AsyncioSNMPBackend(config, logger),
+            ]
+            print("%d interfaces, %d columns, %.1f ms delay" %
+                  (num_interfaces, len(_TREE.oids) - 1, 1000 * delay))
+            print("%12s %10s %10s %10s" % ("backend", "time [ms]", "requests", "rows"))
+            for name, backend in zip(["classic", "sequential", "asyncio"], backends):
+                if backend is None:
+                    print("%12s %10s" % (name, "n/a"))
+                    continue
+                print("%12s %10.1f %10d %10d" % (name, *_measure(backend, responder)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
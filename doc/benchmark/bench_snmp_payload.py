@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare the JSON and the binary encoding of the fetcher SNMP payload
+
+Creates interface like SNMP tables and measures size, encoding and decoding
+time of both payload versions. The decoded data is compared with the input.
+
+Usage: PYTHONPATH=. doc/benchmark/bench_snmp_payload.py [ROWS [COLUMNS]]
+"""
+
+import sys
+import time
+from typing import List
+
+from cmk.utils.type_defs import SectionName
+
+from cmk.core_helpers.protocol import SNMPPayloadVersion, SNMPResultMessage
+
+
+def _make_raw_data(rows: int, columns: int):
+    table = []
+    for index in range(rows):
+        row: List = [str(index), "Ethernet%d" % index, "6", "1500", "1000000000"]
+        row.append([0, 80, 86, index % 256, (index >> 8) % 256, 1])  # MAC address
+        row.extend(str((index * column) % 4096) for column in range(columns - len(row)))
+        table.append(row)
+    return {SectionName("if64"): [table], SectionName("snmp_uptime"): [[["6500337"]]]}
+
+
+def _measure(raw_data, version: SNMPPayloadVersion, rounds: int = 3):
+    SNMPResultMessage.version = version
+    message = SNMPResultMessage(raw_data)
+
+    start = time.time()
+    for _ in range(rounds):
+        data = bytes(message)
+    encode = (time.time() - start) / rounds
+
+    start = time.time()
+    for _ in range(rounds):
+        decoded = SNMPResultMessage.from_bytes(data)
+    decode = (time.time() - start) / rounds
+
+    assert decoded.result().ok == raw_data, "Roundtrip failed"
+    return len(data), encode, decode
+
+
+def main(args: List[str]) -> None:
+    rows = int(args[0]) if len(args) > 0 else 20000
+    columns = int(args[1]) if len(args) > 1 else 20
+    raw_data = _make_raw_data(rows, columns)
+
+    print("%d rows, %d columns (%d cells)" % (rows, columns, rows * columns))
+    print("%-8s %12s %12s %12s %12s" % ("version", "bytes", "encode [s]", "decode [s]", "cells/s"))
+    for version in SNMPPayloadVersion:
+        size, encode, decode = _measure(raw_data, version)
+        print("%-8s %12d %12.3f %12.3f %12d" %
+              (version.name, size, encode, decode, rows * columns / (encode + decode)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
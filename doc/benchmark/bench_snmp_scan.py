@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the SNMP scan of many hosts
+
+Serves a stored walk with the stored walk responder of the tests on localhost for
+all hosts, with one responder per process scanning concurrently. Every response is
+delayed to simulate the round trip time of the network. Scans the hosts for 600
+synthetic sections: 300 detected by the system object ID and a vendor OID, 200 by
+the existence of an OID and 100 by two OIDs depending on each other. Measures the
+scan of the hosts
+- fetching one OID after the other (like the backends without get_many()),
+- fetching the OIDs of a round of the detection at once,
+- like that in concurrent processes, as the discovery of many hosts does and
+- again, with the results of the concurrent scans cached.
+Reports the time and the number of SNMP requests.
+
+Usage: PYTHONPATH=.:tests doc/benchmark/bench_snmp_scan.py [HOSTS [DELAY_MS [PROCESSES]]]
+"""
+
+import logging
+import multiprocessing
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple, Type
+
+from testlib.snmp_responder import StoredWalkResponder  # type: ignore[import]
+
+import cmk.utils.paths
+from cmk.utils.type_defs import HostName, SectionName
+
+import cmk.snmplib.snmp_cache as snmp_cache
+import cmk.snmplib.snmp_scan as snmp_scan
+from cmk.snmplib.type_defs import SNMPBackend, SNMPBackendEnum, SNMPHostConfig
+
+from cmk.core_helpers.snmp_backend import AsyncioSNMPBackend
+
+_ENTERPRISES = ".1.3.6.1.4.1"
+
+_SECTIONS = ([(SectionName("vendor%d" % vendor),
+               [[(snmp_scan.OID_SYS_OBJ, r"%s\.%d\..*" % (_ENTERPRISES, vendor), True),
+                 ("%s.%d.1.1.0" % (_ENTERPRISES, vendor), ".*", True)]])
+              for vendor in range(7900, 8200)] +
+             [(SectionName("exists%d" % vendor), [[("%s.%d.2.1.0" % (_ENTERPRISES, vendor), ".*",
+                                                    True)]]) for vendor in range(1, 201)] +
+             [(SectionName("depends%d" % vendor),
+               [[("%s.%d.3.1.0" % (_ENTERPRISES, vendor), ".*", True),
+                 ("%s.%d.3.2.0" % (_ENTERPRISES, vendor), ".*", True)]])
+              for vendor in range(1, 101)])
+
+
+def _write_walk(path: Path) -> None:
+    with path.open("w") as f:
+        f.write(".1.3.6.1.2.1.1.1.0 Linux synthetic 5.10.0\n")
+        f.write(".1.3.6.1.2.1.1.2.0 %s.8072.3.2.10\n" % _ENTERPRISES)
+        f.write("%s.8072.1.1.0 1\n" % _ENTERPRISES)
+        for vendor in range(1, 201, 10):
+            f.write("%s.%d.2.1.0 %d\n" % (_ENTERPRISES, vendor, vendor))
+            f.write("%s.%d.3.1.0 %d\n" % (_ENTERPRISES, vendor, vendor))
+            f.write("%s.%d.3.2.0 %d\n" % (_ENTERPRISES, vendor, vendor))
+
+
+class _SingleOIDAsyncioSNMPBackend(AsyncioSNMPBackend):
+    """Fetches one OID after the other, like the other backends"""
+    get_many = SNMPBackend.get_many
+
+
+def _scan(hostname: HostName, *, port: int, backend_class: Type[SNMPBackend]) -> None:
+    backend = backend_class(
+        SNMPHostConfig(
+            is_ipv6_primary=False,
+            hostname=hostname,
+            ipaddress="127.0.0.1",
+            credentials="public",
+            port=port,
+            is_bulkwalk_host=True,
+            is_snmpv2or3_without_bulkwalk_host=False,
+            bulk_walk_size_of=10,
+            timing={},
+            oid_range_limits=[],
+            snmpv3_contexts=[],
+            character_encoding=None,
+            is_usewalk_host=False,
+            snmp_backend=SNMPBackendEnum.ASYNCIO,
+        ), logging.getLogger("bench"))
+    snmp_scan.gather_available_raw_section_names(
+        _SECTIONS,
+        on_error="raise",
+        missing_sys_description=False,
+        backend=backend,
+    )
+    snmp_cache.cleanup_host_caches()
+
+
+# The responder of a process scanning concurrently, the hosts do not share one
+_responder: Optional[StoredWalkResponder] = None
+
+
+def _start_responder(walk_path: Path, delay: float) -> None:
+    global _responder
+    _responder = StoredWalkResponder(walk_path, delay=delay)
+    _responder.start()
+
+
+def _scan_in_process(hostname: HostName) -> Tuple[snmp_scan.SNMPScanResults, int]:
+    assert _responder is not None
+    requests_before = _responder.requests
+    with snmp_scan.cached_scan_results() as scan_results:
+        _scan(hostname, port=_responder.port, backend_class=AsyncioSNMPBackend)
+        return scan_results, _responder.requests - requests_before
+
+
+def _measure(function: Callable[[], int]) -> List[float]:
+    start = time.time()
+    requests = function()
+    return [1000 * (time.time() - start), requests]
+
+
+def main(args: List[str]) -> None:
+    num_hosts = int(args[0]) if len(args) > 0 else 20
+    delay = float(args[1]) / 1000.0 if len(args) > 1 else 0.01
+    num_processes = int(args[2]) if len(args) > 2 else 10
+    hostnames = [HostName("host%d" % host) for host in range(num_hosts)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmk.utils.paths.snmp_scan_cache_dir = tmp_dir
+        walk_path = Path(tmp_dir, "walk")
+        _write_walk(walk_path)
+        with StoredWalkResponder(walk_path, delay=delay) as responder:
+            prescanned: snmp_scan.SNMPScanResults = {}
+
+            def scan(backend_class: Type[SNMPBackend]) -> int:
+                requests_before = responder.requests
+                for hostname in hostnames:
+                    _scan(hostname, port=responder.port, backend_class=backend_class)
+                return responder.requests - requests_before
+
+            def scan_concurrently() -> int:
+                requests = 0
+                with multiprocessing.get_context("fork").Pool(
+                        num_processes, initializer=_start_responder,
+                        initargs=(walk_path, delay)) as pool:
+                    for host_scan_results, host_requests in pool.imap_unordered(
+                            _scan_in_process, hostnames):
+                        prescanned.update(host_scan_results)
+                        requests += host_requests
+                return requests
+
+            def scan_cached() -> int:
+                with snmp_scan.cached_scan_results() as scan_results:
+                    scan_results.update(prescanned)
+                    return scan(AsyncioSNMPBackend)
+
+            results = [
+                _measure(lambda: scan(_SingleOIDAsyncioSNMPBackend)),
+                _measure(lambda: scan(AsyncioSNMPBackend)),
+                _measure(scan_concurrently),
+                _measure(scan_cached),
+            ]
+
+    print("%d hosts, %d sections, %.1f ms delay, %d processes" %
+          (num_hosts, len(_SECTIONS), 1000 * delay, num_processes))
+    print("%12s %10s %10s" % ("", "time [ms]", "requests"))
+    for name, result in zip(["one by one", "batched", "concurrent", "cached"], results):
+        print("%12s %10.1f %10d" % (name, *result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Measure the stored walk backend with many hosts simulated by the same walk
+
+Writes a stored walk of a synthetic switch (ifTable and ifXTable of all
+interfaces) and hard links it for all hosts. Then walks the 40 interface columns
+and gets sysDescr of every host, like a check cycle of the hosts would do.
+Reports the time of the first host, which creates the index of the walk, and the
+average time of the other hosts.
+
+Usage: doc/benchmark/bench_stored_walk.py [INTERFACES [HOSTS]]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import List
+
+import cmk.utils.paths
+from cmk.utils.type_defs import HostName
+
+import cmk.snmplib.snmp_cache as snmp_cache
+from cmk.snmplib.type_defs import SNMPBackendEnum, SNMPHostConfig
+
+from cmk.core_helpers.snmp_backend import StoredWalkSNMPBackend
+
+_IF_TABLE = ".1.3.6.1.2.1.2.2.1"
+_IF_X_TABLE = ".1.3.6.1.2.1.31.1.1.1"
+_COLUMNS = (["%s.%d" % (_IF_TABLE, column) for column in range(1, 23)] +
+            ["%s.%d" % (_IF_X_TABLE, column) for column in range(1, 19)])
+
+
+def _write_walk(path: Path, num_interfaces: int) -> None:
+    with path.open("w") as f:
+        f.write(".1.3.6.1.2.1.1.1.0 Synthetic switch\n")
+        for table, num_columns in [(_IF_TABLE, 22), (_IF_X_TABLE, 18)]:
+            for column in range(1, num_columns + 1):
+                for index in range(1, num_interfaces + 1):
+                    if column in (2, 18) and table == _IF_TABLE or column == 1:
+                        value = "GigabitEthernet1/0/%d" % index
+                    elif column == 6 and table == _IF_TABLE:
+                        value = '"00 1A 4B %02X %02X %02X "' % (index >> 16, (index >> 8) & 255,
+                                                               index & 255)
+                    else:
+                        value = "%d" % (index * 1000003 * column)
+                    f.write("%s.%d.%d %s\n" % (table, column, index, value))
+
+
+def _check_cycle(hostname: HostName, logger: logging.Logger) -> float:
+    backend = StoredWalkSNMPBackend(
+        SNMPHostConfig(
+            is_ipv6_primary=False,
+            hostname=hostname,
+            ipaddress="127.0.0.1",
+            credentials="public",
+            port=161,
+            is_bulkwalk_host=True,
+            is_snmpv2or3_without_bulkwalk_host=False,
+            bulk_walk_size_of=10,
+            timing={},
+            oid_range_limits=[],
+            snmpv3_contexts=[],
+            character_encoding=None,
+            is_usewalk_host=True,
+            snmp_backend=SNMPBackendEnum.CLASSIC,
+        ), logger)
+    start = time.time()
+    backend.get(".1.3.6.1.2.1.1.1.0")
+    for column in _COLUMNS:
+        backend.walk(column)
+    duration = time.time() - start
+    snmp_cache.cleanup_host_caches()
+    return duration
+
+
+def main(args: List[str]) -> None:
+    num_interfaces = int(args[0]) if len(args) > 0 else 1000
+    num_hosts = int(args[1]) if len(args) > 1 else 100
+
+    logger = logging.getLogger("bench")
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmk.utils.paths.snmpwalks_dir = tmp_dir
+        cmk.utils.paths.snmpwalk_index_dir = Path(tmp_dir, "index")
+        _write_walk(Path(tmp_dir, "host0"), num_interfaces)
+        for host in range(1, num_hosts):
+            os.link(os.path.join(tmp_dir, "host0"), os.path.join(tmp_dir, "host%d" % host))
+
+        durations = [_check_cycle(HostName("host%d" % host), logger) for host in range(num_hosts)]
+
+    print("%d interfaces, %d columns, %d hosts" % (num_interfaces, len(_COLUMNS), num_hosts))
+    print("%12s %10s" % ("", "time [ms]"))
+    print("%12s %10.1f" % ("first host", 1000 * durations[0]))
+    if num_hosts > 1:
+        print("%12s %10.1f" % ("other hosts", 1000 * sum(durations[1:]) / (num_hosts - 1)))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
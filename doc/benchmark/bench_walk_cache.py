@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""Compare the SNMP walk cache with one repr() file per OID
+
+Caches 20 columns of the interface table of a synthetic switch. Measures saving
+the walks, loading all of them and loading a single one, both with the walk cache
+and with one repr() file per OID (the format of the walk cache up to now).
+
+Usage: doc/benchmark/bench_walk_cache.py [INTERFACES]
+"""
+
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List
+
+import cmk.utils.paths
+import cmk.utils.store as store
+from cmk.utils.type_defs import HostName
+
+import cmk.snmplib.snmp_table as snmp_table
+from cmk.snmplib.type_defs import BackendOIDSpec, BackendSNMPTree, SNMPRowInfo
+
+_IF_TABLE = ".1.3.6.1.2.1.2.2.1"
+_TREE = BackendSNMPTree(
+    base=_IF_TABLE,
+    oids=[BackendOIDSpec("%d" % column, "string", True) for column in range(1, 21)],
+)
+
+
+def _walks(num_interfaces: int) -> Dict[str, SNMPRowInfo]:
+    walks = {}
+    for column in range(1, 21):
+        fetchoid = "%s.%d" % (_IF_TABLE, column)
+        if column == 2:
+            values = [b"GigabitEthernet1/0/%d" % index for index in range(1, num_interfaces + 1)]
+        elif column == 6:
+            values = [
+                bytes([0, 0x1a, 0x4b, index >> 16, (index >> 8) & 255, index & 255])
+                for index in range(1, num_interfaces + 1)
+            ]
+        else:
+            values = [b"%d" % (index * 1000003 * column) for index in range(1, num_interfaces + 1)]
+        walks[fetchoid] = [
+            ("%s.%d" % (fetchoid, index), value) for index, value in enumerate(values, 1)
+        ]
+    return walks
+
+
+def _save_repr_files(path: Path, walks: Dict[str, SNMPRowInfo]) -> None:
+    path.mkdir(parents=True, exist_ok=True)
+    for fetchoid, rowinfo in walks.items():
+        store.save_object_to_file(path / fetchoid, rowinfo, pretty=False)
+
+
+def _load_repr_files(path: Path, fetchoids: List[str]) -> None:
+    for fetchoid in fetchoids:
+        store.load_object_from_file(path / fetchoid)
+
+
+def _save_walk_cache(walks: Dict[str, SNMPRowInfo]) -> None:
+    walk_cache = snmp_table.WalkCache(HostName("switch"))
+    for fetchoid, rowinfo in walks.items():
+        walk_cache[fetchoid] = (True, rowinfo)
+    walk_cache.save()
+
+
+def _load_walk_cache(fetchoids: List[str]) -> None:
+    walk_cache = snmp_table.WalkCache(HostName("switch"))
+    walk_cache.load(trees=[_TREE])
+    for fetchoid in fetchoids:
+        _ = walk_cache[fetchoid]
+
+
+def _measure(function: Callable[[], None]) -> float:
+    start = time.time()
+    function()
+    return 1000 * (time.time() - start)
+
+
+def main(args: List[str]) -> None:
+    num_interfaces = int(args[0]) if len(args) > 0 else 10000
+    walks = _walks(num_interfaces)
+    fetchoids = list(walks)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cmk.utils.paths.var_dir = tmp_dir
+        repr_path = Path(tmp_dir, "repr", "switch")
+
+        results = [
+            (
+                _measure(lambda: _save_repr_files(repr_path, walks)),
+                _measure(lambda: _load_repr_files(repr_path, fetchoids)),
+                _measure(lambda: _load_repr_files(repr_path, fetchoids[1:2])),
+                sum(path.stat().st_size for path in repr_path.iterdir()) / 1024.0,
+            ),
+            (
+                _measure(lambda: _save_walk_cache(walks)),
+                _measure(lambda: _load_walk_cache(fetchoids)),
+                _measure(lambda: _load_walk_cache(fetchoids[1:2])),
+                Path(tmp_dir, "snmp_cache", "switch.walks").stat().st_size / 1024.0,
+            ),
+        ]
+
+    print("%d interfaces, %d columns" % (num_interfaces, len(fetchoids)))
+    print("%12s %10s %10s %10s %10s" % ("", "save [ms]", "load [ms]", "one [ms]", "size [kB]"))
+    for name, result in zip(["repr files", "walk cache"], results):
+        print("%12s %10.1f %10.1f %10.1f %10.1f" % (name, *result))
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -5,9 +5,11 @@
 # conditions defined in the file COPYING, which is part of this source code package.
 """MK Livestatus Python API"""
 import ast
+import bisect
 import contextlib
 import os
 import re
+import select
 import socket
 import ssl
 import threading
@@ -288,6 +290,150 @@ QueryTypes = Union[str, bytes, Query]
 OnlySites = Optional[List[SiteId]]
 DeadSite = Dict[str, Union[str, int, Exception, SiteConfiguration]]
 
+#.
+#   .--ConnPool------------------------------------------------------------.
+#   |     ____                       ____                 _                |
+#   |    / ___|  ___   _ __   _ __  |  _ \   ___    ___  | |               |
+#   |   | |     / _ \ | '_ \ | '_ \ | |_) | / _ \  / _ \ | |               |
+#   |   | |___ | (_) || | | || | | ||  __/ | (_) || (_) || |               |
+#   |    \____| \___/ |_| |_||_| |_||_|     \___/  \___/ |_|               |
+#   |                                                                      |
+#   +----------------------------------------------------------------------+
+#   |  Process wide pool of idle livestatus connections                    |
+#   '----------------------------------------------------------------------'
+
+# Identifies sockets that can be used for the same connections
+PoolKey = Tuple[str, bool, bool, Optional[str]]
+
+
+class LatencyHistogram:
+    """Histogram of the query latencies of a site
+
+    The buckets are cumulative like the ones of Prometheus: counts[i] is the number
+    of queries that took at most bounds[i] seconds."""
+    bounds = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+              float("inf"))
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.counts = [0] * len(self.bounds)
+        self.count = 0
+        self.sum = 0.0
+
+    def record(self, latency: float) -> None:
+        self.count += 1
+        self.sum += latency
+        for index in range(bisect.bisect_left(self.bounds, latency), len(self.bounds)):
+            self.counts[index] += 1
+
+    def copy(self) -> 'LatencyHistogram':
+        histogram = LatencyHistogram()
+        histogram.counts = self.counts[:]
+        histogram.count = self.count
+        histogram.sum = self.sum
+        return histogram
+
+
+class ConnectionPool:
+    """Keeps the idle sockets of the livestatus connections for later reuse
+
+    Connections using the pool take an idle socket of their site instead of
+    connecting, and hand it back to the pool once they are released. Sockets
+    that have been idle for longer than max_idle_time are closed, since the
+    livestatus servers close idle connections after some time. Before a socket
+    is handed out it is checked that the server did not close it in the meantime.
+
+    The pool is thread safe. Sockets of a parent process are never handed out in
+    forked child processes."""
+    def __init__(self, max_idle_per_site: int = 8, max_idle_time: float = 30.0) -> None:
+        super().__init__()
+        self.max_idle_per_site = max_idle_per_site
+        self.max_idle_time = max_idle_time
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        # Most recently used sockets last
+        self._idle: Dict[PoolKey, List[Tuple[float, socket.socket]]] = {}
+        self._latencies: Dict[str, LatencyHistogram] = {}
+
+    def _check_pid(self) -> None:
+        if os.getpid() != self._pid:
+            # The sockets are shared with the parent process, do not close them
+            self._idle.clear()
+            self._latencies.clear()
+            self._pid = os.getpid()
+
+    def checkout(self, key: PoolKey) -> Optional[socket.socket]:
+        """Returns an idle, healthy socket or None in case there is none"""
+        with self._lock:
+            self._check_pid()
+            self._evict_idle(time.time())
+            idle = self._idle.get(key, [])
+            while idle:
+                _last_used, sock = idle.pop()
+                if _is_healthy(sock):
+                    return sock
+                _close_socket(sock)
+        return None
+
+    def checkin(self, key: PoolKey, sock: socket.socket) -> None:
+        with self._lock:
+            self._check_pid()
+            idle = self._idle.setdefault(key, [])
+            idle.append((time.time(), sock))
+            while len(idle) > self.max_idle_per_site:
+                _close_socket(idle.pop(0)[1])
+
+    def _evict_idle(self, now: float) -> None:
+        for key, idle in list(self._idle.items()):
+            while idle and now - idle[0][0] > self.max_idle_time:
+                _close_socket(idle.pop(0)[1])
+            if not idle:
+                del self._idle[key]
+
+    def clear(self) -> None:
+        """Closes all idle sockets"""
+        with self._lock:
+            self._check_pid()
+            for idle in self._idle.values():
+                for _last_used, sock in idle:
+                    _close_socket(sock)
+            self._idle.clear()
+
+    def num_idle(self) -> int:
+        with self._lock:
+            return sum(len(idle) for idle in self._idle.values())
+
+    def record_latency(self, site: str, latency: float) -> None:
+        with self._lock:
+            self._check_pid()
+            self._latencies.setdefault(site, LatencyHistogram()).record(latency)
+
+    def latency_histograms(self) -> Dict[str, LatencyHistogram]:
+        """Returns a copy of the latency histograms by site"""
+        with self._lock:
+            return {site: histogram.copy() for site, histogram in self._latencies.items()}
+
+
+def _is_healthy(sock: socket.socket) -> bool:
+    """An idle socket must not be readable, otherwise it has been closed by the peer
+    or there is left over data of an interrupted query"""
+    try:
+        readable, _writable, _exceptional = select.select([sock], [], [], 0)
+    except (OSError, ValueError):
+        return False
+    return not readable
+
+
+def _close_socket(sock: socket.socket) -> None:
+    try:
+        sock.close()
+    except OSError:
+        pass
+
+
+# The pool used by the connections to sites with persistent connections
+connection_pool = ConnectionPool()
+
 #.
 #   .--SingleSiteConn------------------------------------------------------.
 #   |  ____  _             _      ____  _ _        ____                    |
@@ -355,8 +501,11 @@ class SingleSiteConnection(Helpers):
                  allow_cache: bool = False,
                  tls: bool = False,
                  verify: bool = True,
-                 ca_file_path: Optional[str] = None) -> None:
-        """Create a new connection to a MK Livestatus socket"""
+                 ca_file_path: Optional[str] = None,
+                 pool: Optional[ConnectionPool] = None) -> None:
+        """Create a new connection to a MK Livestatus socket
+
+        With a pool the socket is taken from the pool and handed back by release()."""
         super(SingleSiteConnection, self).__init__()
         self.prepend_site = False
         self.site_name = site_name
@@ -379,6 +528,10 @@ class SingleSiteConnection(Helpers):
         self.tls_verify = verify
         self._tls_ca_file_path = ca_file_path
 
+        self.pool = pool
+        # The process that connected the socket
+        self._socket_pid: Optional[int] = None
+
     @property
     def tls_ca_file_path(self) -> str:
         """CA file bundle to use for certificate verification"""
@@ -403,6 +556,14 @@ class SingleSiteConnection(Helpers):
             self.successful_persistence = True
             return
 
+        if self.pool is not None:
+            pooled_socket = self.pool.checkout(self._pool_key())
+            if pooled_socket is not None:
+                self.socket = pooled_socket
+                self._socket_pid = os.getpid()
+                self.successful_persistence = True
+                return
+
         self.successful_persistence = False
         family, address = _parse_socket_url(self.socketurl)
         self.socket = self._create_socket(family, self.site_name)
@@ -445,6 +606,7 @@ class SingleSiteConnection(Helpers):
                 self.socket = None
                 raise MKLivestatusSocketError("Cannot connect to '%s': %s" % (self.socketurl, e))
 
+        self._socket_pid = os.getpid()
         if self.persist:
             persistent_connections[self.socketurl] = self.socket
 
@@ -477,6 +639,20 @@ class SingleSiteConnection(Helpers):
             except KeyError:
                 pass
 
+    def release(self) -> None:
+        """Hands the socket back to the pool, without a pool this is the same as disconnect()"""
+        if self.pool is not None and self.socket is not None and self._socket_pid == os.getpid():
+            self.pool.checkin(self._pool_key(), self.socket)
+            self.socket = None
+        self.disconnect()
+
+    def _pool_key(self) -> PoolKey:
+        return (self.socketurl, self.tls, self.tls_verify, self._tls_ca_file_path)
+
+    def _record_latency(self, started: float) -> None:
+        if self.pool is not None:
+            self.pool.record_latency(self.site_name or self.socketurl, time.time() - started)
+
     def receive_data(self, size: int) -> bytes:
         if self.socket is None:
             raise MKLivestatusSocketError("Socket to '%s' is not connected" % self.socketurl)
@@ -495,8 +671,11 @@ class SingleSiteConnection(Helpers):
 
     def do_query(self, query_obj: Query, add_headers: str = "") -> LivestatusResponse:
         query = self.build_query(query_obj, add_headers)
+        started = time.time()
         self.send_query(query)
-        return self.recv_response(query, query_obj.suppress_exceptions)
+        response = self.recv_response(query, query_obj.suppress_exceptions)
+        self._record_latency(started)
+        return response
 
     def build_query(self, query_obj: Query, add_headers: str) -> str:
         query = str(query_obj)
@@ -550,34 +729,7 @@ class SingleSiteConnection(Helpers):
                       suppress_exceptions: Tuple[Type[Exception], ...],
                       timeout_at: Optional[float] = None) -> LivestatusResponse:
         try:
-            # Headers are always ASCII encoded
-            resp = self.receive_data(16)
-            code = resp[0:3].decode("ascii")
-            try:
-                length = int(resp[4:15].lstrip())
-            except Exception:
-                self.disconnect()
-                raise MKLivestatusSocketError(
-                    "Malformed output. Livestatus TCP socket might be unreachable or wrong"
-                    "encryption settings are used.")
-
-            data = self.receive_data(length).decode("utf-8")
-
-            if code == "200":
-                try:
-                    return ast.literal_eval(data)
-                except (ValueError, SyntaxError):
-                    self.disconnect()
-                    raise MKLivestatusSocketError("Malformed output")
-
-            elif code == "404":
-                raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
-
-            elif code == "502":
-                raise MKLivestatusBadGatewayError(data.strip())
-
-            else:
-                raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+            return self._receive_response()
 
         except (MKLivestatusSocketClosed, IOError) as e:
             # In case of an IO error or the other side having
@@ -617,6 +769,36 @@ class SingleSiteConnection(Helpers):
             # FIXME: ? self.disconnect()
             raise MKLivestatusSocketError("Unhandled exception: %s" % e)
 
+    def _receive_response(self) -> LivestatusResponse:
+        # Headers are always ASCII encoded
+        resp = self.receive_data(16)
+        code = resp[0:3].decode("ascii")
+        try:
+            length = int(resp[4:15].lstrip())
+        except Exception:
+            self.disconnect()
+            raise MKLivestatusSocketError(
+                "Malformed output. Livestatus TCP socket might be unreachable or wrong"
+                "encryption settings are used.")
+
+        data = self.receive_data(length).decode("utf-8")
+
+        if code == "200":
+            try:
+                return ast.literal_eval(data)
+            except (ValueError, SyntaxError):
+                self.disconnect()
+                raise MKLivestatusSocketError("Malformed output")
+
+        elif code == "404":
+            raise MKLivestatusTableNotFoundError("Not Found (%s): %s" % (code, data.strip()))
+
+        elif code == "502":
+            raise MKLivestatusBadGatewayError(data.strip())
+
+        else:
+            raise MKLivestatusQueryError("%s: %s" % (code, data.strip()))
+
     def set_prepend_site(self, p: bool) -> None:
         self.prepend_site = p
 
@@ -642,6 +824,63 @@ class SingleSiteConnection(Helpers):
                 row.insert(0, b"")
         return response
 
+    def query_pipelined(self, queries: List['QueryTypes']) -> List[LivestatusResponse]:
+        """Sends all queries at once and reads the responses afterwards
+
+        This saves the round trips between the queries. The queries are answered in
+        order on the same KeepAlive connection. In case a query fails, the responses
+        of the other queries are read nevertheless and the error is raised afterwards."""
+        query_objs = [Query(query) if not isinstance(query, Query) else query for query in queries]
+        if self.limit is not None:
+            query_objs = [
+                Query("%sLimit: %d\n" % (query_obj, self.limit), query_obj.suppress_exceptions)
+                for query_obj in query_objs
+            ]
+        if not query_objs:
+            return []
+
+        str_queries = [self.build_query(query_obj, "") for query_obj in query_objs]
+        if self.socket is None:
+            self.connect()
+        try:
+            responses = self._do_pipelined(str_queries)
+        except (MKLivestatusSocketError, IOError) as e:
+            self.disconnect()
+            if not self.successful_persistence:
+                raise MKLivestatusSocketError(str(e))
+            # The peer may have closed a reused socket in the meantime
+            self.connect()
+            responses = self._do_pipelined(str_queries)
+
+        if self.prepend_site:
+            for response in responses:
+                for row in response:
+                    row.insert(0, b"")
+        return responses
+
+    def _do_pipelined(self, str_queries: List[str]) -> List[LivestatusResponse]:
+        started = time.time()
+        # Prevent the reconnect of send_query. It would send the queries twice.
+        self.send_query("\n\n".join(str_queries), do_reconnect=False)
+
+        responses = []
+        error: Optional[Exception] = None
+        for _str_query in str_queries:
+            try:
+                responses.append(self._receive_response())
+            except (MKLivestatusSocketError, IOError):
+                self.disconnect()
+                raise
+            except MKLivestatusException as e:
+                # The response has been read completely, the connection is still usable
+                responses.append(LivestatusResponse([]))
+                error = error or e
+            self._record_latency(started)
+
+        if error is not None:
+            raise error
+        return responses
+
     # TODO: Cleanup all call sites to hand over str types
     def command(self, command: AnyStr, site: Optional[SiteId] = None) -> None:
         command_str = _ensure_unicode(command).rstrip("\n")
@@ -840,14 +1079,15 @@ class MultiSiteConnection(Helpers):
         persist = not temporary and site.get("persist", False)
         tls_type, tls_params = site.get("tls", ("plain_text", {}))
 
+        # Persistent connections are shared between the threads using the pool
         connection = SingleSiteConnection(
             socketurl=url,
             site_name=site_name,
-            persist=persist,
             allow_cache=site.get("cache", False),
             tls=tls_type != "plain_text",
             verify=tls_params.get("verify", True),
             ca_file_path=tls_params.get("ca_file_path", None),
+            pool=connection_pool if persist else None,
         )
 
         if "timeout" in site:
@@ -895,6 +1135,13 @@ class MultiSiteConnection(Helpers):
                 return True
         return False
 
+    def release(self) -> None:
+        """Hands the sockets of persistent connections back to the pool and closes the others
+
+        The connections are established again by the next query."""
+        for _sitename, _site, connection in self.connections:
+            connection.release()
+
     def set_auth_user(self, domain: str, user: UserId) -> None:
         for _sitename, _site, connection in self.connections:
             connection.set_auth_user(domain, user)
@@ -966,6 +1213,7 @@ class MultiSiteConnection(Helpers):
             limit_header = u""
 
         # First send all queries
+        started = time.time()
         for sitename, site, connection in connect_to_sites:
             try:
                 str_query = connection.build_query(query, add_headers + limit_header)
@@ -985,6 +1233,7 @@ class MultiSiteConnection(Helpers):
             try:
                 str_query = connection.build_query(query, add_headers + limit_header)
                 r = connection.recv_response(str_query, query.suppress_exceptions)
+                connection._record_latency(started)
                 stillalive.append((sitename, site, connection))
                 if self.prepend_site:
                     for row in r:
@@ -21,7 +21,11 @@ import cmk.utils.paths
 import cmk.snmplib.snmp_cache as snmp_cache
 from cmk.snmplib.type_defs import SNMPHostConfig, SNMPBackendEnum
 
-from cmk.core_helpers.snmp_backend import ClassicSNMPBackend, StoredWalkSNMPBackend
+from cmk.core_helpers.snmp_backend import (
+    AsyncioSNMPBackend,
+    ClassicSNMPBackend,
+    StoredWalkSNMPBackend,
+)
 try:
     from cmk.core_helpers.cee.snmp_backend.inline import InlineSNMPBackend
 except ImportError:
@@ -158,7 +162,7 @@ def _is_listening(process_def):
 
 
 @pytest.fixture(name="backend",
-                params=[ClassicSNMPBackend, StoredWalkSNMPBackend, InlineSNMPBackend])
+                params=[ClassicSNMPBackend, StoredWalkSNMPBackend, InlineSNMPBackend, AsyncioSNMPBackend])
 def backend_fixture(request, snmp_data_dir):
     backend = request.param
     if backend is None:
@@ -179,8 +183,10 @@ def backend_fixture(request, snmp_data_dir):
         snmpv3_contexts=[],
         character_encoding=None,
         is_usewalk_host=backend is StoredWalkSNMPBackend,
-        snmp_backend=SNMPBackendEnum.INLINE
-        if backend is InlineSNMPBackend else SNMPBackendEnum.CLASSIC,
+        snmp_backend={
+            InlineSNMPBackend: SNMPBackendEnum.INLINE,
+            AsyncioSNMPBackend: SNMPBackendEnum.ASYNCIO,
+        }.get(backend, SNMPBackendEnum.CLASSIC),
     )
 
     snmpwalks_dir = cmk.utils.paths.snmpwalks_dir
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+"""A SNMP agent on localhost answering from a stored walk
+
+The responder understands SNMP v1, v2c and v3 (with the users given as SNMPv3
+credentials of Checkmk). The values of the stored walk are served as the types
+a real agent would most likely use: decimal numbers as INTEGER (Counter64 in case
+they do not fit), numeric OIDs as OBJECT IDENTIFIER and everything else as OCTET
+STRING. So the raw values of a walk via SNMP are the same as the ones of the
+stored walk backend.
+"""
+
+import asyncio
+import bisect
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Any, Iterable, List, Optional, Tuple
+
+from six import ensure_binary, ensure_str
+
+import cmk.utils.agent_simulator as agent_simulator
+from cmk.utils.type_defs import AgentRawData
+
+from cmk.core_helpers.snmp_backend import _protocol
+from cmk.core_helpers.snmp_backend._protocol import OIDTuple, Value, VarBind
+from cmk.core_helpers.snmp_backend._utils import strip_snmp_value
+from cmk.core_helpers.snmp_backend.stored_walk import StoredWalkSNMPBackend
+
+_INTEGER = re.compile(rb"0|-?[1-9][0-9]*")
+_OID = re.compile(rb"(\.(0|[1-9][0-9]*)){2,}")
+
+# Stay below the maximum size of an UDP datagram
+_MAX_RESPONSE_SIZE = 60000
+
+
+def _typed_value(value: bytes) -> Tuple[int, Value]:
+    if _INTEGER.fullmatch(value):
+        number = int(value)
+        if -2**31 <= number < 2**31:
+            return _protocol.INTEGER, number
+        if 0 <= number < 2**64:
+            return _protocol.COUNTER64, number
+    if _OID.fullmatch(value):
+        oid = _protocol.oid_from_str(ensure_str(value))
+        if oid[0] == 2 or (oid[0] < 2 and oid[1] < 40):
+            return _protocol.OBJECT_IDENTIFIER, oid
+    return _protocol.OCTET_STRING, value
+
+
+def read_stored_walk(path: Path) -> List[Tuple[OIDTuple, int, Value]]:
+    """The typed values of a stored walk, sorted by the OIDs"""
+    entries = []
+    for line in StoredWalkSNMPBackend.read_walk_data(str(path)):
+        parts = line.split(None, 1)
+        value = ensure_str(agent_simulator.process(AgentRawData(ensure_binary(
+            parts[1])))) if len(parts) > 1 else ""
+        entries.append((_protocol.oid_from_str(parts[0]), *_typed_value(strip_snmp_value(value))))
+    return sorted(entries)
+
+
+class StoredWalkResponder(asyncio.DatagramProtocol):
+    """Answers the SNMP requests to 127.0.0.1:<port> from a background thread
+
+    The delay simulates the round trip time of the network. The responder counts
+    the received requests.
+    """
+    def __init__(
+        self,
+        walk_path: Path,
+        *,
+        community: str = "public",
+        users: Iterable[Tuple[str, ...]] = (),
+        delay: float = 0.0,
+        engine_id: bytes = b"\x80\x00\x1f\x88\x04checkmk",
+    ) -> None:
+        super().__init__()
+        entries = read_stored_walk(walk_path)
+        self._oids = [oid for oid, _tag, _value in entries]
+        self._values = [(tag, value) for _oid, tag, value in entries]
+        self._community = ensure_binary(community)
+        self._engine_id = engine_id
+        self._users = {user.name: user for user in (self._make_user(c) for c in users)}
+        self._delay = delay
+        self._started = time.time()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._transport: Optional[asyncio.DatagramTransport] = None
+        self.port = 0
+        self.requests = 0
+
+    def _make_user(self, credentials: Tuple[str, ...]) -> _protocol.USMUser:
+        if len(credentials) == 2:
+            return _protocol.make_user(ensure_binary(credentials[1]), self._engine_id)
+        return _protocol.make_user(
+            ensure_binary(credentials[2]),
+            self._engine_id,
+            credentials[1],
+            ensure_binary(credentials[3]),
+            credentials[4] if len(credentials) == 6 else None,
+            ensure_binary(credentials[5]) if len(credentials) == 6 else b"",
+        )
+
+    def __enter__(self) -> "StoredWalkResponder":
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        self.stop()
+
+    def start(self) -> int:
+        loop = asyncio.new_event_loop()
+        self._loop = loop
+        ready = threading.Event()
+
+        def run() -> None:
+            asyncio.set_event_loop(loop)
+            self._transport, _protocol_instance = loop.run_until_complete(
+                loop.create_datagram_endpoint(lambda: self, local_addr=("127.0.0.1", 0)))
+            ready.set()
+            loop.run_forever()
+            self._transport.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        ready.wait()
+        if self._transport is None:
+            raise TypeError()
+        self.port = self._transport.get_extra_info("sockname")[1]
+        return self.port
+
+    def stop(self) -> None:
+        if self._loop is None or self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop = self._thread = None
+
+    def datagram_received(self, data: bytes, addr: Any) -> None:
+        try:
+            response = self._respond(data)
+        except ValueError:
+            return
+        self.requests += 1
+        if response is None or self._transport is None:
+            return
+        if self._delay and self._loop is not None:
+            self._loop.call_later(self._delay, self._transport.sendto, response, addr)
+        else:
+            self._transport.sendto(response, addr)
+
+    def _user_of(self, user_name: bytes, engine_id: bytes) -> Optional[_protocol.USMUser]:
+        return self._users.get(user_name) if engine_id == self._engine_id else None
+
+    def _respond(self, data: bytes) -> Optional[bytes]:
+        request = _protocol.decode_message(data, self._user_of)
+        if request.version != _protocol.VERSION_3:
+            if request.community != self._community:
+                return None
+            pdu = self._response_pdu(request.pdu, request.version)
+            return _protocol.encode_message(request._replace(pdu=pdu))
+
+        security = request.security
+        if security is None:
+            return None
+        engine_time = int(time.time() - self._started)
+        response_security = _protocol.SecurityParameters(self._engine_id, 1, engine_time,
+                                                         security.user_name)
+        if security.engine_id != self._engine_id:
+            report = _protocol.PDU(_protocol.REPORT, request.pdu.request_id, 0, 0, [
+                VarBind(_protocol.USM_STATS_UNKNOWN_ENGINE_IDS, _protocol.COUNTER32, 1),
+            ])
+            return _protocol.encode_message(
+                request._replace(
+                    pdu=report,
+                    flags=0,
+                    security=response_security,
+                    context_engine_id=self._engine_id,
+                ))
+
+        user = self._users.get(security.user_name)
+        if user is None:
+            return None
+        return _protocol.encode_message(
+            request._replace(
+                pdu=self._response_pdu(request.pdu, request.version),
+                flags=request.flags & (_protocol.FLAG_AUTH | _protocol.FLAG_PRIV),
+                security=response_security,
+            ),
+            user,
+            salt=self.requests,
+        )
+
+    def _response_pdu(self, request: _protocol.PDU, version: int) -> _protocol.PDU:
+        if request.tag == _protocol.GET_BULK_REQUEST and version != _protocol.VERSION_1:
+            return self._bulk_response(request)
+
+        varbinds = []
+        for index, varbind in enumerate(request.varbinds):
+            if request.tag == _protocol.GET_REQUEST:
+                position = bisect.bisect_left(self._oids, varbind.oid)
+                if position < len(self._oids) and self._oids[position] != varbind.oid:
+                    position = len(self._oids)
+                exception = _protocol.NO_SUCH_INSTANCE
+            else:
+                position = bisect.bisect_right(self._oids, varbind.oid)
+                exception = _protocol.END_OF_MIB_VIEW
+
+            if position < len(self._oids):
+                varbinds.append(VarBind(self._oids[position], *self._values[position]))
+            elif version == _protocol.VERSION_1:
+                return request._replace(tag=_protocol.RESPONSE,
+                                        error_status=_protocol.NO_SUCH_NAME,
+                                        error_index=index + 1)
+            else:
+                varbinds.append(VarBind(varbind.oid, exception, None))
+        return _protocol.PDU(_protocol.RESPONSE, request.request_id, 0, 0, varbinds)
+
+    def _bulk_response(self, request: _protocol.PDU) -> _protocol.PDU:
+        non_repeaters = request.error_status
+        max_repetitions = max(request.error_index, 1)
+        positions = [bisect.bisect_right(self._oids, varbind.oid) for varbind in request.varbinds]
+
+        varbinds: List[VarBind] = []
+        size = 0
+        for repetition in range(max_repetitions):
+            for index, position in enumerate(positions):
+                if index < non_repeaters and repetition > 0:
+                    continue
+                if position < len(self._oids):
+                    varbind = VarBind(self._oids[position], *self._values[position])
+                else:
+                    varbind = VarBind(request.varbinds[index].oid, _protocol.END_OF_MIB_VIEW, None)
+                positions[index] = position + 1
+                size += 2 * len(varbind.oid) + 16 + len(
+                    varbind.value if isinstance(varbind.value, bytes) else b"")
+                varbinds.append(varbind)
+            if size > _MAX_RESPONSE_SIZE or all(position >= len(self._oids)
+                                                for position in positions):
+                break
+        return _protocol.PDU(_protocol.RESPONSE, request.request_id, 0, 0, varbinds)
@@ -278,3 +278,78 @@ def test_save_autochecks_file(items, expected_content):
         content = f.read()
 
     assert expected_content == content
+
+
+def _filesystem_description(hostname, check_plugin_name, item):
+    return "Filesystem %s" % item
+
+
+@pytest.fixture()
+def autochecks_index_file(monkeypatch, tmp_path):
+    index_file = tmp_path / "index" / "autochecks_index"
+    monkeypatch.setattr(cmk.utils.paths, "autochecks_index_file", index_file)
+    return index_file
+
+
+def test_parse_autochecks_file_rejects_code():
+    Path(cmk.utils.paths.autochecks_dir, "host.mk").write_text(
+        u"[{'check_plugin_name': 'df', 'item': __import__('os').getcwd(), 'parameters': {}, "
+        u"'service_labels': {}}]")
+    with pytest.raises(MKGeneralException):
+        autochecks.parse_autochecks_file("host", _filesystem_description)
+
+
+def test_parse_autochecks_file_large():
+    parameters = {"key%d" % i: i for i in range(20)}
+    Path(cmk.utils.paths.autochecks_dir, "host.mk").write_text(u"%r" % [{
+        'check_plugin_name': 'df',
+        'item': u"/%d" % i,
+        'parameters': parameters,
+        'service_labels': {},
+    } for i in range(40)])
+    services = autochecks.parse_autochecks_file("host", _filesystem_description)
+    assert [service.item for service in services] == ["/%d" % i for i in range(40)]
+    assert all(service.parameters == parameters for service in services)
+
+
+def test_autochecks_index(monkeypatch, autochecks_index_file):
+    for hostname in ["host1", "host2", "hüst"]:
+        autochecks.save_autochecks_file(hostname, [
+            Service(CheckPluginName("df"), "/%s" % hostname, "Filesystem /%s" % hostname, {}),
+        ])
+    autochecks.update_autochecks_index()
+    index = autochecks.AutochecksIndex.load(autochecks_index_file)
+    assert index is not None
+    assert [hostname for hostname, _version, _entry in index.entries()] == [
+        "host1", "host2", "hüst"
+    ]
+
+    read_files = []
+    read_raw_autochecks_file = autochecks._read_raw_autochecks_file
+
+    def read_and_record(path, check_variables):
+        read_files.append(path.name)
+        return read_raw_autochecks_file(path, check_variables)
+
+    monkeypatch.setattr(autochecks, "_read_raw_autochecks_file", read_and_record)
+    assert [service.item for service in autochecks.parse_autochecks_file(
+        "hüst", _filesystem_description)] == ["/hüst"]
+    assert read_files == []
+
+    # Changed files are not taken from the index
+    new_service = Service(CheckPluginName("df"), "/new", "Filesystem /new", {})
+    autochecks.set_autochecks_of_real_hosts(
+        "host1", [autochecks.ServiceWithNodes(new_service, ["host1"])], _filesystem_description)
+    assert autochecks.parse_autochecks_file("host1", _filesystem_description) == [new_service]
+    assert read_files == ["host1.mk"]
+
+    # The update only reads the changed files
+    autochecks.remove_autochecks_file("host2")
+    autochecks.update_autochecks_index()
+    assert read_files == ["host1.mk", "host1.mk"]
+    index = autochecks.AutochecksIndex.load(autochecks_index_file)
+    assert index is not None
+    assert len(index) == 2
+    assert autochecks.parse_autochecks_file("host1", _filesystem_description) == [new_service]
+    assert autochecks.parse_autochecks_file("host2", _filesystem_description) == []
+    assert read_files == ["host1.mk", "host1.mk"]
@@ -6,6 +6,7 @@
 
 from pathlib import Path
 import re
+from typing import Any, Dict
 
 import pytest  # type: ignore[import]
 from six import ensure_str
@@ -1985,6 +1986,30 @@ def test_load_config_folder_paths(folder_path_test_config):
         "lvl2-host", config.cmc_host_rrd_config) == ["LVL2", "LVL1", "LVL0", "MAIN"]
 
 
+def test_config_file_code_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "precompiled_config_dir", tmp_path / "precompiled")
+    path = tmp_path / "rules.mk"
+    path.write_text(u"value = 1\n")
+
+    def load():
+        code, compiled = config._config_file_code(str(path))
+        context: Dict[str, Any] = {}
+        exec(code, context, context)
+        return context["value"], compiled
+
+    assert load() == (1, True)
+    assert load() == (1, False)
+
+    path.write_text(u"value = 22\n")
+    assert load() == (22, True)
+    assert load() == (22, False)
+
+    # Broken cache files are replaced
+    config._precompiled_config_path(str(path)).write_bytes(b"broken")
+    assert load() == (22, True)
+    assert load() == (22, False)
+
+
 @pytest.fixture(name="folder_path_test_config")
 def folder_path_test_config_fixture(monkeypatch):
     config_dir = Path(cmk.utils.paths.check_mk_config_dir)
@@ -2158,6 +2183,48 @@ class TestPackedConfigStore:
             "abc": 1,
         }
 
+    def test_host_settings(self, store):
+        store.write({
+            "abc": 1,
+            "ipaddresses": {
+                "host1": "127.0.0.1",
+                "host2": "127.0.0.2",
+            },
+            "host_attributes": {
+                "host2": {
+                    "management_address": "127.0.1.2"
+                },
+            },
+        })
+
+        packed_config = store.read()
+        assert packed_config["abc"] == 1
+        ipaddresses = packed_config["ipaddresses"]
+        host_attributes = packed_config["host_attributes"]
+        assert isinstance(ipaddresses, config._PackedHostSettings)
+        assert "host1" in ipaddresses
+        assert "host3" not in ipaddresses
+        assert ipaddresses.get("host3") is None
+        assert host_attributes.get("host1", {}) == {}
+        assert host_attributes["host2"] == {"management_address": "127.0.1.2"}
+        assert dict(ipaddresses) == {"host1": "127.0.0.1", "host2": "127.0.0.2"}
+
+    def test_host_settings_loaded_on_access(self, store, monkeypatch):
+        store.write({"ipaddresses": {"host%d" % nr: "127.0.0.%d" % nr for nr in range(10)}})
+        ipaddresses = store.read()["ipaddresses"]
+
+        loaded = []
+        loads = config.pickle.loads
+
+        def record_loads(data):
+            loaded.append(data)
+            return loads(data)
+
+        monkeypatch.setattr(config.pickle, "loads", record_loads)
+        assert ipaddresses["host3"] == "127.0.0.3"
+        assert ipaddresses["host3"] == "127.0.0.3"
+        assert len(loaded) == 1
+
 
 @pytest.mark.parametrize("params, expected_result", [
     (
@@ -245,6 +245,39 @@ class TestHostCheckStore:
         assert os.access(store.host_check_file_path(serial, hostname), os.X_OK)
 
 
+@pytest.mark.parametrize("cpu_count", [1, 2])
+def test_precompile_hostchecks_reuses_unchanged_host_checks(monkeypatch, tmp_path, cpu_count):
+    monkeypatch.setattr(paths, "core_helper_config_dir", tmp_path)
+    monkeypatch.setattr("os.cpu_count", lambda: cpu_count)
+    ts = Scenario().add_host("host1").add_host("host2").add_host("host3")
+    ts.set_option("ipaddresses", {"host1": "127.0.0.1", "host2": "127.0.0.2", "host3": "127.0.0.3"})
+    ts.apply(monkeypatch)
+
+    monkeypatch.setattr(
+        core_nagios,
+        "_get_needed_plugin_names",
+        lambda host_config: ([], [CheckPluginName("uptime")], [])
+        if host_config.hostname != "host3" else ([], [], []),
+    )
+
+    host_check_store = core_nagios.HostCheckStore()
+    serials = [ConfigSerial("1"), ConfigSerial("2")]
+    for serial in serials:
+        with core_config.HelperConfig(serial).create():
+            core_nagios._precompile_hostchecks(serial)
+        assert sorted(host_check_store.load_source_hashes(serial)) == ["host1", "host2"]
+        config.ipaddresses["host2"] = "127.0.0.4"
+
+    def inode(serial, hostname):
+        return host_check_store.host_check_file_path(serial, hostname).stat().st_ino
+
+    assert inode(serials[0], "host1") == inode(serials[1], "host1")
+    assert inode(serials[0], "host2") != inode(serials[1], "host2")
+    assert "127.0.0.4" in host_check_store.host_check_source_file_path(serials[1],
+                                                                        "host2").read_text()
+    assert not host_check_store.host_check_file_path(serials[1], "host3").exists()
+
+
 def test_dump_precompiled_hostcheck(monkeypatch, serial):
     ts = Scenario().add_host("localhost")
     config_cache = ts.apply(monkeypatch)
@@ -7,6 +7,10 @@
 # pylint: disable=protected-access
 import pytest  # type: ignore[import]
 
+import cmk.utils.paths
+import cmk.utils.store as store
+from cmk.utils.item_state_store import ItemStateStore
+
 from cmk.base import item_state
 
 
@@ -68,3 +72,53 @@ def test_get_average(ini_zero, backlog_min, timeseries):
             initialize_zero=ini_zero,
         )
         assert avg == expected_average, "at [%r]: got %r expected %r" % (idx, avg, expected_average)
+
+
+def test_item_state_store_migration(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "counters_dir", str(tmp_path / "counters"))
+    monkeypatch.setattr(cmk.utils.paths, "item_states_dir", tmp_path / "item_states")
+    store.save_object_to_file(tmp_path / "counters" / "host", {("cpu", None, "user"): (0, 42)})
+    monkeypatch.setattr(item_state, "_item_state_store", None)
+    item_state.use_item_state_store(True)
+
+    item_state.load("host")
+    assert item_state.get_all_item_states() == {("cpu", None, "user"): (0, 42)}
+    assert not (tmp_path / "counters" / "host").exists()
+
+    item_state.set_item_state_prefix("if", "1")
+    item_state.set_item_state("in", (1, 23))
+    item_state.save("host")
+    item_state.cleanup_item_states()
+
+    item_state.load("host")
+    assert item_state.get_all_item_states() == {
+        ("cpu", None, "user"): (0, 42),
+        ("if", "1", "in"): (1, 23),
+    }
+    assert item_state.remove_item_states("host")
+    item_state.load("host")
+    assert item_state.get_all_item_states() == {}
+
+
+def test_item_state_store_concurrent_migration(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "counters_dir", str(tmp_path / "counters"))
+    item_state_store = ItemStateStore(tmp_path / "item_states")
+    item_state_store.replace("host", {("cpu", None, "user"): (0, 42)})
+
+    # Another process migrated the file after this one found the host missing in the
+    # store. Taking the lock creates the file again.
+    (tmp_path / "counters").mkdir()
+    (tmp_path / "counters" / "host").touch()
+    load = item_state_store.load
+    loads = []
+
+    def load_outdated_once(hostname):
+        loads.append(hostname)
+        return None if len(loads) == 1 else load(hostname)
+
+    monkeypatch.setattr(item_state_store, "load", load_outdated_once)
+
+    expected = {("cpu", None, "user"): (0, 42)}
+    assert item_state._load_from_item_state_store(item_state_store, "host") == expected
+    assert not (tmp_path / "counters" / "host").exists()
+    assert ItemStateStore(tmp_path / "item_states").load("host") == expected
@@ -4,11 +4,14 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import json
 import math
+import random
 import time
 from pprint import pprint
 import pytest  # type: ignore[import]
 
+import cmk.utils.paths
 from cmk.base import prediction
 from testlib import on_time
 
@@ -120,3 +123,112 @@ def test_time_slices(utcdate, timezone, horizon, period_info, timegroup, result)
     ])
 def test_data_stats(slices, result):
     assert prediction._data_stats(slices) == result
+
+
+def _data_stats_per_point(slices):
+    "The summary of each point computed in Python"
+    descriptors = []
+    for time_column in zip(*slices):
+        point_line = [x for x in time_column if x is not None]
+        if not point_line:
+            descriptors.append([None, None, None, None])
+            continue
+        average = sum(point_line) / float(len(point_line))
+        samples = len(point_line)
+        std_dev = abs(average) if samples == 1 else math.sqrt(
+            abs(sum(p**2 for p in point_line) - average**2 * samples) / float(samples - 1))
+        descriptors.append([average, min(point_line), max(point_line), std_dev])
+    return descriptors
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_data_stats_identical(seed):
+    rand = random.Random(seed)
+    values = [None, 0, 3, 0.0, -0.0, 17, 0.1645, 1e-05, 123456]
+    slices = [[
+        rand.choice(values) if rand.random() < 0.3 else rand.uniform(-1000, 1000)
+        for _point in range(400 - rand.randrange(3))
+    ] for _slice in range(rand.randrange(1, 90))]
+
+    result = prediction._data_stats(slices)
+    expected = _data_stats_per_point(slices)
+
+    # Not only equal, but the same floats and ints, like in the prediction files. The
+    # squares of the standard deviation are products, p**2 may differ in the last bit.
+    assert repr([point[:3] for point in result]) == repr([point[:3] for point in expected])
+    assert [point[3] for point in result] == pytest.approx([point[3] for point in expected],
+                                                           rel=1e-12,
+                                                           abs=1e-12)
+
+
+def _write_info(var_dir, timegroup, computed, service="CPU load", params=None):
+    pred_dir = var_dir / "prediction" / "heute" / service.replace(" ", "_") / "load15"
+    pred_dir.mkdir(parents=True, exist_ok=True)
+    (pred_dir / ("%s.info" % timegroup)).write_text(
+        json.dumps({
+            "time": computed,
+            "range": [0, 0, 0],
+            "cf": "MAX",
+            "dsname": "load15",
+            "slice": 86400,
+            "params": params or {
+                "period": "wday",
+                "horizon": 90,
+                "levels_upper": ("absolute", (2.0, 4.0)),
+            },
+            "host": "heute",
+            "service": service,
+        }))
+
+
+def test_prediction_requests_deduplicated(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    _write_info(tmp_path, "monday", 1000)
+    _write_info(tmp_path, "tuesday", 2000)
+    _write_info(tmp_path, "wednesday", 1500, service="CPU utilization")
+    # Written by an older version without host and service
+    (tmp_path / "prediction" / "heute" / "CPU_load" / "load15" / "sunday.info").write_text(
+        json.dumps({"time": 3000}))
+
+    requests = sorted(prediction.prediction_requests().values())
+    assert [(request.service_description, computed) for request, computed in requests] == [
+        ("CPU load", 2000),
+        ("CPU utilization", 1500),
+    ]
+
+
+def test_prediction_up_to_date_ignores_levels(tmp_path):
+    params = {"period": "wday", "horizon": 90, "levels_upper": ("absolute", (2.0, 4.0))}
+    _write_info(tmp_path, "monday", 1000, params=params)
+    pred_file = str(tmp_path / "prediction" / "heute" / "CPU_load" / "load15" / "monday")
+
+    assert prediction._is_prediction_up_to_date(pred_file, "monday", params, now=2000)
+    assert prediction._is_prediction_up_to_date(pred_file, "monday",
+                                                dict(params, levels_upper=("relative", (10, 20))),
+                                                now=2000)
+    assert not prediction._is_prediction_up_to_date(pred_file, "monday",
+                                                    dict(params, horizon=60),
+                                                    now=2000)
+    assert not prediction._is_prediction_up_to_date(pred_file, "monday", params, now=10**7)
+
+
+def test_precompute_predictions(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    computed = []
+    monkeypatch.setattr(prediction, "_compute_prediction",
+                        lambda request, now: computed.append((request.service_description, now)))
+
+    now = time.time()
+    target_time = int(now) + 900
+    timegroup = prediction._group_by_wday(target_time)[0]
+    # Up to date at the target time
+    _write_info(tmp_path, timegroup, target_time - 10)
+    # Only predictions of other time groups
+    _write_info(tmp_path, "no-day", now - 10, service="CPU utilization")
+
+    stats = prediction.precompute_predictions(lead_time=900)
+    assert [service for service, _now in computed] == ["CPU utilization"]
+    assert computed[0][1] >= target_time
+    assert stats.num_requests == 2
+    assert stats.num_computed == 1
+    assert stats.num_failed == 0
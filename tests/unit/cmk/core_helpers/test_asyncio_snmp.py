@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import pytest  # type: ignore[import]
+
+from testlib.snmp_responder import StoredWalkResponder  # type: ignore[import]
+
+import cmk.utils.paths
+from cmk.utils.exceptions import MKSNMPError
+from cmk.utils.log import logger
+from cmk.utils.type_defs import SectionName
+
+import cmk.snmplib.snmp_cache as snmp_cache
+import cmk.snmplib.snmp_table as snmp_table
+from cmk.snmplib.type_defs import (
+    BackendOIDSpec,
+    BackendSNMPTree,
+    SNMPBackendEnum,
+    SNMPHostConfig,
+    SpecialColumn,
+)
+
+from cmk.core_helpers.snmp_backend import AsyncioSNMPBackend, StoredWalkSNMPBackend
+from cmk.core_helpers.snmp_backend import _protocol
+
+WALK = """\
+.1.3.6.1.2.1.1.1.0 Linux zeus 4.8.6.5-smp #2 SMP Sun Nov 13 14:58:11 CDT 2016 i686
+.1.3.6.1.2.1.1.2.0 .1.3.6.1.4.1.8072.3.2.10
+.1.3.6.1.2.1.1.3.0 449613886
+.1.3.6.1.2.1.1.5.0 "Müller's switch"
+.1.3.6.1.2.1.1.7.0 -72
+.1.3.6.1.2.1.1.8.0 ""
+.1.3.6.1.2.1.2.2.1.6.1 "00 1A 4B 3C 2D 1E "
+.1.3.6.1.2.1.2.2.1.6.2 "B2 E0 7D 2C 4D 15 "
+.1.3.6.1.2.1.2.2.1.6.300 007
+.1.3.6.1.2.1.31.1.1.1.6.1 18446744073709551615
+.1.3.6.1.4.1.318.1.1.10.4.2.3.1.3.200.1 Sensor 1
+"""
+
+USERS = [
+    ("noAuthNoPriv", "noauth"),
+    ("authNoPriv", "md5", "authonly", "authpassword"),
+    ("authPriv", "md5", "md5des", "md5password", "DES", "desencryption"),
+    ("authPriv", "sha", "shaaes", "shapassword", "AES", "aesencryption"),
+    ("authPriv", "SHA-256", "sha256aes", "sha256password", "AES", "aesencryption"),
+]
+
+
+def _config(port, credentials="public", is_bulkwalk_host=True, without_bulkwalk=False, **kwargs):
+    config = SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname="walkhost",
+        ipaddress="127.0.0.1",
+        credentials=credentials,
+        port=port,
+        is_bulkwalk_host=is_bulkwalk_host,
+        is_snmpv2or3_without_bulkwalk_host=without_bulkwalk,
+        bulk_walk_size_of=3,
+        timing={},
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=False,
+        snmp_backend=SNMPBackendEnum.ASYNCIO,
+    )
+    return config._replace(**kwargs)
+
+
+@pytest.fixture(name="walk_path")
+def fixture_walk_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", str(tmp_path))
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalk_index_dir", tmp_path / "index")
+    monkeypatch.setattr(snmp_cache, "_g_walk_cache", {})
+    path = tmp_path / "walkhost"
+    path.write_text(WALK, encoding="utf-8")
+    return path
+
+
+@pytest.fixture(name="responder")
+def fixture_responder(walk_path):
+    with StoredWalkResponder(walk_path, users=USERS) as responder:
+        yield responder
+
+
+@pytest.fixture(name="stored_walk")
+def fixture_stored_walk(walk_path):
+    return StoredWalkSNMPBackend(_config(0, is_usewalk_host=True), logger)
+
+
+@pytest.fixture(name="config",
+                params=[
+                    {
+                        "is_bulkwalk_host": False
+                    },
+                    {
+                        "is_bulkwalk_host": False,
+                        "without_bulkwalk": True
+                    },
+                    {},
+                ] + [{
+                    "credentials": credentials
+                } for credentials in USERS],
+                ids=["v1", "v2c", "v2c-bulk"] + [credentials[2 if len(credentials) > 2 else 1]
+                                                  for credentials in USERS])
+def fixture_config(request, responder):
+    return _config(responder.port, **request.param)
+
+
+def test_localized_key():
+    # RFC 3414, A.3
+    engine_id = bytes.fromhex("000000000000000000000002")
+    assert _protocol.localized_key(
+        "md5", b"maplesyrup", engine_id) == bytes.fromhex("526f5eed9fcce26f8964c2930787d82b")
+    assert _protocol.localized_key("sha1", b"maplesyrup", engine_id) == bytes.fromhex(
+        "6695febc9288e36282235fc7151f128497b38f3f")
+
+
+@pytest.mark.parametrize("tag, value", [
+    (_protocol.INTEGER, 0),
+    (_protocol.INTEGER, -129),
+    (_protocol.INTEGER, 2**31 - 1),
+    (_protocol.COUNTER32, 2**32 - 1),
+    (_protocol.COUNTER64, 2**64 - 1),
+    (_protocol.OCTET_STRING, b"x" * 300),
+    (_protocol.IP_ADDRESS, b"\x0a\x00\x00\x01"),
+    (_protocol.OBJECT_IDENTIFIER, (1, 3, 6, 1, 4, 1, 2**32 - 1, 128, 0)),
+    (_protocol.OBJECT_IDENTIFIER, (2, 100, 3)),
+    (_protocol.NULL, None),
+    (_protocol.END_OF_MIB_VIEW, None),
+])
+@pytest.mark.parametrize("credentials", [None] + USERS[1:])
+def test_encode_decode_message(tag, value, credentials):
+    varbind = _protocol.VarBind((1, 3, 6, 1, 2, 1, 1, 1, 0), tag, value)
+    pdu = _protocol.PDU(_protocol.RESPONSE, 4711, 0, 0, [varbind])
+    if credentials is None:
+        message = _protocol.Message(_protocol.VERSION_2C, pdu, community=b"public")
+        user = None
+    else:
+        engine_id = b"\x80\x00\x1f\x88\x04test"
+        user = _protocol.make_user(
+            credentials[2].encode(), engine_id, credentials[1], credentials[3].encode(),
+            *([credentials[4], credentials[5].encode()] if len(credentials) == 6 else []))
+        message = _protocol.Message(
+            _protocol.VERSION_3,
+            pdu,
+            msg_id=4711,
+            flags=_protocol.FLAG_AUTH | (_protocol.FLAG_PRIV if len(credentials) == 6 else 0),
+            security=_protocol.SecurityParameters(engine_id, 3, 1234, user.name),
+            context_engine_id=engine_id,
+            context_name=b"ctx",
+        )
+
+    encoded = _protocol.encode_message(message, user, salt=42)
+    decoded = _protocol.decode_message(encoded, lambda _name, _engine_id: user)
+    assert decoded.pdu == pdu
+    assert decoded.context_name == message.context_name
+
+    if user is not None:
+        tampered = encoded[:-1] + bytes((encoded[-1] ^ 1,))
+        with pytest.raises(ValueError):
+            _protocol.decode_message(tampered, lambda _name, _engine_id: user)
+
+
+@pytest.mark.parametrize("oid", [
+    ".1.3.6",
+    ".1.3.6.1.2.1.1",
+    ".1.3.6.1.2.1.1.5.0",
+    ".1.3.6.1.2.1.2.2.1.6",
+    ".1.3.6.1.2.1.31.1.1.1.6",
+    ".1.3.6.1.4.1.318.1.1.10.4.2.3.1.3",
+    ".1.3.6.1.4.1.9",
+])
+def test_walk_as_stored_walk(config, stored_walk, oid):
+    assert AsyncioSNMPBackend(config, logger).walk(oid) == stored_walk.walk(oid)
+
+
+@pytest.mark.parametrize("oid", [
+    ".1.3.6.1.2.1.1.2.0",
+    ".1.3.6.1.2.1.1.5.0",
+    ".1.3.6.1.2.1.2.2.1.6.2",
+    ".1.3.6.1.2.1.2.2.1.6.*",
+    ".1.3.6.1.2.1.1.4.0",
+    ".1.3.6.1.4.1.9.*",
+])
+def test_get_as_stored_walk(config, stored_walk, oid):
+    assert AsyncioSNMPBackend(config, logger).get(oid) == stored_walk.get(oid)
+
+
+def test_get_many_as_stored_walk(config, stored_walk):
+    oids = [
+        ".1.3.6.1.2.1.1.2.0",
+        ".1.3.6.1.2.1.1.4.0",
+        ".1.3.6.1.2.1.1.5.0",
+        ".1.3.6.1.2.1.2.2.1.6.*",
+        ".1.3.6.1.4.1.9.*",
+        ".1.3.6.1.2.1.1.7.0",
+    ]
+    assert AsyncioSNMPBackend(config, logger).get_many(oids) == stored_walk.get_many(oids)
+
+
+def test_get_many_together(responder):
+    backend = AsyncioSNMPBackend(_config(responder.port), logger)
+    oids = [".1.3.6.1.2.1.1.%d.0" % column for column in range(1, 9)]
+    oids.append(".1.3.6.1.2.1.2.2.1.6.*")
+    values = backend.get_many(oids)
+    # A GET for the OIDs and a GETNEXT for the OID ending with .*
+    assert responder.requests == 2
+    assert values == [backend.get(oid) for oid in oids]
+
+
+def test_walk_columns_together(responder, stored_walk):
+    backend = AsyncioSNMPBackend(_config(responder.port), logger)
+    oids = [".1.3.6.1.2.1.1.%d" % column for column in range(1, 9)]
+    assert backend.walk_columns(oids) == [stored_walk.walk(oid) for oid in oids]
+    # A single GETBULK for the columns with values and a GET for the empty ones
+    assert responder.requests == 1 + 2
+
+
+def test_snmpv3_engine_is_discovered_once(responder):
+    backend = AsyncioSNMPBackend(_config(responder.port, credentials=USERS[3]), logger)
+    assert backend.get(".1.3.6.1.2.1.1.7.0") == b"-72"
+    assert backend.get(".1.3.6.1.2.1.1.3.0") == b"449613886"
+    assert responder.requests == 3
+
+
+def test_get_snmp_table(responder, stored_walk):
+    tree = BackendSNMPTree(
+        base=".1.3.6.1.2.1.2.2.1",
+        oids=[
+            BackendOIDSpec(SpecialColumn.END, "string", False),
+            BackendOIDSpec("6", "binary", False),
+            BackendOIDSpec("7", "string", False),
+        ],
+    )
+    assert snmp_table.get_snmp_table(
+        section_name=SectionName("test"),
+        tree=tree,
+        walk_cache={},
+        backend=AsyncioSNMPBackend(_config(responder.port), logger),
+    ) == snmp_table.get_snmp_table(
+        section_name=SectionName("test"),
+        tree=tree,
+        walk_cache={},
+        backend=stored_walk,
+    )
+
+
+def test_wrong_community(responder):
+    backend = AsyncioSNMPBackend(
+        _config(responder.port, credentials="private", timing={
+            "timeout": 0.01,
+            "retries": 1
+        }), logger)
+    assert backend.get(".1.3.6.1.2.1.1.5.0") is None
+    with pytest.raises(MKSNMPError, match="Timeout"):
+        backend.walk(".1.3.6.1.2.1.1")
+    assert responder.requests == 2 + 2
@@ -19,7 +19,7 @@ from cmk.core_helpers.controller import (
     run_fetcher,
     write_bytes,
 )
-from cmk.core_helpers.protocol import CMCMessage
+from cmk.core_helpers.protocol import CMCMessage, SNMPPayloadVersion
 from cmk.core_helpers.snmp import SNMPPluginStore
 from cmk.core_helpers.type_defs import Mode
 
@@ -32,6 +32,12 @@ class TestGlobalConfig:
     def test_deserialization(self, global_config):
         assert GlobalConfig.deserialize(global_config.serialize()) == global_config
 
+    def test_deserialization_without_snmp_payload_version(self, global_config):
+        serialized = global_config.serialize()
+        del serialized["fetcher_config"]["snmp_payload_version"]
+        assert GlobalConfig.deserialize(
+            serialized).snmp_payload_version is SNMPPayloadVersion.JSON
+
 
 class TestControllerApi:
     def test_controller_log(self):
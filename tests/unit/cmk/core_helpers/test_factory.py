@@ -11,7 +11,7 @@ from cmk.snmplib.type_defs import SNMPBackendEnum, SNMPHostConfig
 
 import cmk.core_helpers.factory as factory
 
-from cmk.core_helpers.snmp_backend import ClassicSNMPBackend
+from cmk.core_helpers.snmp_backend import AsyncioSNMPBackend, ClassicSNMPBackend
 try:
     from cmk.core_helpers.cee.snmp_backend import pysnmp_backend  # type: ignore[import]
 except ImportError:
@@ -61,6 +61,11 @@ def test_factory_snmp_backend_pysnmp(snmp_config):
                           pysnmp_backend.PySNMPBackend)
 
 
+def test_factory_snmp_backend_asyncio(snmp_config):
+    snmp_config = snmp_config._replace(snmp_backend=SNMPBackendEnum.ASYNCIO)
+    assert isinstance(factory.backend(snmp_config, logging.getLogger()), AsyncioSNMPBackend)
+
+
 def test_factory_snmp_backend_unknown_backend(snmp_config):
     with pytest.raises(NotImplementedError, match="Unknown SNMP backend"):
         snmp_config = snmp_config._replace(snmp_backend="bla")
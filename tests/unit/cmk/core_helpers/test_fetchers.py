@@ -9,10 +9,12 @@ import os
 import socket
 from abc import ABC, abstractmethod
 from collections import namedtuple
+from hashlib import sha256
 from pathlib import Path
 from typing import Optional
 
 import pytest  # type: ignore[import]
+from Cryptodome.Cipher import AES
 from pyghmi.exceptions import IpmiException  # type: ignore[import]
 
 import cmk.utils.version as cmk_version
@@ -723,6 +725,51 @@ class TestTCPFetcher:
         with pytest.raises(MKFetcherError):
             fetcher._decrypt(output)
 
+    def test_decrypt_payload_in_place(self, file_cache):
+        settings = {"use_regular": "enforce", "passphrase": "secret"}
+        fetcher = TCPFetcher(
+            file_cache,
+            family=socket.AF_INET,
+            address=("1.2.3.4", 0),
+            timeout=0.0,
+            encryption_settings=settings,
+            use_only_cache=False,
+        )
+        plaintext = b"<<<section:sep(0)>>>\n" + b"body\n" * 100
+        key_iv = b""
+        digest = b""
+        while len(key_iv) < 32 + AES.block_size:
+            digest = sha256(digest + b"secret").digest()
+            key_iv += digest
+        fill_bytes = AES.block_size - len(plaintext) % AES.block_size
+        encrypted = AES.new(key_iv[:32], AES.MODE_CBC, key_iv[32:48]).encrypt(
+            plaintext + bytes((fill_bytes,)) * fill_bytes)
+
+        output = bytearray(b"02" + encrypted)
+        assert fetcher._decrypt(output) == plaintext
+        assert fetcher._decrypt(AgentRawData(b"02" + encrypted)) == plaintext
+
+    def test_recvall(self, fetcher, monkeypatch):
+        monkeypatch.setattr(fetcher, "initial_chunk_size", 16)
+        monkeypatch.setattr(fetcher, "max_chunk_size", 64)
+        data = bytes(range(256)) * 10
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            sender.sendall(data)
+            sender.shutdown(socket.SHUT_WR)
+            assert fetcher._recvall(receiver) == data
+
+        assert fetcher.stats["bytes_received"] == len(data)
+        assert {"first_byte_time", "receive_time"} <= set(fetcher.stats)
+
+    def test_recvall_empty(self, fetcher):
+        sender, receiver = socket.socketpair()
+        with sender, receiver:
+            sender.shutdown(socket.SHUT_WR)
+            assert fetcher._recvall(receiver) == b""
+
+        assert fetcher.stats["bytes_received"] == 0
+
 
 class StubFileCache(DefaultAgentFileCache):
     """Holds the data to be cached in-memory for testing"""
@@ -36,7 +36,9 @@ from cmk.core_helpers.protocol import (
     FetcherMessage,
     ResultStats,
     PayloadType,
+    SNMPPayloadVersion,
     SNMPResultMessage,
+    iter_snmp_payload,
 )
 
 
@@ -202,14 +204,65 @@ class TestAgentResultMessage:
 
 
 class TestSNMPResultMessage:
+    @pytest.fixture(params=list(SNMPPayloadVersion))
+    def version(self, request):
+        return request.param
+
     @pytest.fixture
-    def snmp_payload(self):
+    def snmp_payload(self, version):
         table: SNMPTable = []
-        return SNMPResultMessage({SectionName("name"): table})
+        return SNMPResultMessage({SectionName("name"): table}, version)
+
+    @pytest.fixture
+    def snmp_raw_data(self):
+        return {
+            SectionName("if"): [
+                [[u"1", u"eth0", [0, 80, 86, 255, 1, 2]], [u"2", u"eth1", []]],
+                [[u"1", u"up"], [u"2", u"up"]],
+            ],
+            SectionName("uptime"): [[[6500337, 11822045]]],
+            SectionName("mixed"): [[u"Ümlaut", -1, 1024, None, [256, 1], u"\udcff"]],
+            SectionName("empty"): [],
+        }
 
     def test_from_bytes_success(self, snmp_payload):
         assert SNMPResultMessage.from_bytes(bytes(snmp_payload)) == snmp_payload
 
+    def test_roundtrip(self, version, snmp_raw_data):
+        message = SNMPResultMessage(snmp_raw_data, version)
+        assert SNMPResultMessage.from_bytes(bytes(message)).result().ok == snmp_raw_data
+
+    def test_from_bytes_keeps_version(self, version, snmp_raw_data):
+        message = SNMPResultMessage(snmp_raw_data, version)
+        assert SNMPResultMessage.from_bytes(bytes(message)).version is version
+
+    def test_version_is_per_message(self, snmp_raw_data):
+        binary_message = SNMPResultMessage(snmp_raw_data, SNMPPayloadVersion.BINARY)
+        assert SNMPResultMessage(snmp_raw_data).version is SNMPPayloadVersion.JSON
+        assert binary_message.version is SNMPPayloadVersion.BINARY
+
+    def test_binary_interns_strings(self):
+        raw_data = {SectionName("name"): [[[u"same value"] * 3]]}
+        message = SNMPResultMessage(raw_data, SNMPPayloadVersion.BINARY)
+        assert bytes(message).count(b"same value") == 1
+
+    def test_decode_json_payload(self, snmp_raw_data):
+        json_message = bytes(SNMPResultMessage(snmp_raw_data, SNMPPayloadVersion.JSON))
+        assert SNMPResultMessage.from_bytes(json_message).result().ok == snmp_raw_data
+
+    def test_iter_snmp_payload(self, snmp_raw_data):
+        sections = iter_snmp_payload(
+            SNMPResultMessage(snmp_raw_data, SNMPPayloadVersion.BINARY).payload)
+        assert next(sections) == (SectionName("if"), snmp_raw_data[SectionName("if")])
+        assert dict(sections) == {
+            k: v for k, v in snmp_raw_data.items() if k != SectionName("if")
+        }
+
+    @pytest.mark.parametrize("data", [b"\x00\x02\x05", b"\x00\x07", b"{]"])
+    def test_from_bytes_failure(self, data):
+        with pytest.raises(ValueError):
+            dict(iter_snmp_payload(data))
+
 
 class TestErrorResultMessage:
     @pytest.fixture(params=[
@@ -410,6 +463,16 @@ class TestResultStats:
     def test_encode_decode(self, l3stats):
         assert ResultStats.from_bytes(bytes(l3stats)) == l3stats
 
+    def test_encode_decode_counters(self):
+        stats = ResultStats(Snapshot.null(), {"bytes_received": 1024, "receive_time": 0.5})
+        other = ResultStats.from_bytes(bytes(stats))
+        assert other == stats
+        assert other.counters == {"bytes_received": 1024, "receive_time": 0.5}
+
+    def test_no_counters_is_compatible(self, l3stats):
+        assert b"counters" not in bytes(l3stats)
+        assert ResultStats.from_bytes(bytes(l3stats)).counters == {}
+
 
 class TestFetcherMessage:
     @pytest.fixture
@@ -457,6 +520,21 @@ class TestFetcherMessage:
         with pytest.raises(ValueError):
             FetcherMessage.from_bytes(b"random bytes")
 
+    def test_from_memoryview(self, agent_raw_data, snmp_raw_data, duration):
+        for message in [
+                FetcherMessage.from_raw_data(result.OK(agent_raw_data), duration, FetcherType.TCP),
+                FetcherMessage.from_raw_data(result.OK(snmp_raw_data), duration, FetcherType.SNMP),
+                FetcherMessage.from_raw_data(
+                    result.OK(snmp_raw_data),
+                    duration,
+                    FetcherType.SNMP,
+                    snmp_payload_version=SNMPPayloadVersion.BINARY,
+                ),
+                FetcherMessage.from_raw_data(result.Error(ValueError("zomg!")), duration,
+                                             FetcherType.TCP),
+        ]:
+            assert FetcherMessage.from_bytes(memoryview(bytes(message) + 42 * b"*")) == message
+
     def test_len(self, message, header, payload, stats):
         assert len(message) == len(header) + len(payload) + len(stats)
 
@@ -4,9 +4,21 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+# pylint: disable=protected-access
+
+import os
+
 import pytest  # type: ignore[import]
 
+import cmk.utils.paths
+from cmk.utils.exceptions import MKSNMPError
+from cmk.utils.log import logger
+
+import cmk.snmplib.snmp_cache as snmp_cache
+from cmk.snmplib.type_defs import SNMPBackendEnum, SNMPHostConfig
+
 import cmk.core_helpers.snmp_backend._utils as utils
+import cmk.core_helpers.snmp_backend.stored_walk as stored_walk
 from cmk.core_helpers.snmp_backend import StoredWalkSNMPBackend
 
 
@@ -31,8 +43,13 @@ class TestStoredWalkSNMPBackend:
         ("1.2.3.4", "1.2.3", 1),
         ("1.2.3", "4.5.6", -1),
     ])
-    def test_compare_oids(self, a, b, result):
-        assert StoredWalkSNMPBackend._compare_oids(a, b) == result
+    def test_oid_key(self, a, b, result):
+        key_a, key_b = stored_walk._oid_key(a), stored_walk._oid_key(b)
+        if result == 0:
+            assert key_b.startswith(key_a)
+        else:
+            assert not key_b.startswith(key_a)
+            assert (key_a > key_b) - (key_a < key_b) == result
 
     def test_read_walk_data(self, tmpdir):
         assert StoredWalkSNMPBackend.read_walk_data(
@@ -48,3 +65,117 @@ def create_files(tmpdir):
     p1.write(".1.2.3 foo\n.1.2.4 bar\nfoobar\n")
     p2 = (tmpdir / "walkdata").join("2.txt")
     p2.write(".1.2.3 foo\n\n\n.1.2.5 test\n")
+
+
+WALK = """\
+.1.3.6.1.2.1.1.1.0 Linux zeus
+.1.3.6.1.2.1.1.2.0 .1.3.6.1.4.1.8072.3.2.10
+.1.3.6.1.2.1.2.2.1.6.1 "00 1A 4B 3C 2D 1E "
+.1.3.6.1.2.1.2.2.1.6.10 "C:\\\\"
+.1.3.6.1.2.1.2.2.1.6.2 first line
+second line
+.1.3.6.1.2.1.1.3.0 %{uptime()}
+.1.3.6.1.2.1.1.4.0
+.1.3.6.1.2.1.11 12
+"""
+
+
+def _config(hostname):
+    return SNMPHostConfig(
+        is_ipv6_primary=False,
+        hostname=hostname,
+        ipaddress="127.0.0.1",
+        credentials="public",
+        port=161,
+        is_bulkwalk_host=False,
+        is_snmpv2or3_without_bulkwalk_host=False,
+        bulk_walk_size_of=10,
+        timing={},
+        oid_range_limits=[],
+        snmpv3_contexts=[],
+        character_encoding=None,
+        is_usewalk_host=True,
+        snmp_backend=SNMPBackendEnum.CLASSIC,
+    )
+
+
+@pytest.fixture(name="walks_dir")
+def fixture_walks_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalks_dir", str(tmp_path / "walks"))
+    monkeypatch.setattr(cmk.utils.paths, "snmpwalk_index_dir", tmp_path / "index")
+    monkeypatch.setattr(snmp_cache, "_g_walk_cache", {})
+    monkeypatch.setattr(stored_walk, "_walk_indexes", {})
+    (tmp_path / "walks").mkdir()
+    (tmp_path / "walks" / "walkhost").write_text(WALK)
+    return tmp_path / "walks"
+
+
+@pytest.mark.parametrize("oid, expected", [
+    (".1.3.6.1.2.1.1", [
+        (".1.3.6.1.2.1.1.1.0", b"Linux zeus"),
+        (".1.3.6.1.2.1.1.2.0", b".1.3.6.1.4.1.8072.3.2.10"),
+        (".1.3.6.1.2.1.1.4.0", b""),
+    ]),
+    (".1.3.6.1.2.1.2.2.1.6", [
+        (".1.3.6.1.2.1.2.2.1.6.1", b"\x00\x1aK<-\x1e"),
+        (".1.3.6.1.2.1.2.2.1.6.2", b"first line\nsecond line"),
+        (".1.3.6.1.2.1.2.2.1.6.10", b"C:\\"),
+    ]),
+    ("1.3.6.1.2.1.1.1.0", [(".1.3.6.1.2.1.1.1.0", b"Linux zeus")]),
+    (".1.3.6.1.2.1.1.*", [(".1.3.6.1.2.1.1.1.0", b"Linux zeus")]),
+    (".1.3.6.1.2.1.1.1.0.*", []),
+    (".1.3.6.1.2.1.1.1.1", []),
+    (".1.3.6.1.2.1.1.1", [(".1.3.6.1.2.1.1.1.0", b"Linux zeus")]),
+    (".1.3.6.1.4", []),
+])
+def test_walk(walks_dir, oid, expected):
+    backend = StoredWalkSNMPBackend(_config("walkhost"), logger)
+    assert [row for row in backend.walk(oid) if row[0] != ".1.3.6.1.2.1.1.3.0"] == expected
+
+
+def test_walk_simulated_value(walks_dir, monkeypatch):
+    monkeypatch.setattr(stored_walk.agent_simulator, "our_uptime", lambda: 4711.0)
+    backend = StoredWalkSNMPBackend(_config("walkhost"), logger)
+    assert backend.get(".1.3.6.1.2.1.1.3.0") == b"4711"
+    monkeypatch.setattr(stored_walk.agent_simulator, "our_uptime", lambda: 4712.0)
+    assert backend.get(".1.3.6.1.2.1.1.3.0") == b"4712"
+
+
+def test_get(walks_dir):
+    backend = StoredWalkSNMPBackend(_config("walkhost"), logger)
+    assert backend.get(".1.3.6.1.2.1.1.2.0") == b".1.3.6.1.4.1.8072.3.2.10"
+    assert backend.get(".1.3.6.1.2.1.2.2.1.6.*") == b"\x00\x1aK<-\x1e"
+    assert backend.get(".1.3.6.1.2.1.1.5.0") is None
+    assert backend.get(".1.3.6.1.2.1.2.2.1.6") is None
+
+
+def test_missing_walk(walks_dir):
+    with pytest.raises(MKSNMPError):
+        StoredWalkSNMPBackend(_config("nowalk"), logger).walk(".1.3.6")
+
+
+def test_index_is_shared(walks_dir, monkeypatch):
+    os.link(str(walks_dir / "walkhost"), str(walks_dir / "otherhost"))
+    rows = StoredWalkSNMPBackend(_config("walkhost"), logger).walk(".1.3.6.1.2.1.11")
+    assert StoredWalkSNMPBackend(_config("otherhost"), logger).walk(".1.3.6.1.2.1.11") == rows
+    assert len(stored_walk._walk_indexes) == 1
+    assert len(list(cmk.utils.paths.snmpwalk_index_dir.iterdir())) == 1
+
+    # A new process uses the index file
+    stored_walk._walk_indexes.clear()
+    snmp_cache.cleanup_host_caches()
+    monkeypatch.setattr(stored_walk.StoredWalkIndex, "create", None)
+    assert StoredWalkSNMPBackend(_config("walkhost"), logger).walk(".1.3.6.1.2.1.11") == rows
+
+
+def test_index_is_updated(walks_dir):
+    backend = StoredWalkSNMPBackend(_config("walkhost"), logger)
+    assert backend.walk(".1.3.6.1.2.1.11") == [(".1.3.6.1.2.1.11", b"12")]
+
+    with (walks_dir / "walkhost").open("a") as f:
+        f.write(".1.3.6.1.2.1.11.1 13\n")
+    snmp_cache.cleanup_host_caches()
+    assert backend.walk(".1.3.6.1.2.1.11") == [
+        (".1.3.6.1.2.1.11", b"12"),
+        (".1.3.6.1.2.1.11.1", b"13"),
+    ]
@@ -206,3 +206,332 @@ def test_mkevent_query_filters(
     status_server.handle_client(status_socket, True, '127.0.0.1')
     response = status_socket.get_response()
     assert (len(response) == 2) is is_match
+
+
+def _new_events(event_status, attrs_list):
+    events = [CMKEventConsole.new_event(attrs) for attrs in attrs_list]
+    for event in events:
+        event.setdefault("core_host", event["host"])
+        event_status.new_event(event)
+    return events
+
+
+def test_event_status_remove_oldest(event_status):
+    events = _new_events(event_status, [
+        {
+            "host": "host1",
+            "rule_id": "rule1",
+        },
+        {
+            "host": "host2",
+            "rule_id": "rule2",
+        },
+        {
+            "host": "host1",
+            "rule_id": "rule2",
+        },
+        {
+            "host": "host2",
+            "rule_id": "rule1",
+        },
+    ])
+    assert [event["id"] for event in events] == [1, 2, 3, 4]
+    assert event_status.event(3) is events[2]
+    assert event_status.event(5) is None
+    assert event_status.events_of_rule("rule2") == [events[1], events[2]]
+
+    event_status.remove_oldest_event("by_rule", {"rule_id": "rule2"})
+    assert event_status.events() == [events[0], events[2], events[3]]
+
+    event_status.remove_oldest_event("by_host", {"host": "host2"})
+    assert event_status.events() == [events[0], events[2]]
+
+    event_status.remove_oldest_event("overall", {})
+    assert event_status.events() == [events[2]]
+    assert event_status.num_existing_events == 1
+    assert event_status.get_num_existing_events_by("by_rule", events[2]) == 1
+
+    event_status.delete_event(3, "me")
+    assert event_status.events() == []
+    with pytest.raises(cmk.ec.main.MKClientError):
+        event_status.delete_event(3, "me")
+
+
+def test_event_status_reindex_host(event_status):
+    events = _new_events(event_status, [
+        {
+            "host": "host1"
+        },
+        {
+            "host": "host2"
+        },
+        {
+            "host": "host1"
+        },
+    ])
+
+    # The host of the first event changes, it is still the oldest one of host2
+    events[0]["host"] = "host2"
+    event_status.event_changed(events[0])
+    event_status.remove_oldest_event("by_host", {"host": "host2"})
+    assert event_status.events() == [events[1], events[2]]
+
+    event_status.remove_oldest_event("by_host", {"host": "host1"})
+    assert event_status.events() == [events[1]]
+
+
+def test_event_status_reindex_host_order(event_status):
+    events = _new_events(event_status, [{"host": "host%d" % (nr % 2)} for nr in range(4)])
+    assert [event["host"] for event in events] == ["host0", "host1", "host0", "host1"]
+
+    # The events moved to another host are kept in the order of their creation
+    for event in [events[2], events[0]]:
+        event["host"] = "host1"
+        event_status.event_changed(event)
+    assert event_status.events_of_rule_and_host(events[0]["rule_id"], "host1") == events
+    assert event_status.events_of_rule_and_host(events[0]["rule_id"], "host0") == []
+
+    for _event in events:
+        event_status.remove_oldest_event("by_host", {"host": "host1"})
+        assert event_status.events() == events[len(events) - len(event_status.events()):]
+    assert event_status.events() == []
+
+
+def test_event_status_pack_unpack(event_status):
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    status = event_status.pack_status()
+    assert status["events"] == events
+
+    event_status.flush()
+    assert event_status.events() == []
+
+    event_status.unpack_status(status)
+    assert event_status.events() == events
+    assert event_status.event(2) is events[1]
+    event_status.remove_oldest_event("by_host", {"host": "host2"})
+    assert event_status.events() == events[:2]
+
+
+def test_event_status_cancel_events(event_status, event_server):
+    events = _new_events(event_status, [
+        {
+            "host": "host1",
+            "rule_id": "rule1",
+            "application": "app",
+        },
+        {
+            "host": "host2",
+            "rule_id": "rule1",
+            "application": "app",
+        },
+        {
+            "host": "host1",
+            "rule_id": "rule2",
+            "application": "app",
+        },
+    ])
+    cancelling_event = CMKEventConsole.new_event({
+        "host": "host1",
+        "application": "app",
+        "text": "ok",
+    })
+    event_status.cancel_events(event_server, cmk.ec.main.StatusTableEvents.columns,
+                               cancelling_event, {}, {"id": "rule1"})
+    assert events[0]["phase"] == "closed"
+    assert events[0]["text"] == "ok"
+    assert event_status.events() == events[1:]
+
+
+@pytest.fixture(name="journaled_event_status")
+def fixture_journaled_event_status(tmp_path, config, perfcounters, history):
+    settings = ec.settings('1.2.3i45', tmp_path, tmp_path / "etc", ['mkeventd'])
+    settings.paths.status_file.value.parent.mkdir(parents=True)
+    return cmk.ec.main.EventStatus(settings, config, perfcounters, history,
+                                   logging.getLogger("cmk.mkeventd.EventStatus"))
+
+
+def _reloaded(event_status):
+    reloaded = cmk.ec.main.EventStatus(event_status.settings, event_status._config,
+                                       event_status._perfcounters, event_status._history,
+                                       event_status._logger)
+    reloaded.load_status(None)
+    return reloaded
+
+
+def test_event_status_save_journal(journaled_event_status):
+    event_status = journaled_event_status
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    event_status.save_status()
+    snapshot = event_status.settings.paths.status_file.value.read_bytes()
+
+    # Only the changes are appended to the journal, the snapshot is kept
+    events[1]["comment"] = "changed"
+    event_status.event_changed(events[1])
+    event_status.remove_event(events[0])
+    new_events = _new_events(event_status, [{"host": "host3"}])
+    event_status.save_status()
+    assert event_status.settings.paths.status_file.value.read_bytes() == snapshot
+    journal = event_status.settings.paths.status_journal_file.value.read_text().splitlines()
+    assert len(journal) == 2
+    entry = ast.literal_eval(journal[1])
+    assert [event["id"] for event in entry["events"]] == [2, 4]
+    assert entry["removed_event_ids"] == [1]
+
+    reloaded = _reloaded(event_status)
+    assert reloaded.events() == [events[1], events[2], new_events[0]]
+    assert reloaded.event(2)["comment"] == "changed"
+    assert reloaded.get_num_existing_events_by("by_host", events[0]) == 0
+    assert _new_events(reloaded, [{"host": "host4"}])[0]["id"] == 5
+
+    assert event_status._perfcounters._times["save"] > 0.0
+
+
+def test_event_status_save_compact(journaled_event_status):
+    event_status = journaled_event_status
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    event_status.save_status()
+    event_status.remove_event(events[0])
+    event_status.save_status()
+
+    event_status.save_status(compact=True)
+    journal = event_status.settings.paths.status_journal_file.value.read_text().splitlines()
+    assert len(journal) == 1
+    assert _reloaded(event_status).events() == events[1:]
+
+
+def test_event_status_load_outdated_journal(journaled_event_status):
+    event_status = journaled_event_status
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    event_status.save_status()
+    event_status.remove_event(events[0])
+    event_status.save_status()
+    journal = event_status.settings.paths.status_journal_file.value.read_bytes()
+
+    # Crash during compaction: The snapshot was written, but not the new journal
+    event_status.remove_event(events[1])
+    event_status.save_status(compact=True)
+    event_status.settings.paths.status_journal_file.value.write_bytes(journal)
+    assert _reloaded(event_status).events() == events[2:]
+
+
+def test_event_status_load_incomplete_journal(journaled_event_status):
+    event_status = journaled_event_status
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    event_status.save_status()
+    event_status.remove_event(events[0])
+    event_status.save_status()
+    with event_status.settings.paths.status_journal_file.value.open("a") as f:
+        f.write("{'next_event_id': 4, 'eve")
+    assert _reloaded(event_status).events() == events[1:]
+
+
+@pytest.mark.parametrize("header", ["{'journal_generation': ", "garbage", "[1, 2]"])
+def test_event_status_load_corrupt_journal_header(journaled_event_status, header):
+    event_status = journaled_event_status
+    events = _new_events(event_status, [{"host": "host%d" % nr} for nr in range(3)])
+    event_status.save_status()
+    journal_path = event_status.settings.paths.status_journal_file.value
+    journal_path.write_text(header + "\n")
+
+    assert _reloaded(event_status).events() == events
+    assert not journal_path.exists()
+    assert (journal_path.parent / (journal_path.name + ".corrupt")).read_text() == header + "\n"
+
+
+def _pipeline_event_server(event_server, config, num_workers):
+    config["event_processing_workers"] = num_workers
+    rule_defaults = {"state": 2, "sl": {"value": 0, "precedence": "message"}, "actions": []}
+    event_server.compile_rules([], [
+        {
+            "id": "pack1",
+            "disabled": False,
+            "rules": [
+                dict(rule_defaults, id="skip", match="skip", drop="skip_pack"),
+                dict(rule_defaults, id="skipped", match="skip"),
+            ],
+        },
+        {
+            "id": "pack2",
+            "disabled": False,
+            "rules": [
+                dict(rule_defaults, id="drop", match="^debug", drop=True),
+                dict(rule_defaults, id="error", match="ERROR (.*)$", match_ok="OK (.*)$"),
+            ],
+        },
+    ])
+    event_server.host_config.get_canonical_name = lambda host_name: host_name
+    return event_server
+
+
+_PIPELINE_LINES = [
+    b"<11>May 26 13:45:01 host1 app: ERROR disk full\n<11>May 26 13:45:01 host2 app: debug\n",
+    b"<11>May 26 13:45:02 host2 app: skip ERROR skipped\n",
+    b"<11>May 26 13:45:03 host1 app: OK disk full\n",
+    b"<11>May 26 13:45:04 host3 app: ERROR cpu\n",
+]
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_event_server_pipeline(event_server, event_status, config, perfcounters, num_workers):
+    event_server = _pipeline_event_server(event_server, config, num_workers)
+    event_server.start_pipeline()
+    for data in _PIPELINE_LINES:
+        event_server.receive_raw_lines(data)
+    event_server.stop_pipeline()
+
+    assert [(event["host"], event["rule_id"], event["text"]) for event in event_status.events()
+           ] == [("host2", "error", "skip ERROR skipped"), ("host3", "error", "ERROR cpu")]
+    assert perfcounters._counters["messages"] == 5
+    assert perfcounters._counters["rule_hits"] == 6
+    assert perfcounters._counters["drops"] == 1
+    assert perfcounters._counters["rule_tries"] == 6
+
+
+@pytest.mark.parametrize("num_workers", [0, 2])
+def test_event_server_pipeline_state_patterns(event_server, event_status, config, perfcounters,
+                                              num_workers):
+    state_patterns = {"2": "full", "1": "almost", "0": ""}
+    event_server = _pipeline_event_server(event_server, config, num_workers)
+    event_server.compile_rules([], [{
+        "id": "pack",
+        "disabled": False,
+        "rules": [{
+            "id": "disk",
+            "match": "disk",
+            "state": ("text_pattern", state_patterns),
+            "sl": {
+                "value": 0,
+                "precedence": "message"
+            },
+            "actions": [],
+        }],
+    }])
+    # The workers of the pipeline compile the rules again from the sources
+    assert state_patterns == {"2": "full", "1": "almost", "0": ""}
+
+    event_server.start_pipeline()
+    event_server.receive_raw_lines(b"<11>May 26 13:45:01 host1 app: disk almost full\n"
+                                   b"<11>May 26 13:45:02 host2 app: disk almost\n")
+    event_server.stop_pipeline()
+
+    assert [(event["host"], event["state"]) for event in event_status.events()] == [("host1", 2),
+                                                                                    ("host2", 1)]
+    assert not any(rule.get("disabled") for rule in event_server._rules)
+
+
+def test_event_server_process_preprocessed_lines_of_old_rules(event_server, event_status, config):
+    event_server = _pipeline_event_server(event_server, config, 0)
+    data = _PIPELINE_LINES[3]
+    generation = event_server.rules_generation
+    results = event_server.preprocess_raw_lines(data, None)
+
+    # The rules are compiled again, the lines have to be matched against the new rules
+    event_server.compile_rules([], [])
+    event_server.process_preprocessed_lines(generation, results, data, None)
+    assert event_status.events() == []
+
+    event_server = _pipeline_event_server(event_server, config, 0)
+    event_server.process_preprocessed_lines(event_server.rules_generation,
+                                            event_server.preprocess_raw_lines(data, None), data,
+                                            None)
+    assert [event["rule_id"] for event in event_status.events()] == ["error"]
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+import itertools
+import logging
+import re
+
+import pytest  # type: ignore[import]
+
+from cmk.ec.main import EventServer, RuleMatcher
+from cmk.ec.prefilter import fold, required_literals, RulePrefilter
+
+
+@pytest.mark.parametrize("pattern,literals", [
+    ("disk full", {"disk full"}),
+    ("Disk .* is FULL$", {" is full"}),
+    ("^(error|warning): disk", {": disk"}),
+    ("^(error|warning) in", {"error", "warning"}),
+    ("(error|warn|.*): disk (sda|sdb)", {": disk "}),
+    ("(error|warn|.*) (sda|hda)", {"sda", "hda"}),
+    ("(?:abc)+cd", {"abc"}),
+    ("(abc)*de", {"de"}),
+    ("[a-z]+ \\d+", {" "}),
+    ("[a-z]+\\d+", None),
+    ("x?", None),
+    ("güner$", {"ner"}),
+    ("(?-i:Kernel): panic", {": panic"}),
+])
+def test_required_literals(pattern, literals):
+    compiled = EventServer._compile_matching_value("match", pattern)
+    if literals is not None:
+        literals = frozenset(literals)
+    assert required_literals(compiled) == literals
+
+
+def test_required_literals_string():
+    assert required_literals("disk full") == frozenset(["disk full"])
+    assert required_literals("grüße") is None
+
+
+def test_fold():
+    # All these characters match "i" and "s" case insensitively
+    assert fold("İıIiſSs") == "iiiisss"
+
+
+_RULES = [
+    {
+        "match": "disk .* is full"
+    },
+    {
+        "match": "^(error|warning) in (module|driver)"
+    },
+    {
+        "match": "[0-9]+ errors"
+    },
+    {
+        "match": "timeout",
+        "match_ok": "connection restored"
+    },
+    {
+        "match": "timeout",
+        "match_host": "^db[0-9]+\\.example\\.com$"
+    },
+    {
+        "match": "timeout",
+        "match_host": "web1"
+    },
+    {
+        "match": "session opened",
+        "match_application": "sshd",
+        "cancel_application": "sudo"
+    },
+    {
+        "match": "session opened",
+        "invert_matching": True
+    },
+    {
+        "match_application": "cron"
+    },
+    {
+        "match": "(?i)STATUS: (up|down)$"
+    },
+]
+
+_TEXTS = [
+    "Disk /dev/sda is full",
+    "ERROR in module foo",
+    "warning in DRIVER bar",
+    "3 errors",
+    "Timeout while connecting",
+    "Connection restored",
+    "pam_unix: session opened for user root",
+    "ſession opened",
+    "status: down",
+    "nothing to see here",
+]
+_HOSTS = ["DB1.example.com", "web1", "web2"]
+_APPLICATIONS = ["sshd", "SUDO", "cron", "kernel"]
+
+
+def test_rule_prefilter_identical_results():
+    matcher = RuleMatcher(logging.getLogger("cmk.mkeventd"), {"debug_rules": False})
+    rules = []
+    for nr, rule in enumerate(_RULES):
+        compiled = {"id": "rule%d" % nr, "pack": "pack"}
+        for key, value in rule.items():
+            compiled[key] = (EventServer._compile_matching_value(key, value)
+                             if isinstance(value, str) else value)
+        rules.append(compiled)
+    prefilter = RulePrefilter(rules)
+    assert prefilter.num_filtered_rules() == 9
+
+    num_candidates = 0
+    for text, host, application in itertools.product(_TEXTS, _HOSTS, _APPLICATIONS):
+        event = {
+            "text": text,
+            "host": host,
+            "application": application,
+            "ipaddress": "",
+            "facility": 1,
+            "priority": 3,
+        }
+        candidates = prefilter.candidates(rules, event)
+        num_candidates += len(candidates)
+        for rule in rules:
+            result = matcher.event_rule_matches(rule, event)
+            if result is not False:
+                assert rule in candidates, (rule, event)
+
+    assert num_candidates < len(rules) * len(_TEXTS) * len(_HOSTS) * len(_APPLICATIONS) / 3
+
+
+def test_rule_prefilter_regex_semantics():
+    # Literals of case insensitive regexes must be found in all matching texts
+    pattern = re.compile("kiss", re.IGNORECASE)
+    for text in ["KISS", "kıſs", "KİSS"]:
+        assert pattern.search(text)
+        assert all(literal in fold(text) for literal in required_literals(pattern))
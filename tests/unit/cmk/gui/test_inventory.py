@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from pathlib import Path
+
+import cmk.utils.paths
+import cmk.utils.store as store
+
+import cmk.gui.inventory as inventory
+
+
+def test_inventory_housekeeping_keeps_delta_archived_versions(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    store.save_object_to_file(tmp_path / "inventory" / "host", {})
+    archive_dir = tmp_path / "inventory_archive" / "host"
+    # A complete version and a version archived as delta with its differences
+    for name in ["100", "200.delta", "200.diff"]:
+        store.save_object_to_file(archive_dir / name, {})
+    delta_cache_dir = tmp_path / "inventory_delta_cache" / "host"
+    for name in ["None_100", "100_200", "200_300", "invalid"]:
+        store.save_object_to_file(delta_cache_dir / name, (0, 0, 0, {}))
+
+    inventory.InventoryHousekeeping().run()
+
+    assert sorted(path.name for path in delta_cache_dir.iterdir()) == ["100_200", "None_100"]
+    assert (tmp_path / "inventory_delta_cache" / "last_cleanup").exists()
+
+
+def test_get_short_inventory_history_filepath(monkeypatch, tmp_path):
+    monkeypatch.setattr(cmk.utils.paths, "omd_root", tmp_path)
+    archive_dir = tmp_path / "var" / "check_mk" / "inventory_archive" / "host"
+    monkeypatch.setattr(cmk.utils.paths, "inventory_archive_dir", str(archive_dir.parent))
+    store.save_object_to_file(archive_dir / "100", {})
+    store.save_object_to_file(archive_dir / "200.delta", None)
+
+    assert inventory.get_short_inventory_history_filepath(
+        "host", "100") == Path("var/check_mk/inventory_archive/host/100")
+    assert inventory.get_short_inventory_history_filepath(
+        "host", "200") == Path("var/check_mk/inventory_archive/host/200.delta")
@@ -100,6 +100,7 @@ def test_registered_configvars():
         'enable_sounds',
         'escape_plugin_output',
         'event_limit',
+        'event_processing_workers',
         'eventsocket_queue_len',
         'failed_notification_horizon',
         'hard_query_limit',
@@ -111,6 +112,7 @@ def test_registered_configvars():
         'inventory_check_autotrigger',
         'inventory_check_interval',
         'inventory_check_severity',
+        'item_state_store',
         'lock_on_logon_failures',
         'log_level',
         'log_levels',
@@ -133,6 +135,7 @@ def test_registered_configvars():
         'pagetitle_date_format',
         'password_policy',
         'piggyback_max_cachefile_age',
+        'piggyback_segment_store',
         'profile',
         'quicksearch_dropdown_limit',
         'quicksearch_search_order',
@@ -158,6 +161,7 @@ def test_registered_configvars():
         'site_nsca',
         'slow_views_duration_threshold',
         'snmp_credentials',
+        'snmp_scan_processes',
         'socket_queue_len',
         'soft_query_limit',
         'staleness_threshold',
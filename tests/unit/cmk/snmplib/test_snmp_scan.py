@@ -13,10 +13,13 @@ import pytest  # type: ignore[import]
 # No stub file
 from testlib.base import Scenario  # type: ignore[import]
 
+import cmk.utils.paths
+from cmk.utils.exceptions import MKSNMPError
 from cmk.utils.log import logger
 from cmk.utils.type_defs import SectionName
 
 import cmk.snmplib.snmp_cache as snmp_cache
+import cmk.snmplib.snmp_modes as snmp_modes
 import cmk.snmplib.snmp_scan as snmp_scan
 from cmk.snmplib.type_defs import SNMPBackend, SNMPHostConfig, SNMPBackendEnum
 from cmk.snmplib.utils import evaluate_snmp_detection
@@ -271,3 +274,195 @@ def test_gather_available_raw_section_names_defaults(backend, mocker):
         SectionName("snmp_os"),
         SectionName("snmp_uptime"),
     }
+
+
+class SNMPRecordingBackend(SNMPBackend):
+    """Answers from the given values and records the OIDs requested at once"""
+    def __init__(self, values):
+        super().__init__(SNMPConfig, logger)
+        self.values = values
+        self.requests = []
+
+    def get(self, oid, context_name=None):
+        raise NotImplementedError("get")
+
+    def get_many(self, oids, context_name=None):
+        self.requests.append(list(oids))
+        return [self.values.get(oid) for oid in oids]
+
+    def walk(self, oid, check_plugin_name=None, table_base_oid=None, context_name=None):
+        raise NotImplementedError("walk")
+
+
+@pytest.fixture
+def recording_backend(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "snmp_scan_cache_dir", str(tmp_path))
+    snmp_cache.cleanup_host_caches()
+    yield SNMPRecordingBackend({
+        snmp_scan.OID_SYS_DESCR: b"sys description",
+        snmp_scan.OID_SYS_OBJ: b".1.3.6.1.4.1.8072.3.2.10",
+        ".1.3.6.1.4.1.1.0": b"yes",
+        ".1.3.6.1.4.1.2.0": b"exists",
+        ".1.3.6.1.4.1.4.0": b"no",
+    })
+    snmp_cache.cleanup_host_caches()
+
+
+SECTIONS = [
+    (SectionName("first"), [[(".1.3.6.1.4.1.1.0", "yes", True),
+                              (".1.3.6.1.4.1.2.0", ".*", True)]]),
+    (SectionName("second"), [[(".1.3.6.1.4.1.3.0", "yes", True)],
+                             [(".1.3.6.1.4.1.1.0", ".*", True)]]),
+    (SectionName("third"), [[(".1.3.6.1.4.1.4.0", "yes", True),
+                             (".1.3.6.1.4.1.5.0", ".*", True)]]),
+]
+
+
+def test_snmp_scan_fetches_detection_oids_in_rounds(recording_backend):
+    assert snmp_scan.gather_available_raw_section_names(
+        SECTIONS,
+        on_error="raise",
+        missing_sys_description=False,
+        backend=recording_backend,
+    ) == {SectionName("first"), SectionName("second")}
+    # The detection of "third" stops at its first OID
+    assert recording_backend.requests == [
+        [snmp_scan.OID_SYS_DESCR, snmp_scan.OID_SYS_OBJ],
+        [".1.3.6.1.4.1.1.0", ".1.3.6.1.4.1.3.0", ".1.3.6.1.4.1.4.0"],
+        [".1.3.6.1.4.1.2.0"],
+    ]
+
+
+def test_snmp_scan_uses_cached_scan_results(recording_backend):
+    def scan(sections):
+        snmp_cache.cleanup_host_caches()
+        recording_backend.requests.clear()
+        return snmp_scan.gather_available_raw_section_names(
+            sections,
+            on_error="raise",
+            missing_sys_description=False,
+            backend=recording_backend,
+        )
+
+    with snmp_scan.cached_scan_results() as scan_results:
+        assert scan(SECTIONS[:2]) == {SectionName("first"), SectionName("second")}
+        assert list(scan_results) == [(recording_backend.hostname, recording_backend.address)]
+
+        assert scan(SECTIONS[:2]) == {SectionName("first"), SectionName("second")}
+        assert recording_backend.requests == []
+
+        # Only the sections not scanned yet are evaluated
+        assert scan(SECTIONS) == {SectionName("first"), SectionName("second")}
+        assert recording_backend.requests == [[".1.3.6.1.4.1.4.0"]]
+
+        # A different system object ID invalidates the results
+        snmp_cache.initialize_single_oid_cache(recording_backend.config)
+        snmp_cache.single_oid_cache()[snmp_scan.OID_SYS_OBJ] = ".1.3.6.1.4.1.9.1.525"
+        recording_backend.requests.clear()
+        assert snmp_scan._snmp_scan(
+            SECTIONS[:1],
+            missing_sys_description=False,
+            backend=recording_backend,
+        ) == {SectionName("first")}
+        assert recording_backend.requests == [[".1.3.6.1.4.1.1.0"], [".1.3.6.1.4.1.2.0"]]
+
+    scan(SECTIONS[:1])
+    assert len(recording_backend.requests) == 3
+
+
+class SNMPFailingBackend(SNMPRecordingBackend):
+    """Like SNMPRecordingBackend, but requests of the failing OIDs time out"""
+    def __init__(self, values):
+        super().__init__(values)
+        self.failing = set()
+
+    def get_many(self, oids, context_name=None):
+        answers = super().get_many(oids, context_name)
+        if self.failing.intersection(oids):
+            raise MKSNMPError("Timeout")
+        return answers
+
+
+@pytest.fixture
+def failing_backend(recording_backend):
+    return SNMPFailingBackend(recording_backend.values)
+
+
+def _scan_again(backend, sections):
+    # Like the discovery of the next host, or of the host in another process
+    snmp_cache.cleanup_host_caches()
+    backend.requests.clear()
+    return snmp_scan.gather_available_raw_section_names(
+        sections,
+        on_error="ignore",
+        missing_sys_description=False,
+        backend=backend,
+    )
+
+
+def test_snmp_scan_failed_description_is_not_remembered(failing_backend):
+    with snmp_scan.cached_scan_results() as scan_results:
+        failing_backend.failing = {snmp_scan.OID_SYS_DESCR}
+        assert _scan_again(failing_backend, SECTIONS[:1]) == set()
+        assert scan_results == {}
+
+        failing_backend.failing = set()
+        assert _scan_again(failing_backend, SECTIONS[:1]) == {SectionName("first")}
+        assert failing_backend.requests[0] == [snmp_scan.OID_SYS_DESCR, snmp_scan.OID_SYS_OBJ]
+
+
+def test_snmp_scan_description_not_found_is_not_seeded(failing_backend):
+    with snmp_scan.cached_scan_results() as scan_results:
+        scan_results[(failing_backend.hostname, failing_backend.address)] = \
+            snmp_scan.SNMPScanResult({snmp_scan.OID_SYS_DESCR: None, snmp_scan.OID_SYS_OBJ: None},
+                                     {})
+        assert _scan_again(failing_backend, SECTIONS[:1]) == {SectionName("first")}
+        assert failing_backend.requests[0] == [snmp_scan.OID_SYS_DESCR, snmp_scan.OID_SYS_OBJ]
+
+
+def test_snmp_scan_timed_out_detection_oid_is_scanned_again(failing_backend):
+    with snmp_scan.cached_scan_results() as scan_results:
+        failing_backend.failing = {".1.3.6.1.4.1.1.0"}
+        assert _scan_again(failing_backend, SECTIONS[:1]) == set()
+        scan_result = scan_results[(failing_backend.hostname, failing_backend.address)]
+        assert SectionName("first") not in scan_result.sections
+
+        failing_backend.failing = set()
+        assert _scan_again(failing_backend, SECTIONS[:1]) == {SectionName("first")}
+        assert failing_backend.requests == [[".1.3.6.1.4.1.1.0"], [".1.3.6.1.4.1.2.0"]]
+        assert scan_result.sections == {SectionName("first"): True}
+
+
+def test_get_multiple_oids_does_not_cache_failed_oids(failing_backend):
+    snmp_cache.initialize_single_oid_cache(failing_backend.config)
+    failing_backend.failing = {".1.3.6.1.4.1.1.0"}
+    assert snmp_modes.get_multiple_oids([".1.3.6.1.4.1.1.0", ".1.3.6.1.4.1.3.0"],
+                                        backend=failing_backend) == {
+                                            ".1.3.6.1.4.1.1.0": None,
+                                            ".1.3.6.1.4.1.3.0": None,
+                                        }
+    assert snmp_cache.single_oid_cache() == {}
+
+    failing_backend.failing = set()
+    assert snmp_modes.get_multiple_oids([".1.3.6.1.4.1.1.0", ".1.3.6.1.4.1.3.0"],
+                                        backend=failing_backend) == {
+                                            ".1.3.6.1.4.1.1.0": "yes",
+                                            ".1.3.6.1.4.1.3.0": None,
+                                        }
+    assert snmp_cache.single_oid_cache() == {
+        ".1.3.6.1.4.1.1.0": "yes",
+        ".1.3.6.1.4.1.3.0": None,
+    }
+
+
+def test_default_get_many_only_loses_failing_oids():
+    class Backend(SNMPTestBackend):
+        def get(self, oid, context_name=None):
+            if oid == ".1.3.6.1.4.1.1.0":
+                raise MKSNMPError("Timeout")
+            return b"value of %s" % oid.encode()
+
+    assert Backend(SNMPConfig, logger).get_many([".1.3.6.1.4.1.1.0", ".1.3.6.1.4.1.2.0"]) == [
+        None,
+        b"value of .1.3.6.1.4.1.2.0",
+    ]
@@ -4,10 +4,13 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+# pylint: disable=protected-access
+
 import pytest  # type: ignore[import]
 
 from testlib.base import Scenario  # type: ignore[import]
 
+import cmk.utils.paths
 from cmk.utils.log import logger
 from cmk.utils.type_defs import SectionName
 import cmk.snmplib.snmp_table as snmp_table
@@ -117,3 +120,125 @@ def test_is_bulkwalk_host(monkeypatch):
     config_cache = ts.apply(monkeypatch)
     assert config_cache.get_host_config("abc").snmp_config("").is_bulkwalk_host is False
     assert config_cache.get_host_config("localhost").snmp_config("").is_bulkwalk_host is True
+
+
+@pytest.mark.parametrize("fetchoid, rowinfo", [
+    (".1.3.6.1.2.1.2.2.1.2", []),
+    (".1.3.6.1.2.1.2.2.1.2", [
+        (".1.3.6.1.2.1.2.2.1.2.1", b"lo"),
+        (".1.3.6.1.2.1.2.2.1.2.2", b""),
+        (".1.3.6.1.2.1.2.2.1.2.10", b"\x00\xff eth0\n"),
+        (".1.3.6.1.2.1.2.2.1.2.3", b"eth1"),
+    ]),
+    (".1.3.6.1.2.1.4.20.1.2", [
+        (".1.3.6.1.2.1.4.20.1.2.10.0.0.1", b"1"),
+        (".1.3.6.1.2.1.4.20.1.2.127.0.0.1", b"2"),
+    ]),
+    (".1.3.6.1.4.1.14988.1.1.1.2.1.3", [
+        (".1.3.6.1.4.1.14988.1.1.1.2.1.3.0", b"1"),
+        (".1.3.6.1.4.1.14988.1.1.1.2.1.3.01", b"2"),
+    ]),
+    (".1.3.6.1.2.1.1", [
+        (".1.3.6.1.2.1.1.1.0", b"sysDescr"),
+        (".1.3.6.1.2.1.2.1.0", b"outside"),
+    ]),
+])
+def test_encode_decode_walk(fetchoid, rowinfo):
+    assert snmp_table._decode_walk(snmp_table._encode_walk(fetchoid, rowinfo)) == rowinfo
+
+
+@pytest.fixture(name="walk_cache_dir")
+def fixture_walk_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cmk.utils.paths, "var_dir", str(tmp_path))
+    return tmp_path / "snmp_cache"
+
+
+def _tree(*columns):
+    return BackendSNMPTree(
+        base=".1.3.6.1.2.1.2.2.1",
+        oids=[BackendOIDSpec(column, "string", save_to_cache) for column, save_to_cache in columns],
+    )
+
+
+def _rowinfo(column):
+    return [(".1.3.6.1.2.1.2.2.1.%s.%d" % (column, index), b"%s-%d" % (column.encode(), index))
+            for index in range(1, 4)]
+
+
+def test_walk_cache(walk_cache_dir):
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache.load(trees=[_tree(("2", True))])
+    assert not walk_cache
+
+    walk_cache[".1.3.6.1.2.1.2.2.1.2"] = (True, _rowinfo("2"))
+    walk_cache[".1.3.6.1.2.1.2.2.1.3"] = (False, _rowinfo("3"))
+    walk_cache[".1.3.6.1.2.1.2.2.1.5"] = (True, _rowinfo("5"))
+    walk_cache.save()
+    assert [path.name for path in walk_cache_dir.iterdir()] == ["testhost.walks"]
+
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache.load(trees=[_tree(("2", True), ("3", True), ("4", False))])
+    assert sorted(walk_cache) == [".1.3.6.1.2.1.2.2.1.2"]
+    assert walk_cache[".1.3.6.1.2.1.2.2.1.2"] == (True, _rowinfo("2"))
+    with pytest.raises(KeyError):
+        _ = walk_cache[".1.3.6.1.2.1.2.2.1.3"]
+
+
+def test_walk_cache_is_loaded_lazily(walk_cache_dir, monkeypatch):
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache[".1.3.6.1.2.1.2.2.1.2"] = (True, _rowinfo("2"))
+    walk_cache[".1.3.6.1.2.1.2.2.1.5"] = (True, _rowinfo("5"))
+    walk_cache.save()
+
+    decoded = []
+    decode_walk = snmp_table._decode_walk
+    monkeypatch.setattr(snmp_table, "_decode_walk",
+                        lambda data: decoded.append(data) or decode_walk(data))
+
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache.load(trees=[_tree(("2", True), ("5", True))])
+    assert len(walk_cache) == 2
+    assert not decoded
+    assert walk_cache[".1.3.6.1.2.1.2.2.1.5"] == (True, _rowinfo("5"))
+    assert walk_cache[".1.3.6.1.2.1.2.2.1.5"] == (True, _rowinfo("5"))
+    assert len(decoded) == 1
+
+
+def test_walk_cache_is_saved_once_per_fetch(walk_cache_dir, monkeypatch):
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache[".1.3.6.1.2.1.2.2.1.2"] = (True, _rowinfo("2"))
+    walk_cache.save()
+    fetched_at = snmp_table._read_walk_cache(walk_cache_dir /
+                                             "testhost.walks")[".1.3.6.1.2.1.2.2.1.2"].fetched_at
+
+    saved = []
+    save_bytes_to_file = snmp_table.store.save_bytes_to_file
+    monkeypatch.setattr(snmp_table.store, "save_bytes_to_file",
+                        lambda path, data: saved.append(path) or save_bytes_to_file(path, data))
+
+    # Nothing new to be cached
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache.load(trees=[_tree(("2", True))])
+    assert walk_cache[".1.3.6.1.2.1.2.2.1.2"] == (True, _rowinfo("2"))
+    walk_cache[".1.3.6.1.2.1.2.2.1.3"] = (False, _rowinfo("3"))
+    walk_cache.save()
+    assert not saved
+
+    # A new walk is added, the other walks are kept including the time they were fetched
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache[".1.3.6.1.2.1.2.2.1.5"] = (True, _rowinfo("5"))
+    walk_cache.save()
+    assert saved == [walk_cache_dir / "testhost.walks"]
+
+    cached = snmp_table._read_walk_cache(walk_cache_dir / "testhost.walks")
+    assert sorted(cached) == [".1.3.6.1.2.1.2.2.1.2", ".1.3.6.1.2.1.2.2.1.5"]
+    assert cached[".1.3.6.1.2.1.2.2.1.2"].fetched_at == fetched_at
+    assert snmp_table._decode_walk(cached[".1.3.6.1.2.1.2.2.1.5"].data) == _rowinfo("5")
+
+
+def test_walk_cache_invalid_file(walk_cache_dir):
+    walk_cache_dir.mkdir()
+    (walk_cache_dir / "testhost.walks").write_bytes(b"[(1, 2)]\n")
+    walk_cache = snmp_table.WalkCache("testhost")
+    walk_cache.load(trees=[_tree(("2", True))])
+    assert not walk_cache
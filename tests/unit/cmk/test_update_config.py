@@ -77,6 +77,21 @@ def test_cleanup_version_specific_caches(uc):
         assert base_dir.exists()
 
 
+def test_cleanup_version_specific_caches_walk_cache(uc):
+    walk_cache_dir = Path(cmk.utils.paths.var_dir, "snmp_cache")
+    walk_cache_dir.mkdir(parents=True, exist_ok=True)
+    walk_cache_file = walk_cache_dir / "heute.walks"
+    walk_cache_file.write_bytes(b"")
+    # The per OID cache files of former versions
+    old_cache_file = walk_cache_dir / "heute" / ".1.3.6.1.2.1.1.1"
+    old_cache_file.parent.mkdir()
+    old_cache_file.write_text(u"[]\n")
+
+    uc._cleanup_version_specific_caches()
+    assert not walk_cache_file.exists()
+    assert not old_cache_file.exists()
+
+
 @pytest.mark.parametrize('ruleset_name, param_value, transformed_param_value', [
     (
         'diskstat_inventory',
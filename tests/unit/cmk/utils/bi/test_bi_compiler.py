@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=redefined-outer-name
+
+import copy
+from pathlib import Path
+import sys
+
+import pytest  # type: ignore[import]
+
+import cmk.utils.paths
+from cmk.utils.bi.bi_compiler import BICompiler
+from cmk.utils.bi.bi_lib import SitesCallback
+import bi_test_data.sample_config as sample_config
+
+
+def _packs_config(group_name="Hosts"):
+    config = copy.deepcopy(sample_config.bi_packs_config)
+    aggregations = config["packs"][0]["aggregations"]
+    for aggr_id, host_name in [("default_aggregation", "heute"), ("clone_aggregation",
+                                                                   "heute_clone")]:
+        aggregation = copy.deepcopy(aggregations[0])
+        aggregation["id"] = aggr_id
+        aggregation["node"]["search"]["conditions"]["host_choice"] = {
+            "type": "host_name_regex",
+            "pattern": host_name,
+        }
+        aggregations.append(aggregation)
+    del aggregations[0]
+    aggregations[1]["groups"]["names"] = [group_name]
+    return config
+
+
+@pytest.fixture
+def bi_compiler(monkeypatch, tmp_path, bi_searcher_with_sample_config):
+    monkeypatch.setattr(cmk.utils.paths, "tmp_dir", str(tmp_path))
+    monkeypatch.setattr(cmk.utils.paths, "default_config_dir", str(tmp_path))
+    (tmp_path / "multisite.d").mkdir()
+    compiler = BICompiler("bi_config.bi", SitesCallback(lambda: {}, lambda query: []))
+    compiler.bi_searcher = bi_searcher_with_sample_config
+    compiler.packs_config = _packs_config()
+
+    def prepare_for_compilation(online_sites):
+        compiler._bi_packs._load_config(compiler.packs_config)
+
+    monkeypatch.setattr(compiler, "prepare_for_compilation", prepare_for_compilation)
+    monkeypatch.setattr(compiler, "_compilation_required", lambda configstatus: True)
+    compiler.lookups = []
+    monkeypatch.setattr(compiler, "_generate_part_of_aggregation_lookup",
+                        compiler.lookups.append)
+
+    compile_aggregations = compiler._compile_aggregations
+    compiler.compiled_ids = []
+
+    def compile_and_record(aggregations, aggr_ids):
+        compiler.compiled_ids.append(sorted(aggr_ids))
+        return compile_aggregations(aggregations, aggr_ids)
+
+    monkeypatch.setattr(compiler, "_compile_aggregations", compile_and_record)
+    return compiler
+
+
+def test_compile_incremental(bi_compiler):
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids == [["clone_aggregation", "default_aggregation"]]
+    assert sorted(bi_compiler.compiled_aggregations) == ["clone_aggregation", "default_aggregation"]
+    assert [branch.properties.title
+            for branch in bi_compiler.compiled_aggregations["clone_aggregation"].branches
+           ] == ["Host heute_clone"]
+    assert bi_compiler.compiled_aggregations["clone_aggregation"].groups.names == ["Hosts"]
+    lookup = bi_compiler.lookups[-1]
+    assert [title for title, _required_elements in lookup["default_aggregation"]] == ["Host heute"]
+    assert ("heute", "heute", "Uptime") in lookup["default_aggregation"][0][1]
+
+    # Nothing changed
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == []
+    assert bi_compiler.lookups[-1] == lookup
+
+    # Only the changed aggregation is compiled again
+    bi_compiler.packs_config = _packs_config("Changed")
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == ["clone_aggregation"]
+    assert bi_compiler.compiled_aggregations["clone_aggregation"].groups.names == ["Changed"]
+    assert bi_compiler.lookups[-1] == lookup
+
+    # Vanished aggregations are removed
+    bi_compiler.packs_config["packs"][0]["aggregations"].pop()
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == []
+    assert list(bi_compiler.lookups[-1]) == ["default_aggregation"]
+    assert list(bi_compiler.compiled_aggregations) == ["default_aggregation"]
+
+
+def _change_services(bi_compiler, host_name):
+    hosts = dict(bi_compiler.bi_searcher.hosts)
+    hosts[host_name] = hosts[host_name]._replace(services={})
+    bi_compiler.bi_searcher.set_hosts(hosts)
+
+
+def test_compile_incremental_by_hosts(bi_compiler):
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids == [["clone_aggregation", "default_aggregation"]]
+
+    # Only the aggregation selecting the changed host is compiled again
+    _change_services(bi_compiler, "heute_clone")
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == ["clone_aggregation"]
+
+    # New hosts may be selected by all aggregations
+    hosts = dict(bi_compiler.bi_searcher.hosts)
+    hosts["heute_new"] = hosts["heute"]._replace(name="heute_new")
+    bi_compiler.bi_searcher.set_hosts(hosts)
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == ["clone_aggregation", "default_aggregation"]
+
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == []
+
+
+def test_searcher_records_selected_hosts(bi_searcher_with_sample_config):
+    selected_host_names = bi_searcher_with_sample_config.record_selected_hosts()
+    bi_searcher_with_sample_config.get_host_name_matches(
+        bi_searcher_with_sample_config.all_hosts, "heute_clone")
+    assert selected_host_names == {"heute_clone"}
+
+    selected_host_names = bi_searcher_with_sample_config.record_selected_hosts()
+    bi_searcher_with_sample_config.get_host_name_matches(
+        bi_searcher_with_sample_config.all_hosts, "heute.*")
+    assert selected_host_names == {"heute", "heute_clone"}
+
+
+def test_compile_in_helper(bi_compiler, monkeypatch):
+    monkeypatch.setattr(bi_compiler, "parallel_compilation_threshold", 1)
+    monkeypatch.setattr(bi_compiler, "helper_command",
+                        [sys.executable, "-m", "cmk.utils.bi.bi_compiler"])
+    monkeypatch.setenv("PYTHONPATH", str(Path(cmk.utils.paths.__file__).parents[2]))
+    monkeypatch.setattr("os.cpu_count", lambda: 2)
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids == [["clone_aggregation", "default_aggregation"]]
+    assert [branch.properties.title
+            for branch in bi_compiler.compiled_aggregations["clone_aggregation"].branches
+           ] == ["Host heute_clone"]
+    assert [title for title, _required_elements in bi_compiler.lookups[-1]["default_aggregation"]
+           ] == ["Host heute"]
+
+    # The hosts selected in the helper are recorded as well
+    _change_services(bi_compiler, "heute")
+    bi_compiler.load_compiled_aggregations()
+    assert bi_compiler.compiled_ids[-1] == ["default_aggregation"]
@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=redefined-outer-name
+
+import copy
+
+import pytest
+
+from cmk.utils.bi.bi_computer import BIBranchResultCache
+from cmk.utils.bi.bi_trees import BICompiledRule
+import bi_test_data.sample_config as sample_config
+
+
+@pytest.fixture
+def compiled_aggregation(bi_packs_sample_config, bi_searcher_with_sample_config):
+    bi_aggregation = bi_packs_sample_config.get_aggregation("default_aggregation")
+    return bi_aggregation.compile(bi_searcher_with_sample_config)
+
+
+@pytest.fixture
+def computed_rules(monkeypatch):
+    computed = []
+    aggregate_node_results = BICompiledRule.aggregate_node_results
+
+    def aggregate_and_count(self, *args, **kwargs):
+        computed.append(self)
+        return aggregate_node_results(self, *args, **kwargs)
+
+    monkeypatch.setattr(BICompiledRule, "aggregate_node_results", aggregate_and_count)
+    return computed
+
+
+def _with_service_state(status_rows, service_description, state):
+    status_rows = copy.deepcopy(status_rows)
+    for service in status_rows[0][-1]:
+        if service[0] == service_description:
+            service[1] = service[4] = state
+    return status_rows
+
+
+def _results(bundles):
+    return [(bundle.instance.properties.title, bundle.actual_result, bundle.assumed_result)
+            for bundle in bundles]
+
+
+def test_branch_result_cache_identical(compiled_aggregation, bi_status_fetcher):
+    cache = BIBranchResultCache()
+    for status_rows in [
+            sample_config.bi_status_rows,
+            sample_config.bi_acknowledgment_status_rows,
+            sample_config.bi_downtime_status_rows,
+            _with_service_state(sample_config.bi_status_rows, "Check_MK Discovery", 2),
+            sample_config.bi_status_rows,
+    ]:
+        bi_status_fetcher.states = bi_status_fetcher.create_bi_status_data(status_rows)
+        branches = compiled_aggregation.branches
+        assert _results(cache.compute_branches(compiled_aggregation, branches,
+                                               bi_status_fetcher)) == _results(
+                                                   compiled_aggregation.compute_branches(
+                                                       branches, bi_status_fetcher))
+
+
+def test_branch_result_cache_recomputes_changed(compiled_aggregation, bi_status_fetcher,
+                                                computed_rules):
+    cache = BIBranchResultCache()
+    branches = compiled_aggregation.branches
+    bi_status_fetcher.states = bi_status_fetcher.create_bi_status_data(
+        sample_config.bi_status_rows)
+    cache.compute_branches(compiled_aggregation, branches, bi_status_fetcher)
+    assert computed_rules
+    num_rules = len(computed_rules)
+
+    # Unchanged states
+    computed_rules.clear()
+    bi_status_fetcher.states = bi_status_fetcher.create_bi_status_data(
+        sample_config.bi_status_rows)
+    cache.compute_branches(compiled_aggregation, branches, bi_status_fetcher)
+    assert not computed_rules
+
+    # Only the rules requiring the service are computed again
+    bi_status_fetcher.states = bi_status_fetcher.create_bi_status_data(
+        _with_service_state(sample_config.bi_status_rows, "Check_MK Discovery", 2))
+    results = cache.compute_branches(compiled_aggregation, branches, bi_status_fetcher)
+    assert 0 < len(computed_rules) < num_rules
+    assert all(
+        any(element.service_description == "Check_MK Discovery"
+            for element in rule.required_elements())
+        for rule in computed_rules)
+    assert results[0].actual_result.state == 2
+
+    # Assumed states are inputs, too
+    computed_rules.clear()
+    bi_status_fetcher.set_assumed_states({("heute", "heute", "Check_MK Discovery"): 0})
+    results = cache.compute_branches(compiled_aggregation, branches, bi_status_fetcher)
+    assert computed_rules
+    assert results[0].assumed_result is not None
+    assert _results(results) == _results(
+        compiled_aggregation.compute_branches(branches, bi_status_fetcher))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=redefined-outer-name
+import pytest  # type: ignore[import]
+
+from cmk.utils.regex import regex
+from cmk.utils.rulesets.ruleset_matcher import matches_labels, matches_tag_spec
+from cmk.utils.bi.bi_lib import BIHostData, BIServiceData
+from cmk.utils.bi.bi_searcher import BISearcher, _literal_prefix
+
+
+@pytest.fixture
+def hosts():
+    hosts = {}
+    for index in range(30):
+        host_name = "%s%02d" % (["web", "db", "webdb"][index % 3], index)
+        hosts[host_name] = BIHostData(
+            "site",
+            {"prod" if index % 2 else "test", "lan" if index % 5 else "wan"},
+            {"os": ["linux", "windows"][index % 2]} if index % 7 else {},
+            "folder%d" % (index % 4),
+            {
+                service_description: BIServiceData(set(), {"fs": "yes"} if "/" in
+                                                   service_description else {})
+                for service_description in
+                ["CPU load", "Filesystem /", "Filesystem /var", "Interface %d" % index]
+            },
+            (),
+            (),
+            "alias of %s" % host_name,
+            host_name,
+        )
+    return hosts
+
+
+@pytest.fixture
+def searcher(hosts):
+    searcher = BISearcher()
+    searcher.set_hosts(hosts)
+    return searcher
+
+
+@pytest.mark.parametrize("pattern, expected_prefix", [
+    ("web", "web"),
+    ("web.*", "web"),
+    ("webs*", "web"),
+    ("webs?", "web"),
+    ("webs+", "webs"),
+    ("web[0-9]", "web"),
+    ("^web", ""),
+    ("web|db", ""),
+    ("Filesystem (.*)", "Filesystem "),
+    ("Filesystem\\ /", "Filesystem"),
+])
+def test_literal_prefix(pattern, expected_prefix):
+    assert _literal_prefix(pattern) == expected_prefix
+
+
+@pytest.mark.parametrize("pattern", [
+    "web.*",
+    "(web|db)(.*)",
+    "webdb[0-9]+",
+    "db0(.)",
+    "db0?",
+    "(.*)0",
+])
+def test_host_name_matches(searcher, hosts, pattern):
+    regex_pattern = regex(pattern + "$")
+    expected = {
+        host_name: regex_pattern.match(host_name).groups()  # type: ignore[union-attr]
+        for host_name in hosts
+        if regex_pattern.match(host_name)
+    }
+    all_hosts = list(hosts.values())
+    for _repetition in range(2):
+        matched_hosts, match_groups = searcher.get_host_name_matches(all_hosts, pattern)
+        assert [host.name for host in matched_hosts] == list(expected)
+        assert match_groups == expected
+
+    some_hosts = all_hosts[::2]
+    matched_hosts, match_groups = searcher.get_host_name_matches(some_hosts, pattern)
+    assert [host.name for host in matched_hosts] == [
+        host.name for host in some_hosts if host.name in expected
+    ]
+    assert match_groups == {host.name: expected[host.name] for host in matched_hosts}
+
+
+def test_host_alias_matches(searcher, hosts):
+    matched_hosts, match_groups = searcher.get_host_alias_matches(list(hosts.values()),
+                                                                  "alias of db(.*)")
+    assert [host.name for host in matched_hosts] == [
+        host_name for host_name in hosts if host_name.startswith("db")
+    ]
+    assert match_groups["db01"] == ("01",)
+
+
+@pytest.mark.parametrize("pattern", ["Filesystem (.*)", "CPU", "Interface 1[0-9]", "(.*)/"])
+def test_service_description_matches(searcher, hosts, pattern):
+    regex_pattern = regex(pattern)
+    some_hosts = list(hosts.values())[5:]
+    expected = [(host.name, service_description,
+                 regex_pattern.match(service_description).groups())  # type: ignore[union-attr]
+                for host in some_hosts
+                for service_description in host.services
+                if regex_pattern.match(service_description)]
+    assert [(match.host.name, match.service_description, match.match_groups)
+            for match in searcher.get_service_description_matches(some_hosts, pattern)
+           ] == expected
+
+
+@pytest.mark.parametrize("condition", [
+    {},
+    {"criticality": "prod"},
+    {"criticality": "prod", "networking": "wan"},
+    {"criticality": {"$ne": "prod"}},
+    {"criticality": {"$or": ["prod", "wan"]}},
+    {"criticality": {"$nor": ["prod", "wan"]}, "networking": {"$ne": "unknown"}},
+    {"criticality": "unknown"},
+])
+def test_filter_host_tags(searcher, hosts, condition):
+    some_hosts = list(hosts.values())[3:]
+    assert searcher.filter_host_tags(some_hosts, condition) == [
+        host for host in some_hosts
+        if all(matches_tag_spec(tag_spec, host.tags) for tag_spec in condition.values())
+    ]
+
+
+@pytest.mark.parametrize("required_labels", [
+    {},
+    {"os": "linux"},
+    {"os": {"$ne": "linux"}},
+    {"os": {"$ne": "unknown"}},
+    {"os": "linux", "other": {"$ne": "x"}},
+    {"unknown": "x"},
+])
+def test_filter_host_labels(searcher, hosts, required_labels):
+    some_hosts = list(hosts.values())[3:]
+    assert searcher.filter_host_labels(some_hosts, required_labels) == [
+        host for host in some_hosts if matches_labels(host.labels, required_labels)
+    ]
+
+
+def test_set_hosts_resets_indexes(searcher, hosts):
+    assert searcher.get_host_name_matches(list(hosts.values()), "web.*")[0]
+    searcher.set_hosts({"web": hosts["web00"]._replace(name="web", tags={"other"})})
+    matched_hosts, _match_groups = searcher.get_host_name_matches(searcher.all_hosts, "web.*")
+    assert [host.name for host in matched_hosts] == ["web"]
+    assert searcher.filter_host_tags(searcher.all_hosts, {"criticality": "prod"}) == []
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from cmk.utils.labels import LabelManager
+from cmk.utils.rulesets.host_match_cache import HostMatchCache
+from cmk.utils.rulesets.ruleset_matcher import RulesetMatcher, RulesetMatchObject
+
+
+def test_host_match_cache_roundtrip(tmp_path):
+    path = tmp_path / "host_matches"
+    cache = HostMatchCache(path, {"host1": "a", "host2": "b"})
+    assert cache.get(("cond",)) is None
+    cache.set(("cond",), {"host1"})
+    cache.save()
+
+    cache = HostMatchCache(path, {"host1": "a", "host2": "b"})
+    assert cache.get(("cond",)) == ({"host1"}, set())
+    assert cache.get(("other",)) is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+
+def test_host_match_cache_outdated_hosts(tmp_path):
+    path = tmp_path / "host_matches"
+    cache = HostMatchCache(path, {"host1": "a", "host2": "b", "host3": "c"})
+    cache.set(("cond",), {"host1", "host2", "host3"})
+    cache.set(("other",), {"host1"})
+    cache.save()
+
+    # host2 changed, host3 was removed, host4 is new
+    cache = HostMatchCache(path, {"host1": "a", "host2": "x", "host4": "d"})
+    assert cache.get(("cond",)) == ({"host1"}, {"host2", "host4"})
+    cache.set(("cond",), {"host1", "host4"})
+    cache.save()
+
+    # Not evaluated again, so "other" is not valid for the changed hosts anymore
+    cache = HostMatchCache(path, {"host1": "a", "host2": "x", "host4": "d"})
+    assert cache.get(("cond",)) == ({"host1", "host4"}, set())
+    assert cache.get(("other",)) is None
+
+
+def _matcher(host_tag_lists, host_match_cache_path):
+    return RulesetMatcher(
+        tag_to_group_map={},
+        host_tag_lists=host_tag_lists,
+        host_paths={},
+        labels=LabelManager({}, [], [], lambda h, s: {}),
+        all_configured_hosts=set(host_tag_lists),
+        clusters_of={},
+        nodes_of={},
+        host_match_cache_path=host_match_cache_path,
+    )
+
+
+def _host_values(matcher, hostname, ruleset):
+    return list(
+        matcher.get_host_ruleset_values(RulesetMatchObject(host_name=hostname),
+                                        ruleset,
+                                        is_binary=False))
+
+
+def test_ruleset_optimizer_persisted_host_matches(tmp_path):
+    path = tmp_path / "host_matches"
+    ruleset = [
+        {
+            "value": "prod",
+            "condition": {
+                "host_tags": {
+                    "criticality": "prod"
+                }
+            },
+        },
+        {
+            "value": "host1",
+            "condition": {
+                "host_name": ["host1"]
+            },
+        },
+    ]
+
+    matcher = _matcher({"host1": {"prod"}, "host2": {"test"}}, path)
+    assert _host_values(matcher, "host1", ruleset) == ["prod", "host1"]
+    assert _host_values(matcher, "host2", ruleset) == []
+    matcher.ruleset_optimizer.save_host_match_cache()
+
+    matcher = _matcher({"host1": {"prod"}, "host2": {"prod"}, "host3": {"prod"}}, path)
+    assert _host_values(matcher, "host1", ruleset) == ["prod", "host1"]
+    assert _host_values(matcher, "host2", ruleset) == ["prod"]
+    assert _host_values(matcher, "host3", ruleset) == ["prod"]
+
+    host_match_cache = matcher.ruleset_optimizer.get_host_match_cache()
+    assert host_match_cache is not None
+    assert host_match_cache.stats()["hits"] == 2
+    assert host_match_cache.stats()["misses"] == 0
+
+
+def test_ruleset_optimizer_persisted_empty_host_list(tmp_path):
+    path = tmp_path / "host_matches"
+    ruleset = [
+        {
+            "value": "nothing",
+            "condition": {
+                "host_name": []
+            },
+        },
+    ]
+
+    matcher = _matcher({"host1": {"prod"}}, path)
+    assert _host_values(matcher, "host1", ruleset) == []
+    matcher.ruleset_optimizer.save_host_match_cache()
+
+    # host1 changed and host2 is new: Both have to be checked again, but an
+    # empty host list still matches no host
+    matcher = _matcher({"host1": {"test"}, "host2": {"prod"}}, path)
+    assert _host_values(matcher, "host1", ruleset) == []
+    assert _host_values(matcher, "host2", ruleset) == []
+
+
+def test_ruleset_optimizer_host_match_cache_disabled(tmp_path):
+    path = tmp_path / "host_matches"
+    matcher = _matcher({"host1": {"prod"}}, None)
+    assert matcher.ruleset_optimizer.get_host_match_cache() is None
+
+    matcher.ruleset_optimizer.enable_host_match_cache(path)
+    assert matcher.ruleset_optimizer.get_host_match_cache() is not None
@@ -526,3 +526,128 @@ def test_ruleset_optimizer_clear_ruleset_caches(monkeypatch):
     ruleset_optimizer.clear_ruleset_caches()
     assert not ruleset_optimizer._host_ruleset_cache
     assert not ruleset_optimizer._service_ruleset_cache
+
+
+service_description_ruleset = [
+    # literal prefix
+    {
+        "value": "prefix",
+        "condition": {
+            "service_description": [{
+                "$regex": "CPU"
+            }],
+        },
+    },
+    # literal string anchored at the end
+    {
+        "value": "exact",
+        "condition": {
+            "service_description": [{
+                "$regex": "Interface 1$"
+            }],
+        },
+    },
+    # real regex
+    {
+        "value": "regex",
+        "condition": {
+            "service_description": [{
+                "$regex": "Interface [0-9]+$"
+            }],
+        },
+    },
+    # mixed literal and regex patterns
+    {
+        "value": "mixed",
+        "condition": {
+            "service_description": [{
+                "$regex": "Memory"
+            }, {
+                "$regex": ".*load"
+            }],
+        },
+    },
+    # negated literal prefixes
+    {
+        "value": "not_interface",
+        "condition": {
+            "service_description": {
+                "$nor": [{
+                    "$regex": "Interface"
+                }],
+            },
+        },
+    },
+    # only for a single host
+    {
+        "value": "host2_only",
+        "condition": {
+            "host_name": ["host2"],
+            "service_description": [{
+                "$regex": "Interface"
+            }],
+        },
+    },
+    # empty list matches everything
+    {
+        "value": "empty",
+        "condition": {
+            "service_description": [],
+        },
+    },
+    # negated empty list matches nothing
+    {
+        "value": "nothing",
+        "condition": {
+            "service_description": {
+                "$nor": []
+            },
+        },
+    },
+]
+
+
+@pytest.mark.parametrize("hostname,service_description,expected_result", [
+    ("host1", "CPU load", ["prefix", "mixed", "not_interface", "empty"]),
+    ("host1", "CPU utilization", ["prefix", "not_interface", "empty"]),
+    ("host1", "Interface 1", ["exact", "regex", "empty"]),
+    ("host1", "Interface 10", ["regex", "empty"]),
+    ("host1", "Interface 1 status", ["empty"]),
+    ("host2", "Interface 1", ["exact", "regex", "host2_only", "empty"]),
+    ("host2", "Memory", ["mixed", "not_interface", "empty"]),
+    ("host3", "Memory", []),
+])
+def test_ruleset_matcher_get_service_ruleset_values_description(monkeypatch, hostname,
+                                                                service_description,
+                                                                expected_result):
+    ts = Scenario()
+    ts.add_host("host1")
+    ts.add_host("host2")
+    config_cache = ts.apply(monkeypatch)
+    matcher = config_cache.ruleset_matcher
+
+    match_object = RulesetMatchObject(host_name=hostname, service_description=service_description)
+    for _ in range(2):  # second round is answered from the match cache
+        assert list(
+            matcher.get_service_ruleset_values(match_object,
+                                               ruleset=service_description_ruleset,
+                                               is_binary=False)) == expected_result
+
+
+def test_ruleset_optimizer_compiled_service_ruleset_groups_hosts(monkeypatch):
+    ts = Scenario()
+    ts.add_host("host1")
+    ts.add_host("host2")
+    ts.add_host("host3")
+    config_cache = ts.apply(monkeypatch)
+    ruleset_optimizer = config_cache.ruleset_matcher.ruleset_optimizer
+
+    compiled_ruleset = ruleset_optimizer.get_compiled_service_ruleset(
+        service_description_ruleset, False, False)
+    assert compiled_ruleset is ruleset_optimizer.get_compiled_service_ruleset(
+        service_description_ruleset, False, False)
+    assert compiled_ruleset.group_of("host1") is compiled_ruleset.group_of("host3")
+    assert compiled_ruleset.group_of("host1") is not compiled_ruleset.group_of("host2")
+
+    ruleset_optimizer.clear_ruleset_caches()
+    assert not ruleset_optimizer._compiled_service_ruleset_cache
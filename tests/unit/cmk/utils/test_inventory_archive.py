@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+import ast
+
+import pytest  # type: ignore[import]
+
+import cmk.utils.store as store
+from cmk.utils.inventory_archive import apply_delta, compute_delta, InventoryArchive
+from cmk.utils.structured_data import StructuredDataTree
+
+
+def _raw_tree(version):
+    return {
+        "hardware": {
+            "cpu": {
+                "cores": 4 + version // 3,
+                "model": "Intel",
+            },
+        },
+        "software": {
+            "os": {
+                "kernel_version": "5.4.%d" % version,
+            },
+            "packages": [{
+                "name": "package%d" % nr,
+                "version": "1.%d" % (nr + version if nr % 50 == 0 else nr),
+            } for nr in range(version, 500 + version)],
+        },
+        "networking": {
+            "interfaces": [{
+                "index": nr,
+                "oper_status": 1
+            } for nr in range(version % 4)],
+        } if version % 5 else {},
+    }
+
+
+@pytest.mark.parametrize("source, target", [
+    ({}, {}),
+    ({}, _raw_tree(1)),
+    (_raw_tree(1), {}),
+    (_raw_tree(1), _raw_tree(2)),
+    (_raw_tree(7), _raw_tree(1)),
+    ({"a": [1, 2, 3]}, {"a": {"b": 1}}),
+    ({"a": [{"x": 1}, {"x": 2}, {"x": 3}]}, {"a": [{"x": 0}, {"x": 2}, {"x": 3}, {"x": 4}]}),
+])
+def test_delta_roundtrip(source, target):
+    delta = compute_delta(source, target)
+    # The deltas are stored as Python literals
+    assert ast.literal_eval(repr(delta)) == delta
+    assert apply_delta(source, delta) == target
+
+
+def test_delta_is_small():
+    delta = compute_delta(_raw_tree(2), _raw_tree(1))
+    assert len(repr(delta)) < len(repr(_raw_tree(1))) / 10
+
+
+def _save_versions(tmp_path, num_versions):
+    archive_dir = tmp_path / "archive"
+    current_path = tmp_path / "current"
+    store.save_object_to_file(current_path, _raw_tree(0))
+    for version in range(1, num_versions):
+        archive = InventoryArchive(archive_dir, current_path)
+        old_raw_tree = store.load_object_from_file(current_path)
+        old_tree = StructuredDataTree().create_tree_from_raw_tree(old_raw_tree)
+        new_tree = StructuredDataTree().create_tree_from_raw_tree(_raw_tree(version))
+        archive.archive("%d" % (1000 + version), old_raw_tree, new_tree.get_raw_tree(),
+                        new_tree.compare_with(old_tree))
+        store.save_object_to_file(current_path, new_tree.get_raw_tree())
+    return archive_dir, current_path
+
+
+def test_archive_reconstruct(tmp_path):
+    archive_dir, current_path = _save_versions(tmp_path, 25)
+    archive = InventoryArchive(archive_dir, current_path)
+    timestamps = archive.timestamps()
+    assert timestamps == ["%d" % (1000 + version) for version in range(1, 25)]
+
+    # Every checkpoint_interval-th entry is stored completely
+    assert sorted(path.name for path in archive_dir.iterdir() if "." not in path.name) == [
+        "1010", "1020"
+    ]
+    assert archive.path("1010") == archive_dir / "1010"
+    assert archive.path("1011") == archive_dir / "1011.delta"
+    for version, timestamp in enumerate(timestamps):
+        expected = StructuredDataTree().create_tree_from_raw_tree(_raw_tree(version))
+        assert InventoryArchive(archive_dir, current_path).load_tree(timestamp).is_equal(expected)
+        assert archive.load_tree(timestamp).is_equal(expected)
+
+
+def test_archive_diff(tmp_path):
+    archive_dir, current_path = _save_versions(tmp_path, 5)
+    archive = InventoryArchive(archive_dir, current_path)
+    for timestamp, successor in zip(archive.timestamps(), archive.timestamps()[1:]):
+        stored_diff = archive.diff(timestamp)
+        assert stored_diff is not None
+        num_new, num_changed, num_removed, delta_tree = archive.load_tree(successor).compare_with(
+            archive.load_tree(timestamp))
+        assert stored_diff[:3] == (num_new, num_changed, num_removed)
+        assert stored_diff[3].is_equal(delta_tree)
+
+
+def test_archive_legacy_entries(tmp_path):
+    archive_dir = tmp_path / "archive"
+    current_path = tmp_path / "current"
+    # Written by older versions: complete trees without differences
+    store.save_object_to_file(archive_dir / "900", _raw_tree(5))
+    store.save_object_to_file(current_path, _raw_tree(6))
+    archive = InventoryArchive(archive_dir, current_path)
+    archive.archive("1000", _raw_tree(6), _raw_tree(7), None)
+    store.save_object_to_file(current_path, _raw_tree(7))
+
+    archive = InventoryArchive(archive_dir, current_path)
+    assert archive.timestamps() == ["900", "1000"]
+    assert archive.diff("900") is None
+    assert archive.load_raw_tree("900") == _raw_tree(5)
+    assert archive.load_raw_tree("1000") == _raw_tree(6)
+
+
+def test_archive_freeze(tmp_path):
+    archive_dir, current_path = _save_versions(tmp_path, 4)
+    InventoryArchive(archive_dir, current_path).freeze()
+    current_path.unlink()
+
+    archive = InventoryArchive(archive_dir, current_path)
+    assert (archive_dir / "1003").exists()
+    assert not (archive_dir / "1003.delta").exists()
+    for version, timestamp in enumerate(archive.timestamps()):
+        assert archive.load_raw_tree(timestamp) == _raw_tree(version)
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+# pylint: disable=protected-access
+
+import cmk.utils.item_state_store as item_state_store
+from cmk.utils.item_state_store import ItemStateStore
+
+
+def test_save_and_load(tmp_path):
+    store = ItemStateStore(tmp_path, num_stripes=4)
+    assert store.load("hüst") is None
+
+    store.save("hüst", {("cpu", None, "user"): (1.0, 42), ("if", "1", "in"): (1.0, 23)}, [])
+    store.save("hüst", {("cpu", None, "user"): (2.0, 43)}, [("if", "1", "in")])
+    store.save("other", {("uptime", None, "last"): 1.5}, [])
+
+    assert store.load("hüst") == {("cpu", None, "user"): (2.0, 43)}
+    assert store.load("other") == {("uptime", None, "last"): 1.5}
+    assert ItemStateStore(tmp_path, num_stripes=4).load("hüst") == {("cpu", None, "user"): (2.0, 43)}
+
+
+def test_changes_of_other_processes_are_kept(tmp_path):
+    store = ItemStateStore(tmp_path)
+    other_store = ItemStateStore(tmp_path)
+
+    store.save("host", {"a": 1, "b": 2}, [])
+    assert other_store.load("host") == {"a": 1, "b": 2}
+    other_store.save("host", {"c": 3}, ["a"])
+    store.save("host", {"b": 4}, [])
+
+    assert store.load("host") == {"b": 4, "c": 3}
+    assert other_store.load("host") == {"b": 4, "c": 3}
+
+
+def test_full_record_limits_records_per_host(tmp_path):
+    store = ItemStateStore(tmp_path, num_stripes=1)
+    for index in range(3 * item_state_store._MAX_RECORDS_PER_HOST):
+        store.save("host", {"counter%d" % (index % 5): index}, [])
+        assert store._stripe("host").num_records("host") <= item_state_store._MAX_RECORDS_PER_HOST
+
+    assert store.load("host") == {"counter%d" % (index % 5): index for index in range(40, 48)}
+
+
+def test_compaction(monkeypatch, tmp_path):
+    monkeypatch.setattr(item_state_store, "_MIN_COMPACTION_SIZE", 0)
+    store = ItemStateStore(tmp_path, num_stripes=1)
+    other_store = ItemStateStore(tmp_path, num_stripes=1)
+
+    other_store.save("removed", {"a": 1}, [])
+    for index in range(100):
+        store.save("host%d" % (index % 3), {"counter": index}, [])
+    assert other_store.remove("removed")
+    assert not other_store.remove("unknown")
+
+    assert (tmp_path / "stripe.00").stat().st_size < 1000
+    assert other_store.load("host0") == {"counter": 99}
+    assert other_store.load("host2") == {"counter": 98}
+    other_store.save("host1", {"counter": 100}, [])
+
+    assert store.load("host1") == {"counter": 100}
+    assert store.load("removed") is None
+
+
+def test_incomplete_record_is_dropped(tmp_path):
+    store = ItemStateStore(tmp_path, num_stripes=1)
+    store.save("host", {"a": 1}, [])
+    with (tmp_path / "stripe.00").open("ab") as f:
+        f.write(item_state_store._pack_record("host", {"a": 2}, [], full=False)[:-1])
+
+    assert ItemStateStore(tmp_path, num_stripes=1).load("host") == {"a": 1}
+    store.save("host", {"b": 3}, [])
+    assert ItemStateStore(tmp_path, num_stripes=1).load("host") == {"a": 1, "b": 3}
+
+
+def test_remove(tmp_path):
+    store = ItemStateStore(tmp_path, num_stripes=1)
+    store.save("host", {"a": 1}, [])
+    assert store.remove("host")
+    assert store.load("host") is None
+    assert not store.remove("host")
+    assert not ItemStateStore(tmp_path, num_stripes=1).remove("host")
+
+    store.save("host", {"b": 2}, [])
+    assert ItemStateStore(tmp_path, num_stripes=1).load("host") == {"b": 2}
+    assert store.remove("host")
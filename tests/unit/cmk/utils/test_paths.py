@@ -15,6 +15,11 @@ pathlib_paths = [
     "discovered_host_labels_dir",
     "piggyback_dir",
     "piggyback_source_dir",
+    "piggyback_segment_dir",
+    "precompiled_config_dir",
+    "item_states_dir",
+    "autochecks_index_file",
+    "snmpwalk_index_dir",
     "notifications_dir",
     "pnp_templates_dir",
     "doc_dir",
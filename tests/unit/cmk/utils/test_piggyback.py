@@ -35,6 +35,9 @@ def test_config():
 
     os.utime(str(source_file), (source_stat.st_atime, source_stat.st_mtime))
 
+    for segment_path in cmk.utils.paths.piggyback_segment_dir.glob("*"):
+        segment_path.unlink()
+
 
 def test_piggyback_default_time_settings():
     time_settings: piggyback.PiggybackTimeSettings = [(None, "max_cache_age",
@@ -432,3 +435,86 @@ def test_get_piggyback_matching_time_settings(time_settings, expected_time_setti
         piggyback._get_matching_time_settings(
             ["source-host"], "piggybacked-host",
             time_settings).keys()) == sorted(expected_time_setting_keys)
+
+
+def test_store_piggyback_segment_replaces_files():
+    time_settings: piggyback.PiggybackTimeSettings = [(None, "max_cache_age",
+                                                       piggyback_max_cachefile_age)]
+    piggyback.store_piggyback_raw_data("source1", {"test-host": [b"<<<check_mk>>>", b"segment"]},
+                                       segmented=True)
+
+    assert not (cmk.utils.paths.piggyback_dir / "test-host" / "source1").exists()
+    assert not (cmk.utils.paths.piggyback_source_dir / "source1").exists()
+    assert piggyback.get_source_hostnames("test-host") == ["source1"]
+
+    raw_data_infos = piggyback.get_piggyback_raw_data("test-host", time_settings)
+    assert len(raw_data_infos) == 1
+    raw_data_info = raw_data_infos[0]
+    assert raw_data_info.source_hostname == "source1"
+    assert raw_data_info.file_path.endswith('/piggyback_segments/source1')
+    assert raw_data_info.successfully_processed is True
+    assert raw_data_info.reason == "Successfully processed from source 'source1'"
+    assert raw_data_info.raw_data == b'<<<check_mk>>>\nsegment\n'
+
+    # Switching back removes the segment
+    piggyback.store_piggyback_raw_data("source1", {"test-host": [b"<<<check_mk>>>", b"file"]})
+    assert list(cmk.utils.paths.piggyback_segment_dir.glob("*")) == []
+    raw_data_infos = piggyback.get_piggyback_raw_data("test-host", time_settings)
+    assert [info.raw_data for info in raw_data_infos] == [b'<<<check_mk>>>\nfile\n']
+
+
+def test_piggyback_segment_not_updated():
+    time_settings: piggyback.PiggybackTimeSettings = [
+        (None, "max_cache_age", piggyback_max_cachefile_age),
+        ("source2", "validity_period", 1000),
+        ("source2", "validity_state", 1),
+    ]
+    piggyback.store_piggyback_raw_data("source2", {"pig": [b"<<<check_mk>>>", b"pig"]},
+                                       segmented=True)
+    piggyback.store_piggyback_raw_data("source2", {"other": [b"<<<check_mk>>>", b"other"]},
+                                       segmented=True)
+
+    raw_data_infos = piggyback.get_piggyback_raw_data("pig", time_settings)
+    assert len(raw_data_infos) == 1
+    assert raw_data_infos[0].successfully_processed is True
+    assert raw_data_infos[0].reason.startswith(
+        "Piggyback file not updated by source 'source2' (still valid")
+    assert raw_data_infos[0].reason_status == 1
+    assert raw_data_infos[0].raw_data == b'<<<check_mk>>>\npig\n'
+
+    assert sorted(piggyback.get_source_and_piggyback_hosts(time_settings)) == [
+        ("source1", "test-host"),
+        ("source2", "other"),
+        ("source2", "pig"),
+    ]
+
+
+def test_piggyback_segment_not_sending():
+    time_settings: piggyback.PiggybackTimeSettings = [(None, "max_cache_age",
+                                                       piggyback_max_cachefile_age)]
+    piggyback.store_piggyback_raw_data("source2", {"pig": [b"<<<check_mk>>>", b"pig"]},
+                                       segmented=True)
+    assert piggyback.has_piggyback_raw_data("pig", time_settings)
+
+    assert piggyback.remove_source_status_file("source2") is True
+    raw_data_infos = piggyback.get_piggyback_raw_data("pig", time_settings)
+    assert len(raw_data_infos) == 1
+    assert raw_data_infos[0].successfully_processed is False
+    assert raw_data_infos[0].reason == "Source 'source2' not sending piggyback data"
+    assert not piggyback.has_piggyback_raw_data("pig", time_settings)
+
+
+def test_cleanup_piggyback_segments():
+    piggyback.store_piggyback_raw_data("source2", {"pig": [b"<<<check_mk>>>", b"pig"]},
+                                       segmented=True)
+    piggyback.store_piggyback_raw_data("source3", {"pig": [b"<<<check_mk>>>", b"pig"]},
+                                       segmented=True)
+
+    piggyback.cleanup_piggyback_files([
+        (None, "max_cache_age", piggyback_max_cachefile_age),
+        ("source3", "max_cache_age", -1),
+    ])
+    assert [path.name for path in cmk.utils.paths.piggyback_segment_dir.glob("*")] == ["source2"]
+
+    piggyback.cleanup_piggyback_files([(None, "max_cache_age", -1)])
+    assert list(cmk.utils.paths.piggyback_segment_dir.glob("*")) == []
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# Copyright (C) 2019 tribe29 GmbH - License: GNU General Public License v2
+# This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
+# conditions defined in the file COPYING, which is part of this source code package.
+
+from cmk.utils.piggyback_segment import Segment, SegmentEntry, write_segment
+
+
+def test_segment_roundtrip(tmp_path):
+    path = tmp_path / "source"
+    entries = [
+        SegmentEntry("host%d" % index, 1000.0 + index, b"<<<section>>>\n%d\n" % index)
+        for index in range(100)
+    ] + [SegmentEntry("hüst", 1.5, b"")]
+    write_segment(path, 1100.0, entries)
+
+    segment = Segment.load(path)
+    assert segment is not None
+    assert segment.last_contact == 1100.0
+    assert len(segment) == 101
+    assert list(segment) == entries
+    assert list(segment.piggybacked_hostnames()) == [entry.piggybacked_hostname for entry in entries]
+
+    assert "host42" in segment
+    assert segment.stored("host42") == 1042.0
+    assert segment.raw_data("host42") == b"<<<section>>>\n42\n"
+    assert segment.raw_data("hüst") == b""
+    assert "host100" not in segment
+    assert segment.stored("host100") is None
+    assert segment.raw_data("host100") is None
+
+
+def test_segment_empty(tmp_path):
+    path = tmp_path / "source"
+    write_segment(path, 0.0, [])
+
+    segment = Segment.load(path)
+    assert segment is not None
+    assert segment.last_contact == 0.0
+    assert len(segment) == 0
+    assert "host" not in segment
+
+
+def test_segment_load_invalid(tmp_path):
+    path = tmp_path / "source"
+    assert Segment.load(path) is None
+
+    path.write_bytes(b"")
+    assert Segment.load(path) is None
+
+    path.write_bytes(b"no segment")
+    assert Segment.load(path) is None
+
+    path.write_bytes(b"NOSEGMNT" + bytes(32))
+    assert Segment.load(path) is None
@@ -4,6 +4,7 @@
 # This file is part of Checkmk (https://checkmk.com). It is subject to the terms and
 # conditions defined in the file COPYING, which is part of this source code package.
 
+import numpy as np  # type: ignore[import]
 import pytest  # type: ignore[import]
 
 import cmk.utils.prediction as prediction
@@ -60,6 +61,34 @@ def test_time_series_upsampling(rrddata, twindow, shift, upsampled):
     assert ts.bfill_upsample(twindow, shift) == upsampled
 
 
+def _bfill_upsample_stepwise(ts, twindow, shift):
+    upsa = []
+    i = 0
+    current_times = prediction.rrd_timestamps(ts.twindow)
+    for t in range(*twindow):
+        if t >= current_times[i] + shift:
+            i += 1
+        upsa.append(ts.values[i])
+    return upsa
+
+
+@pytest.mark.parametrize("step", [1, 7, 10, 30, 60])
+@pytest.mark.parametrize("shift", [-25, 0, 10, 300])
+def test_time_series_upsampling_stepwise(step, shift):
+    ts = prediction.TimeSeries([300, 600, 30] + list(range(10)))
+    for start in range(270, 360, 15):
+        twindow = (start, start + 250, step)
+        try:
+            expected = _bfill_upsample_stepwise(ts, twindow, shift)
+        except IndexError:
+            with pytest.raises(IndexError):
+                ts.bfill_upsample(twindow, shift)
+        else:
+            assert ts.bfill_upsample(twindow, shift) == expected
+            values = np.array(ts.values, dtype=object)
+            assert values[ts.bfill_upsample_indices(twindow, shift)].tolist() == expected
+
+
 @pytest.mark.parametrize("rrddata, twindow, cf, downsampled", [
     ([10, 25, 5, 15, 20, 25], (10, 30, 10), "average", [17.5, 25]),
     ([10, 25, 5, 15, 20, 25], (10, 30, 10), "max", [20, 25]),
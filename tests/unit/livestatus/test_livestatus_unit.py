@@ -9,6 +9,8 @@
 import errno
 import socket
 import ssl
+import threading
+import time
 from contextlib import closing
 
 import pytest  # type: ignore[import]
@@ -212,3 +214,111 @@ def test_local_connection(mock_livestatus):
     live.expect_query("GET status\nColumns: program_start\nColumnHeaders: off")
     with mock_livestatus(expect_status_query=False):
         livestatus.LocalConnection().query_value("GET status\nColumns: program_start")
+
+
+class _KeepAliveServer(threading.Thread):
+    """Answers the queries of a fixed16 KeepAlive connection with their table names"""
+    def __init__(self, path):
+        super().__init__(daemon=True)
+        self.num_connections = 0
+        self._server = socket.socket(socket.AF_UNIX)
+        self._server.bind(str(path))
+        self._server.listen(5)
+
+    def run(self):
+        while True:
+            conn, _address = self._server.accept()
+            self.num_connections += 1
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def _serve(self, conn):
+        data = b""
+        with closing(conn):
+            while True:
+                while b"\n\n" not in data:
+                    packet = conn.recv(4096)
+                    if not packet:
+                        return
+                    data += packet
+                query, data = data.split(b"\n\n", 1)
+                table = query.split(b"\n", 1)[0].decode("utf-8").split()[1]
+                if table == "close":
+                    return
+                if table == "unknown":
+                    code, body = 404, b"Table unknown does not exist"
+                else:
+                    code, body = 200, repr([[table]]).encode("utf-8")
+                conn.sendall(b"%03d %11d\n" % (code, len(body)) + body)
+
+
+@pytest.fixture
+def keep_alive_server(sock_path):
+    server = _KeepAliveServer(sock_path)
+    server.start()
+    return server
+
+
+def test_connection_pool_reuses_socket(keep_alive_server, sock_path):
+    pool = livestatus.ConnectionPool()
+    for _nr in range(3):
+        live = livestatus.SingleSiteConnection("unix:%s" % sock_path, "local", pool=pool)
+        assert live.query("GET hosts") == [["hosts"]]
+        live.release()
+        assert pool.num_idle() == 1
+
+    assert live.successfully_persisted()
+    assert keep_alive_server.num_connections == 1
+    assert pool.latency_histograms()["local"].count == 3
+
+
+def test_connection_pool_discards_closed_socket(keep_alive_server, sock_path):
+    pool = livestatus.ConnectionPool()
+    live = livestatus.SingleSiteConnection("unix:%s" % sock_path, pool=pool)
+    live.send_command("GET close")
+    live.release()
+
+    # The server closes the connection
+    time.sleep(0.1)
+    assert pool.checkout(live._pool_key()) is None
+
+    assert live.query("GET hosts") == [["hosts"]]
+    assert not live.successfully_persisted()
+    assert keep_alive_server.num_connections == 2
+
+
+def test_connection_pool_evicts_idle_sockets(keep_alive_server, sock_path):
+    pool = livestatus.ConnectionPool(max_idle_time=0.0)
+    live = livestatus.SingleSiteConnection("unix:%s" % sock_path, pool=pool)
+    live.query("GET hosts")
+    live.release()
+    time.sleep(0.01)
+    assert pool.checkout(live._pool_key()) is None
+    assert pool.num_idle() == 0
+
+
+def test_query_pipelined(keep_alive_server, sock_path):
+    live = livestatus.SingleSiteConnection("unix:%s" % sock_path)
+    assert live.query_pipelined(["GET hosts", "GET services", "GET status"]) == [
+        [["hosts"]],
+        [["services"]],
+        [["status"]],
+    ]
+
+    with pytest.raises(livestatus.MKLivestatusTableNotFoundError):
+        live.query_pipelined(["GET hosts", "GET unknown", "GET status"])
+
+    # All responses have been read, the connection is still in sync
+    assert live.query("GET services") == [["services"]]
+    assert keep_alive_server.num_connections == 1
+
+
+def test_latency_histogram():
+    histogram = livestatus.LatencyHistogram()
+    histogram.record(0.003)
+    histogram.record(0.2)
+    histogram.record(100.0)
+    assert histogram.count == 3
+    assert histogram.counts[histogram.bounds.index(0.001)] == 0
+    assert histogram.counts[histogram.bounds.index(0.005)] == 1
+    assert histogram.counts[histogram.bounds.index(0.25)] == 2
+    assert histogram.counts[-1] == 3